@@ -2,6 +2,7 @@
 Enhanced Security Middleware for Production
 """
 
+import json
 import logging
 from django.conf import settings
 from django.core.cache import cache
@@ -61,6 +62,8 @@ class RateLimitMiddleware:
             
             if count >= 60:
                 logger.warning(f"Rate limit exceeded for IP {ip} on {request.path}")
+                if request.path.startswith('/api/attendance/scan'):
+                    self.record_rejected_scan(request)
                 return HttpResponse('Rate limit exceeded. Please try again later.', status=429)
             
             # Increment counter
@@ -68,6 +71,18 @@ class RateLimitMiddleware:
         
         return self.get_response(request)
     
+    def record_rejected_scan(self, request):
+        """Count the rejected scan against its kiosk (per-kiosk scan metrics)"""
+        from apps.attendance.scan_metrics import ScanMetrics
+        
+        kiosk_id = request.headers.get('X-Kiosk-Id')
+        if not kiosk_id:
+            try:
+                kiosk_id = json.loads(request.body).get('device_id')
+            except (ValueError, AttributeError):
+                kiosk_id = None
+        ScanMetrics.record_rejected(kiosk_id)
+    
     def get_client_ip(self, request):
         """Get client IP address from request"""
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
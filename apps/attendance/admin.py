@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Session, Attendance
+from django.db import transaction
+from .models import Session, Attendance, MonitorChannel
 
 
 @admin.register(Session)
@@ -41,13 +42,17 @@ class SessionAdmin(admin.ModelAdmin):
     def mark_teacher_attended(self, request, queryset):
         """تسجيل حضور المدرس"""
         from django.utils import timezone
+        session_ids = list(queryset.values_list('session_id', flat=True))
         count = queryset.update(teacher_attended=True, teacher_checkin_time=timezone.now())
+        self._sessions_changed(session_ids, teacher_attended=True)
         self.message_user(request, f'تم تسجيل حضور المدرس لـ {count} حصة')
     mark_teacher_attended.short_description = "✅ تسجيل حضور المدرس"
 
     def cancel_sessions(self, request, queryset):
         """إلغاء الحصص المحددة"""
+        session_ids = list(queryset.values_list('session_id', flat=True))
         count = queryset.update(is_cancelled=True)
+        self._sessions_changed(session_ids, is_cancelled=True)
         self.message_user(request, f'تم إلغاء {count} حصة')
     cancel_sessions.short_description = "❌ إلغاء الحصص"
 
@@ -57,6 +62,20 @@ class SessionAdmin(admin.ModelAdmin):
         self.message_user(request, f'تم تحديد {count} حصة كـ "تم الإشعار"')
     mark_notified.short_description = "📧 تحديد: تم الإشعار"
 
+    @staticmethod
+    def _sessions_changed(session_ids, **flags):
+        """
+        queryset.update() sends no post_save - do what the Session signals do
+        """
+        from .live_stream import LiveMonitorStream
+        from .roster_index import RosterIndexService
+        from .session_counters import SessionCounterService
+
+        transaction.on_commit(RosterIndexService.invalidate_sessions)
+        for session_id in session_ids:
+            SessionCounterService.set_flags(session_id, **flags)
+            LiveMonitorStream.session_changed(session_id)
+
 
 @admin.register(Attendance)
 class AttendanceAdmin(admin.ModelAdmin):
@@ -109,3 +128,27 @@ class AttendanceAdmin(admin.ModelAdmin):
         queryset.delete()
         self.message_user(request, f'تم حذف {count} سجل حضور', level='WARNING')
     delete_attendances.short_description = "🗑️ حذف السجلات"
+
+
+@admin.register(MonitorChannel)
+class MonitorChannelAdmin(admin.ModelAdmin):
+    list_display = ['name', 'slug', 'get_room_count', 'refresh_interval', 'show_alerts', 'is_active']
+    list_filter = ['is_active', 'show_alerts']
+    search_fields = ['name', 'slug']
+    filter_horizontal = ['rooms']
+
+    fieldsets = (
+        ('القناة', {
+            'fields': ('name', 'slug', 'rooms', 'is_active')
+        }),
+        ('إعدادات العرض', {
+            'fields': ('refresh_interval', 'auto_refresh', 'show_alerts', 'enable_sound', 'fullscreen_mode')
+        }),
+        ('حدود التنبيهات', {
+            'fields': ('alert_threshold_low_attendance', 'alert_threshold_high_blocked')
+        }),
+    )
+
+    def get_room_count(self, obj):
+        return obj.rooms.count() or 'الكل'
+    get_room_count.short_description = 'عدد القاعات'
@@ -3,13 +3,25 @@ from . import api_views
 
 urlpatterns = [
     path('scan/', api_views.process_scan, name='api_scan'),
+    path('scan/batch/', api_views.process_scan_batch, name='api_scan_batch'),
     path('session/<int:session_id>/', api_views.session_attendance, name='api_session'),
     path('student/<int:student_id>/history/', api_views.student_history, name='api_student_history'),
     path('sessions/today/', api_views.today_sessions_api, name='api_today_sessions'),
     
     # Live Monitor endpoints
     path('monitor/live-status/', api_views.live_dashboard_status, name='api_live_status'),
+    path('monitor/stream/', api_views.live_dashboard_stream, name='api_live_stream'),
     path('monitor/room/<int:room_id>/', api_views.live_room_detail, name='api_live_room_detail'),
+    path('monitor/channel/<slug:slug>/live-status/', api_views.live_channel_status, name='api_live_channel_status'),
+    path('monitor/channel/<slug:slug>/stream/', api_views.live_channel_stream, name='api_live_channel_stream'),
+    path('monitor/replay/', api_views.live_monitor_replay, name='api_live_replay'),
     path('monitor/settings/', api_views.live_monitor_settings, name='api_live_settings'),
     path('monitor/print-report/', api_views.live_printable_report, name='api_live_print_report'),
+    
+    # Kiosk fleet
+    path('kiosks/fleet/', api_views.kiosk_fleet_status, name='api_kiosk_fleet'),
+    
+    # Scan-path latency metrics
+    path('metrics/scan/', api_views.scan_metrics_api, name='api_scan_metrics'),
+    path('metrics/kiosks/', api_views.kiosk_metrics_api, name='api_kiosk_metrics'),
 ]
@@ -1,8 +1,14 @@
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
+from django.utils.cache import get_conditional_response, patch_cache_control, set_response_etag
+from apps.accounts.decorators import admin_required
 import json
+import logging
 from .services import AttendanceService
+from .scan_dedup import ScanDeduplicator
+
+logger = logging.getLogger(__name__)
 
 
 @login_required
@@ -21,21 +27,14 @@ def process_scan(request):
                 'message': 'الباركود مطلوب'
             }, status=400)
         
-        result = AttendanceService.process_scan(barcode, request.user)
+        result = AttendanceService.process_scan(
+            barcode,
+            request.user,
+            idempotency_key=data.get('idempotency_key') or request.headers.get('Idempotency-Key')
+        )
         
-        # تحويل الكائنات إلى dict
-        if result.get('success') and 'student' in result:
-            result['student'] = {
-                'id': result['student'].student_id,
-                'name': result['student'].full_name,
-                'barcode': result['student'].barcode
-            }
-            if 'attendance' in result:
-                result['attendance'] = {
-                    'id': result['attendance'].attendance_id,
-                    'status': result['attendance'].status,
-                    'scan_time': result['attendance'].scan_time.isoformat()
-                }
+        # تحويل الكائنات إلى dict (نفس صيغة الاستجابة المخزنة للإعادة)
+        result = ScanDeduplicator.serialize(result)
         
         status_code = 200 if result['success'] else 400
         return JsonResponse(result, status=status_code)
@@ -146,6 +145,133 @@ def live_dashboard_status(request):
         }, status=500)
 
 
+@login_required
+@require_http_methods(["GET"])
+def live_dashboard_stream(request):
+    """
+    Server-Sent Events stream for the live monitor
+    بث الشاشة الحية: لقطة كاملة عند الاتصال ثم فروقات القاعات فقط
+    """
+    from .live_stream import LiveMonitorStream
+    
+    response = StreamingHttpResponse(
+        LiveMonitorStream.stream(request.headers.get('Last-Event-ID')),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Disable proxy buffering (nginx) so events are delivered immediately
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+@require_http_methods(["GET"])
+def live_channel_status(request, slug):
+    """
+    Live status for the rooms of one monitor channel (wall screen)
+    حالة الشاشة الحية لقاعات قناة واحدة
+    """
+    from .monitor_service import LiveMonitorService
+    
+    channel = LiveMonitorService.get_channel(slug)
+    if channel is None:
+        return JsonResponse({
+            'success': False,
+            'error': 'Channel not found'
+        }, status=404)
+    
+    try:
+        data = LiveMonitorService.get_channel_dashboard_data(channel)
+        return JsonResponse({
+            'success': True,
+            'channel': {'slug': channel['slug'], 'name': channel['name']},
+            'settings': channel['settings'],
+            'data': data
+        })
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+
+@login_required
+@require_http_methods(["GET"])
+def live_channel_stream(request, slug):
+    """
+    Server-Sent Events stream limited to one monitor channel's rooms
+    بث الشاشة الحية لقاعات قناة واحدة فقط
+    """
+    from .live_stream import LiveMonitorStream
+    from .monitor_service import LiveMonitorService
+    
+    channel = LiveMonitorService.get_channel(slug)
+    if channel is None:
+        return JsonResponse({
+            'success': False,
+            'error': 'Channel not found'
+        }, status=404)
+    
+    response = StreamingHttpResponse(
+        LiveMonitorStream.stream(request.headers.get('Last-Event-ID'), channel=channel),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+@require_http_methods(["GET"])
+def live_monitor_replay(request):
+    """
+    The live monitor as it looked at a past moment (minute snapshots)
+    إعادة عرض الشاشة الحية لوقت سابق
+    
+    Query Parameters:
+        at: ISO date-time, local time if no offset (e.g. 2026-10-13T16:05)
+        room: Limit to one room (optional)
+        channel: Limit to a monitor channel's rooms (optional)
+    """
+    from django.utils import timezone
+    from django.utils.dateparse import parse_datetime
+    from .monitor_history import MonitorHistoryService
+    from .monitor_service import LiveMonitorService
+    
+    at = parse_datetime(request.GET.get('at', ''))
+    if at is None:
+        return JsonResponse({
+            'success': False,
+            'error': 'Parameter "at" must be an ISO date-time'
+        }, status=400)
+    if timezone.is_naive(at):
+        at = timezone.make_aware(at)
+    
+    room_ids = None
+    if request.GET.get('channel'):
+        channel = LiveMonitorService.get_channel(request.GET['channel'])
+        if channel is None:
+            return JsonResponse({
+                'success': False,
+                'error': 'Channel not found'
+            }, status=404)
+        room_ids = channel['room_ids']
+    if request.GET.get('room'):
+        try:
+            room_ids = [int(request.GET['room'])]
+        except ValueError:
+            return JsonResponse({
+                'success': False,
+                'error': 'Invalid room'
+            }, status=400)
+    
+    data = MonitorHistoryService.replay(at, room_ids)
+    return JsonResponse({
+        'success': True,
+        'data': data
+    })
+
+
 @login_required
 @require_http_methods(["GET"])
 def live_room_detail(request, room_id):
@@ -164,7 +290,7 @@ def live_room_detail(request, room_id):
                 'error': 'Room not found'
             }, status=404)
         
-        return JsonResponse({
+        response = JsonResponse({
             'success': True,
             'data': data
         })
@@ -173,6 +299,11 @@ def live_room_detail(request, room_id):
             'success': False,
             'error': str(e)
         }, status=500)
+    
+    # Unchanged room -> 304 (the client revalidates on every click)
+    set_response_etag(response)
+    patch_cache_control(response, private=True, no_cache=True)
+    return get_conditional_response(request, etag=response['ETag'], response=response)
 
 
 @login_required
@@ -268,3 +399,203 @@ def live_printable_report(request):
             'success': False,
             'error': str(e)
         }, status=500)
+
+
+@login_required
+@require_http_methods(["POST"])
+def process_scan_batch(request):
+    """
+    API endpoint لمعالجة دفعة مسح من الكشك (بعد انقطاع الاتصال)
+    
+    Body: {"scans": [{"student_code", "scanned_at", "device_id", "idempotency_key"}, ...]}
+    كل عنصر يُقيَّم بوقت المسح الأصلي، والنتائج بنفس الترتيب.
+    إعادة إرسال الدفعة بنفس مفاتيح العناصر تُرجع النتائج الأصلية.
+    """
+    from django.conf import settings
+    from django.utils import timezone
+    from django.utils.dateparse import parse_datetime
+    from .models import KioskDevice
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'success': False,
+            'message': 'بيانات غير صالحة'
+        }, status=400)
+
+    scans = data.get('scans') if isinstance(data, dict) else data
+    if not isinstance(scans, list) or not scans:
+        return JsonResponse({
+            'success': False,
+            'message': 'قائمة المسح مطلوبة'
+        }, status=400)
+
+    if len(scans) > AttendanceService.MAX_BATCH_SIZE:
+        return JsonResponse({
+            'success': False,
+            'message': f'الحد الأقصى {AttendanceService.MAX_BATCH_SIZE} عملية مسح في الدفعة'
+        }, status=400)
+
+    device_ids = {
+        str(item.get('device_id'))
+        for item in scans
+        if isinstance(item, dict) and item.get('device_id')
+    }
+    active_devices = set(
+        KioskDevice.objects.filter(
+            device_id__in=device_ids,
+            is_active=True
+        ).values_list('device_id', flat=True)
+    )
+
+    now = timezone.now()
+    latest_allowed = now + timezone.timedelta(
+        seconds=AttendanceService.MAX_CLOCK_SKEW_SECONDS
+    )
+    earliest_allowed = now - timezone.timedelta(
+        hours=getattr(settings, 'ATTENDANCE_BATCH_MAX_AGE_HOURS', 48)
+    )
+
+    results = [None] * len(scans)
+    valid_scans = []
+    valid_indexes = []
+
+    for index, item in enumerate(scans):
+        error = None
+        student_code = ''
+        scan_time = None
+
+        if not isinstance(item, dict):
+            error = 'عنصر غير صالح'
+        else:
+            student_code = str(item.get('student_code') or '').strip()
+            scanned_at = item.get('scanned_at')
+            scan_time = parse_datetime(scanned_at) if isinstance(scanned_at, str) else None
+            if scan_time is not None and timezone.is_naive(scan_time):
+                scan_time = timezone.make_aware(scan_time)
+
+            if not student_code:
+                error = 'كود الطالب مطلوب'
+            elif scan_time is None:
+                error = 'وقت المسح غير صالح'
+            elif scan_time > latest_allowed:
+                error = 'وقت المسح في المستقبل'
+            elif scan_time < earliest_allowed:
+                error = 'وقت المسح قديم جداً'
+            elif item.get('device_id') and str(item['device_id']) not in active_devices:
+                error = 'جهاز غير معروف'
+
+        if error:
+            results[index] = {
+                'index': index,
+                'student_code': student_code,
+                'success': False,
+                'status': 'invalid',
+                'color_code': 'gray',
+                'allow_entry': False,
+                'message': error
+            }
+            continue
+
+        valid_indexes.append(index)
+        valid_scans.append({
+            'student_code': student_code,
+            'scan_time': scan_time,
+            'idempotency_key': str(item.get('idempotency_key') or '').strip() or None
+        })
+
+    try:
+        processed = AttendanceService.process_scan_batch(valid_scans, request.user) if valid_scans else []
+    except Exception:
+        logger.exception("Error processing scan batch")
+        return JsonResponse({
+            'success': False,
+            'message': 'حدث خطأ في الخادم'
+        }, status=500)
+
+    for index, scan, result in zip(valid_indexes, valid_scans, processed):
+        results[index] = {
+            'index': index,
+            'student_code': scan['student_code'],
+            'scanned_at': scan['scan_time'].isoformat(),
+            **result
+        }
+
+    return JsonResponse({
+        'success': True,
+        'count': len(results),
+        'results': results
+    })
+
+
+@admin_required
+@require_http_methods(["GET"])
+def scan_metrics_api(request):
+    """
+    API endpoint لمدرجات زمن المسح (p50/p95/p99 لكل كشك ولكل خطوة)
+    
+    Query: ?kiosk=<device_id>&minutes=<1..15>
+    """
+    from .scan_metrics import ScanMetrics
+
+    try:
+        minutes = int(request.GET.get('minutes', ScanMetrics.ROLLING_WINDOW_MINUTES))
+    except ValueError:
+        minutes = ScanMetrics.ROLLING_WINDOW_MINUTES
+
+    summary = ScanMetrics.get_summary(
+        kiosk_id=request.GET.get('kiosk') or None,
+        minutes=max(1, minutes)
+    )
+    return JsonResponse({'success': True, **summary})
+
+
+@require_http_methods(["GET"])
+def kiosk_metrics_api(request):
+    """
+    API endpoint لمعدل المسح لكل كشك (مسح/دقيقة، توزيع النتائج، متوسط الزمن، الرفض)
+    
+    Query: ?kiosk=<device_id>&minutes=<1..15>&format=json|prometheus
+    Access: admin session, or "Authorization: Bearer <METRICS_API_TOKEN>" (scrapers)
+    """
+    from django.conf import settings
+    from django.http import HttpResponse
+    from django.utils.crypto import constant_time_compare
+    from .scan_metrics import ScanMetrics
+
+    token = getattr(settings, 'METRICS_API_TOKEN', '')
+    authorized = (
+        request.user.is_authenticated and request.user.role == 'admin'
+    ) or (
+        bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    )
+    if not authorized:
+        return JsonResponse({'success': False, 'error': 'Forbidden'}, status=403)
+
+    try:
+        minutes = int(request.GET.get('minutes', ScanMetrics.ROLLING_WINDOW_MINUTES))
+    except ValueError:
+        minutes = ScanMetrics.ROLLING_WINDOW_MINUTES
+
+    throughput = ScanMetrics.get_throughput(
+        kiosk_id=request.GET.get('kiosk') or None,
+        minutes=max(1, minutes)
+    )
+    if request.GET.get('format') == 'prometheus':
+        return HttpResponse(
+            ScanMetrics.render_prometheus(throughput),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
+    return JsonResponse({'success': True, **throughput})
+
+
+@login_required
+@require_http_methods(["GET"])
+def kiosk_fleet_status(request):
+    """
+    حالة أسطول الأكشاك (متصل / متوقف / غير متصل) لكل قاعة
+    """
+    from .kiosk_heartbeat import KioskHeartbeatService
+
+    return JsonResponse({'success': True, **KioskHeartbeatService.get_fleet_status()})
@@ -5,3 +5,7 @@ class AttendanceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.attendance'
     verbose_name = 'الحضور'
+
+    def ready(self):
+        """Import signals when app is ready"""
+        import apps.attendance.signals
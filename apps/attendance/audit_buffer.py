@@ -0,0 +1,342 @@
+"""
+Audit Write-Behind Buffer
+مخزن مؤقت لكتابة سجلات التدقيق خارج مسار المسح
+
+Audit-only rows (BlockedAttempt) don't affect the kiosk decision, so they
+can be written after the response instead of inside the scan transaction.
+
+Modes (settings.ATTENDANCE_AUDIT_WRITE_MODE):
+- sync:   bulk_create inside the caller's transaction (default, fully durable)
+- memory: per-process queue flushed by a background thread every
+          ATTENDANCE_AUDIT_FLUSH_ROWS rows or ATTENDANCE_AUDIT_FLUSH_MS ms.
+          Rows still queued are lost if the process is killed.
+- redis:  shared Redis list flushed by the attendance.flush_audit_buffer
+          Celery task. Survives web/worker restarts.
+
+Rows are only queued after the scan transaction commits. Both buffered
+modes flush on interpreter exit and on Celery worker shutdown.
+
+Each batch is written in one transaction, so a failed batch leaves no
+partial rows behind to be duplicated when it is retried. A batch that
+fails on bad data is retried row by row so one bad row cannot wedge the
+queue: in redis mode the rows that still fail are moved to a dead-letter
+list (DEAD_LETTER_KEY), in memory mode they are logged and dropped. A
+database outage (OperationalError) leaves the rows queued in both modes.
+"""
+
+import atexit
+import json
+import logging
+import threading
+from typing import Any, Dict, List
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import OperationalError, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class AuditWriteBuffer:
+    """
+    كتابة مؤجلة لسجلات التدقيق مع bulk_create
+    """
+
+    MODE_SYNC = 'sync'
+    MODE_MEMORY = 'memory'
+    MODE_REDIS = 'redis'
+
+    REDIS_KEY = 'attendance:audit_buffer'
+    DEAD_LETTER_KEY = 'attendance:audit_buffer:dead'
+    FLUSH_LOCK_KEY = 'attendance:audit_buffer:lock'
+    FLUSH_SCHEDULED_KEY = 'attendance:audit_buffer:scheduled'
+    FLUSH_LOCK_TIMEOUT = 60
+    BULK_BATCH_SIZE = 500
+
+    _lock = threading.Lock()
+    _rows: List[Dict[str, Any]] = []
+    _wakeup = threading.Event()
+    _flusher = None
+
+    # ========================================
+    # Public API
+    # ========================================
+
+    @classmethod
+    def get_mode(cls) -> str:
+        return getattr(settings, 'ATTENDANCE_AUDIT_WRITE_MODE', cls.MODE_SYNC)
+
+    @classmethod
+    def add(cls, model, rows: List[Dict[str, Any]]) -> None:
+        """
+        إضافة سجلات تدقيق
+
+        Args:
+            model: نموذج التدقيق (مثال: BlockedAttempt)
+            rows: قائمة حقول (المفاتيح الأجنبية بصيغة *_id)
+        """
+        if not rows:
+            return
+
+        mode = cls.get_mode()
+        if mode == cls.MODE_SYNC:
+            model.objects.bulk_create([model(**row) for row in rows])
+            return
+
+        label = model._meta.label
+        entries = [{'model': label, 'fields': dict(row)} for row in rows]
+
+        # Never log attempts for a scan that rolled back
+        transaction.on_commit(lambda: cls._enqueue(mode, entries))
+
+    @classmethod
+    def flush(cls) -> int:
+        """
+        كتابة كل السجلات المعلقة الآن
+
+        Returns:
+            int: عدد السجلات المكتوبة
+        """
+        written = cls._flush_memory()
+        if cls.get_mode() == cls.MODE_REDIS:
+            written += cls._flush_redis()
+        return written
+
+    @classmethod
+    def pending(cls) -> int:
+        """عدد السجلات المعلقة (للمراقبة)"""
+        count = len(cls._rows)
+        if cls.get_mode() == cls.MODE_REDIS:
+            redis = cls._get_redis()
+            if redis is not None:
+                count += redis.llen(cls.REDIS_KEY)
+        return count
+
+    # ========================================
+    # Queueing
+    # ========================================
+
+    @classmethod
+    def _enqueue(cls, mode: str, entries: List[Dict[str, Any]]) -> None:
+        if mode == cls.MODE_REDIS:
+            redis = cls._get_redis()
+            if redis is not None:
+                cls._enqueue_redis(redis, entries)
+                return
+            logger.warning("Audit buffer: Redis unavailable, falling back to memory mode")
+
+        with cls._lock:
+            cls._rows.extend(entries)
+            size = len(cls._rows)
+
+        cls._ensure_flusher()
+        if size >= cls._flush_rows():
+            cls._wakeup.set()
+
+    @classmethod
+    def _enqueue_redis(cls, redis, entries: List[Dict[str, Any]]) -> None:
+        size = redis.rpush(
+            cls.REDIS_KEY,
+            *[json.dumps(entry, cls=DjangoJSONEncoder) for entry in entries]
+        )
+
+        # Row threshold reached - ask a worker to flush (once per interval)
+        if size >= cls._flush_rows():
+            timeout = max(1, cls._flush_ms() // 1000)
+            if cache.add(cls.FLUSH_SCHEDULED_KEY, 1, timeout):
+                from .tasks import flush_audit_buffer
+                flush_audit_buffer.delay()
+
+    @classmethod
+    def _ensure_flusher(cls) -> None:
+        if cls._flusher is not None and cls._flusher.is_alive():
+            return
+
+        with cls._lock:
+            if cls._flusher is None or not cls._flusher.is_alive():
+                cls._flusher = threading.Thread(
+                    target=cls._run_flusher,
+                    name='audit-write-buffer',
+                    daemon=True
+                )
+                cls._flusher.start()
+
+    @classmethod
+    def _run_flusher(cls) -> None:
+        while True:
+            cls._wakeup.wait(cls._flush_ms() / 1000)
+            cls._wakeup.clear()
+            try:
+                cls._flush_memory()
+            except Exception:
+                logger.exception("Audit buffer flush failed")
+            finally:
+                # This thread owns its own DB connection
+                connections.close_all()
+
+    # ========================================
+    # Flushing
+    # ========================================
+
+    @classmethod
+    def _flush_memory(cls) -> int:
+        """
+        كتابة الصفوف المنتظرة في الذاكرة
+
+        An OperationalError puts the unwritten rows back at the front of
+        the queue; a batch failing on bad data is retried row by row.
+        """
+        with cls._lock:
+            entries, cls._rows = cls._rows, []
+
+        try:
+            return cls._write(entries)
+        except OperationalError:
+            cls._requeue(entries)
+            raise
+        except Exception:
+            logger.exception("Audit buffer batch failed - retrying row by row")
+
+        written = 0
+        for position, entry in enumerate(entries):
+            try:
+                written += cls._write([entry])
+            except OperationalError:
+                cls._requeue(entries[position:])
+                raise
+            except Exception:
+                logger.exception(f"Audit buffer row dropped: {entry}")
+        return written
+
+    @classmethod
+    def _requeue(cls, entries: List[Dict[str, Any]]) -> None:
+        # Keep the original order ahead of rows queued meanwhile
+        with cls._lock:
+            cls._rows = entries + cls._rows
+
+    @classmethod
+    def _flush_redis(cls) -> int:
+        redis = cls._get_redis()
+        if redis is None:
+            return 0
+
+        # One flusher at a time so rows are not written twice
+        if not cache.add(cls.FLUSH_LOCK_KEY, 1, cls.FLUSH_LOCK_TIMEOUT):
+            return 0
+
+        written = 0
+        try:
+            while True:
+                raw = redis.lrange(cls.REDIS_KEY, 0, cls.BULK_BATCH_SIZE - 1)
+                if not raw:
+                    break
+                written += cls._write_redis_batch(redis, raw)
+        finally:
+            cache.delete(cls.FLUSH_LOCK_KEY)
+            cache.delete(cls.FLUSH_SCHEDULED_KEY)
+
+        return written
+
+    @classmethod
+    def _write_redis_batch(cls, redis, raw: List[bytes]) -> int:
+        """
+        كتابة دفعة من قائمة Redis ثم حذفها منها
+
+        Trims only what was written or dead-lettered (at-least-once
+        delivery); an OperationalError stops the flush with the rest queued.
+        """
+        try:
+            written = cls._write([json.loads(item) for item in raw])
+            redis.ltrim(cls.REDIS_KEY, len(raw), -1)
+            return written
+        except OperationalError:
+            raise
+        except Exception:
+            logger.exception("Audit buffer batch failed - retrying row by row")
+
+        written = 0
+        consumed = 0
+        dead = []
+        try:
+            for item in raw:
+                try:
+                    written += cls._write([json.loads(item)])
+                except OperationalError:
+                    raise
+                except Exception:
+                    logger.exception("Audit buffer row moved to dead-letter list")
+                    dead.append(item)
+                consumed += 1
+        finally:
+            if dead:
+                redis.rpush(cls.DEAD_LETTER_KEY, *dead)
+            redis.ltrim(cls.REDIS_KEY, consumed, -1)
+        return written
+
+    @classmethod
+    def _write(cls, entries: List[Dict[str, Any]]) -> int:
+        if not entries:
+            return 0
+
+        by_model: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in entries:
+            by_model.setdefault(entry['model'], []).append(entry['fields'])
+
+        written = 0
+        with transaction.atomic():
+            for label, rows in by_model.items():
+                model = apps.get_model(label)
+                objects = [model(**cls._to_python(model, row)) for row in rows]
+                model.objects.bulk_create(objects, batch_size=cls.BULK_BATCH_SIZE)
+                written += len(objects)
+
+        return written
+
+    @staticmethod
+    def _to_python(model, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Restore values that went through JSON (datetimes, times)"""
+        return {
+            name: model._meta.get_field(name).to_python(value)
+            for name, value in row.items()
+        }
+
+    # ========================================
+    # Helpers
+    # ========================================
+
+    @staticmethod
+    def _flush_rows() -> int:
+        return getattr(settings, 'ATTENDANCE_AUDIT_FLUSH_ROWS', 50)
+
+    @staticmethod
+    def _flush_ms() -> int:
+        return getattr(settings, 'ATTENDANCE_AUDIT_FLUSH_MS', 1000)
+
+    @staticmethod
+    def _get_redis():
+        try:
+            from django_redis import get_redis_connection
+            return get_redis_connection('default')
+        except Exception:
+            return None
+
+
+def _flush_on_shutdown(**kwargs):
+    """Flush-on-shutdown hook (interpreter exit / Celery worker shutdown)"""
+    try:
+        written = AuditWriteBuffer.flush()
+        if written:
+            logger.info(f"Audit buffer flushed {written} rows on shutdown")
+    except Exception:
+        logger.exception("Audit buffer flush on shutdown failed")
+
+
+atexit.register(_flush_on_shutdown)
+
+try:
+    from celery.signals import worker_shutdown
+    worker_shutdown.connect(_flush_on_shutdown, weak=False)
+except ImportError:
+    pass
@@ -0,0 +1,459 @@
+"""
+Scan Storm Benchmark
+قياس أداء مسار المسح تحت ضغط أجهزة الكشك
+
+Seeds rooms, groups and students with a realistic mix of enrollment and
+credit states, then fires concurrent scans from worker threads either
+directly through AttendanceService.process_scan ('service') or through
+the HTMX kiosk endpoint ('http'). The Celery broker and WhatsApp are
+stubbed, so only the scan path itself is measured.
+
+Used by the benchmark_scans management command, which runs it inside a
+throwaway test database. A run also swaps the default cache for a private
+local-memory cache (isolated_cache): the schedule/roster indexes, session
+ids, counters and scan metrics it writes use test primary keys and must
+never reach the production cache that live kiosks read.
+"""
+
+import queue
+import random
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+from unittest import mock
+
+from django.db import OperationalError, connection, connections
+from django.test.utils import override_settings
+from django.utils import timezone
+
+
+class ScanBenchmark:
+    """
+    توليد بيانات الاختبار وإطلاق مسحات متزامنة وقياس النتائج
+    """
+
+    TARGET_SERVICE = 'service'
+    TARGET_HTTP = 'http'
+
+    KIOSK_ID = 'benchmark'
+
+    # Share of enrollments in each credit state (see StudentGroupEnrollment.can_attend_session)
+    CREDIT_MIX = [
+        ('paid', 0.70),
+        ('grace', 0.10),
+        ('exhausted', 0.10),
+        ('new_unpaid', 0.05),
+        ('exempt', 0.05),
+    ]
+
+    WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE')
+
+    def __init__(self, rooms: int, groups: int, students: int, concurrency: int = 8,
+                 duplicate_ratio: float = 0.1, invalid_ratio: float = 0.02, seed: int = 42):
+        self.rooms = rooms
+        self.groups = groups
+        self.students = students
+        self.concurrency = concurrency
+        self.duplicate_ratio = duplicate_ratio
+        self.invalid_ratio = invalid_ratio
+        self.random = random.Random(seed)
+
+    # ========================================
+    # Isolation
+    # ========================================
+
+    @classmethod
+    @contextmanager
+    def isolated_cache(cls):
+        """
+        ذاكرة مؤقتة خاصة بالجولة بدلاً من ذاكرة الإنتاج (Redis)
+
+        The per-process index tables are reset on the way in and out, so
+        neither side sees the other's compiled schedule or roster.
+        """
+        with override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': f'scan-benchmark-{id(cls)}',
+            }
+        }):
+            cls._reset_local_tables()
+            try:
+                yield
+            finally:
+                from django.core.cache import cache
+                cache.clear()
+                cls._reset_local_tables()
+
+    @staticmethod
+    def _reset_local_tables() -> None:
+        from .roster_index import RosterIndexService
+        from .schedule_index import ScheduleIndexService
+
+        ScheduleIndexService._table = {'generation': None, 'data': None}
+        RosterIndexService._group_table = {'generation': None, 'date': None, 'groups': {}}
+
+    # ========================================
+    # Seeding
+    # ========================================
+
+    def seed(self, prefix: str) -> Dict[str, Any]:
+        """
+        إنشاء القاعات والمجموعات والطلاب لجولة واحدة
+
+        All groups start ten minutes from now so every valid scan lands in
+        the on-time window; credit states decide who is let in.
+
+        Returns:
+            {'supervisor': User, 'codes': [student_code, ...]}
+        """
+        from apps.accounts.models import User
+        from apps.students.models import Student, StudentGroupEnrollment
+        from apps.teachers.models import Group, Room, Teacher
+        from .schedule_index import ScheduleIndexService
+        from .services import SessionService
+
+        now = timezone.localtime()
+        start = (now + timedelta(minutes=10)).replace(second=0, microsecond=0)
+        if start.date() != now.date():
+            start = now.replace(second=0, microsecond=0)
+
+        supervisor = User.objects.create_user(
+            username=f'{prefix}-supervisor',
+            role='supervisor'
+        )
+        teacher = Teacher.objects.create(
+            full_name=f'{prefix} Teacher',
+            email=f'{prefix}-teacher@benchmark.local',
+            phone='+201000000000',
+            specialization='Benchmark',
+            hire_date=now.date()
+        )
+
+        rooms = Room.objects.bulk_create([
+            Room(name=f'{prefix} Room {index}', capacity=max(1, self.students // max(1, self.rooms)))
+            for index in range(self.rooms)
+        ])
+        # bulk_create skips Group.full_clean - overlapping rooms are intended here
+        groups = Group.objects.bulk_create([
+            Group(
+                group_name=f'{prefix} Group {index}',
+                teacher=teacher,
+                room=rooms[index % len(rooms)],
+                schedule_day=start.strftime('%A'),
+                schedule_time=start.time(),
+                standard_fee=200
+            )
+            for index in range(self.groups)
+        ])
+        students = Student.objects.bulk_create([
+            Student(
+                student_code=f'{prefix}{index:06d}',
+                full_name=f'{prefix} Student {index}',
+                parent_phone='+201000000000'
+            )
+            for index in range(self.students)
+        ])
+
+        StudentGroupEnrollment.objects.bulk_create([
+            StudentGroupEnrollment(
+                student=student,
+                group=groups[index % len(groups)],
+                **self._credit_state(self._pick_credit_state())
+            )
+            for index, student in enumerate(students)
+        ])
+
+        # bulk_create sends no signals - rebuild the indexes like the warm-up task would
+        ScheduleIndexService.invalidate()
+        SessionService.materialize_sessions(now.date())
+
+        return {
+            'supervisor': supervisor,
+            'codes': [student.student_code for student in students],
+        }
+
+    def _pick_credit_state(self) -> str:
+        roll = self.random.random()
+        cumulative = 0.0
+        for state, share in self.CREDIT_MIX:
+            cumulative += share
+            if roll < cumulative:
+                return state
+        return self.CREDIT_MIX[0][0]
+
+    @staticmethod
+    def _credit_state(state: str) -> Dict[str, Any]:
+        if state == 'grace':
+            return {'is_new_student': False, 'credit_balance': 2, 'sessions_paid_for': 4, 'sessions_attended': 5}
+        if state == 'exhausted':
+            return {'is_new_student': False, 'credit_balance': 2, 'sessions_paid_for': 4, 'sessions_attended': 7}
+        if state == 'new_unpaid':
+            return {'is_new_student': True, 'credit_balance': 0, 'sessions_paid_for': 0, 'sessions_attended': 0}
+        if state == 'exempt':
+            return {'financial_status': 'exempt', 'is_new_student': False, 'credit_balance': 0}
+        return {'is_new_student': False, 'credit_balance': 2, 'sessions_paid_for': 8, 'sessions_attended': 4}
+
+    def build_workload(self, codes: List[str]) -> List[str]:
+        """
+        قائمة المسحات: كل طالب مرة + مسحات مكررة + أكواد غير صالحة
+        """
+        workload = list(codes)
+        workload += self.random.sample(codes, int(len(codes) * self.duplicate_ratio))
+        workload += [f'X{index:05d}' for index in range(int(len(codes) * self.invalid_ratio))]
+        self.random.shuffle(workload)
+        return workload
+
+    # ========================================
+    # Running
+    # ========================================
+
+    def run(self, target: str, prefix: str) -> Dict[str, Any]:
+        """
+        جولة كاملة: تجهيز البيانات ثم إطلاق المسحات بالتوازي
+
+        Returns:
+            تقرير الجولة (انظر summarize)
+        """
+        with self.isolated_cache():
+            return self._run(target, prefix)
+
+    def _run(self, target: str, prefix: str) -> Dict[str, Any]:
+        seeded = self.seed(prefix)
+        workload = self.build_workload(seeded['codes'])
+
+        jobs: queue.Queue = queue.Queue()
+        for code in workload:
+            jobs.put(code)
+
+        samples: List[Dict[str, Any]] = []
+        samples_lock = threading.Lock()
+        stubs = {'published': 0, 'whatsapp': 0}
+
+        def publish(intents):
+            with samples_lock:
+                stubs['published'] += len(intents)
+            return len(intents)
+
+        def send_message(*args, **kwargs):
+            with samples_lock:
+                stubs['whatsapp'] += 1
+            return {'success': True, 'stubbed': True}
+
+        def worker():
+            scan = self._scanner(target, seeded['supervisor'])
+            local = []
+            try:
+                while True:
+                    try:
+                        code = jobs.get_nowait()
+                    except queue.Empty:
+                        break
+                    local.append(self._measure(scan, code))
+            finally:
+                with samples_lock:
+                    samples.extend(local)
+                connections.close_all()
+
+        lock_sampler = LockWaitSampler()
+
+        with ExitStack() as stack:
+            stack.enter_context(mock.patch(
+                'apps.notifications.dispatch.NotificationDispatcher.publish',
+                side_effect=publish
+            ))
+            stack.enter_context(mock.patch(
+                'apps.notifications.services.WhatsAppService.send_message',
+                side_effect=send_message
+            ))
+
+            threads = [
+                threading.Thread(target=worker, name=f'scan-benchmark-{index}')
+                for index in range(self.concurrency)
+            ]
+            lock_sampler.start()
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            wall = time.perf_counter() - started
+            lock_sampler.stop()
+
+        return self.summarize(target, samples, wall, stubs, lock_sampler.summary())
+
+    def _scanner(self, target: str, supervisor):
+        """دالة مسح واحدة حسب الهدف (الخدمة أو نقطة HTMX)"""
+        if target == self.TARGET_HTTP:
+            import json
+            from django.test import Client
+            from django.urls import reverse
+
+            client = Client()
+            client.force_login(supervisor)
+            url = reverse('attendance:htmx_api_scan')
+
+            def scan(code):
+                response = client.post(
+                    url,
+                    data=json.dumps({'barcode': code, 'kiosk_mode': True, 'device_id': self.KIOSK_ID}),
+                    content_type='application/json'
+                )
+                # The endpoint renders HTML - the status code is all we get back
+                return f'http_{response.status_code}'
+
+            return scan
+
+        from .services import AttendanceService
+
+        def scan(code):
+            result = AttendanceService.process_scan(
+                student_code=code,
+                supervisor=supervisor,
+                kiosk_id=self.KIOSK_ID
+            )
+            return result.get('status', 'unknown')
+
+        return scan
+
+    def _measure(self, scan, code: str) -> Dict[str, Any]:
+        counters = {'queries': 0, 'write_ms': 0.0}
+
+        def count(execute, sql, params, many, context):
+            counters['queries'] += 1
+            if sql.lstrip()[:6].upper() in self.WRITE_PREFIXES:
+                started = time.perf_counter()
+                try:
+                    return execute(sql, params, many, context)
+                finally:
+                    counters['write_ms'] += (time.perf_counter() - started) * 1000
+            return execute(sql, params, many, context)
+
+        status = None
+        error = None
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(count):
+                status = scan(code)
+        except OperationalError as e:
+            error = 'lock' if 'lock' in str(e).lower() or 'deadlock' in str(e).lower() else 'database'
+        except Exception as e:
+            error = type(e).__name__
+
+        return {
+            'latency_ms': (time.perf_counter() - started) * 1000,
+            'queries': counters['queries'],
+            'write_ms': counters['write_ms'],
+            'status': status,
+            'error': error,
+        }
+
+    # ========================================
+    # Reporting
+    # ========================================
+
+    def summarize(self, target: str, samples: List[Dict[str, Any]], wall: float,
+                  stubs: Dict[str, int], lock_waits: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        latencies = sorted(sample['latency_ms'] for sample in samples)
+        queries = [sample['queries'] for sample in samples]
+
+        statuses: Dict[str, int] = {}
+        errors: Dict[str, int] = {}
+        for sample in samples:
+            if sample['error']:
+                errors[sample['error']] = errors.get(sample['error'], 0) + 1
+            else:
+                statuses[sample['status']] = statuses.get(sample['status'], 0) + 1
+
+        count = len(samples)
+        return {
+            'target': target,
+            'scans': count,
+            'concurrency': self.concurrency,
+            'wall_seconds': round(wall, 3),
+            'scans_per_second': round(count / wall, 1) if wall else None,
+            'latency_ms': {
+                'p50': self._percentile(latencies, 0.50),
+                'p90': self._percentile(latencies, 0.90),
+                'p95': self._percentile(latencies, 0.95),
+                'p99': self._percentile(latencies, 0.99),
+                'max': round(latencies[-1], 2) if latencies else None,
+            },
+            'queries_per_scan': {
+                'avg': round(sum(queries) / count, 2) if count else None,
+                'max': max(queries) if queries else None,
+            },
+            'write_ms_total': round(sum(sample['write_ms'] for sample in samples), 2),
+            'lock_errors': errors.get('lock', 0),
+            'lock_waits': lock_waits,
+            'errors': errors,
+            'statuses': statuses,
+            'stubbed_notifications': stubs['published'],
+            'stubbed_whatsapp': stubs['whatsapp'],
+        }
+
+    @staticmethod
+    def _percentile(values: List[float], quantile: float) -> Optional[float]:
+        if not values:
+            return None
+        index = min(len(values) - 1, int(round(quantile * (len(values) - 1))))
+        return round(values[index], 2)
+
+
+class LockWaitSampler:
+    """
+    عينات الانتظار على الأقفال (PostgreSQL فقط عبر pg_stat_activity)
+
+    Other backends report None; SQLite lock contention shows up as
+    lock errors in the scan samples instead.
+    """
+
+    INTERVAL_SECONDS = 0.02
+
+    def __init__(self):
+        self.enabled = connection.vendor == 'postgresql'
+        self.samples = 0
+        self.samples_waiting = 0
+        self.max_waiting = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if not self.enabled:
+            return
+        self._thread = threading.Thread(target=self._run, name='scan-benchmark-locks', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        return {
+            'samples': self.samples,
+            'samples_with_waiters': self.samples_waiting,
+            'max_waiting_backends': self.max_waiting,
+        }
+
+    def _run(self) -> None:
+        try:
+            with connection.cursor() as cursor:
+                while not self._stop.is_set():
+                    cursor.execute(
+                        "SELECT count(*) FROM pg_stat_activity "
+                        "WHERE wait_event_type = 'Lock' AND datname = current_database()"
+                    )
+                    waiting = cursor.fetchone()[0]
+                    self.samples += 1
+                    if waiting:
+                        self.samples_waiting += 1
+                        self.max_waiting = max(self.max_waiting, waiting)
+                    self._stop.wait(self.INTERVAL_SECONDS)
+        finally:
+            connections.close_all()
@@ -119,14 +119,25 @@ def kiosk_scanner_page(request, session_id):
     """
     Kiosk Mode Scanner - Full screen colored display
     """
+    from .models import KioskDevice
+    
     session = get_object_or_404(Session, pk=session_id)
     group = session.group
     
+    # ?device=KIOSK-001 - tags offline scans with an active kiosk of this room
+    device_id = KioskDevice.objects.filter(
+        device_id=request.GET.get('device', ''),
+        room_id=group.room_id,
+        is_active=True
+    ).values_list('device_id', flat=True).first()
+    
     return render(request, 'attendance/kiosk_scanner.html', {
         'session_id': session_id,
         'group_name': group.group_name,
         'session_date': session.session_date.strftime('%Y-%m-%d'),
-        'schedule_time': group.schedule_time.strftime('%I:%M %p')
+        'schedule_time': group.schedule_time.strftime('%I:%M %p'),
+        'device_id': device_id or '',
+        'max_batch_size': AttendanceService.MAX_BATCH_SIZE
     })
 
 
@@ -157,7 +168,9 @@ def api_scan(request):
         # Process the scan
         result = AttendanceService.process_scan(
             student_code=barcode,
-            supervisor=request.user
+            supervisor=request.user,
+            kiosk_id=data.get('device_id'),
+            idempotency_key=data.get('idempotency_key') or request.headers.get('Idempotency-Key')
         )
         
         # Determine which template to render based on result
@@ -261,19 +274,13 @@ def api_session_stats(request, session_id):
     HTMX endpoint for getting session statistics
     Returns JSON with stats
     """
-    from django.http import JsonResponse
-    
-    session = get_object_or_404(Session, pk=session_id)
-    attendances = session.attendances.all()
+    from django.http import Http404, JsonResponse
+    from .services import AttendanceReportService
     
-    stats = {
-        'total': attendances.count(),
-        'present': attendances.filter(status='present', allow_entry=True).count(),
-        'late_blocked': attendances.filter(status='late_blocked').count(),
-        'very_late': attendances.filter(status='very_late').count(),
-        'payment_blocked': attendances.filter(status='blocked_payment').count(),
-        'no_session': attendances.filter(status='no_session').count(),
-        'other_blocked': attendances.filter(status='blocked_other').count(),
-    }
+    # Incrementally maintained counters - no per-request aggregation
+    try:
+        stats = AttendanceReportService.get_session_statistics(session_id)
+    except Session.DoesNotExist:
+        raise Http404('Session not found')
     
     return JsonResponse(stats)
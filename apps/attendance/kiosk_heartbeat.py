@@ -0,0 +1,179 @@
+"""
+Kiosk Heartbeats
+إشارات حياة أجهزة الكشك
+
+Every kiosk poll used to UPDATE KioskDevice.last_heartbeat. Heartbeats now
+go to the cache only: one key per kiosk holding the last poll time, with a
+TTL of KIOSK_HEARTBEAT_TTL_SECONDS. Liveness is read from those keys:
+
+- online:  last poll within KIOSK_HEARTBEAT_ONLINE_SECONDS
+- stale:   key still alive but the kiosk stopped polling
+- offline: key expired (or never written) - falls back to the DB value
+
+The attendance.flush_kiosk_heartbeats task copies newer cached heartbeats
+to KioskDevice.last_heartbeat with one bulk_update. It runs more often
+than the TTL, so a heartbeat never expires before it is flushed.
+"""
+
+import logging
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class KioskHeartbeatService:
+    """
+    تسجيل إشارات حياة الأكشاك في الذاكرة المؤقتة وحالة الأسطول
+    """
+
+    CACHE_PREFIX = 'kiosk_heartbeat'
+
+    STATUS_ONLINE = 'online'
+    STATUS_STALE = 'stale'
+    STATUS_OFFLINE = 'offline'
+
+    # ========================================
+    # Recording
+    # ========================================
+
+    @classmethod
+    def beat(cls, device_id: str, at: Optional[datetime] = None) -> None:
+        """
+        تسجيل إشارة حياة (بدون كتابة في قاعدة البيانات)
+        """
+        at = at or timezone.now()
+        try:
+            cache.set(cls._key(device_id), at.timestamp(), cls._ttl())
+        except Exception:
+            # A cache outage must not break the kiosk poll
+            logger.exception(f"Failed to record heartbeat for kiosk {device_id}")
+
+    @classmethod
+    def get_last_beats(cls, device_ids: List[str]) -> Dict[str, datetime]:
+        """
+        آخر إشارة حياة مسجلة في الذاكرة المؤقتة لكل جهاز (قراءة واحدة)
+        """
+        if not device_ids:
+            return {}
+        keys = {cls._key(device_id): device_id for device_id in device_ids}
+        cached = cache.get_many(list(keys))
+        return {
+            keys[key]: datetime.fromtimestamp(value, tz=dt_timezone.utc)
+            for key, value in cached.items()
+        }
+
+    # ========================================
+    # Flush
+    # ========================================
+
+    @classmethod
+    def flush(cls) -> int:
+        """
+        نقل إشارات الحياة الأحدث إلى KioskDevice.last_heartbeat
+
+        Returns:
+            int: عدد الأجهزة المحدثة
+        """
+        from .models import KioskDevice
+
+        kiosks = list(KioskDevice.objects.only('device_id', 'last_heartbeat'))
+        beats = cls.get_last_beats([kiosk.device_id for kiosk in kiosks])
+
+        changed = []
+        for kiosk in kiosks:
+            beat = beats.get(kiosk.device_id)
+            if beat and (kiosk.last_heartbeat is None or beat > kiosk.last_heartbeat):
+                kiosk.last_heartbeat = beat
+                changed.append(kiosk)
+
+        if changed:
+            KioskDevice.objects.bulk_update(changed, ['last_heartbeat'])
+        return len(changed)
+
+    # ========================================
+    # Fleet status
+    # ========================================
+
+    @classmethod
+    def get_fleet_status(cls, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        حالة كل الأكشاك النشطة مجمعة حسب القاعة
+
+        Returns:
+            {
+                'timestamp': ISO,
+                'summary': {'total', 'online', 'stale', 'offline'},
+                'rooms': [{'room_id', 'room_name', 'online', 'stale', 'offline',
+                           'kiosks': [{'device_id', 'device_name', 'status',
+                                       'last_heartbeat', 'seconds_since'}]}]
+            }
+        """
+        from .models import KioskDevice
+
+        now = now or timezone.now()
+        kiosks = list(
+            KioskDevice.objects.filter(is_active=True)
+            .select_related('room')
+            .order_by('room__name', 'device_id')
+        )
+        beats = cls.get_last_beats([kiosk.device_id for kiosk in kiosks])
+
+        summary = {'total': len(kiosks), cls.STATUS_ONLINE: 0, cls.STATUS_STALE: 0, cls.STATUS_OFFLINE: 0}
+        rooms = {}
+        for kiosk in kiosks:
+            beat = beats.get(kiosk.device_id)
+            status = cls._status(beat, now)
+            last_seen = beat or kiosk.last_heartbeat
+
+            room = rooms.setdefault(kiosk.room_id, {
+                'room_id': kiosk.room_id,
+                'room_name': kiosk.room.name,
+                cls.STATUS_ONLINE: 0,
+                cls.STATUS_STALE: 0,
+                cls.STATUS_OFFLINE: 0,
+                'kiosks': [],
+            })
+            room[status] += 1
+            summary[status] += 1
+            room['kiosks'].append({
+                'device_id': kiosk.device_id,
+                'device_name': kiosk.device_name,
+                'status': status,
+                'last_heartbeat': timezone.localtime(last_seen).isoformat() if last_seen else None,
+                'seconds_since': int((now - last_seen).total_seconds()) if last_seen else None,
+            })
+
+        return {
+            'timestamp': timezone.localtime(now).isoformat(),
+            'summary': summary,
+            'rooms': list(rooms.values()),
+        }
+
+    @classmethod
+    def _status(cls, beat: Optional[datetime], now: datetime) -> str:
+        if beat is None:
+            return cls.STATUS_OFFLINE
+        if (now - beat).total_seconds() <= cls._online_seconds():
+            return cls.STATUS_ONLINE
+        return cls.STATUS_STALE
+
+    # ========================================
+    # Settings / keys
+    # ========================================
+
+    @staticmethod
+    def _online_seconds() -> int:
+        return getattr(settings, 'KIOSK_HEARTBEAT_ONLINE_SECONDS', 30)
+
+    @staticmethod
+    def _ttl() -> int:
+        return getattr(settings, 'KIOSK_HEARTBEAT_TTL_SECONDS', 300)
+
+    @classmethod
+    def _key(cls, device_id: str) -> str:
+        return f'{cls.CACHE_PREFIX}:{device_id}'
@@ -0,0 +1,183 @@
+"""
+Kiosk Session Manifest
+بيان حصص القاعة للتحقق المسبق على جهاز الكشك
+
+A kiosk downloads a signed manifest of its room's current and upcoming
+sessions (within KIOSK_MANIFEST_HORIZON_MINUTES): group, schedule window,
+session state and every enrolled student_code with its credit verdict
+from StudentGroupEnrollment.can_attend_session.
+
+The kiosk shows the verdict color from the manifest right away and
+confirms the scan with the server in the background. During a short
+outage it keeps scanning from the manifest and later uploads the queued
+scans to the batch endpoint (scan/batch/), which re-evaluates each one at
+its original scan time - the server stays the source of truth.
+
+Each kiosk authenticates with its own secret (KioskDevice.secret, sent in
+the X-Kiosk-Token header). The signature is an HMAC-SHA256 keyed with that
+same secret over the canonical JSON of the manifest (sorted keys, no
+whitespace), so the kiosk can verify it offline and a proxy cannot feed it
+a forged roster. The manifest carries only what offline verification
+needs - no names.
+"""
+
+import hashlib
+import hmac
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+
+class KioskManifestService:
+    """
+    إنشاء بيان موقّع لحصص قاعة الكشك والتحقق منه
+    """
+
+    TOKEN_HEADER = 'X-Kiosk-Token'
+
+    VERDICT_ALLOWED = 'allowed'
+    VERDICT_NEW_STUDENT_BLOCK = 'new_student_block'
+    VERDICT_DEBT_BLOCK = 'debt_block'
+
+    # can_attend_session reason -> manifest verdict
+    VERDICTS = {
+        'ok': VERDICT_ALLOWED,
+        'exempt': VERDICT_ALLOWED,
+        'new_student_no_payment': VERDICT_NEW_STUDENT_BLOCK,
+        'credit_exceeded': VERDICT_DEBT_BLOCK,
+    }
+
+    # ========================================
+    # Building
+    # ========================================
+
+    @classmethod
+    def build(cls, kiosk, at: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        بيان الحصص الحالية والقادمة لقاعة الكشك
+
+        Returns:
+            {
+                'manifest': {
+                    'device_id', 'issued_at', 'expires_at',
+                    'sessions': [{'group_id', 'session_id', 'is_cancelled',
+                                  'starts_at', 'ends_at',
+                                  'students': [[student_code, verdict], ...]}]
+                },
+                'version': hash of the manifest content (without timestamps),
+                'signature': HMAC-SHA256 (device secret) of the canonical JSON
+            }
+        """
+        from apps.students.models import StudentGroupEnrollment
+        from .models import Session
+        from .schedule_index import ScheduleIndexService
+
+        at = at or timezone.now()
+        local = timezone.localtime(at)
+        day = local.date()
+
+        # Groups running now or starting within the horizon (start order)
+        group_ids = ScheduleIndexService.groups_for_room(
+            kiosk.room_id,
+            at,
+            lead_minutes=cls._horizon_minutes()
+        )
+
+        sessions = {
+            row['group_id']: row
+            for row in Session.objects.filter(
+                group_id__in=group_ids,
+                session_date=day
+            ).values('group_id', 'session_id', 'is_cancelled')
+        }
+
+        students = {group_id: [] for group_id in group_ids}
+        enrollments = StudentGroupEnrollment.objects.filter(
+            group_id__in=group_ids,
+            is_active=True,
+            student__is_active=True
+        ).select_related('student').only(
+            'group_id', 'financial_status', 'is_new_student', 'credit_balance',
+            'sessions_attended', 'sessions_paid_for', 'student__student_code'
+        ).order_by('student__student_code')
+        for enrollment in enrollments:
+            verdict = cls.VERDICTS.get(enrollment.can_attend_session()['reason'], cls.VERDICT_DEBT_BLOCK)
+            students[enrollment.group_id].append([enrollment.student.student_code, verdict])
+
+        midnight = local.replace(hour=0, minute=0, second=0, microsecond=0)
+        entries = []
+        for group_id in group_ids:
+            group = ScheduleIndexService.get_group(group_id)
+            session = sessions.get(group_id, {})
+            entries.append({
+                'group_id': group_id,
+                'session_id': session.get('session_id'),
+                'is_cancelled': session.get('is_cancelled', False),
+                'starts_at': (midnight + timedelta(minutes=group['start'])).isoformat(),
+                'ends_at': (midnight + timedelta(minutes=group['end'])).isoformat(),
+                'students': students[group_id],
+            })
+
+        content = {
+            'device_id': kiosk.device_id,
+            'sessions': entries,
+        }
+        manifest = {
+            **content,
+            'issued_at': local.replace(microsecond=0).isoformat(),
+            'expires_at': (local + timedelta(seconds=cls._ttl_seconds())).replace(microsecond=0).isoformat(),
+        }
+        return {
+            'manifest': manifest,
+            'version': hashlib.sha1(cls._canonical(content).encode()).hexdigest(),
+            'signature': cls.sign(manifest, kiosk.secret),
+        }
+
+    # ========================================
+    # Authentication & Signing
+    # ========================================
+
+    @classmethod
+    def authenticate(cls, request, device_id: str):
+        """
+        الكشك النشط صاحب المفتاح المرسل في X-Kiosk-Token (أو None)
+        """
+        from .models import KioskDevice
+
+        token = request.headers.get(cls.TOKEN_HEADER, '')
+        kiosk = KioskDevice.objects.filter(device_id=device_id, is_active=True).first()
+        if kiosk is None or not token or not constant_time_compare(kiosk.secret, token):
+            return None
+        return kiosk
+
+    @classmethod
+    def sign(cls, manifest: Dict[str, Any], secret: str) -> str:
+        return hmac.new(secret.encode(), cls._canonical(manifest).encode(), hashlib.sha256).hexdigest()
+
+    @classmethod
+    def verify(cls, manifest: Dict[str, Any], signature: str, secret: str) -> bool:
+        """
+        التحقق من توقيع بيان (كما يفعل الكشك بمفتاحه)
+        """
+        return constant_time_compare(cls.sign(manifest, secret), signature or '')
+
+    @staticmethod
+    def _canonical(value: Dict[str, Any]) -> str:
+        return json.dumps(value, sort_keys=True, separators=(',', ':'), cls=DjangoJSONEncoder)
+
+    # ========================================
+    # Settings
+    # ========================================
+
+    @staticmethod
+    def _horizon_minutes() -> int:
+        return getattr(settings, 'KIOSK_MANIFEST_HORIZON_MINUTES', 180)
+
+    @staticmethod
+    def _ttl_seconds() -> int:
+        return getattr(settings, 'KIOSK_MANIFEST_TTL_SECONDS', 300)
@@ -0,0 +1,255 @@
+"""
+Live Monitor Stream
+بث تحديثات الشاشة الحية (Server-Sent Events)
+
+Instead of every open monitor screen polling the full dashboard, changes
+to Attendance, BlockedAttempt and Session rows mark their session dirty.
+After commit a coalesced Celery task recomputes only the affected room and
+appends a delta event to a shared, sequence-numbered event log in the
+cache. Each screen holds one SSE connection: a full snapshot on connect
+(or when it fell too far behind), then only the per-room deltas.
+
+The per-room computation happens once per change no matter how many
+screens are open; each stream only reads the event log from the cache.
+"""
+
+import json
+import logging
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+class LiveMonitorStream:
+    """
+    سجل أحداث الشاشة الحية وبثها للعملاء
+    """
+
+    SEQ_KEY = 'live_monitor:seq'
+    EVENT_PREFIX = 'live_monitor:event'
+    ROOM_STATE_PREFIX = 'live_monitor:room'
+    PENDING_PREFIX = 'live_monitor:pending'
+    SNAPSHOT_KEY = 'live_monitor:snapshot'
+
+    # Events older than this are gone - lagging clients get a new snapshot
+    EVENT_TTL = 300
+    MAX_BACKLOG = 500
+
+    # Bursts of scans in one session collapse into one room refresh
+    COALESCE_SECONDS = 1
+
+    POLL_INTERVAL = 1.0
+    KEEPALIVE_SECONDS = 15
+    # Periodic snapshot picks up sessions starting/ending without row changes
+    SNAPSHOT_SECONDS = 60
+    # One snapshot computation shared by all screens connecting together
+    SNAPSHOT_CACHE_SECONDS = 5
+    # Streams end well inside gunicorn's --timeout (120s); EventSource
+    # reconnects after the retry: delay and resumes from Last-Event-ID.
+    # Each open stream is one greenlet of a gevent worker (see deploy
+    # configs), so sleeping here does not hold a whole worker process.
+    MAX_STREAM_SECONDS = 90
+
+    # ========================================
+    # Producing
+    # ========================================
+
+    @classmethod
+    def session_changed(cls, session_id: Optional[int]) -> None:
+        """
+        تسجيل تغيير في حصة (حضور، محاولة ممنوعة، إلغاء...)
+
+        Runs after the surrounding transaction commits; nothing is published
+        for a rolled back scan.
+        """
+        if not session_id:
+            return
+        transaction.on_commit(lambda: cls._schedule_refresh(session_id))
+
+    @classmethod
+    def _schedule_refresh(cls, session_id: int) -> None:
+        try:
+            if not cache.add(f'{cls.PENDING_PREFIX}:{session_id}', 1, cls.COALESCE_SECONDS):
+                return
+            from .tasks import refresh_live_monitor_session
+            refresh_live_monitor_session.apply_async(
+                args=[session_id],
+                countdown=cls.COALESCE_SECONDS
+            )
+        except Exception:
+            # The monitor must never break a scan
+            logger.exception(f"Failed to schedule live monitor refresh for session {session_id}")
+
+    @classmethod
+    def refresh_session(cls, session_id: int) -> Optional[int]:
+        """
+        إعادة حساب قاعة الحصة ونشر الفرق إن وُجد
+
+        Returns:
+            رقم الحدث المنشور أو None إذا لم تتغير القاعة
+        """
+        from .models import Session
+
+        cache.delete(f'{cls.PENDING_PREFIX}:{session_id}')
+
+        room_id = Session.objects.filter(pk=session_id).values_list(
+            'group__room_id', flat=True
+        ).first()
+        if room_id is None:
+            return None
+        return cls.refresh_room(room_id)
+
+    @classmethod
+    def refresh_room(cls, room_id: int) -> Optional[int]:
+        from .monitor_service import LiveMonitorService
+
+        data = LiveMonitorService.get_room_data(room_id)
+        if data is None:
+            return None
+
+        state_key = f'{cls.ROOM_STATE_PREFIX}:{room_id}'
+        if cache.get(state_key) == data:
+            return None
+        cache.set(state_key, data, cls.EVENT_TTL)
+
+        return cls.publish({'type': 'room', **data})
+
+    @classmethod
+    def publish(cls, event: Dict[str, Any]) -> int:
+        """
+        إضافة حدث إلى السجل المشترك
+
+        Returns:
+            int: رقم تسلسل الحدث
+        """
+        try:
+            seq = cache.incr(cls.SEQ_KEY)
+        except ValueError:
+            cache.add(cls.SEQ_KEY, 0, None)
+            seq = cache.incr(cls.SEQ_KEY)
+
+        cache.set(f'{cls.EVENT_PREFIX}:{seq}', event, cls.EVENT_TTL)
+        return seq
+
+    # ========================================
+    # Consuming
+    # ========================================
+
+    @classmethod
+    def get_seq(cls) -> int:
+        return cache.get(cls.SEQ_KEY, 0)
+
+    @classmethod
+    def snapshot(cls, channel: Optional[Dict[str, Any]] = None):
+        """
+        لقطة كاملة للشاشة مع رقم التسلسل الذي تغطيه
+
+        Args:
+            channel: Monitor channel definition (None = all rooms)
+
+        Returns:
+            (seq, dashboard data)
+        """
+        from .monitor_service import LiveMonitorService
+
+        snapshot_key = cls.SNAPSHOT_KEY
+        if channel is not None:
+            snapshot_key = f"{cls.SNAPSHOT_KEY}:{channel['slug']}:{channel['fingerprint']}"
+
+        cached = cache.get(snapshot_key)
+        if cached is not None:
+            return cached['seq'], cached['data']
+
+        # Read the sequence first - events raised while building are replayed, not lost
+        seq = cls.get_seq()
+        if channel is None:
+            data = LiveMonitorService.get_live_dashboard_data(use_cache=False)
+        else:
+            data = LiveMonitorService.get_channel_dashboard_data(channel, use_cache=False)
+        cache.set(snapshot_key, {'seq': seq, 'data': data}, cls.SNAPSHOT_CACHE_SECONDS)
+        return seq, data
+
+    @classmethod
+    def events_since(cls, seq: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        الأحداث بعد رقم تسلسل معين
+
+        Returns:
+            [{'id': seq, 'event': {...}}, ...] مرتبة، أو None إذا فاتت أحداث
+            (the client must take a new snapshot)
+        """
+        current = cls.get_seq()
+        if current <= seq:
+            return [] if current == seq else None
+        if current - seq > cls.MAX_BACKLOG:
+            return None
+
+        keys = [f'{cls.EVENT_PREFIX}:{number}' for number in range(seq + 1, current + 1)]
+        found = cache.get_many(keys)
+
+        events = []
+        for number, key in zip(range(seq + 1, current + 1), keys):
+            if key not in found:
+                if number == current:
+                    # Sequence taken but event not written yet - pick it up next poll
+                    break
+                return None
+            events.append({'id': number, 'event': found[key]})
+        return events
+
+    @classmethod
+    def stream(cls, last_event_id: Optional[str] = None,
+               channel: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        """
+        مولد رسائل SSE: لقطة كاملة ثم الفروقات فقط
+
+        Args:
+            last_event_id: ترويسة Last-Event-ID عند إعادة الاتصال
+            channel: Monitor channel - only its rooms are sent
+        """
+        room_ids = set(channel['room_ids']) if channel and channel['room_ids'] else None
+
+        seq = None
+        if last_event_id:
+            try:
+                seq = int(last_event_id)
+            except ValueError:
+                seq = None
+
+        started = time.monotonic()
+        last_write = started
+        # A resumed stream already has a snapshot on the client
+        last_snapshot = started if seq is not None else None
+
+        yield f'retry: {int(cls.POLL_INTERVAL * 3000)}\n\n'
+
+        while time.monotonic() - started < cls.MAX_STREAM_SECONDS:
+            now = time.monotonic()
+            events = cls.events_since(seq) if seq is not None else None
+
+            if events is None or last_snapshot is None or now - last_snapshot >= cls.SNAPSHOT_SECONDS:
+                seq, data = cls.snapshot(channel)
+                yield cls._format('snapshot', data, seq)
+                last_snapshot = last_write = now
+            elif events:
+                for item in events:
+                    event = item['event']
+                    if room_ids is not None and event['type'] == 'room' and event['room']['id'] not in room_ids:
+                        continue
+                    yield cls._format(event['type'], event, item['id'])
+                    last_write = now
+                seq = events[-1]['id']
+            elif now - last_write >= cls.KEEPALIVE_SECONDS:
+                yield ': keepalive\n\n'
+                last_write = now
+
+            time.sleep(cls.POLL_INTERVAL)
+
+    @staticmethod
+    def _format(event: str, data: Dict[str, Any], event_id: int) -> str:
+        payload = json.dumps(data, ensure_ascii=False, default=str)
+        return f'id: {event_id}\nevent: {event}\ndata: {payload}\n\n'
@@ -0,0 +1,119 @@
+import json
+import os
+import tempfile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from apps.attendance.benchmark import ScanBenchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database and fire concurrent kiosk scans through "
+        "AttendanceService.process_scan and/or the HTMX scan endpoint; reports "
+        "scans/sec, latency percentiles, query counts and lock contention"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=10, help='Rooms to seed (default: 10)')
+        parser.add_argument('--groups', type=int, default=40, help='Groups to seed (default: 40)')
+        parser.add_argument('--students', type=int, default=1000, help='Students to seed (default: 1000)')
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=8,
+            help='Concurrent scanning threads (default: 8)',
+        )
+        parser.add_argument(
+            '--target',
+            choices=[ScanBenchmark.TARGET_SERVICE, ScanBenchmark.TARGET_HTTP, 'both'],
+            default='both',
+            help='Scan entry point to exercise (default: both)',
+        )
+        parser.add_argument(
+            '--duplicates',
+            type=float,
+            default=0.1,
+            help='Share of students scanned twice (default: 0.1)',
+        )
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the credit mix')
+        parser.add_argument('--json', action='store_true', help='Print the reports as JSON')
+
+    def handle(self, *args, **options):
+        for name in ('rooms', 'groups', 'students', 'concurrency'):
+            if options[name] < 1:
+                raise CommandError(f'--{name} must be at least 1')
+
+        targets = (
+            [ScanBenchmark.TARGET_SERVICE, ScanBenchmark.TARGET_HTTP]
+            if options['target'] == 'both' else [options['target']]
+        )
+
+        benchmark = ScanBenchmark(
+            rooms=options['rooms'],
+            groups=options['groups'],
+            students=options['students'],
+            concurrency=options['concurrency'],
+            duplicate_ratio=options['duplicates'],
+            seed=options['seed'],
+        )
+
+        # Never seed into the real database
+        if connection.vendor == 'sqlite':
+            # Shared in-memory SQLite fails concurrent writers instead of waiting
+            connection.settings_dict['TEST']['NAME'] = os.path.join(
+                tempfile.gettempdir(), f'benchmark_scans_{os.getpid()}.sqlite3'
+            )
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            reports = [
+                benchmark.run(target, prefix=target[0].upper())
+                for target in targets
+            ]
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['json']:
+            self.stdout.write(json.dumps(reports, indent=2))
+            return
+
+        for report in reports:
+            self._print_report(report)
+
+    def _print_report(self, report):
+        latency = report['latency_ms']
+        queries = report['queries_per_scan']
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Target: {report['target']}"))
+        self.stdout.write(
+            f"  {report['scans']} scans, {report['concurrency']} threads, "
+            f"{report['wall_seconds']}s -> {report['scans_per_second']} scans/sec"
+        )
+        self.stdout.write(
+            f"  latency ms: p50 {latency['p50']}  p90 {latency['p90']}  "
+            f"p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}"
+        )
+        self.stdout.write(
+            f"  queries/scan: avg {queries['avg']}  max {queries['max']}  "
+            f"(write time {report['write_ms_total']} ms total)"
+        )
+
+        lock_waits = report['lock_waits']
+        if lock_waits is not None:
+            self.stdout.write(
+                f"  lock waits: {lock_waits['samples_with_waiters']}/{lock_waits['samples']} samples, "
+                f"max {lock_waits['max_waiting_backends']} waiting backends"
+            )
+        self.stdout.write(f"  lock errors: {report['lock_errors']}")
+
+        statuses = ', '.join(f'{status}={count}' for status, count in sorted(report['statuses'].items()))
+        self.stdout.write(f"  statuses: {statuses or '-'}")
+        if report['errors']:
+            errors = ', '.join(f'{error}={count}' for error, count in sorted(report['errors'].items()))
+            self.stdout.write(self.style.WARNING(f"  errors: {errors}"))
+        self.stdout.write(
+            f"  stubbed: {report['stubbed_notifications']} notifications, "
+            f"{report['stubbed_whatsapp']} WhatsApp messages"
+        )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.attendance.models import KioskDevice, generate_kiosk_secret
+
+
+class Command(BaseCommand):
+    help = "Print (or rotate) a kiosk's secret for its X-Kiosk-Token header and manifest verification"
+
+    def add_arguments(self, parser):
+        parser.add_argument('device_id', help='Kiosk device id (e.g. KIOSK-001)')
+        parser.add_argument(
+            '--rotate',
+            action='store_true',
+            help='Generate a new secret; the old one stops working immediately',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            kiosk = KioskDevice.objects.get(device_id=options['device_id'])
+        except KioskDevice.DoesNotExist:
+            raise CommandError(f"Kiosk {options['device_id']} not found")
+
+        if options['rotate']:
+            kiosk.secret = generate_kiosk_secret()
+            kiosk.save(update_fields=['secret', 'updated_at'])
+            self.stderr.write(self.style.WARNING('Secret rotated - update the kiosk configuration'))
+
+        self.stdout.write(kiosk.secret)
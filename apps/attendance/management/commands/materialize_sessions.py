@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from apps.attendance.services import SessionService
+
+
+class Command(BaseCommand):
+    help = "Pre-create Session rows for the day's active groups and prime the session cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            dest='date',
+            help='Start date in YYYY-MM-DD format (default: today)',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=1,
+            dest='days',
+            help='Number of consecutive days to materialize (default: 1)',
+        )
+
+    def handle(self, *args, **options):
+        if options.get('date'):
+            try:
+                start_date = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Invalid --date, expected YYYY-MM-DD')
+        else:
+            start_date = timezone.localdate()
+
+        days = options.get('days') or 1
+        if days < 1:
+            raise CommandError('--days must be at least 1')
+
+        for offset in range(days):
+            result = SessionService.materialize_sessions(start_date + timedelta(days=offset))
+            self.stdout.write(
+                f"{result['date']}: {result['created']} created, "
+                f"{result['groups']} groups scheduled"
+            )
+
+        self.stdout.write(self.style.SUCCESS('Session materialization complete'))
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0004_kioskdevice'),
+        ('teachers', '0004_teacher_qr_code_base64_teacher_qr_code_generated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonitorChannel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.SlugField(help_text='يظهر في رابط الشاشة (مثال: building-a)', unique=True, verbose_name='المعرف')),
+                ('name', models.CharField(help_text='اسم وصفي للشاشة (مثال: شاشة المبنى أ)', max_length=100, verbose_name='اسم القناة')),
+                ('refresh_interval', models.PositiveSmallIntegerField(default=5, verbose_name='فترة التحديث (ثانية)')),
+                ('auto_refresh', models.BooleanField(default=True, verbose_name='تحديث تلقائي')),
+                ('show_alerts', models.BooleanField(default=True, verbose_name='عرض التنبيهات')),
+                ('alert_threshold_low_attendance', models.PositiveSmallIntegerField(default=50, verbose_name='حد الحضور المنخفض (%)')),
+                ('alert_threshold_high_blocked', models.PositiveSmallIntegerField(default=3, verbose_name='حد الطلاب المحظورين')),
+                ('enable_sound', models.BooleanField(default=False, verbose_name='تفعيل الصوت')),
+                ('fullscreen_mode', models.BooleanField(default=False, verbose_name='ملء الشاشة')),
+                ('is_active', models.BooleanField(default=True, verbose_name='نشط')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('rooms', models.ManyToManyField(blank=True, help_text='اتركها فارغة لعرض كل القاعات', related_name='monitor_channels', to='teachers.room', verbose_name='القاعات')),
+            ],
+            options={
+                'verbose_name': 'قناة شاشة المراقبة',
+                'verbose_name_plural': 'قنوات شاشة المراقبة',
+                'db_table': 'monitor_channels',
+                'ordering': ['name'],
+            },
+        ),
+    ]
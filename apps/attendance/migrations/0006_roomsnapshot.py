@@ -0,0 +1,45 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0005_monitorchannel'),
+        ('teachers', '0004_teacher_qr_code_base64_teacher_qr_code_generated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomSnapshot',
+            fields=[
+                ('snapshot_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('taken_at', models.DateTimeField(verbose_name='وقت اللقطة')),
+                ('group_name', models.CharField(max_length=100, verbose_name='اسم المجموعة')),
+                ('teacher_name', models.CharField(blank=True, max_length=200, verbose_name='اسم المدرس')),
+                ('start_time', models.TimeField(verbose_name='بداية الحصة')),
+                ('end_time', models.TimeField(blank=True, null=True, verbose_name='نهاية الحصة')),
+                ('status', models.CharField(max_length=20, verbose_name='حالة القاعة')),
+                ('total', models.PositiveSmallIntegerField(default=0, verbose_name='المسجلين')),
+                ('present', models.PositiveSmallIntegerField(default=0, verbose_name='الحاضرين')),
+                ('late_blocked', models.PositiveSmallIntegerField(default=0, verbose_name='ممنوع - تأخير')),
+                ('very_late_blocked', models.PositiveSmallIntegerField(default=0, verbose_name='ممنوع - تأخير شديد')),
+                ('not_arrived', models.PositiveSmallIntegerField(default=0, verbose_name='لم يصل')),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='monitor_snapshots', to='teachers.group', verbose_name='المجموعة')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monitor_snapshots', to='teachers.room', verbose_name='القاعة')),
+            ],
+            options={
+                'verbose_name': 'لقطة قاعة',
+                'verbose_name_plural': 'لقطات القاعات',
+                'db_table': 'room_snapshots',
+                'ordering': ['-taken_at', 'room'],
+                'indexes': [models.Index(fields=['taken_at'], name='room_snapsh_taken_a_54ae22_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='roomsnapshot',
+            constraint=models.UniqueConstraint(fields=('room', 'taken_at'), name='unique_room_snapshot_minute'),
+        ),
+    ]
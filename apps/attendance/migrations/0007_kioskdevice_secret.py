@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-17 05:06
+
+import apps.attendance.models
+from apps.attendance.models import generate_kiosk_secret
+from django.db import migrations, models
+
+
+def generate_secrets(apps, schema_editor):
+    # AddField evaluates the default once - give every existing kiosk its own
+    KioskDevice = apps.get_model('attendance', 'KioskDevice')
+    for kiosk in KioskDevice.objects.all():
+        kiosk.secret = generate_kiosk_secret()
+        kiosk.save(update_fields=['secret'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0006_roomsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='kioskdevice',
+            name='secret',
+            field=models.CharField(default=apps.attendance.models.generate_kiosk_secret, help_text='يُرسله الجهاز في X-Kiosk-Token ويتحقق به من توقيع البيان', max_length=64, verbose_name='المفتاح السري'),
+        ),
+        migrations.RunPython(generate_secrets, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,5 @@
+import secrets
+
 from django.db import models
 from django.utils import timezone
 
@@ -250,6 +252,11 @@ class BlockedAttempt(models.Model):
         return f"{self.student.full_name} - {self.get_reason_display()} - {self.attempt_time.strftime('%Y-%m-%d %H:%M')}"
 
 
+def generate_kiosk_secret():
+    """Per-device secret shared with one kiosk (token and manifest HMAC key)"""
+    return secrets.token_hex(32)
+
+
 class KioskDevice(models.Model):
     """
     Kiosk Device model for managing QR scanning devices.
@@ -288,6 +295,13 @@ class KioskDevice(models.Model):
         help_text="آخر مرة أرسل فيها الجهاز إشارة حياة"
     )
     
+    secret = models.CharField(
+        max_length=64,
+        default=generate_kiosk_secret,
+        verbose_name="المفتاح السري",
+        help_text="يُرسله الجهاز في X-Kiosk-Token ويتحقق به من توقيع البيان"
+    )
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -303,40 +317,147 @@ class KioskDevice(models.Model):
     def get_current_session(self):
         """Get the currently active session for this kiosk's room"""
         from django.utils import timezone
-        from datetime import timedelta
+        from .schedule_index import ScheduleIndexService
+        from .services import SessionService
         
-        now = timezone.now()
-        current_time = now.time()
-        current_day = now.strftime('%A')
+        now = timezone.localtime()
         
-        # Get groups scheduled for this room at this time
-        from apps.teachers.models import Group
-        groups = Group.objects.filter(
-            room=self.room,
-            schedule_day=current_day,
-            is_active=True
+        # Groups in this room from 30 min before start until the end
+        group_ids = ScheduleIndexService.groups_for_room(
+            self.room_id,
+            now,
+            lead_minutes=30
         )
+        if not group_ids:
+            return None
         
-        for group in groups:
-            start_time = group.schedule_time
-            end_time = (
-                timezone.datetime.combine(timezone.now().date(), start_time) +
-                timedelta(minutes=group.duration)
-            ).time()
-            
-            # Check if current time is within session window (30 min before to end)
-            early_window = (
-                timezone.datetime.combine(timezone.now().date(), start_time) -
-                timedelta(minutes=30)
-            ).time()
-            
-            if early_window <= current_time <= end_time:
-                # Get or create session for today
-                session, _ = Session.objects.get_or_create(
-                    group=group,
-                    session_date=now.date()
-                )
-                return session
-        
-        return None
+        # Session is pre-materialized for today - read it from cache
+        return SessionService.get_session(group_ids[0], now.date())
+
 
+
+class MonitorChannel(models.Model):
+    """
+    Monitor channel: a named set of rooms shown on one wall screen,
+    with that screen's display settings.
+    """
+    slug = models.SlugField(
+        max_length=50,
+        unique=True,
+        verbose_name="المعرف",
+        help_text="يظهر في رابط الشاشة (مثال: building-a)"
+    )
+    name = models.CharField(
+        max_length=100,
+        verbose_name="اسم القناة",
+        help_text="اسم وصفي للشاشة (مثال: شاشة المبنى أ)"
+    )
+    rooms = models.ManyToManyField(
+        'teachers.Room',
+        blank=True,
+        related_name='monitor_channels',
+        verbose_name="القاعات",
+        help_text="اتركها فارغة لعرض كل القاعات"
+    )
+    
+    refresh_interval = models.PositiveSmallIntegerField(
+        default=5,
+        verbose_name="فترة التحديث (ثانية)"
+    )
+    auto_refresh = models.BooleanField(default=True, verbose_name="تحديث تلقائي")
+    show_alerts = models.BooleanField(default=True, verbose_name="عرض التنبيهات")
+    alert_threshold_low_attendance = models.PositiveSmallIntegerField(
+        default=50,
+        verbose_name="حد الحضور المنخفض (%)"
+    )
+    alert_threshold_high_blocked = models.PositiveSmallIntegerField(
+        default=3,
+        verbose_name="حد الطلاب المحظورين"
+    )
+    enable_sound = models.BooleanField(default=False, verbose_name="تفعيل الصوت")
+    fullscreen_mode = models.BooleanField(default=False, verbose_name="ملء الشاشة")
+    
+    is_active = models.BooleanField(default=True, verbose_name="نشط")
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    # Channel used by the general monitor page and its settings form
+    DEFAULT_SLUG = 'default'
+    
+    SETTING_FIELDS = [
+        'refresh_interval',
+        'auto_refresh',
+        'show_alerts',
+        'alert_threshold_low_attendance',
+        'alert_threshold_high_blocked',
+        'enable_sound',
+        'fullscreen_mode',
+    ]
+    
+    class Meta:
+        db_table = 'monitor_channels'
+        verbose_name = 'قناة شاشة المراقبة'
+        verbose_name_plural = 'قنوات شاشة المراقبة'
+        ordering = ['name']
+    
+    def __str__(self):
+        return self.name
+    
+    def get_settings(self):
+        """Display settings in the get_monitor_settings format"""
+        return {field: getattr(self, field) for field in self.SETTING_FIELDS}
+
+
+class RoomSnapshot(models.Model):
+    """
+    Minute-level snapshot of one room on the live monitor (for replay).
+    One narrow row per room with an active session per recorded minute.
+    """
+    snapshot_id = models.BigAutoField(primary_key=True)
+    taken_at = models.DateTimeField(verbose_name="وقت اللقطة")
+    room = models.ForeignKey(
+        'teachers.Room',
+        on_delete=models.CASCADE,
+        related_name='monitor_snapshots',
+        verbose_name="القاعة"
+    )
+    group = models.ForeignKey(
+        'teachers.Group',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='monitor_snapshots',
+        verbose_name="المجموعة"
+    )
+    # Copied so replay does not depend on later renames
+    group_name = models.CharField(max_length=100, verbose_name="اسم المجموعة")
+    teacher_name = models.CharField(max_length=200, blank=True, verbose_name="اسم المدرس")
+    start_time = models.TimeField(verbose_name="بداية الحصة")
+    end_time = models.TimeField(null=True, blank=True, verbose_name="نهاية الحصة")
+    
+    status = models.CharField(max_length=20, verbose_name="حالة القاعة")
+    total = models.PositiveSmallIntegerField(default=0, verbose_name="المسجلين")
+    present = models.PositiveSmallIntegerField(default=0, verbose_name="الحاضرين")
+    late_blocked = models.PositiveSmallIntegerField(default=0, verbose_name="ممنوع - تأخير")
+    very_late_blocked = models.PositiveSmallIntegerField(default=0, verbose_name="ممنوع - تأخير شديد")
+    not_arrived = models.PositiveSmallIntegerField(default=0, verbose_name="لم يصل")
+    
+    class Meta:
+        db_table = 'room_snapshots'
+        verbose_name = 'لقطة قاعة'
+        verbose_name_plural = 'لقطات القاعات'
+        ordering = ['-taken_at', 'room']
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'taken_at'], name='unique_room_snapshot_minute'),
+        ]
+        indexes = [
+            models.Index(fields=['taken_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.room_id} @ {self.taken_at:%Y-%m-%d %H:%M}"
+    
+    @property
+    def blocked_total(self):
+        return self.late_blocked + self.very_late_blocked
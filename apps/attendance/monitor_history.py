@@ -0,0 +1,194 @@
+"""
+Live Monitor History
+سجل الشاشة الحية وإعادة عرضها
+
+A minute job stores one narrow RoomSnapshot row per room with an active
+session (present / blocked / not-arrived counts plus the session labels)
+during operating hours. Replaying the monitor for a past moment then reads
+the rows of the nearest recorded minute instead of re-deriving the state
+from raw Attendance rows.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import RoomSnapshot
+
+logger = logging.getLogger(__name__)
+
+
+class MonitorHistoryService:
+    """
+    تسجيل لقطات الشاشة الحية كل دقيقة وإعادة بنائها لأي وقت سابق
+    """
+
+    # A replay uses the latest snapshot at most this old
+    REPLAY_TOLERANCE_MINUTES = 2
+
+    # ========================================
+    # Recording
+    # ========================================
+
+    @classmethod
+    def is_operating_hour(cls, at: datetime) -> bool:
+        start = getattr(settings, 'LIVE_MONITOR_SNAPSHOT_START_HOUR', 8)
+        end = getattr(settings, 'LIVE_MONITOR_SNAPSHOT_END_HOUR', 22)
+        return start <= timezone.localtime(at).hour < end
+
+    @classmethod
+    def record(cls, at: Optional[datetime] = None) -> int:
+        """
+        تسجيل لقطة الدقيقة الحالية
+
+        Idempotent per (room, minute) - a retried task writes nothing new.
+
+        Returns:
+            int: عدد القاعات المسجلة
+        """
+        from .monitor_service import LiveMonitorService
+
+        taken_at = (at or timezone.now()).replace(second=0, microsecond=0)
+
+        # Fresh build; also refreshes the payload the screens are reading
+        data = LiveMonitorService.get_live_dashboard_data(use_cache=False)
+
+        snapshots = [
+            cls._snapshot_from_room(room, taken_at)
+            for room in data['rooms']
+            if room['session']
+        ]
+        RoomSnapshot.objects.bulk_create(snapshots, ignore_conflicts=True)
+        return len(snapshots)
+
+    @staticmethod
+    def _snapshot_from_room(room: Dict[str, Any], taken_at: datetime) -> RoomSnapshot:
+        session = room['session']
+        end_time = session['end_time']
+        return RoomSnapshot(
+            taken_at=taken_at,
+            room_id=room['id'],
+            group_id=session.get('group_id'),
+            group_name=session['group_name'],
+            teacher_name=session['teacher_name'],
+            start_time=datetime.strptime(session['start_time'], '%H:%M').time(),
+            end_time=datetime.strptime(end_time, '%H:%M').time() if end_time else None,
+            status=room['status'],
+            total=session['total'],
+            present=session['present'],
+            late_blocked=session['late_blocked'],
+            very_late_blocked=session['very_late_blocked'],
+            not_arrived=session['not_arrived'],
+        )
+
+    @classmethod
+    def purge(cls, days: Optional[int] = None) -> int:
+        """
+        حذف اللقطات الأقدم من مدة الاحتفاظ
+
+        Returns:
+            int: عدد الصفوف المحذوفة
+        """
+        days = days or getattr(settings, 'LIVE_MONITOR_SNAPSHOT_RETENTION_DAYS', 180)
+        deleted, _ = RoomSnapshot.objects.filter(
+            taken_at__lt=timezone.now() - timedelta(days=days)
+        ).delete()
+        return deleted
+
+    # ========================================
+    # Replay
+    # ========================================
+
+    @classmethod
+    def replay(cls, at: datetime, room_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+        """
+        إعادة بناء الشاشة الحية كما كانت في وقت سابق
+
+        Args:
+            at: الوقت المطلوب (aware datetime)
+            room_ids: قصر النتيجة على قاعات معينة (None = كل القاعات)
+
+        Returns:
+            Dict بنفس شكل get_live_dashboard_data مع:
+            'recorded_at': وقت اللقطة المستخدمة أو None إذا لم تُسجل لقطة
+        """
+        from apps.teachers.models import Room
+        from .monitor_service import LiveMonitorService
+
+        snapshots = RoomSnapshot.objects.filter(
+            taken_at__lte=at,
+            taken_at__gt=at - timedelta(minutes=cls.REPLAY_TOLERANCE_MINUTES)
+        )
+        if room_ids is not None:
+            snapshots = snapshots.filter(room_id__in=room_ids)
+
+        recorded_at = snapshots.aggregate(latest=Max('taken_at'))['latest']
+        by_room = {}
+        if recorded_at is not None:
+            by_room = {snapshot.room_id: snapshot for snapshot in snapshots.filter(taken_at=recorded_at)}
+
+        rooms = Room.objects.filter(Q(is_active=True) | Q(room_id__in=list(by_room)))
+        if room_ids is not None:
+            rooms = rooms.filter(room_id__in=room_ids)
+
+        local_at = timezone.localtime(at)
+        rooms_data = []
+        alerts = []
+        total_present = 0
+        for room in rooms.order_by('name'):
+            room_data = cls._room_data(room, by_room.get(room.room_id))
+            rooms_data.append(room_data)
+            if room_data['session']:
+                total_present += room_data['session']['present']
+                for alert in LiveMonitorService._generate_room_alerts(room_data):
+                    alerts.append({**alert, 'timestamp': local_at.strftime('%H:%M')})
+
+        return {
+            'timestamp': local_at.isoformat(),
+            'recorded_at': timezone.localtime(recorded_at).isoformat() if recorded_at else None,
+            'summary': {
+                'total_present_today': total_present,
+                'active_sessions': len(by_room),
+                'total_rooms': len(rooms_data),
+                'current_time': local_at.strftime('%H:%M:%S'),
+                'current_date': local_at.strftime('%Y-%m-%d'),
+                'current_day_ar': LiveMonitorService._get_arabic_day(local_at.strftime('%A')),
+            },
+            'rooms': rooms_data,
+            'alerts': alerts,
+        }
+
+    @staticmethod
+    def _room_data(room, snapshot: Optional[RoomSnapshot]) -> Dict[str, Any]:
+        """Room entry in the live dashboard shape"""
+        room_data = {
+            'id': room.room_id,
+            'name': room.name,
+            'name_ar': room.name,
+            'capacity': room.capacity,
+            'status': 'empty',
+            'session': None,
+        }
+        if snapshot is None:
+            return room_data
+
+        room_data['status'] = snapshot.status
+        room_data['session'] = {
+            'group_name': snapshot.group_name,
+            'teacher_name': snapshot.teacher_name,
+            'start_time': snapshot.start_time.strftime('%H:%M'),
+            'end_time': snapshot.end_time.strftime('%H:%M') if snapshot.end_time else '',
+            'capacity': room.capacity,
+            'group_id': snapshot.group_id,
+            'total': snapshot.total,
+            'present': snapshot.present,
+            'late_blocked': snapshot.late_blocked,
+            'very_late_blocked': snapshot.very_late_blocked,
+            'not_arrived': snapshot.not_arrived,
+            'blocked_total': snapshot.blocked_total,
+        }
+        return room_data
@@ -12,6 +12,7 @@ from django.db.models import Q, Count, Sum, Prefetch
 from django.core.cache import cache
 from django.utils import timezone
 from django.conf import settings
+from utils.cache_utils import CachedPayload
 
 
 class LiveMonitorService:
@@ -20,13 +21,19 @@ class LiveMonitorService:
     Real-time monitoring service for attendance tracking across all rooms
     """
     
-    # Cache timeout for live data (5 seconds)
+    # Cache timeout for live data (5 seconds, then served stale while rebuilding)
     CACHE_TIMEOUT = 5
+    STALE_TIMEOUT = 30
+    DASHBOARD_CACHE = CachedPayload('live_dashboard_data', ttl=CACHE_TIMEOUT, stale_ttl=STALE_TIMEOUT)
     
     # Alert thresholds
     LOW_ATTENDANCE_THRESHOLD = 0.5  # 50%
     HIGH_BLOCKED_THRESHOLD = 3  # More than 3 blocked students
     
+    # Monitor channel definitions (rooms + settings) are read on every poll
+    CHANNEL_CACHE_PREFIX = 'monitor_channel'
+    CHANNEL_CACHE_TIMEOUT = 300
+    
     @classmethod
     def get_live_dashboard_data(cls, use_cache: bool = True) -> Dict[str, Any]:
         """
@@ -45,29 +52,83 @@ class LiveMonitorService:
                 'alerts': [...]
             }
         """
-        cache_key = f'live_dashboard_data_{timezone.now().strftime("%Y%m%d_%H%M")}'
+        # Every screen polls this; one worker rebuilds while the rest get the last payload
+        return cls.DASHBOARD_CACHE.get(cls._generate_dashboard_data, refresh=not use_cache)
+    
+    @classmethod
+    def get_channel_dashboard_data(cls, channel: Dict[str, Any], use_cache: bool = True) -> Dict[str, Any]:
+        """
+        Live dashboard data for the rooms of one monitor channel
+        بيانات الشاشة الحية لقاعات قناة واحدة فقط
+        
+        Only the channel's rooms are computed and sent, and the payload is
+        cached per channel - one rebuild serves every screen on the channel.
+        
+        Args:
+            channel: Channel definition from get_channel()
+        """
+        return cls.DASHBOARD_CACHE.get(
+            lambda: cls._generate_dashboard_data(channel['room_ids'], channel['settings']),
+            'channel', channel['slug'], channel['fingerprint'],
+            refresh=not use_cache
+        )
+    
+    @classmethod
+    def get_channel(cls, slug: str) -> Optional[Dict[str, Any]]:
+        """
+        Monitor channel definition (cached)
+        تعريف قناة الشاشة: القاعات والإعدادات
         
-        if use_cache:
-            cached_data = cache.get(cache_key)
-            if cached_data:
-                return cached_data
+        Returns:
+            {'slug', 'name', 'room_ids' (None = all rooms), 'settings', 'fingerprint'}
+            or None if there is no active channel with this slug
+        """
+        import hashlib
+        from apps.attendance.models import MonitorChannel
         
-        # Generate fresh data
-        data = cls._generate_dashboard_data()
+        cache_key = f'{cls.CHANNEL_CACHE_PREFIX}:{slug}'
+        channel = cache.get(cache_key)
+        if channel is not None:
+            return channel
         
-        # Cache for 5 seconds
-        cache.set(cache_key, data, cls.CACHE_TIMEOUT)
+        instance = MonitorChannel.objects.filter(slug=slug, is_active=True).first()
+        if instance is None:
+            return None
         
-        return data
+        room_ids = sorted(instance.rooms.values_list('room_id', flat=True)) or None
+        settings = instance.get_settings()
+        channel = {
+            'slug': instance.slug,
+            'name': instance.name,
+            'room_ids': room_ids,
+            'settings': settings,
+            # Payload cache key part - a changed channel never reads an old payload
+            'fingerprint': hashlib.md5(repr((room_ids, sorted(settings.items()))).encode()).hexdigest()[:12],
+        }
+        cache.set(cache_key, channel, cls.CHANNEL_CACHE_TIMEOUT)
+        return channel
     
     @classmethod
-    def _generate_dashboard_data(cls) -> Dict[str, Any]:
-        """Generate fresh dashboard data"""
+    def forget_channel(cls, slug: str) -> None:
+        """Drop a cached channel definition (channel edited or deleted)"""
+        cache.delete(f'{cls.CHANNEL_CACHE_PREFIX}:{slug}')
+    
+    @classmethod
+    def _generate_dashboard_data(cls, room_ids: Optional[List[int]] = None,
+                                 settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Generate fresh dashboard data
+        
+        Args:
+            room_ids: Limit to these rooms (None = all active rooms)
+            settings: Channel settings (alert thresholds)
+        """
         from apps.teachers.models import Room, Group
         from apps.attendance.models import Attendance, Session
         from apps.students.models import Student
         
-        now = timezone.now()
+        # Schedules are local wall-clock times
+        now = timezone.localtime()
         current_time = now.time()
         current_day = now.strftime('%A')
         
@@ -82,11 +143,17 @@ class LiveMonitorService:
             'Friday': 'Friday'
         }
         
-        # Get all active rooms
-        rooms = Room.objects.filter(is_active=True).order_by('name')
+        # Get all active rooms (or the channel's)
+        rooms = Room.objects.filter(is_active=True)
+        if room_ids is not None:
+            rooms = rooms.filter(room_id__in=room_ids)
+        rooms = list(rooms.order_by('name'))
         
         # Get active sessions for current time
-        active_sessions = cls._get_active_sessions(current_day, current_time)
+        active_sessions = cls._get_active_sessions(current_day, current_time, room_ids)
+        
+        # All rooms' attendance stats in a constant number of queries
+        room_stats = cls._get_rooms_attendance_stats(active_sessions, now.date())
         
         # Build room data
         rooms_data = []
@@ -95,7 +162,7 @@ class LiveMonitorService:
         active_session_count = 0
         
         for room in rooms:
-            room_data = cls._build_room_data(room, active_sessions, now)
+            room_data = cls._build_room_data(room, active_sessions, now, room_stats)
             rooms_data.append(room_data)
             
             if room_data['status'] == 'active':
@@ -103,14 +170,14 @@ class LiveMonitorService:
                 total_present_today += room_data['session']['present']
             
             # Collect alerts
-            room_alerts = cls._generate_room_alerts(room_data)
+            room_alerts = cls._generate_room_alerts(room_data, settings)
             alerts.extend(room_alerts)
         
         # Build summary
         summary = {
             'total_present_today': total_present_today,
             'active_sessions': active_session_count,
-            'total_rooms': rooms.count(),
+            'total_rooms': len(rooms),
             'current_time': now.strftime('%H:%M:%S'),
             'current_date': now.strftime('%Y-%m-%d'),
             'current_day_ar': cls._get_arabic_day(current_day)
@@ -124,7 +191,8 @@ class LiveMonitorService:
         }
     
     @classmethod
-    def _get_active_sessions(cls, day: str, current_time: time) -> Dict[int, Dict]:
+    def _get_active_sessions(cls, day: str, current_time: time,
+                             room_ids: Optional[List[int]] = None) -> Dict[int, Dict]:
         """
         Get active sessions for current time
         الحصول على الجلسات النشطة للوقت الحالي
@@ -137,25 +205,59 @@ class LiveMonitorService:
         groups = Group.objects.filter(
             schedule_day=day,
             is_active=True
-        ).select_related('teacher', 'room').prefetch_related(
-            'enrolled_students'
-        )
+        ).select_related('teacher', 'room')
+        if room_ids is not None:
+            groups = groups.filter(room_id__in=room_ids)
         
         for group in groups:
             # Check if session is currently active
             if cls._is_session_active(group.schedule_time, group.session_duration, current_time):
-                active_sessions[group.room_id] = {
-                    'group': group,
-                    'group_name': group.group_name,
-                    'teacher_name': group.teacher.full_name,
-                    'start_time': group.schedule_time.strftime('%H:%M'),
-                    'end_time': group.get_end_time().strftime('%H:%M') if group.get_end_time() else '',
-                    'capacity': group.room.capacity if group.room else 0,
-                    'group_id': group.group_id
-                }
+                active_sessions[group.room_id] = cls._session_info(group)
         
         return active_sessions
     
+    @classmethod
+    def _session_info(cls, group) -> Dict[str, Any]:
+        """Active session summary for a group"""
+        return {
+            'group': group,
+            'group_name': group.group_name,
+            'teacher_name': group.teacher.full_name,
+            'start_time': group.schedule_time.strftime('%H:%M'),
+            'end_time': group.get_end_time().strftime('%H:%M') if group.get_end_time() else '',
+            'capacity': group.room.capacity if group.room else 0,
+            'group_id': group.group_id
+        }
+    
+    @classmethod
+    def get_room_data(cls, room_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Current data for a single room (used for live stream deltas)
+        بيانات قاعة واحدة بدون إعادة حساب الشاشة كاملة
+        
+        Returns:
+            {'room': {...}, 'alerts': [...]} or None if the room is inactive
+        """
+        from apps.teachers.models import Room, Group
+        from .schedule_index import ScheduleIndexService
+        
+        room = Room.objects.filter(room_id=room_id, is_active=True).first()
+        if room is None:
+            return None
+        
+        now = timezone.localtime()
+        active_sessions = {}
+        group_ids = ScheduleIndexService.groups_for_room(room_id, now)
+        if group_ids:
+            group = Group.objects.select_related('teacher', 'room').get(pk=group_ids[0])
+            active_sessions[room_id] = cls._session_info(group)
+        
+        room_data = cls._build_room_data(room, active_sessions, now)
+        return {
+            'room': room_data,
+            'alerts': cls._generate_room_alerts(room_data)
+        }
+    
     @classmethod
     def _is_session_active(cls, start_time: time, duration: int, current_time: time) -> bool:
         """
@@ -172,20 +274,25 @@ class LiveMonitorService:
         return start_dt <= current_dt <= end_dt
     
     @classmethod
-    def _build_room_data(cls, room, active_sessions: Dict, now: datetime) -> Dict[str, Any]:
+    def _build_room_data(cls, room, active_sessions: Dict, now: datetime,
+                         room_stats: Optional[Dict[int, Dict[str, int]]] = None) -> Dict[str, Any]:
         """
         Build data for a single room
         بناء بيانات لقاعة واحدة
-        """
-        from apps.attendance.models import Attendance
         
+        Args:
+            room_stats: Precomputed stats per room (see _get_rooms_attendance_stats)
+        """
         # Check if room has active session
         session_info = active_sessions.get(room.room_id)
         
         if session_info:
             # Get attendance data for this session
-            group = session_info['group']
-            attendance_stats = cls._get_session_attendance_stats(group, now)
+            if room_stats is None:
+                room_stats = cls._get_rooms_attendance_stats(
+                    {room.room_id: session_info}, now.date()
+                )
+            attendance_stats = room_stats[room.room_id]
             
             # Determine room status
             status = cls._determine_room_status(attendance_stats, room.capacity)
@@ -202,6 +309,7 @@ class LiveMonitorService:
                     'start_time': session_info['start_time'],
                     'end_time': session_info['end_time'],
                     'capacity': session_info['capacity'],
+                    'group_id': session_info['group_id'],
                     **attendance_stats
                 }
             }
@@ -222,40 +330,71 @@ class LiveMonitorService:
         Get attendance statistics for a session
         الحصول على إحصائيات الحضور لجلسة
         """
-        from apps.attendance.models import Attendance
+        stats = cls._get_rooms_attendance_stats(
+            {group.room_id: {'group_id': group.group_id}}, now.date()
+        )
+        return stats[group.room_id]
+    
+    @classmethod
+    def _get_rooms_attendance_stats(cls, active_sessions: Dict[int, Dict], today) -> Dict[int, Dict[str, int]]:
+        """
+        Attendance statistics for every active room
+        إحصائيات الحضور لكل القاعات النشطة
+        
+        One grouped enrollment count per active group; the outcome counts
+        come from SessionCounterService (a query only for unbuilt sessions).
+        
+        Args:
+            active_sessions: {room_id: {'group_id': ..., ...}}
+            today: Session date
+            
+        Returns:
+            {room_id: stats dict}
+        """
+        from django.db.models import Count
+        from apps.attendance.session_counters import SessionCounterService
         from apps.students.models import StudentGroupEnrollment
         
-        # Get enrolled students
-        enrollments = StudentGroupEnrollment.objects.filter(
-            group=group,
-            is_active=True
-        ).select_related('student')
+        if not active_sessions:
+            return {}
         
-        total_students = enrollments.count()
+        group_ids = [info['group_id'] for info in active_sessions.values()]
         
-        # Get today's attendance
-        today = now.date()
-        attendance_records = Attendance.objects.filter(
-            session__date=today,
-            student__in=[e.student for e in enrollments]
+        totals = dict(
+            StudentGroupEnrollment.objects.filter(
+                group_id__in=group_ids,
+                is_active=True
+            ).order_by().values('group_id').annotate(
+                total=Count('id')
+            ).values_list('group_id', 'total')
         )
         
-        present = attendance_records.filter(status='present').count()
-        late = attendance_records.filter(status='late').count()
-        late_blocked = attendance_records.filter(status='late_blocked').count()
-        very_late_blocked = attendance_records.filter(status='very_late_blocked').count()
-        absent = attendance_records.filter(status='absent').count()
+        # Incrementally maintained per-session counters (one cache read)
+        counters = SessionCounterService.get_for_groups(group_ids, today)
+        
+        return {
+            room_id: cls._stats_from_counts(
+                totals.get(info['group_id'], 0),
+                counters.get(info['group_id'], {})
+            )
+            for room_id, info in active_sessions.items()
+        }
+    
+    @staticmethod
+    def _stats_from_counts(total_students: int, counts: Dict[str, int]) -> Dict[str, int]:
+        """Room stats from the session outcome counters"""
+        present = counts.get('present', 0)
+        late_blocked = counts.get('late_blocked', 0)
+        very_late_blocked = counts.get('very_late', 0)
         
         # Calculate not arrived
-        not_arrived = total_students - (present + late + late_blocked + very_late_blocked + absent)
+        not_arrived = total_students - (present + late_blocked + very_late_blocked)
         
         return {
             'total': total_students,
             'present': present,
-            'late': late,
             'late_blocked': late_blocked,
             'very_late_blocked': very_late_blocked,
-            'absent': absent,
             'not_arrived': max(0, not_arrived),
             'blocked_total': late_blocked + very_late_blocked
         }
@@ -280,10 +419,13 @@ class LiveMonitorService:
             return 'active'
     
     @classmethod
-    def _generate_room_alerts(cls, room_data: Dict) -> List[Dict[str, Any]]:
+    def _generate_room_alerts(cls, room_data: Dict, settings: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """
         Generate alerts for a room
         إنشاء تنبيهات لقاعة
+        
+        Args:
+            settings: Channel settings overriding the default alert thresholds
         """
         alerts = []
         
@@ -292,8 +434,19 @@ class LiveMonitorService:
         
         session = room_data['session']
         
+        if settings is None:
+            low_attendance = room_data['status'] == 'low_attendance'
+            high_blocked = cls.HIGH_BLOCKED_THRESHOLD
+        else:
+            attendance_rate = session['present'] / session['total'] if session['total'] else 0
+            low_attendance = (
+                session['blocked_total'] < settings['alert_threshold_high_blocked']
+                and attendance_rate * 100 < settings['alert_threshold_low_attendance']
+            )
+            high_blocked = settings['alert_threshold_high_blocked']
+        
         # Low attendance alert
-        if room_data['status'] == 'low_attendance':
+        if low_attendance:
             alerts.append({
                 'type': 'low_attendance',
                 'severity': 'warning',
@@ -303,7 +456,7 @@ class LiveMonitorService:
             })
         
         # High blocked students alert
-        if session['blocked_total'] >= cls.HIGH_BLOCKED_THRESHOLD:
+        if session['blocked_total'] >= high_blocked:
             alerts.append({
                 'type': 'high_blocked',
                 'severity': 'danger',
@@ -336,68 +489,71 @@ class LiveMonitorService:
         """
         Get detailed attendance data for a specific room
         الحصول على بيانات حضور مفصلة لقاعة معينة
+        
+        The roster and today's attendance of the active group are fetched
+        in one query each and joined in memory.
         """
         from apps.teachers.models import Room, Group
         from apps.attendance.models import Attendance
         from apps.students.models import StudentGroupEnrollment
+        from .schedule_index import ScheduleIndexService
         
-        try:
-            room = Room.objects.get(room_id=room_id, is_active=True)
-        except Room.DoesNotExist:
+        room = Room.objects.filter(room_id=room_id, is_active=True).first()
+        if room is None:
             return None
         
-        now = timezone.now()
-        current_day = now.strftime('%A')
-        current_time = now.time()
-        
-        # Get active session
-        active_sessions = cls._get_active_sessions(current_day, current_time)
-        session_info = active_sessions.get(room_id)
+        room_summary = {
+            'id': room.room_id,
+            'name': room.name,
+            'capacity': room.capacity
+        }
         
-        if not session_info:
+        now = timezone.localtime()
+        group_ids = ScheduleIndexService.groups_for_room(room_id, now)
+        if not group_ids:
             return {
-                'room': {
-                    'id': room.room_id,
-                    'name': room.name,
-                    'capacity': room.capacity
-                },
+                'room': room_summary,
                 'session': None,
                 'students': []
             }
         
-        # Get enrolled students with attendance
-        enrollments = StudentGroupEnrollment.objects.filter(
-            group=session_info['group'],
+        group = Group.objects.select_related('teacher', 'room').get(pk=group_ids[0])
+        session_info = cls._session_info(group)
+        
+        # Session roster
+        roster = StudentGroupEnrollment.objects.filter(
+            group_id=group.group_id,
             is_active=True
-        ).select_related('student')
+        ).order_by('student__full_name').values(
+            'student_id', 'student__full_name', 'student__student_code', 'is_financially_blocked'
+        )
         
-        students_data = []
-        today = now.date()
+        # Today's attendance for the group, by student
+        attendance_by_student = {
+            row['student_id']: row
+            for row in Attendance.objects.filter(
+                session__group_id=group.group_id,
+                session__session_date=now.date()
+            ).values('student_id', 'status', 'scan_time')
+        }
         
-        for enrollment in enrollments:
-            student = enrollment.student
-            
-            # Get today's attendance
-            attendance = Attendance.objects.filter(
-                session__date=today,
-                student=student
-            ).first()
-            
+        students_data = []
+        for enrollment in roster:
+            attendance = attendance_by_student.get(enrollment['student_id'])
             students_data.append({
-                'student_id': student.student_id,
-                'name': student.full_name,
-                'code': student.student_code,
-                'status': attendance.status if attendance else 'not_arrived',
-                'check_in_time': attendance.check_in_time.strftime('%H:%M:%S') if attendance and attendance.check_in_time else None,
-                'is_blocked': enrollment.is_financially_blocked
+                'student_id': enrollment['student_id'],
+                'name': enrollment['student__full_name'],
+                'code': enrollment['student__student_code'],
+                'status': attendance['status'] if attendance else 'not_arrived',
+                'check_in_time': (
+                    timezone.localtime(attendance['scan_time']).strftime('%H:%M:%S')
+                    if attendance and attendance['scan_time'] else None
+                ),
+                'is_blocked': enrollment['is_financially_blocked']
             })
         
         return {
-            'room': {
-                'id': room.room_id,
-                'name': room.name,
-                'capacity': room.capacity
-            },
+            'room': room_summary,
             'session': {
                 'group_name': session_info['group_name'],
                 'teacher_name': session_info['teacher_name'],
@@ -408,12 +564,20 @@ class LiveMonitorService:
         }
     
     @classmethod
-    def get_monitor_settings(cls) -> Dict[str, Any]:
+    def get_monitor_settings(cls, channel: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Get monitor settings from database or defaults
         الحصول على إعدادات الشاشة
+        
+        Args:
+            channel: Channel definition (default: the 'default' channel)
         """
-        from django.contrib.auth.models import User
+        from apps.attendance.models import MonitorChannel
+        
+        if channel is None:
+            channel = cls.get_channel(MonitorChannel.DEFAULT_SLUG)
+        if channel is not None:
+            return dict(channel['settings'])
         
         # Default settings
         settings = {
@@ -426,8 +590,6 @@ class LiveMonitorService:
             'fullscreen_mode': False
         }
         
-        # TODO: Load from database settings model if exists
-        
         return settings
     
     @classmethod
@@ -0,0 +1,257 @@
+"""
+Today's Roster Index
+فهرس قائمة اليوم لتسريع معالجة المسح
+
+Resolves a scanned student_code to everything AttendanceService.process_scan
+needs (student, today's enrollment with its credit snapshot, group schedule
+and today's session) without hitting the database on the hot path.
+
+Two layers:
+- Per-process table of today's groups and sessions (rebuilt when the
+  generation or the session generation counter changes).
+- Shared (Redis) per-student entries keyed by generation, date and code.
+
+Invalidation is driven by signals (see signals.py) on Student,
+StudentGroupEnrollment, Group and Session. Session changes (created at the
+first scan, cancelled, teacher checked in) only bump the session
+generation: student entries do not depend on sessions and stay cached.
+"""
+
+import threading
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from django.core.cache import cache
+from django.utils import timezone
+
+
+class RosterIndexService:
+    """
+    فهرس الطلاب والمجموعات لليوم الحالي
+    In-memory + cache backed index of today's roster keyed by student_code
+    """
+
+    CACHE_PREFIX = 'roster_index'
+    GENERATION_KEY = 'roster_index:generation'
+    SESSION_GENERATION_KEY = 'roster_index:session_generation'
+
+    # Entries are keyed by date, so a day is the natural upper bound
+    CACHE_TIMEOUT = 60 * 60 * 24
+    # Unknown codes are cached briefly to absorb repeated bad scans
+    MISSING_TIMEOUT = 30
+
+    DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+    _local_lock = threading.Lock()
+    _group_table: Dict[str, Any] = {'generation': None, 'date': None, 'groups': {}}
+
+    # ========================================
+    # Public API
+    # ========================================
+
+    @classmethod
+    def resolve(cls, student_code: str, at=None) -> Optional[Dict[str, Any]]:
+        """
+        Resolve a student_code to today's roster entry
+
+        Args:
+            student_code: Scanned student code
+            at: Reference datetime (defaults to now)
+
+        Returns:
+            None if the code is unknown or the student is inactive, otherwise:
+            {
+                'student': Student instance,
+                'enrollments': [StudentGroupEnrollment with .group set, ...],
+                'sessions': {group_id: {'session_id', 'is_cancelled', 'cancellation_reason'}}
+            }
+        """
+        at = at or timezone.now()
+        today = timezone.localtime(at).date()
+
+        generations = cache.get_many([cls.GENERATION_KEY, cls.SESSION_GENERATION_KEY])
+        generation = generations.get(cls.GENERATION_KEY, 0)
+        groups = cls._get_group_table(
+            (generation, generations.get(cls.SESSION_GENERATION_KEY, 0)), today
+        )
+
+        key = cls._student_key(generation, today, student_code)
+        entry = cache.get(key)
+        if entry is None:
+            entry = cls._build_student_entry(student_code, groups)
+            timeout = cls.CACHE_TIMEOUT if entry['student'] is not None else cls.MISSING_TIMEOUT
+            cache.set(key, entry, timeout)
+
+        if entry['student'] is None:
+            return None
+
+        enrollments = []
+        for enrollment in entry['enrollments']:
+            group_data = groups.get(enrollment.group_id)
+            if not group_data:
+                continue
+            enrollment.group = group_data['group']
+            enrollments.append(enrollment)
+
+        return {
+            'student': entry['student'],
+            'enrollments': enrollments,
+            'sessions': {
+                group_id: data['session']
+                for group_id, data in groups.items()
+                if data['session'] is not None
+            },
+        }
+
+    @classmethod
+    def update_enrollment_snapshot(cls, student_code: str, enrollment_id: int, **counters) -> None:
+        """
+        Write-through update of a cached credit snapshot
+        تحديث لقطة الائتمان في الفهرس بدلاً من حذفها
+        """
+        today = timezone.localtime(timezone.now()).date()
+        key = cls._student_key(cls.get_generation(), today, student_code)
+        entry = cache.get(key)
+        if not entry or entry['student'] is None:
+            return
+
+        for enrollment in entry['enrollments']:
+            if enrollment.pk == enrollment_id:
+                for field, value in counters.items():
+                    setattr(enrollment, field, value)
+                cache.set(key, entry, cls.CACHE_TIMEOUT)
+                return
+
+    @classmethod
+    def invalidate_student(cls, student_code: str) -> None:
+        """Drop today's cached entry for a single student"""
+        if not student_code:
+            return
+        today = timezone.localtime(timezone.now()).date()
+        cache.delete(cls._student_key(cls.get_generation(), today, student_code))
+
+    @classmethod
+    def invalidate_students(cls, student_codes) -> None:
+        """Drop today's cached entries for several students (bulk updates)"""
+        today = timezone.localtime(timezone.now()).date()
+        generation = cls.get_generation()
+        cache.delete_many([
+            cls._student_key(generation, today, student_code)
+            for student_code in student_codes if student_code
+        ])
+
+    @classmethod
+    def invalidate_all(cls) -> None:
+        """
+        Invalidate the whole index (group/student changes)
+        Old entries become unreachable and expire on their own.
+        """
+        cls._bump(cls.GENERATION_KEY)
+
+    @classmethod
+    def invalidate_sessions(cls) -> None:
+        """
+        Rebuild only the group/session table (session changes)
+        Cached student entries are kept.
+        """
+        cls._bump(cls.SESSION_GENERATION_KEY)
+
+    @classmethod
+    def get_generation(cls) -> int:
+        return cache.get(cls.GENERATION_KEY, 0)
+
+    @classmethod
+    def get_session_generation(cls) -> int:
+        return cache.get(cls.SESSION_GENERATION_KEY, 0)
+
+    # ========================================
+    # Internal helpers
+    # ========================================
+
+    @staticmethod
+    def _bump(key: str) -> None:
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Key missing (first run or evicted) - start a fresh generation
+            if not cache.add(key, 1, None):
+                cache.incr(key)
+
+    @classmethod
+    def _student_key(cls, generation: int, day: date, student_code: str) -> str:
+        return f'{cls.CACHE_PREFIX}:{generation}:{day.isoformat()}:{student_code}'
+
+    @classmethod
+    def _get_group_table(cls, generation: tuple, day: date) -> Dict[int, Dict[str, Any]]:
+        """
+        Per-process table of today's active groups and their sessions
+
+        Args:
+            generation: (generation, session generation)
+        """
+        table = cls._group_table
+        if table['generation'] == generation and table['date'] == day:
+            return table['groups']
+
+        with cls._local_lock:
+            table = cls._group_table
+            if table['generation'] != generation or table['date'] != day:
+                cls._group_table = {
+                    'generation': generation,
+                    'date': day,
+                    'groups': cls._build_group_table(day),
+                }
+            return cls._group_table['groups']
+
+    @classmethod
+    def _build_group_table(cls, day: date) -> Dict[int, Dict[str, Any]]:
+        from apps.teachers.models import Group
+        from .models import Session
+
+        groups = Group.objects.filter(
+            schedule_day=cls.DAY_NAMES[day.weekday()],
+            is_active=True
+        ).select_related('teacher', 'room')
+
+        table = {
+            group.group_id: {'group': group, 'session': None}
+            for group in groups
+        }
+
+        sessions = Session.objects.filter(
+            session_date=day,
+            group_id__in=list(table.keys())
+        ).values('session_id', 'group_id', 'is_cancelled', 'cancellation_reason')
+
+        for session in sessions:
+            table[session['group_id']]['session'] = {
+                'session_id': session['session_id'],
+                'is_cancelled': session['is_cancelled'],
+                'cancellation_reason': session['cancellation_reason'],
+            }
+
+        return table
+
+    @classmethod
+    def _build_student_entry(cls, student_code: str, groups: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+        from apps.students.models import Student, StudentGroupEnrollment
+
+        student = Student.objects.filter(
+            student_code=student_code,
+            is_active=True
+        ).only(
+            'student_id', 'student_code', 'full_name', 'parent_phone', 'is_active'
+        ).first()
+
+        if student is None:
+            return {'student': None, 'enrollments': []}
+
+        enrollments: List[StudentGroupEnrollment] = list(
+            StudentGroupEnrollment.objects.filter(
+                student=student,
+                is_active=True,
+                group_id__in=list(groups.keys())
+            ).order_by('id')
+        )
+
+        return {'student': student, 'enrollments': enrollments}
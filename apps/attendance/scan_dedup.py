@@ -0,0 +1,183 @@
+"""
+Scan De-duplication
+منع تكرار معالجة المسح المتكرر لنفس الطالب
+
+Students often scan the same code two or three times in a second. The
+first scan of a (student_code, session) pair claims a short-lived cache
+key; repeats inside ATTENDANCE_SCAN_DEDUP_SECONDS get the stored verdict
+back without opening a transaction, so they write no second
+BlockedAttempt and queue no second WhatsApp message.
+
+What a repeat gets is what it would have got from the database:
+- attended: the "already recorded" response
+- blocked:  the same blocked verdict
+
+A repeat arriving while the first scan is still running waits briefly for
+its verdict. A client may also send an idempotency key; a retried request
+with the same key (and student code) gets the original response back for
+ATTENDANCE_SCAN_IDEMPOTENCY_SECONDS.
+
+Responses are stored serialized (see serialize): the student, group and
+attendance instances become the same id/name dicts the scan API returns,
+so a replay differs from the original only by duplicate_scan=True.
+
+Only committed verdicts are stored - the caller stores after the scan
+transaction.
+"""
+
+import time
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class ScanDeduplicator:
+    """
+    ذاكرة قصيرة لأحكام المسح حسب (كود الطالب، الحصة) ومفتاح العميل
+    """
+
+    CACHE_PREFIX = 'scan_dedup'
+    IDEMPOTENCY_PREFIX = 'scan_idempotency'
+
+    PENDING = '__pending__'
+    # Upper bound of a scan transaction holding the claim
+    PENDING_TIMEOUT = 10
+    # How long a repeat waits for the first scan's verdict
+    WAIT_TIMEOUT = 1.0
+    WAIT_INTERVAL = 0.05
+
+    # ========================================
+    # Keys
+    # ========================================
+
+    @classmethod
+    def scan_key(cls, student_code: str, session_id: Optional[int]) -> Optional[str]:
+        if not session_id or not cls._dedup_seconds():
+            return None
+        return f'{cls.CACHE_PREFIX}:{session_id}:{student_code}'
+
+    @classmethod
+    def idempotency_key(cls, key: Optional[str], student_code: str) -> Optional[str]:
+        if not key:
+            return None
+        return f'{cls.IDEMPOTENCY_PREFIX}:{key}:{student_code}'
+
+    # ========================================
+    # Lookup / claim
+    # ========================================
+
+    @classmethod
+    def lookup(cls, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        الحكم المخزن لمفتاح (أو None)
+        """
+        if key is None:
+            return None
+        value = cache.get(key)
+        if value is None or value == cls.PENDING:
+            return None
+        return cls._replay(value)
+
+    @classmethod
+    def claim(cls, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        حجز مفتاح المسح أو إرجاع حكم المسح السابق
+
+        Returns:
+            None: the caller owns the key and must process the scan
+            dict: verdict to return for this repeated scan
+        """
+        if key is None:
+            return None
+
+        deadline = time.monotonic() + cls.WAIT_TIMEOUT
+        while True:
+            if cache.add(key, cls.PENDING, cls.PENDING_TIMEOUT):
+                return None
+            value = cache.get(key)
+            if value is not None and value != cls.PENDING:
+                return cls._replay(value)
+            if time.monotonic() >= deadline:
+                # First scan is too slow - process this one too (the
+                # unique constraint still guards the attendance row)
+                return None
+            time.sleep(cls.WAIT_INTERVAL)
+
+    # ========================================
+    # Storing
+    # ========================================
+
+    @classmethod
+    def remember(
+        cls,
+        scan_key: Optional[str],
+        repeat_response: Dict[str, Any],
+        idempotency_key: Optional[str] = None,
+        response: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        تخزين الحكم بعد نجاح المعاملة
+
+        Args:
+            scan_key: مفتاح (كود الطالب، الحصة) من scan_key
+            repeat_response: الاستجابة لأي مسح متكرر
+            idempotency_key: مفتاح العميل من idempotency_key
+            response: الاستجابة الأصلية (تُعاد لنفس مفتاح العميل)
+        """
+        if scan_key is not None:
+            cache.set(scan_key, cls.serialize(repeat_response), cls._dedup_seconds())
+        if idempotency_key is not None:
+            cache.set(idempotency_key, cls.serialize(response or repeat_response), cls._idempotency_seconds())
+
+    @classmethod
+    def release(cls, scan_key: Optional[str]) -> None:
+        """
+        تحرير المفتاح عند فشل المسح
+        """
+        if scan_key is not None:
+            cache.delete(scan_key)
+
+    # ========================================
+    # Helpers
+    # ========================================
+
+    @staticmethod
+    def serialize(response: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        نتيجة المسح بصيغة JSON كما تُرجعها الواجهة البرمجية
+
+        Model instances become {'id', 'name', ...} dicts; values that are
+        already serialized (a replay) are kept as they are.
+        """
+        data = dict(response)
+        student = data.get('student')
+        if student is not None and not isinstance(student, dict):
+            data['student'] = {
+                'id': student.student_id,
+                'name': student.full_name,
+                'barcode': student.student_code,
+            }
+        group = data.get('group')
+        if group is not None and not isinstance(group, dict):
+            data['group'] = {'id': group.group_id, 'name': group.group_name}
+        attendance = data.get('attendance')
+        if attendance is not None and not isinstance(attendance, dict):
+            data['attendance'] = {
+                'id': attendance.attendance_id,
+                'status': attendance.status,
+                'scan_time': attendance.scan_time.isoformat(),
+            }
+        return data
+
+    @staticmethod
+    def _replay(value: Dict[str, Any]) -> Dict[str, Any]:
+        return {**value, 'duplicate_scan': True}
+
+    @staticmethod
+    def _dedup_seconds() -> int:
+        return getattr(settings, 'ATTENDANCE_SCAN_DEDUP_SECONDS', 10)
+
+    @staticmethod
+    def _idempotency_seconds() -> int:
+        return getattr(settings, 'ATTENDANCE_SCAN_IDEMPOTENCY_SECONDS', 300)
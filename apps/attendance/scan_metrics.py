@@ -0,0 +1,440 @@
+"""
+Scan-Path Latency Metrics
+قياس زمن كل خطوة في مسار المسح
+
+Every live scan records per-step durations and DB query counts
+(lookup, schedule, session, time_check, credit_check, attendance_write,
+credit_consume, audit_write, notify, total). Samples are aggregated into
+fixed-bucket latency histograms per kiosk and per step, in one-minute
+windows kept in the shared cache. Percentiles are read over the last
+ROLLING_WINDOW_MINUTES windows.
+
+The same windows also count each kiosk's verdicts (present, late_blocked,
+..., duplicate), total server time and requests rejected by the rate
+limiter, read back as throughput (scans per minute, verdict mix, average
+latency) in JSON or Prometheus text format.
+
+Kiosk ids come from the client, so only active KioskDevice ids get their
+own bucket; any other id is counted under 'unknown' and requests without
+one under 'web'.
+
+Recording never raises into the scan path and can be switched off with
+settings.ATTENDANCE_SCAN_METRICS_ENABLED.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class ScanTimer:
+    """
+    مؤقت خطوات المسح الواحد مع عدّ الاستعلامات
+    """
+
+    def __init__(self, kiosk_id: Optional[str] = None):
+        self.kiosk_id = str(kiosk_id) if kiosk_id else ScanMetrics.DEFAULT_KIOSK
+        self.durations: Dict[str, float] = {}
+        self.queries: Dict[str, int] = {}
+        # Scan outcome (result status, or 'duplicate' for a de-duplicated repeat)
+        self.verdict: Optional[str] = None
+        self._current: Optional[str] = None
+        self._total_queries = 0
+        self._started = None
+
+    @contextmanager
+    def measure(self):
+        """
+        قياس المسح بالكامل (خطوة 'total') وتسجيله عند الانتهاء
+        """
+        self._started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(self._count_query):
+                yield self
+        finally:
+            self.durations['total'] = (time.perf_counter() - self._started) * 1000
+            self.queries['total'] = self._total_queries
+            ScanMetrics.record(self)
+
+    @contextmanager
+    def step(self, name: str):
+        """
+        قياس خطوة واحدة (تُجمع إذا تكررت)
+        """
+        previous = self._current
+        self._current = name
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.durations[name] = self.durations.get(name, 0.0) + elapsed
+            self.queries.setdefault(name, 0)
+            self._current = previous
+
+    def _count_query(self, execute, sql, params, many, context):
+        self._total_queries += 1
+        if self._current is not None:
+            self.queries[self._current] = self.queries.get(self._current, 0) + 1
+        return execute(sql, params, many, context)
+
+
+class ScanMetrics:
+    """
+    تجميع وقراءة مدرجات زمن المسح (p50 / p95 / p99)
+    """
+
+    CACHE_PREFIX = 'scan_metrics'
+    KIOSKS_KEY = 'scan_metrics:kiosks'
+    ACTIVE_KIOSKS_KEY = 'scan_metrics:active_kiosks'
+    ACTIVE_KIOSKS_TIMEOUT = 60
+    DEFAULT_KIOSK = 'web'
+    UNKNOWN_KIOSK = 'unknown'
+
+    # حدود فئات المدرج بالمللي ثانية (الفئة الأخيرة مفتوحة)
+    BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+    WINDOW_SECONDS = 60
+    ROLLING_WINDOW_MINUTES = 15
+
+    STEPS = [
+        'lookup', 'schedule', 'session', 'time_check', 'credit_check',
+        'attendance_write', 'credit_consume', 'audit_write', 'notify', 'total',
+    ]
+
+    # ========================================
+    # Recording
+    # ========================================
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return getattr(settings, 'ATTENDANCE_SCAN_METRICS_ENABLED', True)
+
+    @classmethod
+    def timer(cls, kiosk_id: Optional[str] = None) -> ScanTimer:
+        if not cls.is_enabled():
+            return ScanTimer(kiosk_id)
+        return ScanTimer(cls.resolve_kiosk(kiosk_id))
+
+    @classmethod
+    def resolve_kiosk(cls, kiosk_id: Optional[str]) -> str:
+        """
+        فئة القياس لمعرف كشك مرسل من العميل
+
+        Active KioskDevice ids keep their own bucket; anything else maps to
+        'unknown' so clients cannot create buckets, and no id maps to 'web'.
+        """
+        if not kiosk_id:
+            return cls.DEFAULT_KIOSK
+        kiosk_id = str(kiosk_id)
+        try:
+            return kiosk_id if kiosk_id in cls._active_kiosks() else cls.UNKNOWN_KIOSK
+        except Exception:
+            logger.exception("Failed to load active kiosks for scan metrics")
+            return cls.UNKNOWN_KIOSK
+
+    @classmethod
+    def forget_active_kiosks(cls) -> None:
+        """KioskDevice added, removed or (de)activated"""
+        cache.delete(cls.ACTIVE_KIOSKS_KEY)
+
+    @classmethod
+    def _active_kiosks(cls) -> set:
+        kiosks = cache.get(cls.ACTIVE_KIOSKS_KEY)
+        if kiosks is None:
+            from .models import KioskDevice
+            kiosks = set(KioskDevice.objects.filter(is_active=True).values_list('device_id', flat=True))
+            cache.set(cls.ACTIVE_KIOSKS_KEY, kiosks, cls.ACTIVE_KIOSKS_TIMEOUT)
+        return kiosks
+
+    @classmethod
+    def record(cls, timer: ScanTimer) -> None:
+        """
+        إضافة عينة مسح إلى نافذة الدقيقة الحالية
+        """
+        if not cls.is_enabled():
+            return
+
+        increments: Dict[str, int] = {}
+        for step, duration in timer.durations.items():
+            increments[f'{step}:count'] = 1
+            increments[f'{step}:b{cls._bucket_index(duration)}'] = 1
+            increments[f'{step}:queries'] = timer.queries.get(step, 0)
+        if 'total' in timer.durations:
+            increments['total:us'] = int(timer.durations['total'] * 1000)
+        if timer.verdict:
+            increments[f'verdict:{timer.verdict}'] = 1
+
+        try:
+            cls._store(timer.kiosk_id, cls._current_window(), increments)
+        except Exception:
+            logger.exception("Failed to record scan metrics")
+
+    @classmethod
+    def record_rejected(cls, kiosk_id: Optional[str] = None, reason: str = 'rate_limited') -> None:
+        """
+        عدّ طلب مسح مرفوض قبل المعالجة (مثال: تجاوز حد المعدل)
+        """
+        if not cls.is_enabled():
+            return
+        try:
+            cls._store(cls.resolve_kiosk(kiosk_id), cls._current_window(), {f'rejected:{reason}': 1})
+        except Exception:
+            logger.exception("Failed to record rejected scan")
+
+    @classmethod
+    def _store(cls, kiosk_id: str, window: int, increments: Dict[str, int]) -> None:
+        key = cls._window_key(kiosk_id, window)
+        timeout = (cls.ROLLING_WINDOW_MINUTES + 1) * cls.WINDOW_SECONDS
+
+        redis = cls._get_redis()
+        if redis is not None:
+            # One round trip: all counters of this sample + kiosk registry
+            pipe = redis.pipeline(transaction=False)
+            for field, amount in increments.items():
+                pipe.hincrby(key, field, amount)
+            pipe.expire(key, timeout)
+            pipe.sadd(cls.KIOSKS_KEY, kiosk_id)
+            pipe.execute()
+            return
+
+        # Fallback for non-Redis caches (best effort, not atomic)
+        data = cache.get(key) or {}
+        for field, amount in increments.items():
+            data[field] = data.get(field, 0) + amount
+        cache.set(key, data, timeout)
+
+        kiosks = cache.get(cls.KIOSKS_KEY) or set()
+        if kiosk_id not in kiosks:
+            kiosks.add(kiosk_id)
+            cache.set(cls.KIOSKS_KEY, kiosks, None)
+
+    # ========================================
+    # Reading
+    # ========================================
+
+    @classmethod
+    def get_kiosks(cls) -> List[str]:
+        redis = cls._get_redis()
+        if redis is not None:
+            return sorted(member.decode() for member in redis.smembers(cls.KIOSKS_KEY))
+        return sorted(cache.get(cls.KIOSKS_KEY) or [])
+
+    @classmethod
+    def get_summary(cls, kiosk_id: Optional[str] = None, minutes: Optional[int] = None) -> Dict[str, Any]:
+        """
+        ملخص المدرجات للنافذة المتحركة
+
+        Returns:
+            {
+                'window_minutes': int,
+                'buckets_ms': [...],
+                'kiosks': {kiosk: {step: {'count', 'p50_ms', 'p95_ms', 'p99_ms', 'avg_queries'}}}
+            }
+        """
+        minutes = min(minutes or cls.ROLLING_WINDOW_MINUTES, cls.ROLLING_WINDOW_MINUTES)
+        current = cls._current_window()
+        windows = range(current - minutes + 1, current + 1)
+        kiosks = [kiosk_id] if kiosk_id else cls.get_kiosks()
+
+        summary = {}
+        for kiosk in kiosks:
+            totals = cls._merge_windows(kiosk, windows)
+            steps = {}
+            for step in cls.STEPS:
+                count = totals.get(f'{step}:count', 0)
+                if not count:
+                    continue
+                counts = [totals.get(f'{step}:b{index}', 0) for index in range(len(cls.BUCKETS_MS) + 1)]
+                steps[step] = {
+                    'count': count,
+                    'p50_ms': cls._percentile(counts, count, 0.50),
+                    'p95_ms': cls._percentile(counts, count, 0.95),
+                    'p99_ms': cls._percentile(counts, count, 0.99),
+                    'avg_queries': round(totals.get(f'{step}:queries', 0) / count, 2),
+                }
+            if steps:
+                summary[kiosk] = steps
+
+        return {
+            'window_minutes': minutes,
+            'buckets_ms': cls.BUCKETS_MS,
+            'kiosks': summary,
+        }
+
+    @classmethod
+    def get_throughput(cls, kiosk_id: Optional[str] = None, minutes: Optional[int] = None) -> Dict[str, Any]:
+        """
+        معدل المسح ونتائجه لكل كشك في النافذة المتحركة
+
+        Returns:
+            {
+                'window_minutes': int,
+                'kiosks': {kiosk: {
+                    'device_name', 'room_name',
+                    'scans', 'scans_per_minute', 'peak_scans_per_minute',
+                    'per_minute': [scans per window, oldest first],
+                    'verdicts': {status: count},
+                    'avg_latency_ms', 'rate_limited'
+                }}
+            }
+        """
+        from .models import KioskDevice
+
+        minutes = min(minutes or cls.ROLLING_WINDOW_MINUTES, cls.ROLLING_WINDOW_MINUTES)
+        current = cls._current_window()
+        windows = range(current - minutes + 1, current + 1)
+        kiosks = [kiosk_id] if kiosk_id else cls.get_kiosks()
+
+        devices = {
+            device.device_id: device
+            for device in KioskDevice.objects.filter(device_id__in=kiosks).select_related('room')
+        }
+
+        result = {}
+        for kiosk in kiosks:
+            rows = cls._load_windows(kiosk, windows)
+            per_minute = [row.get('total:count', 0) for row in rows]
+            totals = cls._sum_rows(rows)
+            scans = totals.get('total:count', 0)
+            rate_limited = totals.get('rejected:rate_limited', 0)
+            if not scans and not rate_limited:
+                continue
+
+            device = devices.get(kiosk)
+            result[kiosk] = {
+                'device_name': device.device_name if device else kiosk,
+                'room_name': device.room.name if device else None,
+                'scans': scans,
+                'scans_per_minute': round(scans / minutes, 2),
+                'peak_scans_per_minute': max(per_minute),
+                'per_minute': per_minute,
+                'verdicts': {
+                    field.split(':', 1)[1]: value
+                    for field, value in sorted(totals.items())
+                    if field.startswith('verdict:')
+                },
+                'avg_latency_ms': round(totals.get('total:us', 0) / scans / 1000, 2) if scans else None,
+                'rate_limited': rate_limited,
+            }
+
+        return {
+            'window_minutes': minutes,
+            'kiosks': result,
+        }
+
+    @staticmethod
+    def render_prometheus(throughput: Dict[str, Any]) -> str:
+        """
+        معدل المسح بصيغة Prometheus النصية (مقاييس gauge للنافذة المتحركة)
+        """
+        def labels(kiosk, data, **extra):
+            values = {'kiosk': kiosk, 'room': data['room_name'] or '', **extra}
+            return ','.join(
+                '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                for name, value in values.items()
+            )
+
+        window = throughput['window_minutes']
+        metrics = [
+            ('kiosk_scans_per_minute', f'Average scans per minute over the last {window} minutes', 'scans_per_minute'),
+            ('kiosk_scans_peak_per_minute', f'Busiest minute of the last {window} minutes', 'peak_scans_per_minute'),
+            ('kiosk_scan_latency_avg_ms', f'Average server time per scan over the last {window} minutes', 'avg_latency_ms'),
+            ('kiosk_scans_rate_limited', f'Scan requests rejected by the rate limiter in the last {window} minutes', 'rate_limited'),
+        ]
+
+        lines = []
+        for name, help_text, field in metrics:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            for kiosk, data in throughput['kiosks'].items():
+                if data[field] is not None:
+                    lines.append(f'{name}{{{labels(kiosk, data)}}} {data[field]}')
+
+        lines.append(f'# HELP kiosk_scan_verdicts Scans per verdict in the last {window} minutes')
+        lines.append('# TYPE kiosk_scan_verdicts gauge')
+        for kiosk, data in throughput['kiosks'].items():
+            for verdict, count in data['verdicts'].items():
+                lines.append(f'kiosk_scan_verdicts{{{labels(kiosk, data, verdict=verdict)}}} {count}')
+
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def _merge_windows(cls, kiosk_id: str, windows) -> Dict[str, int]:
+        return cls._sum_rows(cls._load_windows(kiosk_id, windows))
+
+    @classmethod
+    def _load_windows(cls, kiosk_id: str, windows) -> List[Dict[str, int]]:
+        """
+        عدادات كل نافذة بالترتيب (نافذة فارغة = {})
+        """
+        keys = [cls._window_key(kiosk_id, window) for window in windows]
+
+        redis = cls._get_redis()
+        if redis is not None:
+            pipe = redis.pipeline(transaction=False)
+            for key in keys:
+                pipe.hgetall(key)
+            return [
+                {field.decode(): int(value) for field, value in row.items()}
+                for row in pipe.execute()
+            ]
+
+        cached = cache.get_many(keys)
+        return [cached.get(key, {}) for key in keys]
+
+    @staticmethod
+    def _sum_rows(rows: List[Dict[str, int]]) -> Dict[str, int]:
+        totals: Dict[str, int] = {}
+        for row in rows:
+            for field, value in row.items():
+                totals[field] = totals.get(field, 0) + value
+        return totals
+
+    @classmethod
+    def _percentile(cls, counts: List[int], total: int, quantile: float) -> Optional[float]:
+        """
+        الحد الأعلى للفئة التي تحتوي على النسبة المطلوبة
+        (None للفئة المفتوحة الأخيرة)
+        """
+        target = quantile * total
+        cumulative = 0
+        for index, count in enumerate(counts):
+            cumulative += count
+            if cumulative >= target:
+                return cls.BUCKETS_MS[index] if index < len(cls.BUCKETS_MS) else None
+        return None
+
+    # ========================================
+    # Helpers
+    # ========================================
+
+    @classmethod
+    def _bucket_index(cls, duration_ms: float) -> int:
+        for index, bound in enumerate(cls.BUCKETS_MS):
+            if duration_ms <= bound:
+                return index
+        return len(cls.BUCKETS_MS)
+
+    @classmethod
+    def _current_window(cls) -> int:
+        return int(time.time() // cls.WINDOW_SECONDS)
+
+    @classmethod
+    def _window_key(cls, kiosk_id: str, window: int) -> str:
+        return f'{cls.CACHE_PREFIX}:{kiosk_id}:{window}'
+
+    @staticmethod
+    def _get_redis():
+        try:
+            from django_redis import get_redis_connection
+            return get_redis_connection('default')
+        except Exception:
+            return None
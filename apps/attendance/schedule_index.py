@@ -0,0 +1,233 @@
+"""
+Compiled Weekly Schedule Index
+جدول الأسبوع المُجمّع للإجابة عن "ماذا يحدث الآن؟"
+
+Active groups are compiled once per Group change into per-weekday
+timelines of minute-of-day intervals (start, start + session_duration)
+keyed by room and by teacher. A timeline is sorted by start minute with a
+running maximum of end minutes, so "which groups cover minute m" is a
+bisect plus a short backwards walk instead of a Group query with
+datetime.combine per row.
+
+The compiled table is shared through the cache (one build per generation)
+and kept per process; readers only fetch the generation counter.
+Invalidation is driven by Group signals (see signals.py).
+"""
+
+import threading
+from bisect import bisect_right
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.core.cache import cache
+from django.utils import timezone
+
+
+class ScheduleIndexService:
+    """
+    فهرس الجدول الأسبوعي للقاعات والمدرسين والمجموعات
+    """
+
+    CACHE_PREFIX = 'schedule_index'
+    GENERATION_KEY = 'schedule_index:generation'
+
+    # The table only changes with Group rows - keep it until invalidated
+    CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+    DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+    _local_lock = threading.Lock()
+    _table: Dict[str, Any] = {'generation': None, 'data': None}
+
+    # ========================================
+    # Public API
+    # ========================================
+
+    @classmethod
+    def groups_for_room(cls, room_id: int, at=None, lead_minutes: int = 0) -> List[int]:
+        """
+        المجموعات الجارية الآن في القاعة (مرتبة حسب وقت البدء)
+
+        Args:
+            room_id: رقم القاعة
+            at: وقت مرجعي (افتراضياً: الآن)
+            lead_minutes: دقائق قبل البدء تُحسب ضمن الحصة
+        """
+        weekday, minute = cls._weekday_minute(at)
+        timeline = cls._get_table()['rooms'].get(room_id, {}).get(weekday)
+        return cls._covering(timeline, minute, lead_minutes)
+
+    @classmethod
+    def groups_for_teacher(cls, teacher_id: int, at=None, lead_minutes: int = 0) -> List[int]:
+        """
+        المجموعات الجارية الآن للمدرس (مرتبة حسب وقت البدء)
+        """
+        weekday, minute = cls._weekday_minute(at)
+        timeline = cls._get_table()['teachers'].get(teacher_id, {}).get(weekday)
+        return cls._covering(timeline, minute, lead_minutes)
+
+    @classmethod
+    def pick_group(cls, group_ids: Iterable[int], at=None, lead_minutes: int = 0) -> Optional[int]:
+        """
+        اختيار مجموعة الطالب الخاصة بالوقت الحالي
+
+        Among the student's groups scheduled today, the one whose window
+        covers the reference minute wins; otherwise the one starting
+        closest to it (so early/late messages refer to the right group).
+
+        Returns:
+            group_id أو None إذا لم تكن أي مجموعة مجدولة اليوم
+        """
+        weekday, minute = cls._weekday_minute(at)
+        groups = cls._get_table()['groups']
+
+        best = None
+        best_distance = None
+        for group_id in group_ids:
+            entry = groups.get(group_id)
+            if entry is None or entry['weekday'] != weekday:
+                continue
+            if entry['start'] - lead_minutes <= minute <= entry['end']:
+                return group_id
+            distance = abs(entry['start'] - minute)
+            if best_distance is None or distance < best_distance:
+                best, best_distance = group_id, distance
+
+        return best
+
+    @classmethod
+    def get_group(cls, group_id: int) -> Optional[Dict[str, Any]]:
+        """
+        بيانات المجموعة المُجمّعة (بدون استعلام Group)
+
+        Returns:
+            {'weekday', 'start', 'end', 'room_id', 'teacher_id',
+             'group_name', 'schedule_time'} أو None
+        """
+        return cls._get_table()['groups'].get(group_id)
+
+    @classmethod
+    def invalidate(cls) -> None:
+        """
+        إعادة بناء الجدول عند أول قراءة بعد تغيير المجموعات
+        """
+        try:
+            cache.incr(cls.GENERATION_KEY)
+        except ValueError:
+            # Key missing (first run or evicted) - start a fresh generation
+            if not cache.add(cls.GENERATION_KEY, 1, None):
+                cache.incr(cls.GENERATION_KEY)
+
+    @classmethod
+    def get_generation(cls) -> int:
+        return cache.get(cls.GENERATION_KEY, 0)
+
+    # ========================================
+    # Compiling
+    # ========================================
+
+    @classmethod
+    def _get_table(cls) -> Dict[str, Any]:
+        generation = cls.get_generation()
+        table = cls._table
+        if table['generation'] == generation:
+            return table['data']
+
+        with cls._local_lock:
+            table = cls._table
+            if table['generation'] != generation:
+                key = f'{cls.CACHE_PREFIX}:{generation}'
+                data = cache.get(key)
+                if data is None:
+                    data = cls._compile()
+                    cache.set(key, data, cls.CACHE_TIMEOUT)
+                cls._table = {'generation': generation, 'data': data}
+            return cls._table['data']
+
+    @classmethod
+    def _compile(cls) -> Dict[str, Any]:
+        from apps.teachers.models import Group
+
+        rows = Group.objects.filter(is_active=True).values(
+            'group_id', 'group_name', 'room_id', 'teacher_id',
+            'schedule_day', 'schedule_time', 'session_duration'
+        )
+
+        groups: Dict[int, Dict[str, Any]] = {}
+        rooms: Dict[int, Dict[int, list]] = {}
+        teachers: Dict[int, Dict[int, list]] = {}
+
+        for row in rows:
+            if row['schedule_day'] not in cls.DAY_NAMES:
+                continue
+            weekday = cls.DAY_NAMES.index(row['schedule_day'])
+            start = row['schedule_time'].hour * 60 + row['schedule_time'].minute
+            entry = {
+                'weekday': weekday,
+                'start': start,
+                'end': start + row['session_duration'],
+                'room_id': row['room_id'],
+                'teacher_id': row['teacher_id'],
+                'group_name': row['group_name'],
+                'schedule_time': row['schedule_time'],
+            }
+            groups[row['group_id']] = entry
+            rooms.setdefault(row['room_id'], {}).setdefault(weekday, []).append(
+                (entry['start'], entry['end'], row['group_id'])
+            )
+            teachers.setdefault(row['teacher_id'], {}).setdefault(weekday, []).append(
+                (entry['start'], entry['end'], row['group_id'])
+            )
+
+        return {
+            'groups': groups,
+            'rooms': cls._build_timelines(rooms),
+            'teachers': cls._build_timelines(teachers),
+        }
+
+    @staticmethod
+    def _build_timelines(intervals_by_key: Dict[int, Dict[int, list]]) -> Dict[int, Dict[int, Dict[str, list]]]:
+        timelines = {}
+        for key, days in intervals_by_key.items():
+            timelines[key] = {}
+            for weekday, intervals in days.items():
+                intervals.sort()
+                max_ends = []
+                running = -1
+                for _, end, _ in intervals:
+                    running = max(running, end)
+                    max_ends.append(running)
+                timelines[key][weekday] = {
+                    'starts': [start for start, _, _ in intervals],
+                    'ends': [end for _, end, _ in intervals],
+                    'max_ends': max_ends,
+                    'group_ids': [group_id for _, _, group_id in intervals],
+                }
+        return timelines
+
+    # ========================================
+    # Lookup helpers
+    # ========================================
+
+    @staticmethod
+    def _covering(timeline: Optional[Dict[str, list]], minute: int, lead_minutes: int) -> List[int]:
+        """
+        المجموعات التي تغطي الدقيقة: start - lead <= minute <= end
+        """
+        if not timeline:
+            return []
+
+        index = bisect_right(timeline['starts'], minute + lead_minutes) - 1
+        matches = []
+        # max_ends is non-decreasing - stop once nothing earlier can still cover
+        while index >= 0 and timeline['max_ends'][index] >= minute:
+            if timeline['ends'][index] >= minute:
+                matches.append(timeline['group_ids'][index])
+            index -= 1
+
+        matches.reverse()
+        return matches
+
+    @staticmethod
+    def _weekday_minute(at=None):
+        local = timezone.localtime(at or timezone.now())
+        return local.weekday(), local.hour * 60 + local.minute
@@ -4,12 +4,22 @@ No tolerance for late arrivals - 1 minute late = BLOCKED
 """
 from datetime import datetime, timedelta
 from django.utils import timezone
-from django.db import transaction
+from django.core.cache import cache
+from django.db import transaction, IntegrityError
+from django.db.models import F
 from .models import Attendance, Session, BlockedAttempt
+from .roster_index import RosterIndexService
+from .schedule_index import ScheduleIndexService
+from .audit_buffer import AuditWriteBuffer
+from .live_stream import LiveMonitorStream
+from .session_counters import SessionCounterService
+from .scan_metrics import ScanMetrics, ScanTimer
+from .scan_dedup import ScanDeduplicator
 from apps.students.models import Student, StudentGroupEnrollment
 from apps.payments.models import Payment
 from apps.payments.services import CreditService
 from apps.payments.whatsapp_templates import get_credit_whatsapp_message
+from apps.notifications.dispatch import NotificationDispatcher
 from apps.notifications.tasks import (
     send_attendance_success_task,
     send_late_block_task,
@@ -35,9 +45,12 @@ class AttendanceService:
     LATE_BLOCK_THRESHOLD_MINUTES = 0  # 0 دقيقة = صارم جداً (أي تأخير = ممنوع)
     VERY_LATE_THRESHOLD_MINUTES = 10  # 10+ دقائق = تأخير شديد
 
+    # المسح المؤجل (دفعات الكشك)
+    MAX_BATCH_SIZE = 200
+    MAX_CLOCK_SKEW_SECONDS = 120  # السماح بفرق بسيط في ساعة الكشك
+
     @staticmethod
-    @transaction.atomic
-    def process_scan(student_code, supervisor):
+    def process_scan(student_code, supervisor, scan_time=None, kiosk_id=None, idempotency_key=None):
         """
         معالجة إدخال كود الطالب - النظام الصارم
         
@@ -47,6 +60,14 @@ class AttendanceService:
         3. فحص الوقت الصارم (أي تأخير = ممنوع)
         4. فحص مالي
         
+        Args:
+            scan_time: وقت المسح الأصلي (افتراضياً: الآن) - للمسح المؤجل من الكشك
+            kiosk_id: معرف الكشك (لقياس زمن الخطوات - انظر ScanMetrics)
+            idempotency_key: مفتاح العميل - إعادة الطلب بنفس المفتاح تُرجع نفس النتيجة
+        
+        المسح المتكرر لنفس الطالب والحصة خلال ثوانٍ يُجاب من الكاش
+        بدون معاملة (انظر ScanDeduplicator).
+        
         الإرجاع:
         - success: True/False
         - status: present, late_blocked, very_late, no_session, blocked_payment, blocked_other
@@ -56,18 +77,323 @@ class AttendanceService:
         - student_name: اسم الطالب
         - minutes_late: دقائق التأخير
         """
-        current_time = timezone.now()
+        timer = ScanMetrics.timer(kiosk_id)
+        current_time = scan_time or timezone.now()
+        idempotency_key = ScanDeduplicator.idempotency_key(idempotency_key, student_code)
+
+        with timer.measure():
+            replay = ScanDeduplicator.lookup(idempotency_key)
+            if replay is not None:
+                timer.verdict = 'duplicate'
+                return replay
+
+            decision = AttendanceService._evaluate_scan(student_code, current_time, timer)
+
+            # Repeated scan of the same student and session -> previous verdict
+            scan_key = ScanDeduplicator.scan_key(student_code, decision['session_id'])
+            replay = ScanDeduplicator.claim(scan_key)
+            if replay is not None:
+                timer.verdict = 'duplicate'
+                return replay
+
+            try:
+                # Notifications are published once, after commit (see NotificationDispatcher)
+                with transaction.atomic(), NotificationDispatcher.batch():
+                    result = AttendanceService._process_scan(
+                        decision, supervisor, current_time, timer
+                    )
+            except Exception:
+                ScanDeduplicator.release(scan_key)
+                raise
+
+            ScanDeduplicator.remember(
+                scan_key,
+                AttendanceService._create_duplicate_response(decision) if result['success'] else result,
+                idempotency_key=idempotency_key,
+                response=result
+            )
+            timer.verdict = result['status']
+            return result
+
+    @staticmethod
+    def _process_scan(decision, supervisor, current_time, timer):
+        """
+        تنفيذ قرار المسح داخل المعاملة مع قياس كل خطوة
+        """
+        if decision['action'] == 'attend':
+            # ========================================
+            # التسجيل النهائي (حضور مسموح)
+            # ========================================
+            student = decision['student']
+            matching_group = decision['group']
+
+            # التسجيل - القيد الفريد (student, session) يمنع التسجيل المسبق
+            try:
+                with transaction.atomic():
+                    with timer.step('attendance_write'):
+                        attendance = Attendance.objects.create(
+                            **AttendanceService._attendance_fields(decision, supervisor)
+                        )
+                    # خصم الحصة بتحديث شرطي - يفشل إذا نفد الائتمان منذ الفحص
+                    with timer.step('credit_consume'):
+                        credit = AttendanceService.update_payment_sessions(
+                            student, matching_group, current_time,
+                            enrollment=decision['enrollment']
+                        )
+                    if credit is not None and not credit['consumed']:
+                        transaction.set_rollback(True)
+            except IntegrityError:
+                return AttendanceService._create_duplicate_response(decision)
+
+            if credit is None or credit['consumed']:
+                # إرسال إشعار الحضور الناجح (Async - لا يمنع عملية المسح)
+                with timer.step('notify'):
+                    AttendanceService._trigger_attendance_success_notification(
+                        student=student,
+                        group=matching_group,
+                        scan_time=current_time
+                    )
+
+                return {
+                    **decision['response'],
+                    'student': student,
+                    'group': matching_group,
+                    'attendance': attendance
+                }
+
+            # مسح متزامن استهلك آخر رصيد - منع مالي
+            decision = AttendanceService._credit_exhausted_decision(
+                decision, credit, current_time
+            )
+
+        if decision['action'] == 'blocked_time':
+            # تسجيل محاولة الدخول الممنوعة (سجل تدقيق - قد يُكتب لاحقاً)
+            with timer.step('audit_write'):
+                AuditWriteBuffer.add(BlockedAttempt, [decision['blocked_attempt']])
+            
+            # إرسال إخطار WhatsApp لولي الأمر (Async - لا يمنع عملية المسح)
+            with timer.step('notify'):
+                SessionCounterService.record_blocked([decision['blocked_attempt']])
+                LiveMonitorStream.session_changed(decision['session_id'])
+                AttendanceService._trigger_late_block_notification(
+                    student=decision['student'],
+                    group=decision['group'],
+                    time_check=decision['time_check'],
+                    current_time=current_time
+                )
+
+        elif decision['action'] == 'blocked_payment':
+            # تسجيل محاولة الدخول الممنوعة (مالية)
+            with timer.step('audit_write'):
+                AuditWriteBuffer.add(BlockedAttempt, [decision['blocked_attempt']])
+            
+            # إرسال إخطار WhatsApp للحظر المالي (Async)
+            with timer.step('notify'):
+                SessionCounterService.record_blocked([decision['blocked_attempt']])
+                LiveMonitorStream.session_changed(decision['session_id'])
+                AttendanceService._trigger_financial_block_notification(
+                    student=decision['student'],
+                    group=decision['group'],
+                    financial_check=decision['financial_check'],
+                    enrollment=decision['enrollment']
+                )
+
+        return decision['response']
+
+    @staticmethod
+    @transaction.atomic
+    def process_scan_batch(scans, supervisor):
+        """
+        معالجة دفعة من عمليات المسح (كشك كان غير متصل)
+        
+        كل عنصر يُقيَّم بوقت المسح الأصلي وبنفس قواعد process_scan،
+        ثم تُدرج سجلات Attendance و BlockedAttempt دفعة واحدة.
+        
+        إعادة إرسال عنصر بنفس idempotency_key (بعد ضياع الاستجابة) تُرجع
+        النتيجة الأصلية بدون محاولة ممنوعة أو إشعار ثانٍ.
+        
+        Args:
+            scans: قائمة مرتبة من {'student_code': str, 'scan_time': datetime,
+                'idempotency_key': str (اختياري)}
+            supervisor: المستخدم المسؤول
+            
+        Returns:
+            list: نتيجة لكل عنصر بنفس الترتيب (بدون كائنات النماذج)
+        """
+        keys = [
+            ScanDeduplicator.idempotency_key(scan.get('idempotency_key'), scan['student_code'])
+            for scan in scans
+        ]
+        results = [None] * len(scans)
+        first_positions = {}
+        pending = []
+
+        for position, key in enumerate(keys):
+            if key is not None and key in first_positions:
+                continue
+            replay = ScanDeduplicator.lookup(key)
+            if replay is not None:
+                results[position] = replay
+                continue
+            if key is not None:
+                first_positions[key] = position
+            pending.append(position)
+
+        processed = AttendanceService._process_scan_batch(
+            [scans[position] for position in pending], supervisor
+        )
+        for position, result in zip(pending, processed):
+            results[position] = result
+
+        # نفس المفتاح مكرر داخل الدفعة -> نتيجة العنصر الأول
+        for position, key in enumerate(keys):
+            if results[position] is None:
+                results[position] = {**results[first_positions[key]], 'duplicate_scan': True}
+
+        stored = {key: results[position] for key, position in first_positions.items()}
+        if stored:
+            transaction.on_commit(lambda: [
+                ScanDeduplicator.remember(None, result, idempotency_key=key)
+                for key, result in stored.items()
+            ])
+
+        return results
+
+    @staticmethod
+    def _process_scan_batch(scans, supervisor):
+        """
+        تقييم وتنفيذ عناصر الدفعة التي لم تُعالج من قبل
+        """
+        decisions = [
+            AttendanceService._evaluate_scan(scan['student_code'], scan['scan_time'])
+            for scan in scans
+        ]
+
+        # فحص التسجيل المسبق باستعلام واحد لكل الدفعة
+        attend_keys = {
+            (decision['student'].student_id, decision['session_id'])
+            for decision in decisions
+            if decision['action'] == 'attend'
+        }
+        existing = set()
+        if attend_keys:
+            existing = set(
+                Attendance.objects.filter(
+                    student_id__in={key[0] for key in attend_keys},
+                    session_id__in={key[1] for key in attend_keys}
+                ).values_list('student_id', 'session_id')
+            )
+
+        results = []
+        attendances = []
+        blocked_attempts = []
+
+        # الإشعارات تُنشر دفعة واحدة بعد نجاح المعاملة
+        with NotificationDispatcher.batch():
+            for scan, decision in zip(scans, decisions):
+                current_time = scan['scan_time']
+
+                if decision['action'] == 'attend':
+                    student = decision['student']
+                    enrollment = decision['enrollment']
+                    key = (student.student_id, decision['session_id'])
+
+                    if key in existing:
+                        results.append(AttendanceService._create_duplicate_response(decision))
+                        continue
+
+                    # الخصم الشرطي يلتقط حضوراً سابقاً لنفس التسجيل في الدفعة
+                    credit = AttendanceService.update_payment_sessions(
+                        student, decision['group'], current_time, enrollment=enrollment
+                    )
+                    if credit is not None and not credit['consumed']:
+                        decision = AttendanceService._credit_exhausted_decision(
+                            decision, credit, current_time
+                        )
+
+                if decision['action'] == 'attend':
+                    existing.add(key)
+                    attendances.append(
+                        Attendance(**AttendanceService._attendance_fields(decision, supervisor))
+                    )
+                    AttendanceService._trigger_attendance_success_notification(
+                        student=student,
+                        group=decision['group'],
+                        scan_time=current_time
+                    )
+                elif decision['action'] == 'blocked_time':
+                    blocked_attempts.append(decision['blocked_attempt'])
+                    AttendanceService._trigger_late_block_notification(
+                        student=decision['student'],
+                        group=decision['group'],
+                        time_check=decision['time_check'],
+                        current_time=current_time
+                    )
+                elif decision['action'] == 'blocked_payment':
+                    blocked_attempts.append(decision['blocked_attempt'])
+                    AttendanceService._trigger_financial_block_notification(
+                        student=decision['student'],
+                        group=decision['group'],
+                        financial_check=decision['financial_check'],
+                        enrollment=decision['enrollment']
+                    )
+
+                results.append(decision['response'])
+
+        Attendance.objects.bulk_create(attendances)
+        AuditWriteBuffer.add(BlockedAttempt, blocked_attempts)
+
+        # bulk_create sends no signals - count outcomes and refresh the live monitor once per session
+        increments = {}
+        for attendance in attendances:
+            fields = increments.setdefault(attendance.session_id, {})
+            field = SessionCounterService.field_for_status(attendance.status)
+            fields[field] = fields.get(field, 0) + 1
+        SessionCounterService.record_many(increments)
+        SessionCounterService.record_blocked(blocked_attempts)
+
+        for session_id in {decision['session_id'] for decision in decisions if decision['action'] != 'none'}:
+            LiveMonitorStream.session_changed(session_id)
+
+        return results
+
+    @staticmethod
+    def _evaluate_scan(student_code, current_time, timer=None):
+        """
+        تقييم المسح بدون أي كتابة في قاعدة البيانات
         
+        Args:
+            timer: ScanTimer لقياس الخطوات (اختياري)
+        
+        Returns:
+            dict: {
+                'action': 'none' | 'blocked_time' | 'blocked_payment' | 'attend',
+                'response': استجابة الكشك,
+                'student', 'group', 'enrollment', 'session_id',
+                'time_check', 'financial_check',
+                'blocked_attempt': معاملات BlockedAttempt (للحالات الممنوعة)
+            }
+        """
+        decision = {
+            'action': 'none',
+            'student': None,
+            'group': None,
+            'enrollment': None,
+            'session_id': None,
+            'time_check': None,
+            'financial_check': None,
+            'blocked_attempt': None,
+            'scan_time': current_time,
+        }
+        timer = timer or ScanTimer()
+
         # ========================================
-        # الخطوة 1: التعريف - جلب الطالب
+        # الخطوة 1: التعريف - جلب الطالب (من فهرس اليوم)
         # ========================================
-        try:
-            student = Student.objects.prefetch_related('groups').get(
-                student_code=student_code,
-                is_active=True
-            )
-        except Student.DoesNotExist:
-            return AttendanceService._create_blocked_response(
+        with timer.step('lookup'):
+            roster = RosterIndexService.resolve(student_code, current_time)
+        if roster is None:
+            decision['response'] = AttendanceService._create_blocked_response(
                 student=None,
                 status='blocked_other',
                 color_code='white',
@@ -77,37 +403,29 @@ class AttendanceService:
                 reason='invalid_code',
                 current_time=current_time
             )
+            return decision
+
+        student = roster['student']
+        decision['student'] = student
 
         # ========================================
         # الخطوة 2: مطابقة الجدول
         # ========================================
-        current_day_name = AttendanceService.get_current_day_name()
-
-        # جلب كل المجموعات المسجل فيها الطالب
-        enrollments = StudentGroupEnrollment.objects.filter(
-            student=student,
-            is_active=True
-        ).select_related('group')
-
-        matching_group = None
-        enrollment = None
-
-        # البحث عن المجموعة التي موعدها الآن (نفس اليوم فقط)
-        for enr in enrollments:
-            group = enr.group
-
-            # مطابقة اليوم
-            if group.schedule_day != current_day_name:
-                continue
+        with timer.step('schedule'):
+            # البحث عن المجموعة التي موعدها الآن من جدول الأسبوع المُجمّع
+            enrollments = {enr.group_id: enr for enr in roster['enrollments']}
+            group_id = ScheduleIndexService.pick_group(
+                enrollments,
+                current_time,
+                lead_minutes=AttendanceService.EARLY_ARRIVAL_LIMIT_MINUTES
+            )
 
-            # هذه هي المجموعة المطابقة لليوم
-            matching_group = group
-            enrollment = enr
-            break
+            enrollment = enrollments.get(group_id)
+            matching_group = enrollment.group if enrollment else None
 
         if not matching_group:
             # لا توجد حصة مجدولة
-            return AttendanceService._create_blocked_response(
+            decision['response'] = AttendanceService._create_blocked_response(
                 student=student,
                 status='no_session',
                 color_code='white',
@@ -117,57 +435,65 @@ class AttendanceService:
                 reason='no_session',
                 current_time=current_time
             )
+            return decision
+
+        decision['group'] = matching_group
+        decision['enrollment'] = enrollment
 
         # ========================================
         # الخطوة 2.5: فحص إلغاء الحصة (CRITICAL CHECK)
         # ========================================
-        # Get or create session for today
-        session, _ = Session.objects.get_or_create(
-            group=matching_group,
-            session_date=current_time.date()
-        )
+        with timer.step('session'):
+            session = roster['sessions'].get(matching_group.group_id)
+            if session is None:
+                # Not pre-materialized yet (see SessionService.materialize_sessions)
+                created_session = SessionService.get_session(
+                    matching_group.group_id,
+                    timezone.localtime(current_time).date()
+                )
+                session = {
+                    'session_id': created_session.session_id,
+                    'is_cancelled': created_session.is_cancelled,
+                    'cancellation_reason': created_session.cancellation_reason,
+                }
+        decision['session_id'] = session['session_id']
         
         # Check if session is cancelled
-        if session.is_cancelled:
-            return AttendanceService._create_blocked_response(
+        if session['is_cancelled']:
+            decision['response'] = AttendanceService._create_blocked_response(
                 student=student,
                 status='no_session',
                 color_code='white',
                 allow_entry=False,
-                message=f'تم إلغاء الحصة اليوم\n{session.cancellation_reason}',
+                message=f'تم إلغاء الحصة اليوم\n{session["cancellation_reason"]}',
                 minutes_late=0,
                 reason='session_cancelled',
                 current_time=current_time,
                 group_name=matching_group.group_name
             )
+            return decision
 
         # ========================================
         # الخطوة 3: فحص الوقت الصارم (STRICT MODE)
         # ========================================
-        time_check = AttendanceService._check_strict_time(
-            current_time,
-            matching_group.schedule_time
-        )
+        with timer.step('time_check'):
+            time_check = AttendanceService._check_strict_time(
+                current_time,
+                matching_group.schedule_time
+            )
+        decision['time_check'] = time_check
 
         if not time_check['allowed']:
-            # تسجيل محاولة الدخول الممنوعة
-            AttendanceService._create_blocked_attempt(
+            decision['action'] = 'blocked_time'
+            decision['blocked_attempt'] = AttendanceService._blocked_attempt_fields(
                 student=student,
                 group=matching_group,
+                session_id=decision['session_id'],
                 reason=time_check['reason_code'],
                 minutes_late=time_check['minutes_late'],
                 current_time=current_time
             )
-            
-            # إرسال إخطار WhatsApp لولي الأمر (Async - لا يمنع عملية المسح)
-            AttendanceService._trigger_late_block_notification(
-                student=student,
-                group=matching_group,
-                time_check=time_check,
-                current_time=current_time
-            )
-            
-            return AttendanceService._create_blocked_response(
+            decision['response'] = AttendanceService._create_blocked_response(
                 student=student,
                 status=time_check['status'],
                 color_code='red',
@@ -178,95 +504,118 @@ class AttendanceService:
                 current_time=current_time,
                 group_name=matching_group.group_name
             )
+            return decision
 
         # ========================================
         # الخطوة 4: الفحص المالي
         # ========================================
-        financial_check = AttendanceService._check_financial_status(
-            student,
-            matching_group
-        )
+        with timer.step('credit_check'):
+            financial_check = AttendanceService._check_financial_status(
+                student,
+                matching_group,
+                enrollment=enrollment
+            )
 
         if not financial_check['allowed']:
-            # تسجيل محاولة الدخول الممنوعة (مالية)
-            AttendanceService._create_blocked_attempt(
+            return AttendanceService._payment_blocked_decision(
+                decision, financial_check, current_time
+            )
+
+        decision['action'] = 'attend'
+        decision['response'] = {
+            'success': True,
+            'status': 'present',
+            'color_code': 'green',
+            'allow_entry': True,
+            'message': f'مرحباً {student.full_name} - {matching_group.group_name}',
+            'student_name': student.full_name,
+            'minutes_late': time_check['minutes_late'],
+            'time': current_time.strftime('%H:%M:%S'),
+        }
+        return decision
+
+    @staticmethod
+    def _payment_blocked_decision(decision, financial_check, current_time):
+        """
+        تحويل القرار إلى منع مالي (🟡)
+        """
+        student = decision['student']
+        group = decision['group']
+        minutes_late = decision['time_check']['minutes_late']
+
+        decision.update({
+            'action': 'blocked_payment',
+            'financial_check': financial_check,
+            'blocked_attempt': AttendanceService._blocked_attempt_fields(
                 student=student,
-                group=matching_group,
+                group=group,
+                session_id=decision['session_id'],
                 reason='payment',
-                minutes_late=time_check['minutes_late'],
+                minutes_late=minutes_late,
                 current_time=current_time
-            )
-            
-            # إرسال إخطار WhatsApp للحظر المالي (Async)
-            AttendanceService._trigger_financial_block_notification(
-                student=student,
-                group=matching_group,
-                financial_check=financial_check
-            )
-            
-            return AttendanceService._create_blocked_response(
+            ),
+            'response': AttendanceService._create_blocked_response(
                 student=student,
                 status='blocked_payment',
                 color_code='yellow',
                 allow_entry=False,
                 message=financial_check['message'],
-                minutes_late=time_check['minutes_late'],
+                minutes_late=minutes_late,
                 reason='payment',
                 current_time=current_time,
-                group_name=matching_group.group_name
-            )
-
-        # ========================================
-        # التسجيل النهائي (حضور مسموح)
-        # ========================================
-        # Session already retrieved in step 2.5, no need to get_or_create again
+                group_name=group.group_name
+            ),
+        })
+        return decision
 
-        # التحقق من عدم التسجيل المسبق
-        if Attendance.objects.filter(student=student, session=session).exists():
-            return {
-                'success': False,
-                'status': 'blocked_other',
-                'color_code': 'gray',
-                'allow_entry': False,
-                'message': 'تم تسجيل الحضور مسبقاً',
-                'student_name': student.full_name,
-                'minutes_late': time_check['minutes_late']
-            }
+    @staticmethod
+    def _credit_exhausted_decision(decision, credit, current_time):
+        """
+        فشل الخصم الشرطي (نفد الائتمان بعد الفحص المتفائل)
+        إعادة تقييم الحالة المالية بالعدادات الجديدة
+        """
+        enrollment = decision['enrollment']
+        for field in ('sessions_attended', 'sessions_paid_for', 'credit_balance'):
+            setattr(enrollment, field, credit[field])
 
-        # تسجيل الحضور
-        attendance = Attendance.objects.create(
-            student=student,
-            session=session,
-            scan_time=current_time,
-            status='present',
-            color_code='green',
-            allow_entry=True,
-            minutes_late=time_check['minutes_late'],
-            supervisor=supervisor
+        financial_check = AttendanceService._check_financial_status(
+            decision['student'],
+            decision['group'],
+            enrollment=enrollment
         )
-
-        # تحديث عدد الحصص في Payment
-        AttendanceService.update_payment_sessions(student, matching_group)
-
-        # إرسال إشعار الحضور الناجح (Async - لا يمنع عملية المسح)
-        AttendanceService._trigger_attendance_success_notification(
-            student=student,
-            group=matching_group,
-            scan_time=current_time
+        return AttendanceService._payment_blocked_decision(
+            decision, financial_check, current_time
         )
 
+    @staticmethod
+    def _attendance_fields(decision, supervisor):
+        """
+        حقول سجل الحضور الناجح
+        """
         return {
-            'success': True,
+            'student': decision['student'],
+            'session_id': decision['session_id'],
+            'scan_time': decision['scan_time'],
             'status': 'present',
             'color_code': 'green',
             'allow_entry': True,
-            'message': f'مرحباً {student.full_name} - {matching_group.group_name}',
-            'student_name': student.full_name,
-            'minutes_late': time_check['minutes_late'],
-            'time': current_time.strftime('%H:%M:%S'),
-            'student': student,
-            'group': matching_group,
-            'attendance': attendance
+            'minutes_late': decision['time_check']['minutes_late'],
+            'supervisor': supervisor,
+        }
+
+    @staticmethod
+    def _create_duplicate_response(decision):
+        """
+        استجابة التسجيل المكرر (⚪ رمادي)
+        """
+        return {
+            'success': False,
+            'status': 'blocked_other',
+            'color_code': 'gray',
+            'allow_entry': False,
+            'message': 'تم تسجيل الحضور مسبقاً',
+            'student_name': decision['student'].full_name,
+            'minutes_late': decision['time_check']['minutes_late']
         }
 
     @staticmethod
@@ -292,10 +641,10 @@ class AttendanceService:
                 'reason_code': str
             }
         """
-        # تحويل schedule_time إلى datetime
-        today = timezone.now().date()
+        # تحويل schedule_time إلى datetime (بتاريخ المسح المحلي)
+        scan_date = timezone.localtime(scan_time).date()
         session_start = timezone.make_aware(
-            datetime.combine(today, schedule_time)
+            datetime.combine(scan_date, schedule_time)
         )
 
         # حساب الفرق بالدقائق
@@ -342,7 +691,7 @@ class AttendanceService:
         }
 
     @staticmethod
-    def _check_financial_status(student, group):
+    def _check_financial_status(student, group, enrollment=None):
         """
         فحص الحالة المالية للطالب باستخدام نظام الائتمان الجديد
         
@@ -351,20 +700,21 @@ class AttendanceService:
         - الطلاب القدامى: يمكنهم حضور حصتين بدون دفع
         - الحصة الثالثة بدون دفع = حظر تلقائي
         
+        Args:
+            enrollment: لقطة الائتمان من فهرس اليوم (اختياري) - تُغني عن استعلام قاعدة البيانات
+        
         Returns:
-            dict: {'allowed': bool, 'message': str}
+            dict: {'allowed': bool, 'reason': str, 'message': str}
         """
-        # استخدام CreditService للفحص
-        credit_check = CreditService.check_credit_status(student, group)
-        
-        if not credit_check['allowed']:
-            # إرسال إخطار WhatsApp للحظر المالي
-            AttendanceService._send_financial_block_notification(
-                student, group, credit_check['reason']
-            )
+        if enrollment is not None:
+            credit_check = enrollment.can_attend_session()
+        else:
+            # استخدام CreditService للفحص
+            credit_check = CreditService.check_credit_status(student, group)
         
         return {
             'allowed': credit_check['allowed'],
+            'reason': credit_check['reason'],
             'message': credit_check['message']
         }
 
@@ -389,19 +739,20 @@ class AttendanceService:
         }
 
     @staticmethod
-    def _create_blocked_attempt(student, group, reason, minutes_late, current_time):
+    def _blocked_attempt_fields(student, group, session_id, reason, minutes_late, current_time):
         """
-        تسجيل محاولة دخول ممنوعة في سجل التدقيق
+        حقول سجل محاولة الدخول الممنوعة (سجل التدقيق)
+        مشتركة بين الإدراج الفردي والجماعي
         """
-        BlockedAttempt.objects.create(
-            student=student,
-            session=None,  # Will be linked if session exists
-            attempt_time=current_time,
-            reason=reason,
-            minutes_late=minutes_late,
-            group_name=group.group_name,
-            scheduled_time=group.schedule_time
-        )
+        return {
+            'student_id': student.student_id,
+            'session_id': session_id,
+            'attempt_time': current_time,
+            'reason': reason,
+            'minutes_late': minutes_late,
+            'group_name': group.group_name,
+            'scheduled_time': group.schedule_time,
+        }
 
     @staticmethod
     def _trigger_attendance_success_notification(student, group, scan_time):
@@ -412,7 +763,8 @@ class AttendanceService:
         Trigger: Student scans QR, status = present, allow_entry = true
         """
         try:
-            send_attendance_success_task.delay(
+            NotificationDispatcher.dispatch(
+                send_attendance_success_task,
                 student_id=student.student_id,
                 group_id=group.group_id,
                 scan_time_str=scan_time.isoformat()
@@ -433,7 +785,8 @@ class AttendanceService:
             scheduled_time_str = group.schedule_time.strftime('%H:%M')
             scan_time_str = current_time.strftime('%H:%M')
             
-            send_late_block_task.delay(
+            NotificationDispatcher.dispatch(
+                send_late_block_task,
                 student_id=student.student_id,
                 group_id=group.group_id,
                 minutes_late=time_check['minutes_late'],
@@ -445,7 +798,7 @@ class AttendanceService:
             print(f"Failed to queue late block notification: {e}")
 
     @staticmethod
-    def _trigger_financial_block_notification(student, group, financial_check):
+    def _trigger_financial_block_notification(student, group, financial_check, enrollment=None):
         """
         Trigger async notification for financial block
         
@@ -460,33 +813,39 @@ class AttendanceService:
             
             if reason == 'new_student_no_payment':
                 # 🟡 FINANCIAL BLOCK (New Student)
-                send_financial_block_new_task.delay(
+                NotificationDispatcher.dispatch(
+                    send_financial_block_new_task,
                     student_id=student.student_id,
                     group_id=group.group_id
                 )
             elif reason in ['credit_exceeded', 'debt_exceeded']:
                 # 🟡 FINANCIAL BLOCK (Debt Exceeded)
-                enrollment = StudentGroupEnrollment.objects.get(
-                    student=student,
-                    group=group
-                )
+                if enrollment is None:
+                    enrollment = StudentGroupEnrollment.objects.get(
+                        student=student,
+                        group=group
+                    )
                 unpaid_sessions = enrollment.sessions_attended - enrollment.sessions_paid_for
                 due_amount = enrollment.get_effective_fee() * unpaid_sessions
                 
-                send_financial_block_debt_task.delay(
+                NotificationDispatcher.dispatch(
+                    send_financial_block_debt_task,
                     student_id=student.student_id,
                     group_id=group.group_id,
                     unpaid_sessions=unpaid_sessions,
-                    due_amount=due_amount
+                    due_amount=float(due_amount)  # Celery JSON serializer
                 )
         except Exception as e:
             # Don't block attendance if notification task fails
             print(f"Failed to queue financial block notification: {e}")
 
     @staticmethod
-    def get_current_day_name():
+    def get_current_day_name(at=None):
         """
         الحصول على اسم اليوم الحالي بالإنجليزي
+        
+        Args:
+            at: وقت مرجعي (افتراضياً: الآن)
         """
         days_map = {
             0: 'Monday',
@@ -497,28 +856,166 @@ class AttendanceService:
             5: 'Saturday',
             6: 'Sunday',
         }
-        today = timezone.now().weekday()
+        today = timezone.localtime(at or timezone.now()).weekday()
         return days_map.get(today)
 
     @staticmethod
-    def update_payment_sessions(student, group):
+    def update_payment_sessions(student, group, scan_time=None, enrollment=None):
         """
         تحديث عدد الحصص في سجل المدفوعات ونظام الائتمان
+        
+        Args:
+            scan_time: وقت المسح - يحدد الشهر (افتراضياً: الآن)
+            enrollment: التسجيل من فهرس اليوم (اختياري)
+            
+        Returns:
+            dict | None: نتيجة CreditService.record_attendance_and_update_credit
         """
-        # تحديث نظام الائتمان
-        CreditService.record_attendance_and_update_credit(student, group)
+        # تحديث نظام الائتمان (تحديث شرطي واحد)
+        credit = CreditService.record_attendance_and_update_credit(
+            student,
+            group,
+            enrollment_id=enrollment.pk if enrollment is not None else None
+        )
+        if credit is not None and not credit['consumed']:
+            return credit
         
         # تحديث سجل المدفوعات الشهري
-        current_month = timezone.now().replace(day=1)
-        payment = Payment.objects.filter(
+        current_month = timezone.localdate(scan_time or timezone.now()).replace(day=1)
+        Payment.objects.filter(
             student=student,
             group=group,
             month=current_month
-        ).first()
+        ).update(
+            sessions_attended=F('sessions_attended') + 1,
+            updated_at=timezone.now()
+        )
+        
+        return credit
+
+
+class SessionService:
+    """
+    خدمة تجهيز الحصص اليومية
+    Pre-materializes today's Session rows so the scan path only reads them
+    """
+
+    CACHE_PREFIX = 'session_id'
+    # Keys are per date; keep them a little past midnight
+    CACHE_TIMEOUT = 60 * 60 * 36
+
+    DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+    @staticmethod
+    def _cache_key(group_id, session_date):
+        return f'{SessionService.CACHE_PREFIX}:{group_id}:{session_date.isoformat()}'
+
+    @staticmethod
+    def materialize_sessions(session_date=None):
+        """
+        إنشاء حصص اليوم لكل المجموعات النشطة مسبقاً
+        
+        Args:
+            session_date: التاريخ (افتراضياً: اليوم)
+            
+        Returns:
+            dict: {'date': str, 'groups': int, 'created': int}
+        """
+        from apps.teachers.models import Group
+        
+        session_date = session_date or timezone.localdate()
+        day_name = SessionService.DAY_NAMES[session_date.weekday()]
+
+        group_ids = list(
+            Group.objects.filter(
+                schedule_day=day_name,
+                is_active=True
+            ).values_list('group_id', flat=True)
+        )
+
+        existing_before = Session.objects.filter(
+            session_date=session_date,
+            group_id__in=group_ids
+        ).count()
+
+        Session.objects.bulk_create(
+            [Session(group_id=group_id, session_date=session_date) for group_id in group_ids],
+            ignore_conflicts=True
+        )
+
+        session_ids = SessionService.prime_cache(session_date, group_ids)
+
+        # bulk_create does not send post_save - refresh the scan index explicitly
+        RosterIndexService.invalidate_sessions()
+
+        return {
+            'date': session_date.isoformat(),
+            'groups': len(group_ids),
+            'created': len(session_ids) - existing_before,
+        }
+
+    @staticmethod
+    def prime_cache(session_date, group_ids=None):
+        """
+        تحميل أرقام الحصص في الكاش بمفتاح (group_id, date)
         
-        if payment:
-            payment.sessions_attended += 1
-            payment.save()
+        Returns:
+            dict: {group_id: session_id}
+        """
+        sessions = Session.objects.filter(session_date=session_date)
+        if group_ids is not None:
+            sessions = sessions.filter(group_id__in=group_ids)
+
+        session_ids = dict(sessions.values_list('group_id', 'session_id'))
+        cache.set_many(
+            {
+                SessionService._cache_key(group_id, session_date): session_id
+                for group_id, session_id in session_ids.items()
+            },
+            SessionService.CACHE_TIMEOUT
+        )
+        return session_ids
+
+    @staticmethod
+    def get_session_id(group_id, session_date=None):
+        """
+        الحصول على رقم الحصة (قراءة فقط في الحالة العادية)
+        يرجع إلى get_or_create فقط إذا لم تُجهّز الحصة مسبقاً
+        """
+        session_date = session_date or timezone.localdate()
+        key = SessionService._cache_key(group_id, session_date)
+
+        session_id = cache.get(key)
+        if session_id is not None:
+            return session_id
+
+        session_id = Session.objects.filter(
+            group_id=group_id,
+            session_date=session_date
+        ).values_list('session_id', flat=True).first()
+
+        if session_id is None:
+            session, _ = Session.objects.get_or_create(
+                group_id=group_id,
+                session_date=session_date
+            )
+            session_id = session.session_id
+
+        cache.set(key, session_id, SessionService.CACHE_TIMEOUT)
+        return session_id
+
+    @staticmethod
+    def get_session(group_id, session_date=None):
+        """
+        الحصول على كائن الحصة عبر رقمها المخزن
+        """
+        session_id = SessionService.get_session_id(group_id, session_date)
+        return Session.objects.select_related('group').get(pk=session_id)
+
+    @staticmethod
+    def forget_session(group_id, session_date):
+        """حذف رقم الحصة من الكاش (عند حذف الحصة)"""
+        cache.delete(SessionService._cache_key(group_id, session_date))
 
 
 class AttendanceReportService:
@@ -529,19 +1026,24 @@ class AttendanceReportService:
     @staticmethod
     def get_session_statistics(session_id):
         """
-        الحصول على إحصائيات الحصة
+        الحصول على إحصائيات الحصة (من العدادات التزايدية)
         """
-        session = Session.objects.get(pk=session_id)
-        attendances = session.attendances.all()
+        counters = SessionCounterService.get(session_id)
+        if counters is None:
+            raise Session.DoesNotExist(f'Session {session_id} does not exist')
+        
+        blocked = sum(counters[field] for field in SessionCounterService.OUTCOME_FIELDS if field != 'present')
         
         return {
-            'total': attendances.count(),
-            'present': attendances.filter(status='present', allow_entry=True).count(),
-            'blocked': attendances.filter(allow_entry=False).count(),
-            'late_blocked': attendances.filter(status='late_blocked').count(),
-            'very_late': attendances.filter(status='very_late').count(),
-            'payment_blocked': attendances.filter(status='blocked_payment').count(),
-            'no_session': attendances.filter(status='no_session').count(),
+            'total': counters['present'] + blocked,
+            'present': counters['present'],
+            'blocked': blocked,
+            'late_blocked': counters['late_blocked'],
+            'very_late': counters['very_late'],
+            'payment_blocked': counters['blocked_payment'],
+            'other_blocked': counters['blocked_other'],
+            'teacher_attended': bool(counters['teacher_attended']),
+            'is_cancelled': bool(counters['is_cancelled']),
         }
     
     @staticmethod
@@ -0,0 +1,426 @@
+"""
+Per-Session Counters
+عدادات الحصة المحدّثة تزايدياً
+
+Live dashboards used to re-aggregate Attendance rows on every refresh.
+Instead each session keeps a small hash of counters (present, late_blocked,
+very_late, blocked_payment, blocked_other, teacher_attended, is_cancelled)
+that is bumped after commit whenever a scan records an outcome, a teacher
+checks in or a session is cancelled. Readers get the numbers in O(1).
+
+Counters live in the shared cache (Redis HINCRBY when available) rather
+than in a stats table: every scan of a session would otherwise update the
+same row and serialize on its lock. The rows stay the source of truth -
+a missing hash is rebuilt from them on read, and reconcile() periodically
+rewrites today's counters to remove any drift (lost increments, admin
+edits, audit rows that were still buffered).
+
+Blocked counters count students, not attempts: a student who scans three
+times after being refused is one late_blocked, both live (record_blocked)
+and when rebuilt from the BlockedAttempt rows.
+"""
+
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class SessionCounterService:
+    """
+    عدادات الحضور والمنع لكل حصة
+    """
+
+    CACHE_PREFIX = 'session_counters'
+    CACHE_TIMEOUT = 60 * 60 * 48
+
+    OUTCOME_FIELDS = ['present', 'late_blocked', 'very_late', 'blocked_payment', 'blocked_other']
+    FLAG_FIELDS = ['teacher_attended', 'is_cancelled']
+
+    # Attendance.status -> counter
+    ATTENDANCE_STATUS_FIELDS = {
+        'present': 'present',
+        'late_blocked': 'late_blocked',
+        'very_late': 'very_late',
+        'blocked_payment': 'blocked_payment',
+        'no_session': 'blocked_other',
+        'blocked_other': 'blocked_other',
+    }
+
+    # BlockedAttempt.reason -> counter (anything else, e.g. too_early, is blocked_other)
+    BLOCKED_REASON_FIELDS = {
+        'late': 'late_blocked',
+        'very_late': 'very_late',
+        'payment': 'blocked_payment',
+    }
+
+    # Marks a hash written by a rebuild; a hash without it only holds
+    # increments that raced an expiry and is rebuilt from the rows
+    BUILT_FIELD = '_built'
+
+    # ========================================
+    # Writing (after commit)
+    # ========================================
+
+    @classmethod
+    def field_for_status(cls, status: str) -> str:
+        return cls.ATTENDANCE_STATUS_FIELDS.get(status, 'blocked_other')
+
+    @classmethod
+    def field_for_reason(cls, reason: str) -> str:
+        return cls.BLOCKED_REASON_FIELDS.get(reason, 'blocked_other')
+
+    @classmethod
+    def record(cls, session_id: Optional[int], field: str, amount: int = 1) -> None:
+        """
+        زيادة عداد نتيجة مسح بعد نجاح المعاملة
+        """
+        if session_id:
+            cls.record_many({session_id: {field: amount}})
+
+    @classmethod
+    def record_many(cls, increments: Dict[int, Dict[str, int]]) -> None:
+        """
+        زيادة عدة عدادات لعدة حصص دفعة واحدة
+
+        Args:
+            increments: {session_id: {field: amount}}
+        """
+        increments = {
+            session_id: fields
+            for session_id, fields in increments.items()
+            if session_id and fields
+        }
+        if increments:
+            transaction.on_commit(lambda: cls._safely(cls._increment, increments))
+
+    @classmethod
+    def record_blocked(cls, attempts: Iterable[Dict[str, Any]]) -> None:
+        """
+        عدّ المحاولات الممنوعة بعد نجاح المعاملة - كل طالب مرة واحدة لكل حصة وسبب
+
+        Args:
+            attempts: صفوف BlockedAttempt ({'session_id', 'student_id', 'reason', ...})
+        """
+        attempts = [
+            (attempt['session_id'], attempt['student_id'], cls.field_for_reason(attempt['reason']))
+            for attempt in attempts
+            if attempt.get('session_id')
+        ]
+        if attempts:
+            transaction.on_commit(lambda: cls._safely(cls._increment_blocked, attempts))
+
+    @classmethod
+    def set_flags(cls, session_id: Optional[int], **flags: bool) -> None:
+        """
+        تحديث حالة الحصة (حضور المدرس / الإلغاء) بعد نجاح المعاملة
+        """
+        if session_id:
+            values = {field: int(bool(value)) for field, value in flags.items()}
+            transaction.on_commit(lambda: cls._safely(cls._set_flags, session_id, values))
+
+    @classmethod
+    def invalidate(cls, session_id: Optional[int]) -> None:
+        """
+        حذف العدادات (تعديل أو حذف سجل) - تُعاد من الجداول عند القراءة التالية
+        """
+        if session_id:
+            transaction.on_commit(lambda: cls._safely(cls._delete, session_id))
+
+    @classmethod
+    def _increment(cls, increments: Dict[int, Dict[str, int]]) -> None:
+        redis = cls._get_redis()
+        if redis is not None:
+            pipe = redis.pipeline(transaction=False)
+            for session_id, fields in increments.items():
+                key = cls._key(session_id)
+                for field, amount in fields.items():
+                    pipe.hincrby(key, field, amount)
+                pipe.expire(key, cls.CACHE_TIMEOUT)
+            pipe.execute()
+            return
+
+        # Fallback for non-Redis caches (best effort, not atomic).
+        # Only built entries are bumped - a missing one is rebuilt on read.
+        keys = {cls._key(session_id): fields for session_id, fields in increments.items()}
+        found = cache.get_many(list(keys))
+        for key, data in found.items():
+            for field, amount in keys[key].items():
+                data[field] = data.get(field, 0) + amount
+        if found:
+            cache.set_many(found, cls.CACHE_TIMEOUT)
+
+    @classmethod
+    def _increment_blocked(cls, attempts: List[tuple]) -> None:
+        increments = {}
+        for session_id, student_id, field in dict.fromkeys(attempts):
+            # Only the student's first refusal for this session and reason counts
+            if cache.add(cls._blocked_key(session_id, field, student_id), 1, cls.CACHE_TIMEOUT):
+                fields = increments.setdefault(session_id, {})
+                fields[field] = fields.get(field, 0) + 1
+        if increments:
+            cls._increment(increments)
+
+    @classmethod
+    def _set_flags(cls, session_id: int, values: Dict[str, int]) -> None:
+        key = cls._key(session_id)
+        redis = cls._get_redis()
+        if redis is not None:
+            pipe = redis.pipeline(transaction=False)
+            pipe.hset(key, mapping=values)
+            pipe.expire(key, cls.CACHE_TIMEOUT)
+            pipe.execute()
+            return
+
+        data = cache.get(key)
+        if data is not None:
+            data.update(values)
+            cache.set(key, data, cls.CACHE_TIMEOUT)
+
+    @classmethod
+    def _delete(cls, session_id: int) -> None:
+        key = cls._key(session_id)
+        redis = cls._get_redis()
+        if redis is not None:
+            redis.delete(key)
+        else:
+            cache.delete(key)
+
+    @staticmethod
+    def _safely(func, *args) -> None:
+        # Counters must never break a scan; reconciliation repairs a lost update
+        try:
+            func(*args)
+        except Exception:
+            logger.exception("Failed to update session counters")
+
+    # ========================================
+    # Reading
+    # ========================================
+
+    @classmethod
+    def get(cls, session_id: int) -> Optional[Dict[str, int]]:
+        """
+        عدادات حصة واحدة
+
+        Returns:
+            dict بالعدادات أو None إذا لم تكن الحصة موجودة
+        """
+        return cls.get_many([session_id]).get(session_id)
+
+    @classmethod
+    def get_many(cls, session_ids: Iterable[int]) -> Dict[int, Dict[str, int]]:
+        """
+        عدادات عدة حصص بقراءة واحدة من الكاش
+        (الحصص غير المبنية تُحسب من الجداول باستعلام واحد)
+
+        Returns:
+            {session_id: counters} - الحصص غير الموجودة لا تظهر
+        """
+        session_ids = list(dict.fromkeys(session_ids))
+        if not session_ids:
+            return {}
+
+        counters = cls._load(session_ids)
+        missing = [session_id for session_id in session_ids if session_id not in counters]
+        if missing:
+            counters.update(cls.rebuild(missing))
+        return counters
+
+    @classmethod
+    def get_for_groups(cls, group_ids: Iterable[int], session_date=None) -> Dict[int, Dict[str, int]]:
+        """
+        عدادات حصص مجموعات في تاريخ معين (للشاشة الحية)
+
+        Session ids come from SessionService's (group_id, date) cache; groups
+        without a session yet are simply absent (nothing is created).
+
+        Returns:
+            {group_id: counters}
+        """
+        from .services import SessionService
+
+        session_date = session_date or timezone.localdate()
+        group_ids = list(dict.fromkeys(group_ids))
+        if not group_ids:
+            return {}
+
+        keys = {SessionService._cache_key(group_id, session_date): group_id for group_id in group_ids}
+        session_ids = {keys[key]: session_id for key, session_id in cache.get_many(list(keys)).items()}
+
+        counters = cls._load(list(session_ids.values())) if session_ids else {}
+        result = {
+            group_id: counters[session_id]
+            for group_id, session_id in session_ids.items()
+            if session_id in counters
+        }
+
+        missing = [group_id for group_id in group_ids if group_id not in result]
+        if missing:
+            for counter in cls._compute(group_ids=missing, session_date=session_date).values():
+                result[counter['group_id']] = counter
+        return result
+
+    # ========================================
+    # Rebuilding / reconciliation
+    # ========================================
+
+    @classmethod
+    def rebuild(cls, session_ids: List[int]) -> Dict[int, Dict[str, int]]:
+        """
+        إعادة بناء العدادات من سجلات Attendance و BlockedAttempt
+        """
+        return cls._compute(session_ids=session_ids)
+
+    @classmethod
+    def reconcile(cls, session_date=None) -> Dict[str, Any]:
+        """
+        إعادة كتابة عدادات كل حصص اليوم من الجداول (تصحيح الانحراف)
+
+        Returns:
+            dict: {'date': str, 'sessions': int, 'drifted': int}
+        """
+        session_date = session_date or timezone.localdate()
+
+        session_ids = cls._session_ids_for_date(session_date)
+        stored = cls._load(session_ids) if session_ids else {}
+        fresh = cls._compute(session_date=session_date)
+
+        drifted = sum(
+            1 for session_id, counters in fresh.items()
+            if session_id in stored and stored[session_id] != counters
+        )
+        if drifted:
+            logger.warning(f"Corrected drifted counters for {drifted} sessions on {session_date}")
+
+        return {
+            'date': session_date.isoformat(),
+            'sessions': len(fresh),
+            'drifted': drifted,
+        }
+
+    @classmethod
+    def _compute(cls, session_ids=None, group_ids=None, session_date=None) -> Dict[int, Dict[str, int]]:
+        """
+        حساب العدادات باستعلام واحد وتخزينها
+
+        Returns:
+            {session_id: counters}
+        """
+        from .models import Session
+
+        sessions = Session.objects.all()
+        if session_ids is not None:
+            sessions = sessions.filter(pk__in=session_ids)
+        if group_ids is not None:
+            sessions = sessions.filter(group_id__in=group_ids)
+        if session_date is not None:
+            sessions = sessions.filter(session_date=session_date)
+
+        annotations = {}
+        for field in cls.OUTCOME_FIELDS:
+            statuses = [status for status, target in cls.ATTENDANCE_STATUS_FIELDS.items() if target == field]
+            annotations[f'attended_{field}'] = Count(
+                'attendances', filter=Q(attendances__status__in=statuses), distinct=True
+            )
+            if field == 'blocked_other':
+                reasons = Q(blocked_attempts__isnull=False) & ~Q(
+                    blocked_attempts__reason__in=list(cls.BLOCKED_REASON_FIELDS)
+                )
+            else:
+                reasons = Q(blocked_attempts__reason__in=[
+                    reason for reason, target in cls.BLOCKED_REASON_FIELDS.items() if target == field
+                ])
+            annotations[f'blocked_{field}'] = Count(
+                'blocked_attempts__student_id', filter=reasons, distinct=True
+            )
+
+        rows = sessions.order_by().values(
+            'session_id', 'group_id', 'teacher_attended', 'is_cancelled'
+        ).annotate(**annotations)
+
+        counters = {}
+        for row in rows:
+            counter = {
+                field: row[f'attended_{field}'] + row[f'blocked_{field}']
+                for field in cls.OUTCOME_FIELDS
+            }
+            counter['teacher_attended'] = int(row['teacher_attended'])
+            counter['is_cancelled'] = int(row['is_cancelled'])
+            counter['group_id'] = row['group_id']
+            counters[row['session_id']] = counter
+
+        if counters:
+            cls._safely(cls._store, counters)
+        return counters
+
+    @staticmethod
+    def _session_ids_for_date(session_date) -> List[int]:
+        from .models import Session
+        return list(
+            Session.objects.filter(session_date=session_date).values_list('session_id', flat=True)
+        )
+
+    # ========================================
+    # Storage
+    # ========================================
+
+    @classmethod
+    def _store(cls, counters: Dict[int, Dict[str, int]]) -> None:
+        redis = cls._get_redis()
+        if redis is not None:
+            pipe = redis.pipeline(transaction=False)
+            for session_id, counter in counters.items():
+                key = cls._key(session_id)
+                pipe.hset(key, mapping={**counter, cls.BUILT_FIELD: 1})
+                pipe.expire(key, cls.CACHE_TIMEOUT)
+            pipe.execute()
+            return
+
+        cache.set_many(
+            {cls._key(session_id): dict(counter) for session_id, counter in counters.items()},
+            cls.CACHE_TIMEOUT
+        )
+
+    @classmethod
+    def _load(cls, session_ids: List[int]) -> Dict[int, Dict[str, int]]:
+        """Built counters found in the cache (misses are left out)"""
+        try:
+            redis = cls._get_redis()
+            if redis is not None:
+                pipe = redis.pipeline(transaction=False)
+                for session_id in session_ids:
+                    pipe.hgetall(cls._key(session_id))
+                counters = {}
+                for session_id, raw in zip(session_ids, pipe.execute()):
+                    data = {field.decode(): int(value) for field, value in raw.items()}
+                    if data.pop(cls.BUILT_FIELD, None):
+                        counters[session_id] = data
+                return counters
+
+            keys = {cls._key(session_id): session_id for session_id in session_ids}
+            return {keys[key]: data for key, data in cache.get_many(list(keys)).items()}
+        except Exception:
+            logger.exception("Failed to read session counters")
+            return {}
+
+    @classmethod
+    def _key(cls, session_id: int) -> str:
+        return f'{cls.CACHE_PREFIX}:{session_id}'
+
+    @classmethod
+    def _blocked_key(cls, session_id: int, field: str, student_id: int) -> str:
+        return f'{cls.CACHE_PREFIX}:blocked:{session_id}:{field}:{student_id}'
+
+    @staticmethod
+    def _get_redis():
+        try:
+            from django_redis import get_redis_connection
+            return get_redis_connection('default')
+        except Exception:
+            return None
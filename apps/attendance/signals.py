@@ -0,0 +1,141 @@
+"""
+Signals for Attendance app - keep the scan roster and schedule indexes in sync
+"""
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from apps.students.models import Student, StudentGroupEnrollment
+from apps.teachers.models import Group
+from .models import Session, Attendance, BlockedAttempt, MonitorChannel, KioskDevice
+from .roster_index import RosterIndexService
+from .schedule_index import ScheduleIndexService
+from .live_stream import LiveMonitorStream
+from .session_counters import SessionCounterService
+from .scan_metrics import ScanMetrics
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def invalidate_roster_index(sender, instance, **kwargs):
+    """
+    Schedule or student identity changed - rebuild the index lazily.
+    Student is included because a changed student_code must stop resolving.
+    """
+    RosterIndexService.invalidate_all()
+
+
+@receiver(post_save, sender=Session)
+@receiver(post_delete, sender=Session)
+def invalidate_roster_sessions(sender, instance, **kwargs):
+    """
+    Session created, cancelled or deleted - rebuild only the group/session
+    table; cached student entries stay valid
+    """
+    RosterIndexService.invalidate_sessions()
+
+
+@receiver(post_save, sender=StudentGroupEnrollment)
+@receiver(post_delete, sender=StudentGroupEnrollment)
+def invalidate_student_roster_entry(sender, instance, **kwargs):
+    """
+    Enrollment or credit counters changed - drop only this student's entry
+    """
+    try:
+        student_code = instance.student.student_code
+    except Student.DoesNotExist:
+        return
+    RosterIndexService.invalidate_student(student_code)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_schedule_index(sender, instance, **kwargs):
+    """
+    Group schedule, room, teacher or status changed - recompile the weekly table
+    """
+    ScheduleIndexService.invalidate()
+
+
+@receiver(post_delete, sender=Session)
+def forget_cached_session_id(sender, instance, **kwargs):
+    """
+    Deleted session - stop serving its id from the (group_id, date) cache
+    """
+    from .services import SessionService
+    SessionService.forget_session(instance.group_id, instance.session_date)
+
+
+@receiver(post_save, sender=Attendance)
+@receiver(post_delete, sender=Attendance)
+@receiver(post_save, sender=BlockedAttempt)
+@receiver(post_delete, sender=BlockedAttempt)
+@receiver(post_save, sender=Session)
+@receiver(post_delete, sender=Session)
+def push_live_monitor_update(sender, instance, **kwargs):
+    """
+    Attendance changed - push a room delta to the live monitor screens
+    (bulk_create paths call LiveMonitorStream.session_changed themselves)
+    """
+    LiveMonitorStream.session_changed(instance.session_id)
+
+
+@receiver(post_save, sender=Attendance)
+def count_attendance(sender, instance, created, **kwargs):
+    """
+    New attendance row bumps its session counter; an edited one may have
+    changed status, so the session counters are rebuilt on next read
+    (bulk_create paths record their counts themselves)
+    """
+    if created:
+        SessionCounterService.record(
+            instance.session_id, SessionCounterService.field_for_status(instance.status)
+        )
+    else:
+        SessionCounterService.invalidate(instance.session_id)
+
+
+@receiver(post_delete, sender=Attendance)
+@receiver(post_delete, sender=BlockedAttempt)
+def uncount_session_row(sender, instance, **kwargs):
+    """
+    Deleted attendance or blocked attempt - rebuild the session counters
+    """
+    SessionCounterService.invalidate(instance.session_id)
+
+
+@receiver(post_save, sender=Session)
+def sync_session_counter_flags(sender, instance, **kwargs):
+    """
+    Teacher check-in or cancellation - mirror the flags into the counters
+    """
+    SessionCounterService.set_flags(
+        instance.session_id,
+        teacher_attended=instance.teacher_attended,
+        is_cancelled=instance.is_cancelled
+    )
+
+
+@receiver(post_save, sender=MonitorChannel)
+@receiver(post_delete, sender=MonitorChannel)
+@receiver(m2m_changed, sender=MonitorChannel.rooms.through)
+def forget_monitor_channel(sender, instance, **kwargs):
+    """
+    Channel rooms or settings changed - reload its cached definition
+    """
+    from .monitor_service import LiveMonitorService
+    if isinstance(instance, MonitorChannel):
+        LiveMonitorService.forget_channel(instance.slug)
+    else:
+        # Reverse side (room.monitor_channels) - pk_set holds the channels
+        for slug in MonitorChannel.objects.filter(pk__in=kwargs.get('pk_set') or []).values_list('slug', flat=True):
+            LiveMonitorService.forget_channel(slug)
+
+
+@receiver(post_save, sender=KioskDevice)
+@receiver(post_delete, sender=KioskDevice)
+def forget_active_kiosks(sender, instance, **kwargs):
+    """
+    Kiosk added, removed or (de)activated - reload the scan metrics kiosk list
+    """
+    ScanMetrics.forget_active_kiosks()
@@ -168,3 +168,147 @@ def send_session_cancelled_notifications(
     except Exception as e:
         logger.exception(f"Error sending session cancellation notifications: {str(e)}")
         raise self.retry(exc=e)
+
+
+@shared_task(name='attendance.materialize_today_sessions')
+def materialize_today_sessions():
+    """
+    Create today's Session rows for every active group ahead of the first scan
+    and prime the (group_id, date) -> session_id cache.
+    
+    Runs hourly via Celery Beat (idempotent - existing sessions are kept).
+    """
+    from apps.attendance.services import SessionService
+    
+    result = SessionService.materialize_sessions()
+    
+    logger.info(
+        f"Materialized sessions for {result['date']}: "
+        f"{result['created']} created, {result['groups']} groups scheduled"
+    )
+    
+    return {
+        'success': True,
+        **result
+    }
+
+
+@shared_task(name='attendance.flush_audit_buffer')
+def flush_audit_buffer():
+    """
+    Write buffered audit rows (BlockedAttempt) with bulk_create.
+    
+    Scheduled every ATTENDANCE_AUDIT_FLUSH_MS in redis mode, and queued
+    early when the buffer reaches ATTENDANCE_AUDIT_FLUSH_ROWS.
+    """
+    from apps.attendance.audit_buffer import AuditWriteBuffer
+    
+    written = AuditWriteBuffer.flush()
+    if written:
+        logger.info(f"Flushed {written} buffered audit rows")
+    
+    return {
+        'success': True,
+        'written': written
+    }
+
+
+@shared_task(name='attendance.refresh_live_monitor_session')
+def refresh_live_monitor_session(session_id):
+    """
+    Recompute the room of a changed session and publish a live monitor delta.
+    
+    Queued (coalesced per session) after Attendance/BlockedAttempt/Session
+    changes commit - see LiveMonitorStream.
+    """
+    from apps.attendance.live_stream import LiveMonitorStream
+    
+    event_id = LiveMonitorStream.refresh_session(session_id)
+    
+    return {
+        'success': True,
+        'session_id': session_id,
+        'event_id': event_id
+    }
+
+
+@shared_task(name='attendance.reconcile_session_counters')
+def reconcile_session_counters():
+    """
+    Rewrite today's per-session counters from Attendance/BlockedAttempt rows.
+    
+    Fixes drift from lost increments, admin bulk actions or audit rows that
+    were still buffered. Runs every 5 minutes via Celery Beat.
+    """
+    from apps.attendance.session_counters import SessionCounterService
+    
+    result = SessionCounterService.reconcile()
+    
+    logger.info(
+        f"Reconciled session counters for {result['date']}: "
+        f"{result['sessions']} sessions, {result['drifted']} drifted"
+    )
+    
+    return {
+        'success': True,
+        **result
+    }
+
+
+@shared_task(name='attendance.record_monitor_snapshot')
+def record_monitor_snapshot():
+    """
+    Store this minute's per-room live monitor counts for later replay.
+    
+    Runs every minute via Celery Beat; outside operating hours
+    (LIVE_MONITOR_SNAPSHOT_START_HOUR..END_HOUR) it does nothing.
+    """
+    from apps.attendance.monitor_history import MonitorHistoryService
+    
+    now = timezone.now()
+    if not MonitorHistoryService.is_operating_hour(now):
+        return {'success': True, 'skipped': True}
+    
+    rooms = MonitorHistoryService.record(now)
+    
+    return {
+        'success': True,
+        'rooms': rooms,
+        'taken_at': now.replace(second=0, microsecond=0).isoformat()
+    }
+
+
+@shared_task(name='attendance.purge_monitor_snapshots')
+def purge_monitor_snapshots():
+    """
+    Delete live monitor snapshots older than LIVE_MONITOR_SNAPSHOT_RETENTION_DAYS.
+    
+    Runs daily via Celery Beat.
+    """
+    from apps.attendance.monitor_history import MonitorHistoryService
+    
+    deleted = MonitorHistoryService.purge()
+    if deleted:
+        logger.info(f"Purged {deleted} old live monitor snapshots")
+    
+    return {
+        'success': True,
+        'deleted': deleted
+    }
+
+
+@shared_task(name='attendance.flush_kiosk_heartbeats')
+def flush_kiosk_heartbeats():
+    """
+    Copy cached kiosk heartbeats to KioskDevice.last_heartbeat in one bulk update.
+    
+    Runs every minute via Celery Beat (must stay below KIOSK_HEARTBEAT_TTL_SECONDS).
+    """
+    from apps.attendance.kiosk_heartbeat import KioskHeartbeatService
+    
+    updated = KioskHeartbeatService.flush()
+    
+    return {
+        'success': True,
+        'updated': updated
+    }
@@ -3,7 +3,8 @@ Unit Tests for Attendance Service - Educore V2
 اختبار النظام الجديد: قاعدة 10 دقائق صارمة + student_code
 """
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from unittest.mock import patch
 from django.utils import timezone
 from datetime import datetime, timedelta, time
 from apps.accounts.models import User
@@ -369,3 +370,1468 @@ class ProcessScanIntegrationTest(TestCase):
 
         # قد ينجح أو يفشل حسب اليوم الحالي
         self.assertIn('success', result)
+
+
+class RosterIndexTest(TestCase):
+    """
+    اختبار فهرس قائمة اليوم (RosterIndexService)
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+        self.supervisor = User.objects.create_user(
+            username='supervisor',
+            password='testpass123',
+            role='supervisor'
+        )
+        self.teacher = Teacher.objects.create(
+            full_name='Test Teacher',
+            email='teacher@test.com',
+            phone='+201234567890',
+            specialization='Math',
+            hire_date=timezone.now().date()
+        )
+        self.room = Room.objects.create(name='Room A', capacity=30)
+
+        # ثبات الوقت: اليوم الساعة 9:55 (قبل الحصة بخمس دقائق)
+        self.now = timezone.make_aware(
+            datetime.combine(timezone.localdate(), time(9, 55))
+        )
+        self.group = Group.objects.create(
+            group_name='Today Group',
+            teacher=self.teacher,
+            room=self.room,
+            schedule_day=self.now.strftime('%A'),
+            schedule_time=time(10, 0),
+            standard_fee=200.00
+        )
+        self.student = Student.objects.create(
+            student_code='2001',
+            full_name='Indexed Student',
+            parent_phone='+201234567890'
+        )
+        self.enrollment = StudentGroupEnrollment.objects.create(
+            student=self.student,
+            group=self.group,
+            financial_status='exempt'
+        )
+
+    def test_resolve_unknown_code(self):
+        """اختبار: كود غير موجود"""
+        from apps.attendance.roster_index import RosterIndexService
+        self.assertIsNone(RosterIndexService.resolve('0000', self.now))
+
+    def test_resolve_returns_today_enrollment(self):
+        """اختبار: الفهرس يرجع تسجيل اليوم مع المجموعة"""
+        from apps.attendance.roster_index import RosterIndexService
+        roster = RosterIndexService.resolve('2001', self.now)
+        self.assertEqual(roster['student'].student_id, self.student.student_id)
+        self.assertEqual(len(roster['enrollments']), 1)
+        self.assertEqual(roster['enrollments'][0].group.group_id, self.group.group_id)
+
+    def test_warm_resolve_hits_no_database(self):
+        """اختبار: القراءة الثانية لا تستعلم قاعدة البيانات"""
+        from apps.attendance.roster_index import RosterIndexService
+        RosterIndexService.resolve('2001', self.now)
+        with self.assertNumQueries(0):
+            RosterIndexService.resolve('2001', self.now)
+
+    def test_enrollment_change_invalidates_entry(self):
+        """اختبار: تعديل التسجيل يحدّث الفهرس"""
+        from apps.attendance.roster_index import RosterIndexService
+        RosterIndexService.resolve('2001', self.now)
+
+        self.enrollment.financial_status = 'normal'
+        self.enrollment.save()
+
+        roster = RosterIndexService.resolve('2001', self.now)
+        self.assertEqual(roster['enrollments'][0].financial_status, 'normal')
+
+    def test_group_change_invalidates_index(self):
+        """اختبار: تغيير يوم المجموعة يزيلها من الفهرس"""
+        from apps.attendance.roster_index import RosterIndexService
+        RosterIndexService.resolve('2001', self.now)
+
+        other_day = (self.now + timedelta(days=1)).strftime('%A')
+        self.group.schedule_day = other_day
+        self.group.save()
+
+        roster = RosterIndexService.resolve('2001', self.now)
+        self.assertEqual(roster['enrollments'], [])
+
+    def test_session_change_keeps_student_entries(self):
+        """اختبار: إنشاء حصة يحدّث جدول الحصص دون إعادة بناء إدخالات الطلاب"""
+        from apps.attendance.roster_index import RosterIndexService
+        RosterIndexService.resolve('2001', self.now)
+
+        session = Session.objects.create(group=self.group, session_date=self.now.date())
+
+        # One query to rebuild the group table, one for its sessions - no student lookups
+        with self.assertNumQueries(2):
+            roster = RosterIndexService.resolve('2001', self.now)
+        self.assertEqual(roster['sessions'][self.group.group_id]['session_id'], session.pk)
+
+    def test_process_scan_uses_index(self):
+        """اختبار: مسح ناجح عبر الفهرس ثم منع التسجيل المكرر"""
+        from unittest.mock import patch
+        with patch('django.utils.timezone.now', return_value=self.now):
+            result = AttendanceService.process_scan('2001', self.supervisor)
+            self.assertTrue(result['success'])
+            self.assertEqual(result['status'], 'present')
+
+            duplicate = AttendanceService.process_scan('2001', self.supervisor)
+            self.assertFalse(duplicate['success'])
+            self.assertEqual(duplicate['color_code'], 'gray')
+
+        self.assertEqual(
+            Attendance.objects.filter(student=self.student).count(), 1
+        )
+
+    def test_concurrent_credit_use_blocks_scan(self):
+        """اختبار: نفاد الائتمان بعد الفحص المتفائل يمنع الحضور"""
+        from unittest.mock import patch
+        from apps.attendance.models import BlockedAttempt
+        from apps.attendance.roster_index import RosterIndexService
+
+        StudentGroupEnrollment.objects.filter(pk=self.enrollment.pk).update(
+            financial_status='normal',
+            is_new_student=False,
+            credit_balance=2,
+            sessions_attended=0
+        )
+        RosterIndexService.invalidate_student('2001')
+        RosterIndexService.resolve('2001', self.now)
+
+        # مسح آخر استهلك الرصيد (update لا يحدّث الفهرس)
+        StudentGroupEnrollment.objects.filter(pk=self.enrollment.pk).update(sessions_attended=3)
+
+        with patch('django.utils.timezone.now', return_value=self.now):
+            result = AttendanceService.process_scan('2001', self.supervisor)
+
+        self.assertEqual(result['status'], 'blocked_payment')
+        self.assertFalse(Attendance.objects.filter(student=self.student).exists())
+        self.assertEqual(BlockedAttempt.objects.filter(student=self.student).count(), 1)
+
+    def test_credit_snapshot_updates_after_commit_only(self):
+        """اختبار: لقطة الرصيد في الفهرس لا تتغير إذا تراجعت معاملة الحضور"""
+        from django.db import transaction
+        from apps.attendance.roster_index import RosterIndexService
+        from apps.payments.services import CreditService
+
+        StudentGroupEnrollment.objects.filter(pk=self.enrollment.pk).update(
+            financial_status='normal', is_new_student=False, credit_balance=2, sessions_attended=0
+        )
+        RosterIndexService.invalidate_student('2001')
+        RosterIndexService.resolve('2001', self.now)
+
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                CreditService.record_attendance_and_update_credit(self.student, self.group, self.enrollment.pk)
+                raise RuntimeError('rollback')
+        roster = RosterIndexService.resolve('2001', self.now)
+        self.assertEqual(roster['enrollments'][0].sessions_attended, 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CreditService.record_attendance_and_update_credit(self.student, self.group, self.enrollment.pk)
+        roster = RosterIndexService.resolve('2001', self.now)
+        self.assertEqual(roster['enrollments'][0].sessions_attended, 1)
+
+    def test_admin_bulk_actions_invalidate_index(self):
+        """اختبار: إجراءات الإدارة الجماعية (update) تحدّث الفهرس رغم غياب الإشارات"""
+        from apps.attendance.roster_index import RosterIndexService
+        from apps.attendance.session_counters import SessionCounterService
+        admin_user = User.objects.create_superuser(username='admin', password='testpass123', email='a@test.com')
+        self.client.force_login(admin_user)
+        RosterIndexService.resolve('2001', self.now)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/admin/students/studentgroupenrollment/', {
+                'action': 'set_normal_status', '_selected_action': [self.enrollment.pk],
+            })
+        roster = RosterIndexService.resolve('2001', self.now)
+        self.assertEqual(roster['enrollments'][0].financial_status, 'normal')
+
+        session = Session.objects.create(group=self.group, session_date=self.now.date())
+        generation = RosterIndexService.get_generation()
+        session_generation = RosterIndexService.get_session_generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/admin/attendance/session/', {
+                'action': 'cancel_sessions', '_selected_action': [session.pk],
+            })
+        # Session changes rebuild only the group/session table
+        self.assertGreater(RosterIndexService.get_session_generation(), session_generation)
+        self.assertEqual(RosterIndexService.get_generation(), generation)
+        self.assertTrue(RosterIndexService.resolve('2001', self.now)['sessions'][self.group.group_id]['is_cancelled'])
+        self.assertEqual(SessionCounterService.get(session.pk)['is_cancelled'], 1)
+
+        generation = RosterIndexService.get_generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/admin/students/student/', {
+                'action': 'deactivate_students', '_selected_action': [self.student.pk],
+            })
+        self.assertGreater(RosterIndexService.get_generation(), generation)
+
+
+class SessionMaterializationTest(TestCase):
+    """
+    اختبار تجهيز حصص اليوم مسبقاً (SessionService)
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+        self.teacher = Teacher.objects.create(
+            full_name='Test Teacher',
+            email='teacher@test.com',
+            phone='+201234567890',
+            specialization='Math',
+            hire_date=timezone.now().date()
+        )
+        self.room = Room.objects.create(name='Room A', capacity=30)
+        self.today = timezone.localdate()
+        self.group = Group.objects.create(
+            group_name='Today Group',
+            teacher=self.teacher,
+            room=self.room,
+            schedule_day=self.today.strftime('%A'),
+            schedule_time=time(10, 0),
+            standard_fee=200.00
+        )
+        Group.objects.create(
+            group_name='Tomorrow Group',
+            teacher=self.teacher,
+            room=self.room,
+            schedule_day=(self.today + timedelta(days=1)).strftime('%A'),
+            schedule_time=time(10, 0),
+            standard_fee=200.00
+        )
+
+    def test_materialize_creates_today_sessions_only(self):
+        """اختبار: إنشاء حصص مجموعات اليوم فقط"""
+        from apps.attendance.services import SessionService
+        result = SessionService.materialize_sessions(self.today)
+        self.assertEqual(result['created'], 1)
+        self.assertTrue(
+            Session.objects.filter(group=self.group, session_date=self.today).exists()
+        )
+        self.assertEqual(Session.objects.count(), 1)
+
+    def test_materialize_is_idempotent(self):
+        """اختبار: التشغيل المتكرر لا ينشئ حصصاً مكررة"""
+        from apps.attendance.services import SessionService
+        SessionService.materialize_sessions(self.today)
+        result = SessionService.materialize_sessions(self.today)
+        self.assertEqual(result['created'], 0)
+        self.assertEqual(Session.objects.count(), 1)
+
+    def test_primed_session_id_hits_no_database(self):
+        """اختبار: قراءة رقم الحصة من الكاش بدون استعلام"""
+        from apps.attendance.services import SessionService
+        SessionService.materialize_sessions(self.today)
+        session = Session.objects.get(group=self.group, session_date=self.today)
+        with self.assertNumQueries(0):
+            session_id = SessionService.get_session_id(self.group.group_id, self.today)
+        self.assertEqual(session_id, session.session_id)
+
+    def test_deleted_session_is_forgotten(self):
+        """اختبار: حذف الحصة يزيل رقمها من الكاش"""
+        from apps.attendance.services import SessionService
+        SessionService.materialize_sessions(self.today)
+        Session.objects.filter(group=self.group).delete()
+        session_id = SessionService.get_session_id(self.group.group_id, self.today)
+        self.assertTrue(Session.objects.filter(pk=session_id).exists())
+
+
+class ScheduleIndexTest(TestCase):
+    """
+    اختبار جدول الأسبوع المُجمّع (ScheduleIndexService)
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+        self.teacher = Teacher.objects.create(
+            full_name='Test Teacher',
+            email='teacher@test.com',
+            phone='+201234567890',
+            specialization='Math',
+            hire_date=timezone.now().date()
+        )
+        self.room = Room.objects.create(name='Room A', capacity=30)
+        self.today = timezone.localdate()
+        self.morning = Group.objects.create(
+            group_name='Morning Group',
+            teacher=self.teacher,
+            room=self.room,
+            schedule_day=self.today.strftime('%A'),
+            schedule_time=time(10, 0),
+            standard_fee=200.00
+        )
+        self.noon = Group.objects.create(
+            group_name='Noon Group',
+            teacher=self.teacher,
+            room=self.room,
+            schedule_day=self.today.strftime('%A'),
+            schedule_time=time(12, 15),
+            standard_fee=200.00
+        )
+
+    def _at(self, hour, minute):
+        return timezone.make_aware(datetime.combine(self.today, time(hour, minute)))
+
+    def test_room_lookup_respects_lead_window(self):
+        """اختبار: نافذة الوصول المبكر للقاعة"""
+        from apps.attendance.schedule_index import ScheduleIndexService
+        room_id = self.room.pk
+        self.assertEqual(ScheduleIndexService.groups_for_room(room_id, self._at(9, 20), 30), [])
+        self.assertEqual(
+            ScheduleIndexService.groups_for_room(room_id, self._at(9, 35), 30),
+            [self.morning.group_id]
+        )
+        self.assertEqual(
+            ScheduleIndexService.groups_for_room(room_id, self._at(11, 50), 30),
+            [self.morning.group_id, self.noon.group_id]
+        )
+        self.assertEqual(
+            ScheduleIndexService.groups_for_room(room_id, self._at(14, 16), 30),
+            []
+        )
+
+    def test_teacher_lookup_hits_no_database_when_warm(self):
+        """اختبار: القراءة الثانية لا تستعلم جدول المجموعات"""
+        from apps.attendance.schedule_index import ScheduleIndexService
+        teacher_id = self.teacher.teacher_id
+        ScheduleIndexService.groups_for_teacher(teacher_id, self._at(10, 30))
+        with self.assertNumQueries(0):
+            group_ids = ScheduleIndexService.groups_for_teacher(teacher_id, self._at(12, 30))
+        self.assertEqual(group_ids, [self.noon.group_id])
+
+    def test_pick_group_prefers_covering_then_nearest(self):
+        """اختبار: اختيار مجموعة الطالب حسب الوقت"""
+        from apps.attendance.schedule_index import ScheduleIndexService
+        group_ids = [self.morning.group_id, self.noon.group_id]
+        self.assertEqual(
+            ScheduleIndexService.pick_group(group_ids, self._at(12, 20), 30),
+            self.noon.group_id
+        )
+        self.assertEqual(
+            ScheduleIndexService.pick_group(group_ids, self._at(8, 0), 30),
+            self.morning.group_id
+        )
+
+    def test_group_change_recompiles_table(self):
+        """اختبار: تغيير موعد المجموعة يعيد بناء الجدول"""
+        from apps.attendance.schedule_index import ScheduleIndexService
+        ScheduleIndexService.groups_for_room(self.room.pk, self._at(10, 30))
+
+        self.morning.schedule_day = (self.today + timedelta(days=1)).strftime('%A')
+        self.morning.save()
+
+        self.assertEqual(
+            ScheduleIndexService.groups_for_room(self.room.pk, self._at(10, 30)),
+            []
+        )
+
+
+class BatchScanTest(TestCase):
+    """
+    اختبار معالجة دفعات المسح المؤجل (process_scan_batch)
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+        self.supervisor = User.objects.create_user(
+            username='supervisor',
+            password='testpass123',
+            role='supervisor'
+        )
+        self.teacher = Teacher.objects.create(
+            full_name='Test Teacher',
+            email='teacher@test.com',
+            phone='+201234567890',
+            specialization='Math',
+            hire_date=timezone.now().date()
+        )
+        self.room = Room.objects.create(name='Room A', capacity=30)
+
+        # الحصة أمس الساعة 10:00 - المسح يُعاد إرساله اليوم
+        self.day = timezone.localdate() - timedelta(days=1)
+        self.group = Group.objects.create(
+            group_name='Yesterday Group',
+            teacher=self.teacher,
+            room=self.room,
+            schedule_day=self.day.strftime('%A'),
+            schedule_time=time(10, 0),
+            standard_fee=200.00
+        )
+        self.students = []
+        for code in ('3001', '3002'):
+            student = Student.objects.create(
+                student_code=code,
+                full_name=f'Student {code}',
+                parent_phone='+201234567890'
+            )
+            StudentGroupEnrollment.objects.create(
+                student=student,
+                group=self.group,
+                financial_status='exempt'
+            )
+            self.students.append(student)
+
+    def at(self, hour, minute):
+        return timezone.make_aware(datetime.combine(self.day, time(hour, minute)))
+
+    def test_batch_uses_original_scan_time(self):
+        """اختبار: تقييم كل مسح بوقته الأصلي والنتائج بنفس الترتيب"""
+        results = AttendanceService.process_scan_batch([
+            {'student_code': '3001', 'scan_time': self.at(9, 55)},
+            {'student_code': '3002', 'scan_time': self.at(10, 5)},
+            {'student_code': '0000', 'scan_time': self.at(10, 6)},
+            {'student_code': '3001', 'scan_time': self.at(9, 58)},
+        ], self.supervisor)
+
+        self.assertEqual(
+            [result['status'] for result in results],
+            ['present', 'late_blocked', 'blocked_other', 'blocked_other']
+        )
+        self.assertEqual(results[3]['color_code'], 'gray')
+
+        attendance = Attendance.objects.get(student=self.students[0])
+        self.assertEqual(attendance.scan_time, self.at(9, 55))
+        self.assertEqual(attendance.session.session_date, self.day)
+
+        from apps.attendance.models import BlockedAttempt
+        self.assertEqual(BlockedAttempt.objects.filter(student=self.students[1]).count(), 1)
+
+    def test_batch_endpoint_reports_invalid_items_in_place(self):
+        """اختبار: العناصر غير الصالحة تُرجع في مكانها دون إيقاف الدفعة"""
+        import json
+        self.client.force_login(self.supervisor)
+        response = self.client.post(
+            '/api/attendance/scan/batch/',
+            data=json.dumps({'scans': [
+                {'student_code': '3001', 'scanned_at': self.at(9, 55).isoformat()},
+                {'student_code': '3002', 'scanned_at': 'yesterday'},
+                {'student_code': '3002', 'scanned_at': self.at(9, 50).isoformat(), 'device_id': 'KIOSK-X'},
+                {'student_code': '3002', 'scanned_at': (timezone.now() - timedelta(hours=49)).isoformat()},
+            ]}),
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['index'] for result in results], [0, 1, 2, 3])
+        self.assertEqual(results[0]['status'], 'present')
+        self.assertEqual(results[1]['status'], 'invalid')
+        self.assertEqual(results[2]['status'], 'invalid')
+        self.assertEqual(results[3]['status'], 'invalid')
+        self.assertEqual(results[3]['message'], 'وقت المسح قديم جداً')
+        self.assertEqual(Attendance.objects.count(), 1)
+
+
+    def test_batch_retry_with_same_keys_replays_results(self):
+        """اختبار: إعادة إرسال الدفعة بنفس المفاتيح لا تكرر المحاولات الممنوعة"""
+        from apps.attendance.models import BlockedAttempt
+        scans = [
+            {'student_code': '3001', 'scan_time': self.at(9, 55), 'idempotency_key': 'k-1'},
+            {'student_code': '3002', 'scan_time': self.at(10, 5), 'idempotency_key': 'k-2'},
+            {'student_code': '3002', 'scan_time': self.at(10, 5), 'idempotency_key': 'k-2'},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            first = AttendanceService.process_scan_batch(scans, self.supervisor)
+        self.assertEqual([result['status'] for result in first], ['present', 'late_blocked', 'late_blocked'])
+        self.assertTrue(first[2]['duplicate_scan'])
+
+        retry = AttendanceService.process_scan_batch(scans, self.supervisor)
+        self.assertEqual([result['status'] for result in retry], ['present', 'late_blocked', 'late_blocked'])
+        self.assertTrue(all(result['duplicate_scan'] for result in retry))
+        self.assertEqual(Attendance.objects.count(), 1)
+        self.assertEqual(BlockedAttempt.objects.filter(student=self.students[1]).count(), 1)
+
+class AuditWriteBufferTest(TestCase):
+    """
+    اختبار الكتابة المؤجلة لسجلات التدقيق (AuditWriteBuffer)
+    """
+
+    def setUp(self):
+        from apps.attendance.audit_buffer import AuditWriteBuffer
+        AuditWriteBuffer._rows = []
+
+        self.student = Student.objects.create(
+            student_code='4001',
+            full_name='Audit Student',
+            parent_phone='+201234567890'
+        )
+        self.attempt_time = timezone.make_aware(
+            datetime.combine(timezone.localdate(), time(10, 5))
+        )
+        self.row = {
+            'student_id': self.student.student_id,
+            'session_id': None,
+            'attempt_time': self.attempt_time,
+            'reason': 'late',
+            'minutes_late': 5,
+            'group_name': 'Audit Group',
+            'scheduled_time': time(10, 0),
+        }
+
+    def test_sync_mode_writes_immediately(self):
+        """اختبار: الوضع المتزامن يكتب داخل المعاملة"""
+        from apps.attendance.audit_buffer import AuditWriteBuffer
+        from apps.attendance.models import BlockedAttempt
+        AuditWriteBuffer.add(BlockedAttempt, [self.row])
+        self.assertEqual(BlockedAttempt.objects.count(), 1)
+
+    def test_memory_mode_defers_until_flush(self):
+        """اختبار: الوضع المؤجل لا يكتب قبل التفريغ"""
+        from unittest.mock import patch
+        from django.test import override_settings
+        from apps.attendance.audit_buffer import AuditWriteBuffer
+        from apps.attendance.models import BlockedAttempt
+
+        with override_settings(ATTENDANCE_AUDIT_WRITE_MODE='memory'), \
+                patch.object(AuditWriteBuffer, '_ensure_flusher'):
+            with self.captureOnCommitCallbacks(execute=True):
+                AuditWriteBuffer.add(BlockedAttempt, [self.row, dict(self.row, reason='payment')])
+
+            self.assertEqual(BlockedAttempt.objects.count(), 0)
+            self.assertEqual(AuditWriteBuffer.flush(), 2)
+
+        self.assertEqual(BlockedAttempt.objects.count(), 2)
+        self.assertEqual(AuditWriteBuffer.pending(), 0)
+
+    def test_memory_flush_keeps_rows_on_database_outage(self):
+        """اختبار: انقطاع قاعدة البيانات يعيد الصفوف للطابور بنفس الترتيب"""
+        from unittest.mock import patch
+        from django.db import OperationalError
+        from apps.attendance.audit_buffer import AuditWriteBuffer
+        from apps.attendance.models import BlockedAttempt
+
+        entries = [
+            {'model': 'attendance.BlockedAttempt', 'fields': dict(self.row, minutes_late=minutes)}
+            for minutes in (1, 2)
+        ]
+        AuditWriteBuffer._rows = list(entries)
+
+        with patch.object(AuditWriteBuffer, '_write', side_effect=OperationalError('down')):
+            with self.assertRaises(OperationalError):
+                AuditWriteBuffer._flush_memory()
+        self.assertEqual(AuditWriteBuffer._rows, entries)
+
+        self.assertEqual(AuditWriteBuffer._flush_memory(), 2)
+        self.assertEqual(BlockedAttempt.objects.count(), 2)
+        self.assertEqual(AuditWriteBuffer.pending(), 0)
+
+    def test_memory_flush_skips_bad_rows(self):
+        """اختبار: سجل تالف لا يمنع كتابة باقي الدفعة"""
+        from apps.attendance.audit_buffer import AuditWriteBuffer
+        from apps.attendance.models import BlockedAttempt
+
+        AuditWriteBuffer._rows = [
+            {'model': 'attendance.BlockedAttempt', 'fields': self.row},
+            {'model': 'attendance.BlockedAttempt', 'fields': dict(self.row, student_id=None)},
+            {'model': 'attendance.BlockedAttempt', 'fields': dict(self.row, reason='payment')},
+        ]
+
+        self.assertEqual(AuditWriteBuffer._flush_memory(), 2)
+        self.assertEqual(BlockedAttempt.objects.count(), 2)
+        self.assertEqual(AuditWriteBuffer.pending(), 0)
+
+    def test_serialized_rows_are_restored(self):
+        """اختبار: استرجاع القيم بعد التخزين كـ JSON (وضع Redis)"""
+        import json
+        from django.core.serializers.json import DjangoJSONEncoder
+        from apps.attendance.audit_buffer import AuditWriteBuffer
+        from apps.attendance.models import BlockedAttempt
+
+        raw = json.dumps({'model': 'attendance.BlockedAttempt', 'fields': self.row}, cls=DjangoJSONEncoder)
+        AuditWriteBuffer._write([json.loads(raw)])
+
+        attempt = BlockedAttempt.objects.get()
+        self.assertEqual(attempt.attempt_time, self.attempt_time)
+        self.assertEqual(attempt.scheduled_time, time(10, 0))
+
+    def test_redis_flush_dead_letters_bad_rows(self):
+        """اختبار: سجل تالف ينتقل لقائمة الأخطاء ولا يوقف التفريغ أو يكرر الدفعة"""
+        import json
+        from unittest.mock import patch
+        from django.core.serializers.json import DjangoJSONEncoder
+        from apps.attendance.audit_buffer import AuditWriteBuffer
+        from apps.attendance.models import BlockedAttempt
+
+        class RedisList:
+            def __init__(self):
+                self.lists = {}
+
+            def lrange(self, key, start, end):
+                return self.lists.get(key, [])[start:end + 1]
+
+            def ltrim(self, key, start, end):
+                self.lists[key] = self.lists.get(key, [])[start:]
+
+            def rpush(self, key, *values):
+                self.lists.setdefault(key, []).extend(values)
+
+        redis = RedisList()
+        good = json.dumps({'model': 'attendance.BlockedAttempt', 'fields': self.row}, cls=DjangoJSONEncoder)
+        bad = json.dumps({'model': 'attendance.BlockedAttempt', 'fields': dict(self.row, student_id=None)},
+                         cls=DjangoJSONEncoder)
+        redis.rpush(AuditWriteBuffer.REDIS_KEY, good, bad, 'not json', good)
+
+        with patch.object(AuditWriteBuffer, '_get_redis', return_value=redis):
+            self.assertEqual(AuditWriteBuffer._flush_redis(), 2)
+
+        self.assertEqual(BlockedAttempt.objects.count(), 2)
+        self.assertEqual(redis.lists[AuditWriteBuffer.REDIS_KEY], [])
+        self.assertEqual(redis.lists[AuditWriteBuffer.DEAD_LETTER_KEY], [bad, 'not json'])
+
+
+class ScanMetricsTest(TestCase):
+    """
+    اختبار قياس زمن خطوات المسح (ScanMetrics)
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_percentiles_from_histogram(self):
+        """اختبار: حساب p50/p95 من فئات المدرج"""
+        from apps.attendance.scan_metrics import ScanMetrics, ScanTimer
+        for duration in [3] * 90 + [150] * 10:
+            timer = ScanTimer('K1')
+            timer.durations = {'lookup': duration}
+            timer.queries = {'lookup': 1}
+            ScanMetrics.record(timer)
+
+        lookup = ScanMetrics.get_summary('K1')['kiosks']['K1']['lookup']
+        self.assertEqual(lookup['count'], 100)
+        self.assertEqual(lookup['p50_ms'], 5)
+        self.assertEqual(lookup['p95_ms'], 200)
+        self.assertEqual(lookup['avg_queries'], 1)
+
+    def test_process_scan_records_steps(self):
+        """اختبار: كل مسح يسجل زمن الخطوات للكشك"""
+        from apps.attendance.models import KioskDevice
+        from apps.attendance.scan_metrics import ScanMetrics
+        KioskDevice.objects.create(device_id='KIOSK-1', device_name='K1', room=Room.objects.create(name='M1', capacity=30))
+        AttendanceService.process_scan('0000', None, kiosk_id='KIOSK-1')
+
+        steps = ScanMetrics.get_summary()['kiosks']['KIOSK-1']
+        self.assertEqual(steps['total']['count'], 1)
+        self.assertIn('lookup', steps)
+        self.assertGreaterEqual(steps['total']['avg_queries'], steps['lookup']['avg_queries'])
+
+    def test_only_active_kiosks_get_a_bucket(self):
+        """اختبار: معرفات الأكشاك غير المسجلة أو المعطلة تُجمع تحت unknown"""
+        from apps.attendance.models import KioskDevice
+        from apps.attendance.scan_metrics import ScanMetrics
+        kiosk = KioskDevice.objects.create(device_id='KIOSK-1', device_name='K1', room=Room.objects.create(name='M1', capacity=30))
+
+        self.assertEqual(ScanMetrics.resolve_kiosk('KIOSK-1'), 'KIOSK-1')
+        self.assertEqual(ScanMetrics.resolve_kiosk('made-up'), 'unknown')
+        self.assertEqual(ScanMetrics.resolve_kiosk(None), 'web')
+
+        kiosk.is_active = False
+        kiosk.save()
+        ScanMetrics.record_rejected('KIOSK-1')
+        self.assertEqual(ScanMetrics.get_kiosks(), ['unknown'])
+
+    def test_metrics_endpoint_requires_admin(self):
+        """اختبار: نقطة JSON للمدير فقط"""
+        supervisor = User.objects.create_user(username='sup', password='x', role='supervisor')
+        admin = User.objects.create_user(username='adm', password='x', role='admin')
+
+        self.client.force_login(supervisor)
+        self.assertEqual(self.client.get('/api/attendance/metrics/scan/').status_code, 302)
+
+        self.client.force_login(admin)
+        response = self.client.get('/api/attendance/metrics/scan/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('kiosks', response.json())
+
+    @override_settings(METRICS_API_TOKEN='scrape-me')
+    def test_kiosk_throughput_json_and_prometheus(self):
+        """اختبار: معدل المسح وتوزيع النتائج والرفض لكل كشك"""
+        from apps.attendance.models import KioskDevice
+        from apps.attendance.scan_metrics import ScanMetrics, ScanTimer
+        KioskDevice.objects.create(device_id='K2', device_name='K2', room=Room.objects.create(name='M2', capacity=30))
+        with patch.object(ScanMetrics, '_current_window', return_value=1000):
+            for verdict in ['present', 'present', 'late_blocked', 'duplicate']:
+                timer = ScanTimer('K2')
+                timer.durations = {'total': 4}
+                timer.verdict = verdict
+                ScanMetrics.record(timer)
+            ScanMetrics.record_rejected('K2')
+
+            kiosk = ScanMetrics.get_throughput(minutes=2)['kiosks']['K2']
+        self.assertEqual(kiosk['scans'], 4)
+        self.assertEqual(kiosk['scans_per_minute'], 2)
+        self.assertEqual(kiosk['peak_scans_per_minute'], 4)
+        self.assertEqual(kiosk['verdicts'], {'duplicate': 1, 'late_blocked': 1, 'present': 2})
+        self.assertEqual(kiosk['avg_latency_ms'], 4)
+        self.assertEqual(kiosk['rate_limited'], 1)
+
+        url = '/api/attendance/metrics/kiosks/?format=prometheus'
+        self.assertEqual(self.client.get(url).status_code, 403)
+        with patch.object(ScanMetrics, '_current_window', return_value=1000):
+            response = self.client.get(url, HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('kiosk_scan_verdicts{kiosk="K2",room="M2",verdict="present"} 2', response.content.decode())
+
+
+class ScanBenchmarkTest(TestCase):
+    """
+    اختبار أداة قياس ضغط المسح (benchmark_scans)
+    """
+
+    def test_workload_mixes_duplicates_and_invalid_codes(self):
+        """اختبار: المسحات تشمل المكررة والأكواد غير الصالحة"""
+        from apps.attendance.benchmark import ScanBenchmark
+        benchmark = ScanBenchmark(rooms=1, groups=1, students=100, duplicate_ratio=0.1, invalid_ratio=0.05)
+        codes = [f'S{index:06d}' for index in range(100)]
+
+        workload = benchmark.build_workload(codes)
+
+        self.assertEqual(len(workload), 115)
+        self.assertEqual(set(codes) - set(workload), set())
+        self.assertEqual(len([code for code in workload if code.startswith('X')]), 5)
+
+    def test_summary_reports_percentiles_and_lock_errors(self):
+        """اختبار: ملخص الجولة"""
+        from apps.attendance.benchmark import ScanBenchmark
+        benchmark = ScanBenchmark(rooms=1, groups=1, students=1, concurrency=2)
+        samples = [
+            {'latency_ms': float(ms), 'queries': 5, 'write_ms': 1.0, 'status': 'present', 'error': None}
+            for ms in range(1, 101)
+        ]
+        samples.append({'latency_ms': 500.0, 'queries': 2, 'write_ms': 0.0, 'status': None, 'error': 'lock'})
+
+        report = benchmark.summarize('service', samples, 2.0, {'published': 3, 'whatsapp': 0}, None)
+
+        self.assertEqual(report['scans'], 101)
+        self.assertEqual(report['scans_per_second'], 50.5)
+        self.assertEqual(report['latency_ms']['p50'], 51.0)
+        self.assertEqual(report['latency_ms']['max'], 500.0)
+        self.assertEqual(report['lock_errors'], 1)
+        self.assertEqual(report['statuses'], {'present': 100})
+
+    def test_seed_and_scans_leave_default_cache_untouched(self):
+        """اختبار: الجولة لا تكتب في الذاكرة المؤقتة الافتراضية"""
+        from django.core.cache import caches
+        from apps.attendance.benchmark import ScanBenchmark
+        from apps.attendance.roster_index import RosterIndexService
+        from apps.attendance.schedule_index import ScheduleIndexService
+
+        default = caches['default']
+        default.clear()
+        default.set('sentinel', 1)
+        before = set(default._cache)
+
+        benchmark = ScanBenchmark(rooms=1, groups=1, students=3)
+        with benchmark.isolated_cache():
+            self.assertIsNot(caches['default'], default)
+            seeded = benchmark.seed('T')
+            scan = benchmark._scanner(ScanBenchmark.TARGET_SERVICE, seeded['supervisor'])
+            for code in seeded['codes']:
+                scan(code)
+
+        self.assertEqual(set(default._cache), before)
+        self.assertIsNone(ScheduleIndexService._table['generation'])
+        self.assertIsNone(RosterIndexService._group_table['generation'])
+
+
+class LiveMonitorStreamTest(TestCase):
+    """
+    اختبار بث الشاشة الحية (LiveMonitorStream)
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+        self.teacher = Teacher.objects.create(
+            full_name='Test Teacher',
+            email='teacher@test.com',
+            phone='+201234567890',
+            specialization='Math',
+            hire_date=timezone.now().date()
+        )
+        self.room = Room.objects.create(name='Room A', capacity=30)
+        self.group = Group.objects.create(
+            group_name='Today Group',
+            teacher=self.teacher,
+            room=self.room,
+            schedule_day=timezone.localdate().strftime('%A'),
+            schedule_time=time(10, 0),
+            standard_fee=200.00
+        )
+        self.session = Session.objects.create(group=self.group, session_date=timezone.localdate())
+        self.student = Student.objects.create(
+            student_code='3001',
+            full_name='Stream Student',
+            parent_phone='+201234567890'
+        )
+
+    def test_committed_attendance_publishes_room_delta(self):
+        """اختبار: تسجيل حضور ينشر تحديثاً للقاعة بعد الحفظ"""
+        from apps.attendance.live_stream import LiveMonitorStream
+        start = LiveMonitorStream.get_seq()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Attendance.objects.create(student=self.student, session=self.session, status='present')
+
+        events = LiveMonitorStream.events_since(start)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['event']['type'], 'room')
+        self.assertEqual(events[0]['event']['room']['id'], self.room.room_id)
+
+    def test_unchanged_room_publishes_nothing(self):
+        """اختبار: لا يُنشر حدث إذا لم تتغير بيانات القاعة"""
+        from apps.attendance.live_stream import LiveMonitorStream
+        self.assertIsNotNone(LiveMonitorStream.refresh_room(self.room.room_id))
+        self.assertIsNone(LiveMonitorStream.refresh_room(self.room.room_id))
+
+    def test_expired_events_require_snapshot(self):
+        """اختبار: فقدان أحداث يتطلب لقطة جديدة"""
+        from django.core.cache import cache
+        from apps.attendance.live_stream import LiveMonitorStream
+        first = LiveMonitorStream.publish({'type': 'room', 'room': {'id': 1}})
+        LiveMonitorStream.publish({'type': 'room', 'room': {'id': 2}})
+        LiveMonitorStream.publish({'type': 'room', 'room': {'id': 3}})
+
+        self.assertEqual(len(LiveMonitorStream.events_since(first)), 2)
+        cache.delete(f'{LiveMonitorStream.EVENT_PREFIX}:{first + 1}')
+        self.assertIsNone(LiveMonitorStream.events_since(first))
+
+    @patch('apps.attendance.live_stream.time.sleep')
+    def test_stream_sends_snapshot_then_deltas(self, mock_sleep):
+        """اختبار: البث يبدأ بلقطة ثم الفروقات فقط"""
+        from apps.attendance.live_stream import LiveMonitorStream
+        stream = LiveMonitorStream.stream()
+
+        self.assertTrue(next(stream).startswith('retry:'))
+        snapshot = next(stream)
+        self.assertIn('event: snapshot', snapshot)
+
+        seq = LiveMonitorStream.publish({'type': 'room', 'room': {'id': self.room.room_id}})
+        delta = next(stream)
+        self.assertIn(f'id: {seq}\nevent: room', delta)
+
+
+class LiveMonitorAggregationTest(TestCase):
+    """
+    اختبار تجميع إحصائيات الشاشة الحية بعدد ثابت من الاستعلامات
+    """
+
+    def setUp(self):
+        self.teacher = Teacher.objects.create(
+            full_name='Test Teacher',
+            email='teacher@test.com',
+            phone='+201234567890',
+            specialization='Math',
+            hire_date=timezone.now().date()
+        )
+        now = timezone.localtime()
+        # Started a few minutes ago (clamped to midnight)
+        self.start = max(now - timedelta(minutes=5), now.replace(hour=0, minute=0)).time()
+        self.today = now.date()
+        self.counter = 0
+
+    def _add_active_room(self, present=1, late_blocked=0):
+        self.counter += 1
+        room = Room.objects.create(name=f'Room {self.counter}', capacity=30)
+        group = Group.objects.create(
+            group_name=f'Group {self.counter}',
+            teacher=self.teacher,
+            room=room,
+            schedule_day=self.today.strftime('%A'),
+            schedule_time=self.start,
+            standard_fee=200.00
+        )
+        session = Session.objects.create(group=group, session_date=self.today)
+        statuses = ['present'] * present + ['late_blocked'] * late_blocked
+        for index, status in enumerate(statuses):
+            student = Student.objects.create(
+                student_code=f'{self.counter}{index:03d}',
+                full_name=f'Student {self.counter}-{index}',
+                parent_phone='+201234567890'
+            )
+            StudentGroupEnrollment.objects.create(student=student, group=group)
+            Attendance.objects.create(student=student, session=session, status=status)
+        return room
+
+    def test_room_stats_are_grouped_per_room(self):
+        """اختبار: الإحصائيات صحيحة لكل قاعة"""
+        from apps.attendance.monitor_service import LiveMonitorService
+        first = self._add_active_room(present=2)
+        second = self._add_active_room(present=1, late_blocked=3)
+
+        data = LiveMonitorService.get_live_dashboard_data(use_cache=False)
+        rooms = {room['id']: room for room in data['rooms']}
+
+        self.assertEqual(rooms[first.room_id]['session']['present'], 2)
+        self.assertEqual(rooms[first.room_id]['session']['total'], 2)
+        self.assertEqual(rooms[second.room_id]['session']['blocked_total'], 3)
+        self.assertEqual(rooms[second.room_id]['session']['not_arrived'], 0)
+        self.assertNotIn('absent', rooms[second.room_id]['session'])
+        self.assertEqual(rooms[second.room_id]['status'], 'issues')
+        self.assertEqual(data['summary']['total_present_today'], 2)
+
+    def test_query_count_is_independent_of_room_count(self):
+        """اختبار: عدد الاستعلامات ثابت مهما زاد عدد القاعات"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from apps.attendance.monitor_service import LiveMonitorService
+
+        self._add_active_room()
+        with CaptureQueriesContext(connection) as few:
+            LiveMonitorService.get_live_dashboard_data(use_cache=False)
+
+        for _ in range(5):
+            self._add_active_room()
+        with CaptureQueriesContext(connection) as many:
+            LiveMonitorService.get_live_dashboard_data(use_cache=False)
+
+        self.assertEqual(len(few), len(many))
+        self.assertLessEqual(len(many), 4)
+
+    def test_room_detail_queries_and_etag(self):
+        """اختبار: تفاصيل القاعة بعدد ثابت من الاستعلامات و 304 إذا لم تتغير"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from apps.attendance.monitor_service import LiveMonitorService
+
+        small = self._add_active_room(present=1)
+        large = self._add_active_room(present=2, late_blocked=4)
+        LiveMonitorService.get_room_detail(small.room_id)
+
+        with CaptureQueriesContext(connection) as few:
+            LiveMonitorService.get_room_detail(small.room_id)
+        with CaptureQueriesContext(connection) as many:
+            detail = LiveMonitorService.get_room_detail(large.room_id)
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(len(detail['students']), 6)
+        self.assertEqual(
+            sorted(student['status'] for student in detail['students']),
+            ['late_blocked'] * 4 + ['present'] * 2
+        )
+
+        user = User.objects.create_user(username='monitor', password='testpass123', role='admin')
+        self.client.force_login(user)
+        url = f'/api/attendance/monitor/room/{large.room_id}/'
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+
+        unchanged = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(unchanged.status_code, 304)
+
+        student = Student.objects.create(
+            student_code='9900', full_name='Late Joiner', parent_phone='+201234567890'
+        )
+        StudentGroupEnrollment.objects.create(student=student, group=Group.objects.get(room=large))
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+
+
+class ActiveRoomTestCase(TestCase):
+    """
+    قاعات بحصص جارية الآن لاختبارات الشاشة الحية
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(username='monitor', password='testpass123', role='admin')
+        self.client.force_login(self.user)
+        self.teacher = Teacher.objects.create(
+            full_name='Test Teacher',
+            email='teacher@test.com',
+            phone='+201234567890',
+            specialization='Math',
+            hire_date=timezone.now().date()
+        )
+        now = timezone.localtime()
+        self.start = max(now - timedelta(minutes=5), now.replace(hour=0, minute=0)).time()
+        self.today = now.date()
+        self.counter = 0
+
+    def _add_active_room(self, present=0):
+        self.counter += 1
+        room = Room.objects.create(name=f'Room {self.counter}', capacity=30)
+        group = Group.objects.create(
+            group_name=f'Group {self.counter}',
+            teacher=self.teacher,
+            room=room,
+            schedule_day=self.today.strftime('%A'),
+            schedule_time=self.start,
+            standard_fee=200.00
+        )
+        session = Session.objects.create(group=group, session_date=self.today)
+        for index in range(present):
+            student = Student.objects.create(
+                student_code=f'{self.counter}{index:03d}',
+                full_name=f'Student {self.counter}-{index}',
+                parent_phone='+201234567890'
+            )
+            StudentGroupEnrollment.objects.create(student=student, group=group)
+            Attendance.objects.create(student=student, session=session, status='present')
+        return room
+
+
+class MonitorChannelTest(ActiveRoomTestCase):
+    """
+    اختبار قنوات الشاشة الحية (شاشة لكل مجموعة قاعات)
+    """
+
+    def test_channel_payload_contains_only_its_rooms(self):
+        """اختبار: القناة تحسب وترسل قاعاتها فقط"""
+        from apps.attendance.models import MonitorChannel
+        first = self._add_active_room(present=2)
+        self._add_active_room(present=1)
+
+        channel = MonitorChannel.objects.create(slug='wall-a', name='Wall A', alert_threshold_high_blocked=1)
+        channel.rooms.add(first)
+
+        response = self.client.get('/api/attendance/monitor/channel/wall-a/live-status/')
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual([room['id'] for room in payload['data']['rooms']], [first.room_id])
+        self.assertEqual(payload['data']['summary']['total_rooms'], 1)
+        self.assertEqual(payload['settings']['alert_threshold_high_blocked'], 1)
+
+        # Editing the channel is picked up immediately
+        second = Room.objects.exclude(pk=first.pk).get()
+        channel.rooms.add(second)
+        payload = self.client.get('/api/attendance/monitor/channel/wall-a/live-status/').json()
+        self.assertEqual(payload['data']['summary']['total_rooms'], 2)
+
+        missing = self.client.get('/api/attendance/monitor/channel/nope/live-status/')
+        self.assertEqual(missing.status_code, 404)
+
+    @override_settings(STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    })
+    def test_settings_page_persists_default_channel(self):
+        """اختبار: حفظ الإعدادات يُخزَّن في القناة الافتراضية"""
+        from apps.attendance.monitor_service import LiveMonitorService
+        self.assertEqual(LiveMonitorService.get_monitor_settings()['refresh_interval'], 5)
+
+        response = self.client.post('/attendance/monitor/settings/', {
+            'refresh_interval': 12,
+            'show_alerts': 'on',
+            'alert_threshold_low_attendance': 40,
+            'alert_threshold_high_blocked': 2,
+        })
+        self.assertEqual(response.status_code, 200)
+
+        settings = LiveMonitorService.get_monitor_settings()
+        self.assertEqual(settings['refresh_interval'], 12)
+        self.assertEqual(settings['alert_threshold_high_blocked'], 2)
+        self.assertFalse(settings['auto_refresh'])
+
+
+class MonitorHistoryTest(ActiveRoomTestCase):
+    """
+    اختبار لقطات الشاشة الحية بالدقيقة وإعادة عرضها
+    """
+
+    def test_replay_returns_recorded_minute(self):
+        """اختبار: إعادة العرض تعيد حالة القاعة كما سُجلت"""
+        from apps.attendance.models import RoomSnapshot
+        from apps.attendance.monitor_history import MonitorHistoryService
+        room = self._add_active_room(present=2)
+        self._add_active_room(present=1)
+        taken_at = timezone.now()
+
+        self.assertEqual(MonitorHistoryService.record(taken_at), 2)
+        # Retried task - one row per room and minute
+        MonitorHistoryService.record(taken_at)
+        self.assertEqual(RoomSnapshot.objects.count(), 2)
+
+        # Later attendance does not change the recorded minute
+        Attendance.objects.filter(session__group__room=room).delete()
+
+        response = self.client.get('/api/attendance/monitor/replay/', {
+            'at': timezone.localtime(taken_at).replace(tzinfo=None).isoformat(),
+            'room': room.room_id,
+        })
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['data']
+        self.assertIsNotNone(data['recorded_at'])
+        self.assertEqual(len(data['rooms']), 1)
+        self.assertEqual(data['rooms'][0]['session']['present'], 2)
+
+        earlier = MonitorHistoryService.replay(taken_at - timedelta(hours=1))
+        self.assertIsNone(earlier['recorded_at'])
+        self.assertTrue(all(room['session'] is None for room in earlier['rooms']))
+
+        invalid = self.client.get('/api/attendance/monitor/replay/', {'at': 'yesterday'})
+        self.assertEqual(invalid.status_code, 400)
+
+
+class SessionCounterTest(TestCase):
+    """
+    اختبار عدادات الحصة التزايدية والمصالحة مع السجلات
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+        self.supervisor = User.objects.create_user(
+            username='supervisor',
+            password='testpass123',
+            role='supervisor'
+        )
+        self.teacher = Teacher.objects.create(
+            full_name='Test Teacher',
+            email='teacher@test.com',
+            phone='+201234567890',
+            specialization='Math',
+            hire_date=timezone.now().date()
+        )
+        self.room = Room.objects.create(name='Room A', capacity=30)
+        self.day = timezone.localdate() - timedelta(days=1)
+        self.group = Group.objects.create(
+            group_name='Counter Group',
+            teacher=self.teacher,
+            room=self.room,
+            schedule_day=self.day.strftime('%A'),
+            schedule_time=time(10, 0),
+            standard_fee=200.00
+        )
+        self.students = []
+        for code in ('4001', '4002', '4003'):
+            student = Student.objects.create(
+                student_code=code,
+                full_name=f'Student {code}',
+                parent_phone='+201234567890'
+            )
+            StudentGroupEnrollment.objects.create(
+                student=student,
+                group=self.group,
+                financial_status='exempt'
+            )
+            self.students.append(student)
+
+        from apps.attendance.services import SessionService
+        self.session_id = SessionService.get_session_id(self.group.group_id, self.day)
+
+    def at(self, hour, minute):
+        return timezone.make_aware(datetime.combine(self.day, time(hour, minute)))
+
+    def test_scans_increment_counters_after_commit(self):
+        """اختبار: كل نتيجة مسح تزيد عدادها دون إعادة التجميع"""
+        from apps.attendance.session_counters import SessionCounterService
+        self.assertEqual(SessionCounterService.get(self.session_id)['present'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            AttendanceService.process_scan('4001', self.supervisor, scan_time=self.at(9, 55))
+        with self.captureOnCommitCallbacks(execute=True):
+            AttendanceService.process_scan('4002', self.supervisor, scan_time=self.at(10, 5))
+        with self.captureOnCommitCallbacks(execute=True):
+            AttendanceService.process_scan_batch(
+                [{'student_code': '4003', 'scan_time': self.at(9, 50)}], self.supervisor
+            )
+
+        with self.assertNumQueries(0):
+            counters = SessionCounterService.get(self.session_id)
+        self.assertEqual(counters['present'], 2)
+        self.assertEqual(counters['late_blocked'], 1)
+
+        from apps.attendance.models import BlockedAttempt
+        attempt = BlockedAttempt.objects.get(student=self.students[1])
+        self.assertEqual(attempt.session_id, self.session_id)
+
+        result = SessionCounterService.reconcile(self.day)
+        self.assertEqual(result['drifted'], 0)
+
+    @override_settings(ATTENDANCE_SCAN_DEDUP_SECONDS=0)
+    def test_repeated_blocked_scans_count_student_once(self):
+        """اختبار: تكرار مسح طالب ممنوع يُعدّ مرة واحدة (مباشرة وبعد إعادة البناء)"""
+        from apps.attendance.session_counters import SessionCounterService
+        SessionCounterService.get(self.session_id)
+
+        for minute in (5, 6):
+            with self.captureOnCommitCallbacks(execute=True):
+                AttendanceService.process_scan('4002', self.supervisor, scan_time=self.at(10, minute))
+        with self.captureOnCommitCallbacks(execute=True):
+            AttendanceService.process_scan_batch([
+                {'student_code': '4002', 'scan_time': self.at(10, 7)},
+                {'student_code': '4003', 'scan_time': self.at(10, 7)},
+            ], self.supervisor)
+
+        from apps.attendance.models import BlockedAttempt
+        self.assertEqual(BlockedAttempt.objects.filter(student=self.students[1]).count(), 3)
+        self.assertEqual(SessionCounterService.get(self.session_id)['late_blocked'], 2)
+        self.assertEqual(SessionCounterService.rebuild([self.session_id])[self.session_id]['late_blocked'], 2)
+
+    def test_reconcile_fixes_drift(self):
+        """اختبار: المصالحة تصحح العدادات بعد كتابة لا ترسل إشارات"""
+        from apps.attendance.session_counters import SessionCounterService
+        SessionCounterService.get(self.session_id)
+
+        Attendance.objects.bulk_create([
+            Attendance(student=self.students[0], session_id=self.session_id, status='present'),
+            Attendance(student=self.students[1], session_id=self.session_id, status='very_late'),
+        ])
+        self.assertEqual(SessionCounterService.get(self.session_id)['present'], 0)
+
+        result = SessionCounterService.reconcile(self.day)
+
+        self.assertEqual(result, {'date': self.day.isoformat(), 'sessions': 1, 'drifted': 1})
+        counters = SessionCounterService.get(self.session_id)
+        self.assertEqual(counters['present'], 1)
+        self.assertEqual(counters['very_late'], 1)
+
+    def test_session_flags_and_stats_endpoint(self):
+        """اختبار: حضور المدرس يظهر في العدادات ونقطة الإحصائيات تقرأ منها"""
+        from apps.attendance.session_counters import SessionCounterService
+        SessionCounterService.get(self.session_id)
+
+        session = Session.objects.get(pk=self.session_id)
+        session.teacher_attended = True
+        with self.captureOnCommitCallbacks(execute=True):
+            session.save()
+        self.assertEqual(SessionCounterService.get(self.session_id)['teacher_attended'], 1)
+
+        self.client.force_login(self.supervisor)
+        response = self.client.get(f'/attendance/htmx/api/session/{self.session_id}/stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['teacher_attended'])
+
+        missing = self.client.get(f'/attendance/htmx/api/session/{self.session_id + 100}/stats/')
+        self.assertEqual(missing.status_code, 404)
+
+
+class KioskHeartbeatTest(TestCase):
+    """
+    اختبار إشارات حياة الأكشاك في الذاكرة المؤقتة وحالة الأسطول
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        from apps.attendance.models import KioskDevice
+        cache.clear()
+        self.user = User.objects.create_user(username='fleet', password='testpass123', role='admin')
+        self.room_a = Room.objects.create(name='Room A', capacity=30)
+        self.room_b = Room.objects.create(name='Room B', capacity=30)
+        self.online = KioskDevice.objects.create(device_id='KIOSK-001', device_name='A1', room=self.room_a)
+        self.stale = KioskDevice.objects.create(device_id='KIOSK-002', device_name='A2', room=self.room_a)
+        self.offline = KioskDevice.objects.create(device_id='KIOSK-003', device_name='B1', room=self.room_b)
+
+    def test_poll_does_not_write_heartbeat(self):
+        """اختبار: استعلام الكشك لا يحدّث قاعدة البيانات حتى التفريغ"""
+        from apps.attendance.models import KioskDevice
+        from apps.attendance.tasks import flush_kiosk_heartbeats
+
+        response = self.client.get('/attendance/api/kiosk/KIOSK-001/current-session/')
+        self.assertEqual(response.status_code, 200)
+        self.online.refresh_from_db()
+        self.assertIsNone(self.online.last_heartbeat)
+
+        self.assertEqual(flush_kiosk_heartbeats()['updated'], 1)
+        self.online.refresh_from_db()
+        self.assertIsNotNone(self.online.last_heartbeat)
+        self.assertEqual(KioskDevice.objects.filter(last_heartbeat__isnull=False).count(), 1)
+
+        # Nothing newer to write
+        self.assertEqual(flush_kiosk_heartbeats()['updated'], 0)
+
+    def test_fleet_status_groups_kiosks_by_room(self):
+        """اختبار: حالة الأسطول لكل قاعة في استعلام واحد"""
+        from apps.attendance.kiosk_heartbeat import KioskHeartbeatService
+        now = timezone.now()
+        KioskHeartbeatService.beat('KIOSK-001', now - timedelta(seconds=5))
+        KioskHeartbeatService.beat('KIOSK-002', now - timedelta(minutes=2))
+
+        with self.assertNumQueries(1):
+            fleet = KioskHeartbeatService.get_fleet_status(now)
+
+        self.assertEqual(fleet['summary'], {'total': 3, 'online': 1, 'stale': 1, 'offline': 1})
+        room_a, room_b = fleet['rooms']
+        self.assertEqual((room_a['room_name'], room_a['online'], room_a['stale']), ('Room A', 1, 1))
+        self.assertEqual(room_b['kiosks'][0]['status'], 'offline')
+        self.assertIsNone(room_b['kiosks'][0]['last_heartbeat'])
+
+        self.assertEqual(self.client.get('/api/attendance/kiosks/fleet/').status_code, 302)
+        self.client.force_login(self.user)
+        payload = self.client.get('/api/attendance/kiosks/fleet/').json()
+        self.assertEqual(payload['summary']['stale'], 1)
+
+    @override_settings(STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    })
+    def test_kiosk_page_tags_offline_scans_with_room_device(self):
+        """اختبار: صفحة الكشك تمرر معرف جهاز نشط في قاعة الحصة فقط"""
+        teacher = Teacher.objects.create(
+            full_name='Kiosk Teacher', email='kiosk@test.com', phone='+201234567890',
+            specialization='Math', hire_date=timezone.now().date()
+        )
+        group = Group.objects.create(
+            group_name='Kiosk Group', teacher=teacher, room=self.room_a,
+            schedule_day='Monday', schedule_time=time(10, 0), standard_fee=200.00
+        )
+        session = Session.objects.create(group=group, session_date=timezone.localdate())
+        self.client.force_login(self.user)
+        url = f'/attendance/scanner/{session.pk}/kiosk/'
+
+        response = self.client.get(url, {'device': 'KIOSK-001'})
+        self.assertContains(response, 'data-device-id="KIOSK-001"')
+        self.assertContains(response, 'data-max-batch-size="200"')
+        # Another room's kiosk is not accepted
+        self.assertContains(self.client.get(url, {'device': 'KIOSK-003'}), 'data-device-id=""')
+
+
+class KioskManifestTest(ActiveRoomTestCase):
+    """
+    اختبار البيان الموقّع لحصص قاعة الكشك
+    """
+
+    def test_manifest_lists_verdicts_and_is_signed(self):
+        """اختبار: البيان يحمل حالة كل طالب وتوقيعاً بمفتاح الجهاز و304 عند عدم التغيير"""
+        from apps.attendance.models import KioskDevice
+        from apps.attendance.kiosk_manifest import KioskManifestService
+        room = self._add_active_room(present=3)
+        kiosk = KioskDevice.objects.create(device_id='KIOSK-M1', device_name='M1', room=room)
+        enrollments = list(StudentGroupEnrollment.objects.order_by('student__student_code'))
+        StudentGroupEnrollment.objects.filter(pk=enrollments[0].pk).update(sessions_paid_for=4)
+        StudentGroupEnrollment.objects.filter(pk=enrollments[2].pk).update(
+            is_new_student=False, sessions_attended=3
+        )
+
+        url = '/attendance/api/kiosk/KIOSK-M1/manifest/'
+        response = self.client.get(url, HTTP_X_KIOSK_TOKEN=kiosk.secret)
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+
+        session = payload['manifest']['sessions'][0]
+        self.assertNotIn('group_name', session)
+        self.assertEqual(session['students'], [
+            ['1000', 'allowed'], ['1001', 'new_student_block'], ['1002', 'debt_block'],
+        ])
+        self.assertTrue(KioskManifestService.verify(payload['manifest'], payload['signature'], kiosk.secret))
+        other = KioskDevice.objects.create(device_id='KIOSK-M2', device_name='M2', room=room)
+        self.assertNotEqual(other.secret, kiosk.secret)
+        self.assertFalse(KioskManifestService.verify(payload['manifest'], payload['signature'], other.secret))
+        session['students'][1][1] = 'allowed'
+        self.assertFalse(KioskManifestService.verify(payload['manifest'], payload['signature'], kiosk.secret))
+
+        self.assertEqual(
+            self.client.get(url, HTTP_X_KIOSK_TOKEN=kiosk.secret, HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+            304
+        )
+
+    def test_manifest_requires_device_token(self):
+        """اختبار: البيان مرفوض بدون مفتاح الجهاز أو بمفتاح جهاز آخر أو لجهاز معطل"""
+        from apps.attendance.models import KioskDevice
+        room = self._add_active_room(present=1)
+        kiosk = KioskDevice.objects.create(device_id='KIOSK-M1', device_name='M1', room=room)
+        other = KioskDevice.objects.create(device_id='KIOSK-M2', device_name='M2', room=room)
+        url = '/attendance/api/kiosk/KIOSK-M1/manifest/'
+
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_X_KIOSK_TOKEN=other.secret).status_code, 403)
+        self.assertEqual(
+            self.client.get('/attendance/api/kiosk/NOPE/manifest/', HTTP_X_KIOSK_TOKEN=kiosk.secret).status_code,
+            403
+        )
+        KioskDevice.objects.filter(pk=kiosk.pk).update(is_active=False)
+        self.assertEqual(self.client.get(url, HTTP_X_KIOSK_TOKEN=kiosk.secret).status_code, 403)
+
+
+class ScanDeduplicationTest(TestCase):
+    """
+    اختبار منع تكرار معالجة المسح المتكرر ومفتاح العميل
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.supervisor = User.objects.create_user(username='dedup', password='testpass123', role='supervisor')
+        teacher = Teacher.objects.create(
+            full_name='Test Teacher',
+            email='teacher@test.com',
+            phone='+201234567890',
+            specialization='Math',
+            hire_date=timezone.now().date()
+        )
+        self.day = timezone.localdate()
+        group = Group.objects.create(
+            group_name='Dedup Group',
+            teacher=teacher,
+            room=Room.objects.create(name='Room D', capacity=30),
+            schedule_day=self.day.strftime('%A'),
+            schedule_time=time(10, 0),
+            standard_fee=200.00
+        )
+        self.student = Student.objects.create(
+            student_code='5001',
+            full_name='Repeat Scanner',
+            parent_phone='+201234567890'
+        )
+        StudentGroupEnrollment.objects.create(student=self.student, group=group, financial_status='exempt')
+        from apps.attendance.services import SessionService
+        SessionService.materialize_sessions(self.day)
+
+    def at(self, hour, minute):
+        return timezone.make_aware(datetime.combine(self.day, time(hour, minute)))
+
+    def test_repeated_late_scan_is_answered_from_cache(self):
+        """اختبار: المسح المتأخر المتكرر لا يكتب محاولة ممنوعة ثانية"""
+        from apps.attendance.models import BlockedAttempt
+        first = AttendanceService.process_scan('5001', self.supervisor, scan_time=self.at(10, 5))
+        self.assertEqual(first['status'], 'late_blocked')
+
+        with self.assertNumQueries(0):
+            repeat = AttendanceService.process_scan('5001', self.supervisor, scan_time=self.at(10, 5))
+
+        self.assertEqual(repeat['status'], 'late_blocked')
+        self.assertTrue(repeat['duplicate_scan'])
+        self.assertEqual(BlockedAttempt.objects.filter(student=self.student).count(), 1)
+
+    def test_idempotency_key_replays_original_response(self):
+        """اختبار: إعادة الطلب بنفس المفتاح تُرجع النتيجة الأصلية والمسح المكرر رمادي"""
+        first = AttendanceService.process_scan(
+            '5001', self.supervisor, scan_time=self.at(9, 55), idempotency_key='req-1'
+        )
+        self.assertEqual(first['status'], 'present')
+
+        retried = AttendanceService.process_scan(
+            '5001', self.supervisor, scan_time=self.at(9, 55), idempotency_key='req-1'
+        )
+        self.assertEqual((retried['status'], retried['duplicate_scan']), ('present', True))
+        self.assertEqual(retried['student']['id'], self.student.student_id)
+        self.assertEqual(retried['attendance']['id'], first['attendance'].attendance_id)
+
+        repeat = AttendanceService.process_scan('5001', self.supervisor, scan_time=self.at(9, 55))
+        self.assertEqual(repeat['color_code'], 'gray')
+        self.assertEqual(Attendance.objects.filter(student=self.student).count(), 1)
+
+    def test_api_replay_matches_original_response(self):
+        """اختبار: إعادة الطلب عبر الواجهة تُرجع نفس الاستجابة مع duplicate_scan فقط"""
+        import json
+        self.client.force_login(self.supervisor)
+        with patch('django.utils.timezone.now', return_value=self.at(9, 55)):
+            responses = [
+                self.client.post(
+                    '/api/attendance/scan/', json.dumps({'barcode': '5001'}),
+                    content_type='application/json', HTTP_IDEMPOTENCY_KEY='req-2'
+                )
+                for _ in range(2)
+            ]
+
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+        first, retried = (response.json() for response in responses)
+        self.assertEqual(first['student']['name'], 'Repeat Scanner')
+        self.assertEqual(retried.pop('duplicate_scan'), True)
+        self.assertEqual(retried, first)
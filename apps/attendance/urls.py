@@ -52,10 +52,14 @@ urlpatterns = [
     
     # Live monitor dashboard
     path('monitor/', views.live_monitor_dashboard, name='live_monitor'),
+    path('monitor/channel/<slug:slug>/', views.live_monitor_channel, name='live_monitor_channel'),
     
     # Live monitor settings
     path('monitor/settings/', views.live_monitor_settings, name='live_monitor_settings'),
     
+    # Scan-path latency metrics
+    path('monitor/scan-metrics/', views.scan_metrics_dashboard, name='scan_metrics'),
+    
     # ========================================
     # Teacher & Kiosk APIs
     # ========================================
@@ -65,4 +69,5 @@ urlpatterns = [
     
     # Kiosk current session API
     path('api/kiosk/<str:device_id>/current-session/', views.kiosk_current_session, name='kiosk_current_session'),
+    path('api/kiosk/<str:device_id>/manifest/', views.kiosk_manifest, name='kiosk_manifest'),
 ]
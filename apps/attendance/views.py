@@ -1,10 +1,12 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
+from apps.accounts.decorators import admin_required
 from django.views.decorators.http import require_http_methods
 from django.http import JsonResponse
 from django.utils import timezone
 from .models import Session, Attendance
-from .services import AttendanceService
+from .services import AttendanceService, SessionService
+from .session_counters import SessionCounterService
 from apps.students.models import Student
 import json
 import logging
@@ -147,14 +149,42 @@ def live_monitor_dashboard(request):
     return render(request, 'attendance/live_monitor.html', context)
 
 
+@login_required
+def live_monitor_channel(request, slug):
+    """
+    Live monitor for one channel (a wall screen showing a subset of rooms)
+    شاشة المراقبة الحية لقناة واحدة
+    """
+    from django.http import Http404
+    from .monitor_service import LiveMonitorService
+    
+    channel = LiveMonitorService.get_channel(slug)
+    if channel is None:
+        raise Http404('Monitor channel not found')
+    
+    context = {
+        'page_title': channel['name'],
+        'dashboard_data': LiveMonitorService.get_channel_dashboard_data(channel),
+        'settings': channel['settings'],
+        'channel': channel,
+    }
+    
+    return render(request, 'attendance/live_monitor.html', context)
+
+
 @login_required
 def live_monitor_settings(request):
     """
     Live monitor settings page
     صفحة إعدادات الشاشة الحية
+    
+    Edits the 'default' channel, or ?channel=<slug>
     """
+    from .models import MonitorChannel
     from .monitor_service import LiveMonitorService
     
+    slug = request.GET.get('channel') or MonitorChannel.DEFAULT_SLUG
+    
     if request.method == 'POST':
         # Save settings
         settings = {
@@ -163,23 +193,71 @@ def live_monitor_settings(request):
             'show_alerts': request.POST.get('show_alerts') == 'on',
             'enable_sound': request.POST.get('enable_sound') == 'on',
             'fullscreen_mode': request.POST.get('fullscreen_mode') == 'on',
+            'alert_threshold_low_attendance': int(request.POST.get('alert_threshold_low_attendance', 50)),
+            'alert_threshold_high_blocked': int(request.POST.get('alert_threshold_high_blocked', 3)),
         }
         
-        # TODO: Save to database or user profile
+        if slug == MonitorChannel.DEFAULT_SLUG:
+            MonitorChannel.objects.update_or_create(
+                slug=slug,
+                defaults={'name': 'الشاشة الرئيسية', **settings}
+            )
+        else:
+            channel = get_object_or_404(MonitorChannel, slug=slug)
+            for field, value in settings.items():
+                setattr(channel, field, value)
+            channel.save()
         
         from django.contrib import messages
         messages.success(request, 'تم حفظ الإعدادات بنجاح')
-        
-    current_settings = LiveMonitorService.get_monitor_settings()
+    
+    channel = LiveMonitorService.get_channel(slug)
+    if channel is None and slug != MonitorChannel.DEFAULT_SLUG:
+        from django.http import Http404
+        raise Http404('Monitor channel not found')
+    current_settings = LiveMonitorService.get_monitor_settings(channel)
     
     context = {
         'page_title': 'إعدادات الشاشة الحية',
         'settings': current_settings,
+        'channel': channel,
     }
     
     return render(request, 'attendance/monitor_settings.html', context)
 
 
+@admin_required
+def scan_metrics_dashboard(request):
+    """
+    Scan-path latency page (per kiosk / per step percentiles)
+    صفحة قياس زمن خطوات المسح
+    """
+    from .scan_metrics import ScanMetrics
+    
+    summary = ScanMetrics.get_summary()
+    
+    # Flatten to rows - templates can't index dicts by variable
+    kiosks = [
+        {
+            'kiosk_id': kiosk_id,
+            'rows': [
+                {'step': step, **steps[step]}
+                for step in ScanMetrics.STEPS
+                if step in steps
+            ],
+        }
+        for kiosk_id, steps in summary['kiosks'].items()
+    ]
+    
+    context = {
+        'page_title': 'زمن معالجة المسح',
+        'window_minutes': summary['window_minutes'],
+        'kiosks': kiosks,
+    }
+    
+    return render(request, 'attendance/scan_metrics.html', context)
+
+
 @require_http_methods(["POST"])
 def scan_teacher_qr(request):
     """
@@ -217,61 +295,41 @@ def scan_teacher_qr(request):
                 'color_code': 'red'
             })
         
-        # Get current session for this teacher
-        now = timezone.now()
-        current_day = now.strftime('%A')
-        
-        from apps.teachers.models import Group
-        groups = Group.objects.filter(
-            teacher=teacher,
-            schedule_day=current_day,
-            is_active=True
-        )
-        
-        session_found = False
-        for group in groups:
-            # Check if within session time window
-            start_time = group.schedule_time
-            end_time = (
-                timezone.datetime.combine(now.date(), start_time) +
-                timezone.timedelta(minutes=group.duration)
-            ).time()
-            
-            current_time = now.time()
-            if start_time <= current_time <= end_time:
-                # Get or create session
-                session, _ = Session.objects.get_or_create(
-                    group=group,
-                    session_date=now.date()
-                )
-                
-                # Mark teacher as attended
-                session.teacher_attended = True
-                session.teacher_checkin_time = now
-                session.save(update_fields=['teacher_attended', 'teacher_checkin_time'])
-                
-                session_found = True
-                
-                logger.info(
-                    f"Teacher {teacher.full_name} checked in for session "
-                    f"{session.session_id} at {now}"
-                )
-                
-                return JsonResponse({
-                    'success': True,
-                    'message': f'مرحباً {teacher.full_name}\nتم تسجيل حضورك بنجاح',
-                    'color_code': 'green',
-                    'teacher_name': teacher.full_name,
-                    'group_name': group.group_name,
-                    'session_time': start_time.strftime('%H:%M')
-                })
+        # Get current session for this teacher (compiled weekly schedule)
+        from .schedule_index import ScheduleIndexService
+        now = timezone.localtime()
         
-        if not session_found:
+        group_ids = ScheduleIndexService.groups_for_teacher(teacher.teacher_id, now)
+        if not group_ids:
             return JsonResponse({
                 'success': False,
                 'message': f'{teacher.full_name}\nلا توجد حصة مجدولة الآن',
                 'color_code': 'white'
             })
+        
+        group = ScheduleIndexService.get_group(group_ids[0])
+        
+        # Session is pre-materialized for today - read it from cache
+        session = SessionService.get_session(group_ids[0], now.date())
+        
+        # Mark teacher as attended
+        session.teacher_attended = True
+        session.teacher_checkin_time = now
+        session.save(update_fields=['teacher_attended', 'teacher_checkin_time'])
+        
+        logger.info(
+            f"Teacher {teacher.full_name} checked in for session "
+            f"{session.session_id} at {now}"
+        )
+        
+        return JsonResponse({
+            'success': True,
+            'message': f'مرحباً {teacher.full_name}\nتم تسجيل حضورك بنجاح',
+            'color_code': 'green',
+            'teacher_name': teacher.full_name,
+            'group_name': group['group_name'],
+            'session_time': group['schedule_time'].strftime('%H:%M')
+        })
     
     except Exception as e:
         logger.exception(f"Error in teacher QR scan: {str(e)}")
@@ -289,12 +347,12 @@ def kiosk_current_session(request, device_id):
     """
     try:
         from .models import KioskDevice
+        from .kiosk_heartbeat import KioskHeartbeatService
         
         kiosk = get_object_or_404(KioskDevice, device_id=device_id, is_active=True)
         
-        # Update heartbeat
-        kiosk.last_heartbeat = timezone.now()
-        kiosk.save(update_fields=['last_heartbeat'])
+        # Heartbeat goes to the cache; flushed to the DB in bulk by Celery
+        KioskHeartbeatService.beat(kiosk.device_id)
         
         # Get current session
         session = kiosk.get_current_session()
@@ -308,12 +366,10 @@ def kiosk_current_session(request, device_id):
         # Get session details
         group = session.group
         
-        # Count attendance
-        total_students = group.enrollments.filter(is_active=True).count()
-        attended_count = Attendance.objects.filter(
-            session=session,
-            allow_entry=True
-        ).count()
+        # Count attendance (present count from the session counters)
+        total_students = group.studentgroupenrollment_set.filter(is_active=True).count()
+        counters = SessionCounterService.get(session.session_id) or {}
+        attended_count = counters.get('present', 0)
         
         return JsonResponse({
             'has_session': True,
@@ -322,7 +378,7 @@ def kiosk_current_session(request, device_id):
             'teacher_name': group.teacher.full_name,
             'room_name': group.room.name,
             'schedule_time': group.schedule_time.strftime('%H:%M'),
-            'duration': group.duration,
+            'duration': group.session_duration,
             'total_students': total_students,
             'attended_count': attended_count,
             'is_cancelled': session.is_cancelled,
@@ -336,3 +392,30 @@ def kiosk_current_session(request, device_id):
             'error': 'خطأ في النظام'
         }, status=500)
 
+
+@require_http_methods(["GET"])
+def kiosk_manifest(request, device_id):
+    """
+    API endpoint: signed manifest of the kiosk room's current and upcoming sessions
+    بيان موقّع بطلاب حصص القاعة وحالتهم المالية للتحقق المسبق على الكشك
+    
+    The kiosk authenticates with its secret in X-Kiosk-Token; unknown,
+    inactive or unauthenticated devices get 403.
+    Answers 304 while the roster and verdicts are unchanged (If-None-Match).
+    """
+    from django.utils.cache import get_conditional_response, patch_cache_control
+    from .kiosk_manifest import KioskManifestService
+    
+    kiosk = KioskManifestService.authenticate(request, device_id)
+    if kiosk is None:
+        return JsonResponse({
+            'success': False,
+            'error': 'جهاز غير مصرح'
+        }, status=403)
+    data = KioskManifestService.build(kiosk)
+    
+    response = JsonResponse({'success': True, **data})
+    etag = f'"{data["version"]}"'
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return get_conditional_response(request, etag=etag, response=response)
@@ -0,0 +1,226 @@
+"""
+Notification Dispatch Layer
+طبقة إرسال الإشعارات بعد نجاح المعاملة
+
+Notification tasks are not published from inside the scan transaction.
+Intents are collected while the transaction runs and published after
+commit (transaction.on_commit) over a single broker producer connection.
+Intents from a transaction that rolls back are never published.
+
+If the broker is unreachable, intents are appended to a local spool file
+(settings.NOTIFICATION_SPOOL_PATH, JSON lines) and the
+notifications.drain_dispatch_spool task publishes them later. After a
+failed publish the process skips the broker for
+NOTIFICATION_BROKER_RETRY_SECONDS and spools straight away, so only one
+request per window waits for the broker connection to time out.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationDispatcher:
+    """
+    تجميع نوايا الإشعار ونشرها دفعة واحدة بعد نجاح المعاملة
+    """
+
+    _local = threading.local()
+
+    # monotonic() deadline set by a failed publish - until then intents are spooled
+    _broker_down_until = 0.0
+
+    # ========================================
+    # Collecting
+    # ========================================
+
+    @classmethod
+    @contextmanager
+    def batch(cls):
+        """
+        جمع كل الإشعارات داخل الكتلة ونشرها مرة واحدة بعد نجاح المعاملة
+
+        يجب أن تُغلق الكتلة داخل transaction.atomic حتى ترتبط بالمعاملة.
+        """
+        outer = getattr(cls._local, 'intents', None)
+        if outer is not None:
+            # Nested batch - the outermost one publishes
+            yield
+            return
+
+        cls._local.intents = []
+        try:
+            yield
+        except BaseException:
+            cls._local.intents = None
+            raise
+
+        intents, cls._local.intents = cls._local.intents, None
+        if intents:
+            transaction.on_commit(lambda: cls.publish(intents))
+
+    @classmethod
+    def dispatch(cls, task, **kwargs) -> None:
+        """
+        تسجيل نية إرسال مهمة إشعار
+
+        Args:
+            task: مهمة Celery (مثال: send_late_block_task)
+            **kwargs: معاملات المهمة (قابلة للتحويل إلى JSON)
+        """
+        intent = {'task': task.name, 'kwargs': kwargs}
+
+        intents = getattr(cls._local, 'intents', None)
+        if intents is not None:
+            intents.append(intent)
+        else:
+            # Outside a batch - still wait for the surrounding transaction
+            transaction.on_commit(lambda: cls.publish([intent]))
+
+    # ========================================
+    # Publishing
+    # ========================================
+
+    @classmethod
+    def publish(cls, intents: List[Dict[str, Any]]) -> int:
+        """
+        نشر النوايا عبر اتصال واحد بالوسيط، أو حفظها في ملف الانتظار
+
+        Returns:
+            int: عدد المهام المنشورة
+        """
+        from celery import current_app
+
+        if not intents:
+            return 0
+
+        if cls._is_eager():
+            # Eager mode (tests/dev): run through the task objects directly
+            for intent in intents:
+                try:
+                    current_app.tasks[intent['task']].delay(**intent['kwargs'])
+                except Exception as e:
+                    logger.error(f"Eager notification task {intent['task']} failed: {e}")
+            return len(intents)
+
+        if time.monotonic() < cls._broker_down_until:
+            NotificationSpool.append(intents)
+            return 0
+
+        published = 0
+        try:
+            with current_app.producer_or_acquire() as producer:
+                for intent in intents:
+                    current_app.send_task(
+                        intent['task'],
+                        kwargs=intent['kwargs'],
+                        producer=producer,
+                        retry=False
+                    )
+                    published += 1
+        except Exception as e:
+            cls._broker_down_until = time.monotonic() + cls._broker_retry_seconds()
+            logger.warning(
+                f"Broker unavailable, spooling {len(intents) - published} notifications: {e}"
+            )
+            NotificationSpool.append(intents[published:])
+
+        return published
+
+    @staticmethod
+    def _broker_retry_seconds() -> int:
+        return getattr(settings, 'NOTIFICATION_BROKER_RETRY_SECONDS', 30)
+
+    @staticmethod
+    def _is_eager() -> bool:
+        from celery import current_app
+        return bool(current_app.conf.task_always_eager)
+
+    @classmethod
+    def drain_spool(cls) -> Dict[str, int]:
+        """
+        نشر الإشعارات المحفوظة في ملف الانتظار
+        """
+        intents = NotificationSpool.take()
+        if not intents:
+            return {'drained': 0, 'published': 0}
+
+        published = cls.publish(intents)
+        return {'drained': len(intents), 'published': published}
+
+
+class NotificationSpool:
+    """
+    ملف انتظار محلي (JSON lines) للإشعارات عند تعطل الوسيط
+    """
+
+    @staticmethod
+    def get_path() -> str:
+        return str(getattr(
+            settings,
+            'NOTIFICATION_SPOOL_PATH',
+            os.path.join(settings.BASE_DIR, 'spool', 'notifications.jsonl')
+        ))
+
+    @classmethod
+    def append(cls, intents: List[Dict[str, Any]]) -> None:
+        path = cls.get_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        lines = ''.join(json.dumps(intent, cls=DjangoJSONEncoder) + '\n' for intent in intents)
+        with open(path, 'a', encoding='utf-8') as spool:
+            fcntl.flock(spool, fcntl.LOCK_EX)
+            try:
+                spool.write(lines)
+                spool.flush()
+                os.fsync(spool.fileno())
+            finally:
+                fcntl.flock(spool, fcntl.LOCK_UN)
+
+    @classmethod
+    def take(cls) -> List[Dict[str, Any]]:
+        """
+        قراءة كل النوايا المحفوظة وتفريغ الملف (تحت قفل)
+        """
+        path = cls.get_path()
+        if not os.path.exists(path):
+            return []
+
+        with open(path, 'r+', encoding='utf-8') as spool:
+            fcntl.flock(spool, fcntl.LOCK_EX)
+            try:
+                lines = spool.readlines()
+                spool.seek(0)
+                spool.truncate()
+            finally:
+                fcntl.flock(spool, fcntl.LOCK_UN)
+
+        intents = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                intents.append(json.loads(line))
+            except ValueError:
+                logger.error(f"Dropping corrupt spooled notification: {line[:200]}")
+        return intents
+
+    @classmethod
+    def size(cls) -> int:
+        path = cls.get_path()
+        if not os.path.exists(path):
+            return 0
+        with open(path, 'r', encoding='utf-8') as spool:
+            return sum(1 for line in spool if line.strip())
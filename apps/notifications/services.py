@@ -7,7 +7,7 @@ import requests
 from django.conf import settings
 from django.utils import timezone
 from django.db import transaction
-from typing import Dict, Optional, Any
+from typing import Dict, List, Optional, Any
 
 
 class TemplateService:
@@ -106,6 +106,13 @@ class TemplateService:
 للطالب/ة: {student_name}
 رقم الإيصال: {receipt_number}
 التاريخ: {payment_date}
+تم تحديث الرصيد ✅""",
+            
+            'payment_confirmation_bulk': """شكراً لكم 🙏
+تم استلام دفعة بقيمة: {amount} جنيه
+{lines}
+رقم الإيصال: {receipt_number}
+التاريخ: {payment_date}
 تم تحديث الرصيد ✅""",
         }
         
@@ -602,6 +609,54 @@ class NotificationService:
             context=context
         )
     
+    def send_bulk_payment_confirmation(
+        self,
+        students,
+        lines: List[Dict[str, Any]],
+        amount: float,
+        receipt_number: str,
+        payment_date: timezone.datetime
+    ) -> Dict[str, Any]:
+        """
+        Send one payment confirmation for a family's bulk payment
+        
+        Args:
+            students: Students of the same parent phone (first one is logged)
+            lines: [{'student_name', 'group_name', 'amount', 'sessions'}]
+            amount: Total amount
+            receipt_number: Receipt number
+            payment_date: Payment date
+            
+        Returns:
+            dict: Result
+        """
+        student = students[0]
+        context = {
+            'student_name': '، '.join(sorted({line['student_name'] for line in lines})),
+            'amount': amount,
+            'lines': '\n'.join(
+                f"- {line['student_name']} ({line['group_name']}): {line['amount']} جنيه - {line['sessions']} حصة"
+                for line in lines
+            ),
+            'receipt_number': receipt_number,
+            'payment_date': payment_date.strftime('%Y-%m-%d'),
+        }
+        
+        message = self.template_service.render_template(
+            'payment_confirmation_bulk',
+            context
+        )
+        
+        return self.whatsapp_service.send_message(
+            to=student.parent_phone,
+            message=message,
+            student=student,
+            student_name=context['student_name'],
+            notification_type='payment_confirmation',
+            template_type='payment_confirmation_bulk',
+            context=context
+        )
+    
     def send_session_cancelled(
         self,
         student,
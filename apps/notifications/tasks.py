@@ -8,7 +8,7 @@ from celery.utils.log import get_task_logger
 from datetime import timedelta
 from django.utils import timezone
 from django.db.models import Q, Count
-from typing import Dict, Any
+from typing import Dict, Any, List
 
 from .services import NotificationService
 from .models import NotificationLog, NotificationCost
@@ -334,6 +334,124 @@ def send_payment_confirmation_task(
         raise self.retry(exc=e)
 
 
+@shared_task(
+    bind=True,
+    max_retries=3,
+    default_retry_delay=300,
+    autoretry_for=(Exception,),
+)
+def send_bulk_payment_confirmation_task(
+    self,
+    student_ids: List[int],
+    lines: List[Dict[str, Any]],
+    amount: float,
+    receipt_number: str,
+    payment_date_str: str
+) -> Dict[str, Any]:
+    """
+    Send one consolidated payment confirmation per parent phone (async)
+    
+    Triggered when: A bulk payment covers several students / groups
+    
+    Args:
+        student_ids: Students paid for (same parent phone)
+        lines: [{'student_name', 'group_name', 'amount', 'sessions'}]
+        amount: Total amount
+        receipt_number: Receipt number
+        payment_date_str: Payment date as ISO string
+        
+    Returns:
+        dict: Result
+    """
+    from apps.students.models import Student
+    from django.utils.dateparse import parse_datetime
+    
+    try:
+        students = list(Student.objects.filter(student_id__in=student_ids).order_by('student_id'))
+        if not students:
+            logger.error(f"Students {student_ids} not found")
+            return {'success': False, 'error': 'Student not found'}
+        
+        service = NotificationService()
+        result = service.send_bulk_payment_confirmation(
+            students, lines, amount, receipt_number, parse_datetime(payment_date_str)
+        )
+        
+        logger.info(f"Bulk payment confirmation {receipt_number} sent to {students[0].parent_phone}: {result}")
+        return result
+        
+    except Exception as e:
+        logger.error(f"Error sending bulk payment confirmation: {e}")
+        raise self.retry(exc=e)
+
+
+@shared_task(
+    bind=True,
+    max_retries=3,
+    default_retry_delay=300,
+    autoretry_for=(Exception,),
+)
+def send_credit_warning_task(
+    self,
+    student_id: int,
+    group_id: int,
+    warning_type: str,
+    remaining_credit: int = None
+) -> Dict[str, Any]:
+    """
+    Send credit warning notification (async)
+    
+    Triggered when: Attendance leaves one session of credit (credit_warning)
+    or the second unpaid session is attended (credit_final_warning)
+    
+    Args:
+        student_id: Student ID
+        group_id: Group ID
+        warning_type: credit_warning | credit_final_warning
+        remaining_credit: Remaining sessions of credit
+        
+    Returns:
+        dict: Result
+    """
+    from apps.students.models import Student
+    from apps.teachers.models import Group
+    from apps.payments.whatsapp_templates import get_credit_whatsapp_message
+    from .services import WhatsAppService
+    
+    try:
+        student = Student.objects.get(student_id=student_id)
+        group = Group.objects.get(group_id=group_id)
+        
+        context = {
+            'student_name': student.full_name,
+            'group_name': group.group_name,
+        }
+        if remaining_credit is not None:
+            context['remaining_credit'] = remaining_credit
+        
+        notification = get_credit_whatsapp_message(warning_type, context)
+        result = WhatsAppService().send_message(
+            to=student.parent_phone,
+            message=notification['message'],
+            student=student,
+            student_name=student.full_name,
+            notification_type=warning_type
+        )
+        
+        logger.info(f"Credit warning ({warning_type}) sent to {student.full_name}: {result}")
+        return result
+        
+    except Student.DoesNotExist:
+        logger.error(f"Student {student_id} not found")
+        return {'success': False, 'error': 'Student not found'}
+    except Group.DoesNotExist:
+        logger.error(f"Group {group_id} not found")
+        return {'success': False, 'error': 'Group not found'}
+    except Exception as e:
+        logger.error(f"Error sending credit warning: {e}")
+        raise self.retry(exc=e)
+
+
 # ========================================
 # Scheduled Tasks (Celery Beat)
 # ========================================
@@ -473,6 +591,23 @@ def cleanup_old_notification_logs_task():
     return {'deleted_count': deleted_count}
 
 
+@shared_task(name='notifications.drain_dispatch_spool')
+def drain_dispatch_spool_task():
+    """
+    Publish notifications spooled while the broker was unreachable
+    Runs every minute
+    """
+    from .dispatch import NotificationDispatcher
+    
+    result = NotificationDispatcher.drain_spool()
+    if result['drained']:
+        logger.info(
+            f"Drained {result['drained']} spooled notifications "
+            f"({result['published']} published)"
+        )
+    return result
+
+
 # ========================================
 # Batch Notification Tasks
 # ========================================
@@ -603,3 +603,95 @@ class IntegrationTest(TestCase):
         
         # Check notification was triggered
         mock_task.assert_called_once()
+
+
+class NotificationDispatchTest(TestCase):
+    """Test on_commit notification dispatch and broker-down spool"""
+
+    def setUp(self):
+        import tempfile
+        from .dispatch import NotificationDispatcher
+        NotificationDispatcher._broker_down_until = 0.0
+        self.spool_dir = tempfile.mkdtemp()
+        self.spool_path = f'{self.spool_dir}/notifications.jsonl'
+
+    def tearDown(self):
+        import shutil
+        from .dispatch import NotificationDispatcher
+        NotificationDispatcher._broker_down_until = 0.0
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+    @patch('apps.notifications.dispatch.NotificationDispatcher.publish')
+    def test_batch_publishes_once_after_commit(self, mock_publish):
+        """Test intents are collected and published once on commit"""
+        from django.db import transaction
+        from .dispatch import NotificationDispatcher
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic(), NotificationDispatcher.batch():
+                NotificationDispatcher.dispatch(send_late_block_task, student_id=1)
+                NotificationDispatcher.dispatch(send_attendance_success_task, student_id=2)
+                mock_publish.assert_not_called()
+
+        mock_publish.assert_called_once()
+        intents = mock_publish.call_args[0][0]
+        self.assertEqual([intent['kwargs']['student_id'] for intent in intents], [1, 2])
+
+    @patch('apps.notifications.dispatch.NotificationDispatcher.publish')
+    def test_rolled_back_intents_are_dropped(self, mock_publish):
+        """Test nothing is published for a rolled back transaction"""
+        from django.db import transaction
+        from .dispatch import NotificationDispatcher
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError):
+                with transaction.atomic(), NotificationDispatcher.batch():
+                    NotificationDispatcher.dispatch(send_late_block_task, student_id=1)
+                    raise ValueError('rollback')
+
+        mock_publish.assert_not_called()
+
+    def test_broker_down_spools_and_drains(self):
+        """Test intents are spooled when the broker is unreachable"""
+        from celery import current_app
+        from .dispatch import NotificationDispatcher, NotificationSpool
+
+        intents = [
+            {'task': send_late_block_task.name, 'kwargs': {'student_id': 1}},
+            {'task': send_attendance_success_task.name, 'kwargs': {'student_id': 2}},
+        ]
+
+        with override_settings(NOTIFICATION_SPOOL_PATH=self.spool_path), \
+                patch.object(NotificationDispatcher, '_is_eager', return_value=False), \
+                patch.object(current_app, 'producer_or_acquire', side_effect=ConnectionError('down')):
+            self.assertEqual(NotificationDispatcher.publish(intents), 0)
+            self.assertEqual(NotificationSpool.size(), 2)
+
+        with override_settings(NOTIFICATION_SPOOL_PATH=self.spool_path), \
+                patch.object(NotificationDispatcher, 'publish', return_value=2) as mock_publish:
+            result = NotificationDispatcher.drain_spool()
+
+        self.assertEqual(result, {'drained': 2, 'published': 2})
+        self.assertEqual(mock_publish.call_args[0][0], intents)
+        with override_settings(NOTIFICATION_SPOOL_PATH=self.spool_path):
+            self.assertEqual(NotificationSpool.size(), 0)
+
+    def test_broker_skipped_after_recent_failure(self):
+        """Test publishes right after a broker failure spool without connecting"""
+        from celery import current_app
+        from .dispatch import NotificationDispatcher, NotificationSpool
+
+        intent = {'task': send_late_block_task.name, 'kwargs': {'student_id': 1}}
+
+        with override_settings(NOTIFICATION_SPOOL_PATH=self.spool_path), \
+                patch.object(NotificationDispatcher, '_is_eager', return_value=False), \
+                patch.object(current_app, 'producer_or_acquire', side_effect=ConnectionError('down')) as mock_acquire:
+            NotificationDispatcher.publish([intent])
+            NotificationDispatcher.publish([intent])
+            self.assertEqual(mock_acquire.call_count, 1)
+            self.assertEqual(NotificationSpool.size(), 2)
+
+            # Window over - the broker is tried again
+            NotificationDispatcher._broker_down_until = 0.0
+            NotificationDispatcher.publish([intent])
+            self.assertEqual(mock_acquire.call_count, 2)
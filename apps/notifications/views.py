@@ -13,6 +13,10 @@ from datetime import timedelta
 
 from .models import NotificationLog, NotificationTemplate, NotificationPreference, NotificationCost
 from .services import NotificationCost as NotificationCostService
+from utils.cache_utils import CachedPayload
+
+
+NOTIFICATION_STATS_CACHE = CachedPayload('notification_stats', ttl=60)
 
 
 @login_required
@@ -289,11 +293,18 @@ def api_notification_stats(request):
     """
     API endpoint for notification statistics (for dashboard widgets)
     """
-    from django.db.models import Count, Q
-    
     now = timezone.now()
+    month = now.strftime('%Y-%m')
     month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     
+    # Shared by every dashboard widget; one worker rebuilds, the rest get the last stats
+    stats = NOTIFICATION_STATS_CACHE.get(lambda: _build_notification_stats(month_start), month)
+    
+    return JsonResponse({**stats, 'month': month})
+
+
+def _build_notification_stats(month_start):
+    """Notification statistics payload for the month (uncached)"""
     # Get stats
     total_sent = NotificationLog.objects.filter(
         sent_at__gte=month_start,
@@ -314,12 +325,11 @@ def api_notification_stats(request):
         ).count()
         by_type[type_code] = count
     
-    return JsonResponse({
+    return {
         'total_sent': total_sent,
         'total_failed': total_failed,
         'by_type': by_type,
-        'month': now.strftime('%Y-%m'),
-    })
+    }
 
 
 # ========================================
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.db.models import Sum
-from .models import Payment, PaymentAuditLog
+from .models import LedgerEntry, Payment, PaymentAuditLog, StudentBalance, TeacherSettlement
 from apps.students.models import StudentGroupEnrollment
 
 
@@ -133,36 +133,96 @@ class PaymentAdmin(admin.ModelAdmin):
     clear_payments.short_description = "🔄 تصفير المدفوعات"
 
     def bulk_record_payment(self, request, queryset):
-        """تسجيل دفع جماعي وتحديث الائتمان"""
+        """تسجيل دفع جماعي وتحديث الائتمان (معاملة واحدة وإيصال واحد لكل ولي أمر)"""
         from .services import CreditService
         from django.contrib import messages
         
-        count = 0
+        # بند واحد لكل (طالب، مجموعة) - عدد الحصص 4 كحد أدنى للشهر
+        lines = {}
         for payment in queryset:
-            try:
-                # حساب عدد الحصص (نفترض 4 حصص كحد أدنى للشهر)
-                sessions_count = max(4, payment.sessions_attended)
-                amount_per_session = payment.amount_due / sessions_count if sessions_count > 0 else 0
-                
-                # تسجيل الدفع
-                result = CreditService.record_payment_and_update_credit(
-                    student=payment.student,
-                    group=payment.group,
-                    amount=payment.amount_due,
-                    sessions_count=sessions_count,
-                    performed_by=request.user,
-                    notes=f'دفع جماعي من لوحة الإدارة - {payment.month.strftime("%Y-%m")}'
-                )
-                
-                if result['success']:
-                    count += 1
-            except Exception as e:
-                messages.warning(request, f'خطأ في {payment.student.full_name}: {str(e)}')
+            line = lines.setdefault(
+                (payment.student_id, payment.group_id),
+                {'student_id': payment.student_id, 'group_id': payment.group_id, 'amount': 0, 'sessions': 0}
+            )
+            line['amount'] += payment.amount_due
+            line['sessions'] += max(4, payment.sessions_attended)
+        entries = list(lines.values())
+        result = CreditService.record_bulk_payments(
+            entries,
+            performed_by=request.user,
+            notes='دفع جماعي من لوحة الإدارة'
+        )
         
-        if count > 0:
+        if result['success']:
             self.message_user(
                 request,
-                f'تم تسجيل دفع {count} طالب وتحديث الائتمان',
+                f'تم تسجيل دفع {len(entries)} طالب وتحديث الائتمان',
                 level='SUCCESS'
             )
+        else:
+            for error in result['errors']:
+                messages.warning(request, f"خطأ في البند {error['index']}: {error['error']}")
     bulk_record_payment.short_description = "💰 تسجيل دفع جماعي (تحديث الائتمان)"
+
+
+@admin.register(TeacherSettlement)
+class TeacherSettlementAdmin(admin.ModelAdmin):
+    """Admin interface for stored settlement snapshots (read only)"""
+    list_display = [
+        'teacher', 'month', 'version', 'total_revenue',
+        'center_share', 'teacher_share', 'computed_at'
+    ]
+    list_filter = ['month']
+    search_fields = ['teacher__full_name']
+    ordering = ['-month', 'teacher', '-version']
+    date_hierarchy = 'month'
+    exclude = ['report_pdf']
+
+    def has_add_permission(self, request):
+        """اللقطات تُنشأ من مهمة نهاية الشهر فقط"""
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        """منع التعديل"""
+        return False
+
+
+@admin.register(LedgerEntry)
+class LedgerEntryAdmin(admin.ModelAdmin):
+    """Admin interface for the student ledger (append-only)"""
+    list_display = [
+        'created_at', 'student', 'group', 'entry_type', 'sessions',
+        'amount', 'enrollment_balance', 'student_balance'
+    ]
+    list_filter = ['entry_type', 'created_at']
+    search_fields = ['student__full_name', 'student__student_code', 'group__group_name']
+    ordering = ['-created_at', '-entry_id']
+    date_hierarchy = 'created_at'
+    list_select_related = ['student', 'group']
+
+    def has_add_permission(self, request):
+        """القيود تُضاف من CreditService فقط"""
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        """منع التعديل"""
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        """الدفتر للإضافة فقط"""
+        return False
+
+
+@admin.register(StudentBalance)
+class StudentBalanceAdmin(admin.ModelAdmin):
+    """Admin interface for materialized student balances"""
+    list_display = ['student', 'balance', 'owed_sessions', 'total_paid', 'updated_at']
+    search_fields = ['student__full_name', 'student__student_code']
+    ordering = ['balance']
+    list_select_related = ['student']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -3,4 +3,6 @@ from . import api_views
 
 urlpatterns = [
     path('<int:payment_id>/record/', api_views.record_payment, name='api_record_payment'),
+    path('bulk/', api_views.bulk_record_payments, name='api_bulk_record_payments'),
+    path('ledger/<int:student_id>/', api_views.student_ledger, name='api_student_ledger'),
 ]
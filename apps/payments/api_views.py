@@ -1,8 +1,11 @@
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 import json
 from .models import Payment
+from .ledger import LedgerService
 
 
 @login_required
@@ -35,3 +38,72 @@ def record_payment(request, payment_id):
             'success': False,
             'error': 'Payment not found'
         }, status=404)
+
+
+@login_required
+@require_http_methods(["POST"])
+def bulk_record_payments(request):
+    """
+    API endpoint لتسجيل دفع جماعي (عدة أبناء / مجموعات)
+    
+    Body (JSON): {"entries": [{"student_id", "group_id", "amount", "sessions"}], "notes": ""}
+    """
+    from .services import CreditService
+    
+    try:
+        data = json.loads(request.body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return JsonResponse({
+            'success': False,
+            'error': 'Invalid JSON'
+        }, status=400)
+    
+    if not isinstance(data, dict) or not isinstance(data.get('entries'), list):
+        return JsonResponse({
+            'success': False,
+            'error': 'entries must be a list'
+        }, status=400)
+    
+    result = CreditService.record_bulk_payments(
+        data['entries'],
+        performed_by=request.user,
+        notes=str(data.get('notes', ''))
+    )
+    return JsonResponse(result, status=200 if result['success'] else 400)
+
+
+@login_required
+@require_http_methods(["GET"])
+def student_ledger(request, student_id):
+    """
+    API endpoint لرصيد الطالب وكشف حسابه
+    
+    Query: ?start=YYYY-MM-DD&end=YYYY-MM-DD (end exclusive)
+    """
+    from datetime import datetime, time
+    from apps.students.models import Student
+    
+    if not Student.objects.filter(pk=student_id).exists():
+        return JsonResponse({
+            'success': False,
+            'error': 'Student not found'
+        }, status=404)
+    
+    bounds = {}
+    for name in ('start', 'end'):
+        value = request.GET.get(name)
+        if not value:
+            continue
+        day = parse_date(value)
+        if day is None:
+            return JsonResponse({
+                'success': False,
+                'error': f'Invalid {name} date'
+            }, status=400)
+        bounds[name] = timezone.make_aware(datetime.combine(day, time.min))
+    
+    return JsonResponse({
+        'success': True,
+        'balance': LedgerService.get_balance(student_id),
+        'statement': LedgerService.get_statement(student_id, **bounds)
+    })
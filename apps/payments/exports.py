@@ -0,0 +1,90 @@
+"""
+Credit Report Export
+تصدير تقرير الائتمان (CSV / Excel)
+
+Both formats consume CreditService.iter_credit_report_rows, so a full
+center export never holds more than one database chunk of rows:
+
+- CSV is generated line by line for a StreamingHttpResponse.
+- XLSX uses openpyxl's write-only workbook, which streams rows to a
+  temporary file; the finished file is then sent with FileResponse
+  (an .xlsx is a zip archive and cannot be sent before it is closed).
+
+Text cells starting with =, +, - or @ (e.g. a student name typed by
+staff) are prefixed with a quote so spreadsheets do not run them as
+formulas (CSV/formula injection).
+"""
+
+import csv
+import tempfile
+from typing import Any, Dict, Iterable, Iterator
+
+
+class CreditReportExport:
+    """
+    تصدير صفوف تقرير الائتمان
+    """
+
+    # Column headers, in CreditService.CREDIT_REPORT_FIELDS order
+    HEADERS = (
+        'كود الطالب', 'اسم الطالب', 'المجموعة', 'طالب جديد', 'رصيد الائتمان',
+        'الحصص المحضور', 'الحصص المدفوعة', 'الدين (حصص)', 'محظور مالياً', 'سبب الحظر',
+    )
+
+    # Leading characters that make Excel / LibreOffice treat a cell as a formula
+    FORMULA_PREFIXES = ('=', '+', '-', '@')
+
+    class _Echo:
+        """File-like object whose write() returns the line (for csv.writer)"""
+
+        def write(self, value):
+            return value
+
+    @classmethod
+    def csv_lines(cls, rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+        """
+        أسطر CSV واحداً تلو الآخر (مع BOM ليفتحها Excel بالعربية)
+        """
+        writer = csv.writer(cls._Echo())
+        yield '\ufeff' + writer.writerow(cls.HEADERS)
+        for row in rows:
+            yield writer.writerow(cls._values(row))
+
+    @classmethod
+    def write_xlsx(cls, rows: Iterable[Dict[str, Any]]):
+        """
+        كتابة ملف Excel بوضع write-only
+
+        Returns:
+            ملف مؤقت مفتوح في بدايته (يُحذف عند إغلاقه)
+        """
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet('تقرير الائتمان')
+        sheet.sheet_view.rightToLeft = True
+        sheet.append(cls.HEADERS)
+        for row in rows:
+            sheet.append(cls._values(row))
+
+        output = tempfile.TemporaryFile(suffix='.xlsx')
+        workbook.save(output)
+        output.seek(0)
+        return output
+
+    @staticmethod
+    def _values(row: Dict[str, Any]) -> list:
+        from .services import CreditService
+
+        values = [row[field] for field in CreditService.CREDIT_REPORT_FIELDS]
+        return [CreditReportExport._cell(value) for value in values]
+
+    @staticmethod
+    def _cell(value: Any) -> Any:
+        if value is True:
+            return 'نعم'
+        if value is False:
+            return 'لا'
+        if isinstance(value, str) and value.startswith(CreditReportExport.FORMULA_PREFIXES):
+            return "'" + value
+        return value
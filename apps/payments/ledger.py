@@ -0,0 +1,296 @@
+"""
+Student Ledger
+دفتر الطالب المالي مع أرصدة جارية
+
+CreditService appends one LedgerEntry per credit change:
+
+- attendance_debit: -1 session (a consumed attendance)
+- payment_credit:   +N sessions and the amount paid
+- adjustment:       credit_balance change (manual, or the grace sessions a
+                    new student gets with the first payment)
+
+The balance is in sessions of remaining credit - credit_balance +
+sessions_paid_for - sessions_attended, summed over the student's
+enrollments. StudentBalance keeps the student's totals (balance, owed
+sessions, money paid) up to date with a single UPDATE per operation, so
+"what does this family owe" is one primary-key read. Each entry stores the
+running balances after it, so a statement is one range scan on the
+(student, created_at) index.
+
+Students without a StudentBalance row (history from before the ledger)
+are seeded from their enrollment counters on first use; rebuild_balance
+re-seeds a student after counters were edited outside CreditService, and
+the nightly reconcile task finds and re-seeds any that drifted.
+"""
+
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from django.db import IntegrityError, transaction
+from django.db.models import DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import LedgerEntry, Payment, StudentBalance
+
+
+class LedgerService:
+    """
+    قيود دفتر الطالب والأرصدة المجمعة
+    """
+
+    ATTENDANCE_DEBIT = 'attendance_debit'
+    PAYMENT_CREDIT = 'payment_credit'
+    ADJUSTMENT = 'adjustment'
+
+    # ========================================
+    # Posting
+    # ========================================
+
+    @classmethod
+    def entry(
+        cls,
+        entry_type: str,
+        sessions: int,
+        enrollment_balance: int,
+        owed_sessions: int = 0,
+        amount: Decimal = Decimal('0'),
+        notes: str = '',
+    ) -> Dict[str, Any]:
+        """
+        قيد واحد لـ post
+
+        Args:
+            sessions: تغير الرصيد بالحصص (+/-)
+            enrollment_balance: رصيد التسجيل بعد القيد
+            owed_sessions: تغير عدد الحصص غير المدفوعة
+            amount: المبلغ المدفوع (قيود الدفع فقط)
+        """
+        return {
+            'entry_type': entry_type,
+            'sessions': sessions,
+            'enrollment_balance': enrollment_balance,
+            'owed_sessions': owed_sessions,
+            'amount': amount,
+            'notes': notes[:255],
+        }
+
+    @classmethod
+    def post(
+        cls,
+        student_id: int,
+        group_id: int,
+        enrollment_id: Optional[int],
+        *entries: Dict[str, Any],
+        performed_by=None,
+    ) -> List[LedgerEntry]:
+        """
+        إضافة قيود عملية واحدة وتحديث رصيد الطالب (تحديث واحد)
+
+        Called after the enrollment counters (and Payment row) were
+        written, inside the caller's transaction.
+        """
+        sessions = sum(entry['sessions'] for entry in entries)
+        owed_sessions = sum(entry['owed_sessions'] for entry in entries)
+        paid = sum(
+            (entry['amount'] for entry in entries if entry['entry_type'] == cls.PAYMENT_CREDIT),
+            Decimal('0')
+        )
+
+        with transaction.atomic(savepoint=False):
+            balance = cls._apply(student_id, sessions, owed_sessions, paid) - sessions
+            rows = []
+            for entry in entries:
+                balance += entry['sessions']
+                rows.append(LedgerEntry(
+                    student_id=student_id,
+                    group_id=group_id,
+                    enrollment_id=enrollment_id,
+                    entry_type=entry['entry_type'],
+                    sessions=entry['sessions'],
+                    amount=entry['amount'],
+                    enrollment_balance=entry['enrollment_balance'],
+                    student_balance=balance,
+                    notes=entry['notes'],
+                    performed_by=performed_by,
+                ))
+            return LedgerEntry.objects.bulk_create(rows)
+
+    @classmethod
+    def _apply(cls, student_id: int, sessions: int, owed_sessions: int, paid: Decimal) -> int:
+        """
+        تطبيق التغير على StudentBalance وإرجاع الرصيد بعده
+        """
+        updated = StudentBalance.objects.filter(pk=student_id).update(
+            balance=F('balance') + sessions,
+            owed_sessions=F('owed_sessions') + owed_sessions,
+            total_paid=F('total_paid') + paid,
+            updated_at=timezone.now()
+        )
+        if not updated:
+            # First entries: the counters already include this operation
+            try:
+                with transaction.atomic():
+                    return StudentBalance.objects.create(student_id=student_id, **cls._totals(student_id)).balance
+            except IntegrityError:
+                # Seeded concurrently - apply the change to that row
+                return cls._apply(student_id, sessions, owed_sessions, paid)
+        return StudentBalance.objects.filter(pk=student_id).values_list('balance', flat=True).get()
+
+    # ========================================
+    # Balances
+    # ========================================
+
+    @classmethod
+    def get_balance(cls, student_id: int) -> Dict[str, Any]:
+        """
+        رصيد الطالب عبر كل مجموعاته (قراءة واحدة بالمفتاح)
+
+        Returns:
+            {'balance': int, 'owed_sessions': int, 'total_paid': float}
+        """
+        row = StudentBalance.objects.filter(pk=student_id).values(
+            'balance', 'owed_sessions', 'total_paid'
+        ).first()
+        if row is None:
+            row = cls.rebuild_balance(student_id)
+        return {
+            'balance': row['balance'],
+            'owed_sessions': row['owed_sessions'],
+            'total_paid': float(row['total_paid']),
+        }
+
+    @staticmethod
+    def get_enrollment_balance(enrollment_id: int) -> Optional[int]:
+        """
+        رصيد تسجيل واحد (من عدادات التسجيل نفسها)
+        """
+        from apps.students.models import StudentGroupEnrollment
+
+        return StudentGroupEnrollment.objects.filter(pk=enrollment_id).values_list(
+            F('credit_balance') + F('sessions_paid_for') - F('sessions_attended'),
+            flat=True
+        ).first()
+
+    @classmethod
+    def rebuild_balance(cls, student_id: int) -> Dict[str, Any]:
+        """
+        إعادة حساب رصيد الطالب من عدادات التسجيلات والمدفوعات
+        """
+        totals = cls._totals(student_id)
+        StudentBalance.objects.update_or_create(student_id=student_id, defaults=totals)
+        return totals
+
+    @classmethod
+    def _totals(cls, student_id: int) -> Dict[str, Any]:
+        return cls._totals_many([student_id])[student_id]
+
+    @staticmethod
+    def _totals_many(student_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """
+        الأرصدة المتوقعة لعدة طلاب من العدادات (استعلامان مجمعان)
+        """
+        from apps.students.models import StudentGroupEnrollment
+
+        totals = {
+            student_id: {'balance': 0, 'owed_sessions': 0, 'total_paid': Decimal('0')}
+            for student_id in student_ids
+        }
+        # Every enrollment - debt in a group the student left is still owed
+        for row in StudentGroupEnrollment.objects.filter(student_id__in=student_ids).values('student_id').annotate(
+            balance=Coalesce(Sum(F('credit_balance') + F('sessions_paid_for') - F('sessions_attended')), 0),
+            owed_sessions=Coalesce(Sum(Greatest(F('sessions_attended') - F('sessions_paid_for'), 0)), 0),
+        ).order_by():
+            totals[row['student_id']].update(balance=row['balance'], owed_sessions=row['owed_sessions'])
+        for row in Payment.objects.filter(student_id__in=student_ids).values('student_id').annotate(
+            total=Coalesce(Sum('amount_paid'), Value(Decimal('0')), output_field=DecimalField())
+        ).order_by():
+            totals[row['student_id']]['total_paid'] = row['total']
+        return totals
+
+    @classmethod
+    def reconcile(cls, chunk_size: int = 500, fix: bool = True) -> Dict[str, Any]:
+        """
+        مقارنة الأرصدة المخزنة بالعدادات وإصلاح الفروقات
+
+        Catches counters edited outside CreditService (raw updates, data
+        fixes). Drifted students are re-seeded with rebuild_balance.
+
+        Returns:
+            {'checked': int, 'drifted': [{'student_id', 'stored', 'expected'}]}
+        """
+        fields = ('balance', 'owed_sessions', 'total_paid')
+        student_ids = list(StudentBalance.objects.order_by('pk').values_list('pk', flat=True))
+        drifted = []
+        for start in range(0, len(student_ids), chunk_size):
+            chunk = student_ids[start:start + chunk_size]
+            expected = cls._totals_many(chunk)
+            for row in StudentBalance.objects.filter(pk__in=chunk).values('student_id', *fields):
+                stored = {field: row[field] for field in fields}
+                if stored != expected[row['student_id']]:
+                    drifted.append({
+                        'student_id': row['student_id'],
+                        'stored': stored,
+                        'expected': expected[row['student_id']],
+                    })
+        if fix:
+            for item in drifted:
+                cls.rebuild_balance(item['student_id'])
+        return {'checked': len(student_ids), 'drifted': drifted}
+
+    # ========================================
+    # Statements
+    # ========================================
+
+    @staticmethod
+    def get_statement(student_id: int, start=None, end=None) -> Dict[str, Any]:
+        """
+        كشف حساب الطالب في فترة [start, end)
+
+        Returns:
+            {
+                'student_id', 'opening_balance', 'closing_balance',
+                'entries': [{'entry_id', 'created_at', 'entry_type', 'group_id',
+                             'group_name', 'sessions', 'amount',
+                             'enrollment_balance', 'student_balance', 'notes'}]
+            }
+        """
+        entries = LedgerEntry.objects.filter(student_id=student_id)
+        if start is not None:
+            entries = entries.filter(created_at__gte=start)
+        if end is not None:
+            entries = entries.filter(created_at__lt=end)
+        entries = list(entries.select_related('group').order_by('created_at', 'entry_id'))
+
+        if entries:
+            opening = entries[0].student_balance - entries[0].sessions
+            closing = entries[-1].student_balance
+        elif start is not None:
+            # No movement in the period - balance of the last earlier entry
+            opening = closing = LedgerEntry.objects.filter(
+                student_id=student_id,
+                created_at__lt=start
+            ).order_by('-created_at', '-entry_id').values_list('student_balance', flat=True).first()
+        else:
+            opening = closing = None
+
+        return {
+            'student_id': student_id,
+            'opening_balance': opening,
+            'closing_balance': closing,
+            'entries': [
+                {
+                    'entry_id': entry.entry_id,
+                    'created_at': timezone.localtime(entry.created_at).isoformat(),
+                    'entry_type': entry.entry_type,
+                    'group_id': entry.group_id,
+                    'group_name': entry.group.group_name,
+                    'sessions': entry.sessions,
+                    'amount': float(entry.amount),
+                    'enrollment_balance': entry.enrollment_balance,
+                    'student_balance': entry.student_balance,
+                    'notes': entry.notes,
+                }
+                for entry in entries
+            ],
+        }
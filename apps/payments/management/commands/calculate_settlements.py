@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from apps.payments.services import SettlementService, SettlementSnapshotService
+from apps.teachers.models import Teacher
+
+
+class Command(BaseCommand):
+    help = 'Calculate month-end settlements for all active teachers'
+
+    def add_arguments(self, parser):
+        today = timezone.localdate()
+        parser.add_argument('--year', type=int, default=today.year, help='Settlement year (default: this year)')
+        parser.add_argument('--month', type=int, default=today.month, help='Settlement month 1-12 (default: this month)')
+        parser.add_argument(
+            '--teacher',
+            type=int,
+            action='append',
+            dest='teachers',
+            help='Limit to a teacher id (repeatable)',
+        )
+        parser.add_argument(
+            '--save',
+            action='store_true',
+            help='Persist settlement snapshots (new version only where payments changed)',
+        )
+
+    def handle(self, *args, **options):
+        year, month = options['year'], options['month']
+        if not 1 <= month <= 12:
+            raise CommandError('--month must be between 1 and 12')
+
+        result = SettlementService.calculate_month_settlements(year, month, teacher_ids=options['teachers'])
+        settlements = result['data']
+        names = dict(
+            Teacher.objects.filter(
+                teacher_id__in=[data['teacher_id'] for data in settlements]
+            ).values_list('teacher_id', 'full_name')
+        )
+
+        self.stdout.write(f'Settlements for {year}-{month:02d} ({len(settlements)} teachers)')
+        for data in settlements:
+            self.stdout.write(
+                f"{names.get(data['teacher_id'], data['teacher_id'])}: "
+                f"revenue {data['total_revenue']:.2f} / expected {data['expected_revenue']:.2f} | "
+                f"center {data['center_share']:.2f} ({data['center_percentage']:g}%) | "
+                f"teacher {data['teacher_share']:.2f}"
+            )
+
+        total_revenue = sum(data['total_revenue'] for data in settlements)
+        total_teacher = sum(data['teacher_share'] for data in settlements)
+        self.stdout.write(self.style.SUCCESS(
+            f'Total revenue {total_revenue:.2f}, teachers {total_teacher:.2f}, '
+            f'center {total_revenue - total_teacher:.2f}'
+        ))
+
+        if options['save']:
+            saved = SettlementSnapshotService.snapshot_month(year, month, teacher_ids=options['teachers'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Saved snapshots for {saved['teachers']} teachers in {saved['chunks']} chunks "
+                f"({saved['created']} new versions)"
+            ))
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_rename_pay_audit_stu_idx_payment_aud_student_242867_idx_and_more'),
+        ('teachers', '0004_teacher_qr_code_base64_teacher_qr_code_generated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeacherSettlement',
+            fields=[
+                ('settlement_id', models.AutoField(primary_key=True, serialize=False)),
+                ('month', models.DateField(verbose_name='الشهر')),
+                ('version', models.PositiveIntegerField(default=1, verbose_name='الإصدار')),
+                ('checksum', models.CharField(help_text="SHA-256 of the month's payments and the teacher's groups", max_length=64, verbose_name='بصمة المدخلات')),
+                ('total_revenue', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='إجمالي الإيراد')),
+                ('expected_revenue', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='الإيراد المتوقع')),
+                ('center_share', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='نصيب السنتر')),
+                ('teacher_share', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='نصيب المدرس')),
+                ('center_percentage', models.DecimalField(decimal_places=2, max_digits=5, verbose_name='نسبة السنتر %')),
+                ('data', models.JSONField(verbose_name='تفاصيل التسوية')),
+                ('report_pdf', models.BinaryField(blank=True, null=True)),
+                ('computed_at', models.DateTimeField(auto_now_add=True, verbose_name='وقت الحساب')),
+                ('teacher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='settlements', to='teachers.teacher', verbose_name='المدرس')),
+            ],
+            options={
+                'verbose_name': 'تسوية مدرس',
+                'verbose_name_plural': 'تسويات المدرسين',
+                'db_table': 'teacher_settlements',
+                'ordering': ['-month', 'teacher', '-version'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='teachersettlement',
+            constraint=models.UniqueConstraint(fields=('teacher', 'month', 'version'), name='unique_teacher_settlement_version'),
+        ),
+    ]
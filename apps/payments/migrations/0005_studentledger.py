@@ -0,0 +1,58 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:48
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_teachersettlement'),
+        ('students', '0004_rename_stu_cred_idx_student_gro_is_new__88c21f_idx_and_more'),
+        ('teachers', '0004_teacher_qr_code_base64_teacher_qr_code_generated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentBalance',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ledger_balance', serialize=False, to='students.student', verbose_name='الطالب')),
+                ('balance', models.IntegerField(default=0, verbose_name='الرصيد (حصص)')),
+                ('owed_sessions', models.IntegerField(default=0, verbose_name='الحصص غير المدفوعة')),
+                ('total_paid', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='إجمالي المدفوع')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='آخر تحديث')),
+            ],
+            options={
+                'verbose_name': 'رصيد طالب',
+                'verbose_name_plural': 'أرصدة الطلاب',
+                'db_table': 'student_balances',
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('entry_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('entry_type', models.CharField(choices=[('attendance_debit', 'خصم حضور'), ('payment_credit', 'إضافة دفع'), ('adjustment', 'تعديل')], max_length=20, verbose_name='نوع القيد')),
+                ('sessions', models.IntegerField(verbose_name='الحصص (+/-)')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='المبلغ')),
+                ('enrollment_balance', models.IntegerField(verbose_name='رصيد المجموعة بعد القيد')),
+                ('student_balance', models.IntegerField(verbose_name='رصيد الطالب بعد القيد')),
+                ('notes', models.CharField(blank=True, max_length=255, verbose_name='ملاحظات')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='التاريخ والوقت')),
+                ('enrollment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='students.studentgroupenrollment', verbose_name='التسجيل')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='teachers.group', verbose_name='المجموعة')),
+                ('performed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to=settings.AUTH_USER_MODEL, verbose_name='تم بواسطة')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='students.student', verbose_name='الطالب')),
+            ],
+            options={
+                'verbose_name': 'قيد مالي',
+                'verbose_name_plural': 'دفتر الطلاب المالي',
+                'db_table': 'ledger_entries',
+                'ordering': ['created_at', 'entry_id'],
+                'indexes': [models.Index(fields=['student', 'created_at'], name='ledger_student_created_idx'), models.Index(fields=['enrollment', 'created_at'], name='ledger_enrollment_created_idx')],
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -168,3 +169,162 @@ class Payment(models.Model):
     def remaining(self):
         """Calculate remaining amount to be paid."""
         return max(0, self.amount_due - self.amount_paid)
+
+
+class TeacherSettlement(models.Model):
+    """
+    Stored month settlement of a teacher (one row per computed version).
+    A new version is written only when the month's inputs (checksum) change.
+    """
+    settlement_id = models.AutoField(primary_key=True)
+    teacher = models.ForeignKey(
+        'teachers.Teacher',
+        on_delete=models.CASCADE,
+        related_name='settlements',
+        verbose_name="المدرس"
+    )
+    month = models.DateField(verbose_name="الشهر")
+    version = models.PositiveIntegerField(default=1, verbose_name="الإصدار")
+    checksum = models.CharField(
+        max_length=64,
+        verbose_name="بصمة المدخلات",
+        help_text="SHA-256 of the month's payments and the teacher's groups"
+    )
+
+    total_revenue = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="إجمالي الإيراد")
+    expected_revenue = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="الإيراد المتوقع")
+    center_share = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="نصيب السنتر")
+    teacher_share = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="نصيب المدرس")
+    center_percentage = models.DecimalField(max_digits=5, decimal_places=2, verbose_name="نسبة السنتر %")
+    data = models.JSONField(verbose_name="تفاصيل التسوية")
+
+    # Cached utils.pdf_generator.generate_settlement_report output
+    report_pdf = models.BinaryField(null=True, blank=True, editable=False)
+
+    computed_at = models.DateTimeField(auto_now_add=True, verbose_name="وقت الحساب")
+
+    class Meta:
+        db_table = 'teacher_settlements'
+        verbose_name = 'تسوية مدرس'
+        verbose_name_plural = 'تسويات المدرسين'
+        ordering = ['-month', 'teacher', '-version']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['teacher', 'month', 'version'],
+                name='unique_teacher_settlement_version'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.teacher.full_name} - {self.month.strftime('%Y-%m')} v{self.version}"
+
+
+class LedgerEntry(models.Model):
+    """
+    قيد في دفتر الطالب المالي (إضافة فقط)
+    Append-only financial ledger of a student.
+
+    Amounts are in sessions of remaining credit (credit_balance +
+    sessions_paid_for - sessions_attended, the value can_attend_session
+    checks); payments also carry the money amount. Each entry stores the
+    running balances after it, so a statement is one range scan on
+    (student, created_at).
+    """
+    ENTRY_TYPE_CHOICES = [
+        ('attendance_debit', 'خصم حضور'),
+        ('payment_credit', 'إضافة دفع'),
+        ('adjustment', 'تعديل'),
+    ]
+
+    entry_id = models.BigAutoField(primary_key=True)
+    student = models.ForeignKey(
+        'students.Student',
+        on_delete=models.CASCADE,
+        related_name='ledger_entries',
+        verbose_name="الطالب"
+    )
+    group = models.ForeignKey(
+        'teachers.Group',
+        on_delete=models.CASCADE,
+        related_name='ledger_entries',
+        verbose_name="المجموعة"
+    )
+    enrollment = models.ForeignKey(
+        'students.StudentGroupEnrollment',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='ledger_entries',
+        verbose_name="التسجيل"
+    )
+    entry_type = models.CharField(
+        max_length=20,
+        choices=ENTRY_TYPE_CHOICES,
+        verbose_name="نوع القيد"
+    )
+    sessions = models.IntegerField(verbose_name="الحصص (+/-)")
+    amount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        verbose_name="المبلغ"
+    )
+
+    # الأرصدة الجارية بعد القيد
+    enrollment_balance = models.IntegerField(verbose_name="رصيد المجموعة بعد القيد")
+    student_balance = models.IntegerField(verbose_name="رصيد الطالب بعد القيد")
+
+    notes = models.CharField(max_length=255, blank=True, verbose_name="ملاحظات")
+    performed_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='ledger_entries',
+        verbose_name="تم بواسطة"
+    )
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="التاريخ والوقت")
+
+    class Meta:
+        db_table = 'ledger_entries'
+        verbose_name = 'قيد مالي'
+        verbose_name_plural = 'دفتر الطلاب المالي'
+        ordering = ['created_at', 'entry_id']
+        indexes = [
+            models.Index(fields=['student', 'created_at'], name='ledger_student_created_idx'),
+            models.Index(fields=['enrollment', 'created_at'], name='ledger_enrollment_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_entry_type_display()} {self.sessions:+d} - {self.student_id} - {self.created_at}"
+
+
+class StudentBalance(models.Model):
+    """
+    الرصيد المالي المجمع للطالب عبر كل مجموعاته (يُحدث مع كل قيد)
+    Materialized totals of a student's ledger - one row per student.
+    """
+    student = models.OneToOneField(
+        'students.Student',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='ledger_balance',
+        verbose_name="الطالب"
+    )
+    balance = models.IntegerField(default=0, verbose_name="الرصيد (حصص)")
+    owed_sessions = models.IntegerField(default=0, verbose_name="الحصص غير المدفوعة")
+    total_paid = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name="إجمالي المدفوع"
+    )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="آخر تحديث")
+
+    class Meta:
+        db_table = 'student_balances'
+        verbose_name = 'رصيد طالب'
+        verbose_name_plural = 'أرصدة الطلاب'
+
+    def __str__(self):
+        return f"{self.student_id}: {self.balance}"
@@ -1,14 +1,22 @@
-from django.db.models import Sum, Q
-from django.db import transaction, models
+import hashlib
+import json
+from decimal import Decimal
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Sum, Q, F, Case, When, Value, OuterRef, Subquery, Count, Max
+from django.db.models.functions import Coalesce
+from django.db import transaction, models, IntegrityError
 from django.utils import timezone
 from datetime import datetime
-from .models import Payment, PaymentAuditLog
+from .models import Payment, PaymentAuditLog, TeacherSettlement
+from .ledger import LedgerService
 from apps.teachers.models import Group
 from apps.students.models import StudentGroupEnrollment
 from apps.attendance.models import Attendance
-from apps.notifications.services import WhatsAppService
-from apps.notifications.tasks import send_payment_confirmation_task
-from .whatsapp_templates import get_credit_whatsapp_message
+from apps.attendance.roster_index import RosterIndexService
+from apps.notifications.tasks import (
+    send_payment_confirmation_task, send_bulk_payment_confirmation_task, send_credit_warning_task
+)
+from apps.notifications.dispatch import NotificationDispatcher
 
 
 class CreditService:
@@ -26,11 +34,19 @@ class CreditService:
     RETURNING_STUDENT_CREDIT = 2
     CREDIT_LIMIT_WARNING = 1  # إرسال تحذير عند حصة واحدة متبقية
 
+    # أعمدة تفاصيل تقرير الائتمان (get_credit_report / iter_credit_report_rows)
+    CREDIT_REPORT_FIELDS = (
+        'student_code', 'student_name', 'group_name', 'is_new_student',
+        'credit_balance', 'sessions_attended', 'sessions_paid_for', 'debt',
+        'is_blocked', 'block_reason',
+    )
+    CREDIT_REPORT_CHUNK_SIZE = 2000
+
     @staticmethod
-    @transaction.atomic
     def check_credit_status(student, group):
         """
         فحص حالة الائتمان للطالب في مجموعة معينة
+        قراءة فقط (بدون قفل) - الخصم الفعلي شرطي في record_attendance_and_update_credit
         
         Args:
             student: كائن الطالب
@@ -45,7 +61,7 @@ class CreditService:
             }
         """
         try:
-            enrollment = StudentGroupEnrollment.objects.select_for_update().get(
+            enrollment = StudentGroupEnrollment.objects.get(
                 student=student,
                 group=group,
                 is_active=True
@@ -229,37 +245,11 @@ class CreditService:
                 is_active=True
             )
             
-            # حفظ القيم القديمة للسجل
-            old_values = {
-                'sessions_paid_for': enrollment.sessions_paid_for,
-                'credit_balance': enrollment.credit_balance,
-                'last_payment_amount': float(enrollment.last_payment_amount) if enrollment.last_payment_amount else 0,
-            }
-            
-            # تحديث عدد الحصص المدفوعة
-            enrollment.sessions_paid_for += sessions_count
-            enrollment.last_payment_date = timezone.now()
-            enrollment.last_payment_amount = amount
-            
-            # إذا كان طالب جديد، قم بتحويله لطالب قديم بعد أول دفع
-            if enrollment.is_new_student:
-                enrollment.is_new_student = False
-                enrollment.credit_balance = CreditService.RETURNING_STUDENT_CREDIT
-            
-            # إزالة الحظر المالي إذا كان موجوداً
-            if enrollment.is_financially_blocked:
-                enrollment.is_financially_blocked = False
-                enrollment.financial_block_reason = ''
-            
+            old_values, new_values, ledger_entries = CreditService._apply_payment(
+                enrollment, amount, sessions_count, timezone.now(), notes
+            )
             enrollment.save()
             
-            # حفظ القيم الجديدة
-            new_values = {
-                'sessions_paid_for': enrollment.sessions_paid_for,
-                'credit_balance': enrollment.credit_balance,
-                'last_payment_amount': float(enrollment.last_payment_amount),
-            }
-            
             # تسجيل في سجل التدقيق
             CreditService._log_audit(
                 student=student,
@@ -296,6 +286,11 @@ class CreditService:
                     payment.status = 'partial'
                 payment.save()
             
+            LedgerService.post(
+                student.student_id, group.group_id, enrollment.pk, *ledger_entries,
+                performed_by=performed_by
+            )
+            
             # إرسال إشعار تأكيد استلام الدفع (Async)
             CreditService._trigger_payment_confirmation(
                 student=student,
@@ -316,40 +311,338 @@ class CreditService:
             }
 
     @staticmethod
-    @transaction.atomic
-    def record_attendance_and_update_credit(student, group):
+    def record_bulk_payments(entries, performed_by=None, notes=''):
         """
-        تسجيل الحضور وتحديث عداد الحصص المحضور
-        يتم استدعاؤه بعد تسجيل الحضور بنجاح
+        تسجيل دفع جماعي (عدة أبناء / مجموعات) في معاملة واحدة
+        
+        - قفل التسجيلات بترتيب المفتاح (لا تتعارض دفعتان متزامنتان)
+        - سجلات التدقيق بـ bulk_create (الإجراء bulk_payment)
+        - سجلات الدفع الشهرية بـ upsert جماعي واحد
+        - إيصال واتساب واحد لكل رقم ولي أمر
         
         Args:
-            student: كائن الطالب
-            group: كائن المجموعة
+            entries: [{'student_id', 'group_id', 'amount', 'sessions'}]
+            performed_by: المستخدم الذي قام بالتسجيل
+            notes: ملاحظات إضافية
+            
+        Returns:
+            dict: {
+                'success': bool,
+                'message': str,
+                'errors': [{'index', 'error'}] (عند الفشل),
+                'total_amount': float,
+                'receipts': [{'parent_phone', 'receipt_number', 'amount', 'lines'}]
+            }
         """
-        try:
-            enrollment = StudentGroupEnrollment.objects.select_for_update().get(
-                student=student,
-                group=group,
-                is_active=True
+        lines, errors = CreditService._bulk_payment_lines(entries)
+        if errors:
+            return {
+                'success': False,
+                'message': 'بيانات الدفع غير صحيحة',
+                'errors': errors
+            }
+        
+        pairs = Q()
+        for student_id, group_id in lines:
+            pairs |= Q(student_id=student_id, group_id=group_id)
+        
+        paid_at = timezone.now()
+        current_month = timezone.localdate(paid_at).replace(day=1)
+        
+        with transaction.atomic(), NotificationDispatcher.batch():
+            # Primary-key order: concurrent batches lock in the same order
+            enrollments = {
+                (enrollment.student_id, enrollment.group_id): enrollment
+                for enrollment in StudentGroupEnrollment.objects.select_for_update(of=('self',)).filter(
+                    pairs, is_active=True
+                ).select_related('student', 'group').order_by('pk')
+            }
+            missing = [
+                {'index': line['index'], 'error': 'الطالب غير مسجل في هذه المجموعة'}
+                for pair, line in lines.items() if pair not in enrollments
+            ]
+            if missing:
+                return {
+                    'success': False,
+                    'message': 'الطالب غير مسجل في هذه المجموعة',
+                    'errors': missing
+                }
+            
+            audit_logs = []
+            ledger = []
+            for pair, line in lines.items():
+                enrollment = enrollments[pair]
+                old_values, new_values, ledger_entries = CreditService._apply_payment(
+                    enrollment, line['amount'], line['sessions'], paid_at, notes
+                )
+                audit_logs.append(PaymentAuditLog(
+                    student_id=enrollment.student_id,
+                    group_id=enrollment.group_id,
+                    action='bulk_payment',
+                    old_value=old_values,
+                    new_value=new_values,
+                    amount=line['amount'],
+                    sessions_count=line['sessions'],
+                    notes=notes,
+                    performed_by=performed_by
+                ))
+                ledger.append((enrollment, ledger_entries))
+            
+            StudentGroupEnrollment.objects.bulk_update(
+                list(enrollments.values()),
+                ['sessions_paid_for', 'last_payment_date', 'last_payment_amount', 'is_new_student',
+                 'credit_balance', 'is_financially_blocked', 'financial_block_reason']
             )
+            audit_logs = PaymentAuditLog.objects.bulk_create(audit_logs)
+            CreditService._upsert_month_payments(enrollments, lines, current_month, paid_at)
             
-            enrollment.sessions_attended += 1
-            enrollment.save()
+            for enrollment, ledger_entries in ledger:
+                LedgerService.post(
+                    enrollment.student_id, enrollment.group_id, enrollment.pk, *ledger_entries,
+                    performed_by=performed_by
+                )
             
-            # التحقق من الحاجة لإرسال تحذير
-            debt = enrollment.sessions_attended - enrollment.sessions_paid_for
-            remaining_credit = enrollment.credit_balance - debt
+            receipts = CreditService._trigger_bulk_payment_confirmation(
+                [(enrollments[pair], line, log) for (pair, line), log in zip(lines.items(), audit_logs)],
+                paid_at
+            )
             
-            # إرسال تحذير عند حصة واحدة متبقية
-            if remaining_credit == CreditService.CREDIT_LIMIT_WARNING:
-                CreditService._send_credit_warning(student, group, remaining_credit)
+            # bulk_update لا يرسل post_save - تحديث فهرس المسح بعد نجاح المعاملة
+            student_codes = {enrollment.student.student_code for enrollment in enrollments.values()}
+            transaction.on_commit(lambda: [
+                RosterIndexService.invalidate_student(student_code) for student_code in student_codes
+            ])
+        
+        return {
+            'success': True,
+            'message': f'تم تسجيل {len(lines)} دفعة',
+            'total_amount': float(sum(line['amount'] for line in lines.values())),
+            'receipts': receipts
+        }
+
+    @staticmethod
+    def _bulk_payment_lines(entries):
+        """
+        التحقق من بنود الدفع الجماعي
+        
+        Returns:
+            tuple: ({(student_id, group_id): {'index', 'amount', 'sessions'}}, errors)
+        """
+        from decimal import InvalidOperation
+        
+        lines = {}
+        errors = []
+        if not entries:
+            return lines, [{'index': None, 'error': 'لا توجد بنود دفع'}]
+        
+        for index, entry in enumerate(entries):
+            try:
+                pair = (int(entry['student_id']), int(entry['group_id']))
+                amount = Decimal(str(entry['amount']))
+                sessions = int(entry['sessions'])
+            except (KeyError, TypeError, ValueError, InvalidOperation):
+                errors.append({'index': index, 'error': 'بند غير صالح'})
+                continue
             
-            # إرسال تحذير عند الحصة الثانية غير المدفوعة
-            if debt == 2 and not enrollment.is_new_student:
-                CreditService._send_final_warning(student, group)
+            if not amount.is_finite() or amount < 0 or sessions <= 0:
+                errors.append({'index': index, 'error': 'مبلغ أو عدد حصص غير صالح'})
+            elif pair in lines:
+                errors.append({'index': index, 'error': 'الطالب والمجموعة مكرران في نفس الدفعة'})
+            else:
+                lines[pair] = {'index': index, 'amount': amount, 'sessions': sessions}
+        
+        return lines, errors
+
+    @staticmethod
+    def _upsert_month_payments(enrollments, lines, month, paid_at):
+        """
+        إضافة المبالغ لسجلات الدفع الشهرية (استعلام قراءة + upsert واحد)
+        """
+        pairs = Q()
+        for student_id, group_id in lines:
+            pairs |= Q(student_id=student_id, group_id=group_id)
+        existing = {
+            (payment.student_id, payment.group_id): payment
+            for payment in Payment.objects.filter(pairs, month=month)
+        }
+        
+        payments = []
+        for pair, line in lines.items():
+            payment = existing.get(pair)
+            if payment is None:
+                payment = Payment(
+                    student_id=pair[0],
+                    group_id=pair[1],
+                    month=month,
+                    amount_due=enrollments[pair].get_effective_fee(),
+                    amount_paid=0
+                )
+            payment.amount_paid += line['amount']
+            payment.payment_date = paid_at
+            payment.status = 'paid' if payment.amount_paid >= payment.amount_due else 'partial'
+            payments.append(payment)
+        
+        # Rows are serialized by the enrollment locks - the conflict path
+        # only overwrites with the totals computed above
+        Payment.objects.bulk_create(
+            payments,
+            update_conflicts=True,
+            unique_fields=['student', 'group', 'month'],
+            update_fields=['amount_paid', 'payment_date', 'status', 'updated_at']
+        )
+
+    @staticmethod
+    def _apply_payment(enrollment, amount, sessions_count, paid_at, notes=''):
+        """
+        تطبيق دفعة على تسجيل (في الذاكرة - الحفظ على المستدعي)
+        
+        Returns:
+            tuple: (القيم القديمة, القيم الجديدة, قيود الدفتر)
+        """
+        # حفظ القيم القديمة للسجل
+        old_values = {
+            'sessions_paid_for': enrollment.sessions_paid_for,
+            'credit_balance': enrollment.credit_balance,
+            'last_payment_amount': float(enrollment.last_payment_amount) if enrollment.last_payment_amount else 0,
+        }
+        old_debt = max(0, enrollment.sessions_attended - enrollment.sessions_paid_for)
+        
+        # تحديث عدد الحصص المدفوعة
+        enrollment.sessions_paid_for += sessions_count
+        enrollment.last_payment_date = paid_at
+        enrollment.last_payment_amount = amount
+        
+        # إذا كان طالب جديد، قم بتحويله لطالب قديم بعد أول دفع
+        if enrollment.is_new_student:
+            enrollment.is_new_student = False
+            enrollment.credit_balance = CreditService.RETURNING_STUDENT_CREDIT
+        
+        # إزالة الحظر المالي إذا كان موجوداً
+        if enrollment.is_financially_blocked:
+            enrollment.is_financially_blocked = False
+            enrollment.financial_block_reason = ''
+        
+        # حفظ القيم الجديدة
+        new_values = {
+            'sessions_paid_for': enrollment.sessions_paid_for,
+            'credit_balance': enrollment.credit_balance,
+            'last_payment_amount': float(enrollment.last_payment_amount),
+        }
+        
+        # قيود الدفتر: الدفع ثم رصيد السماح للطالب الجديد
+        old_credit_balance = old_values['credit_balance']
+        paid_balance = old_credit_balance + enrollment.sessions_paid_for - enrollment.sessions_attended
+        ledger_entries = [LedgerService.entry(
+            LedgerService.PAYMENT_CREDIT,
+            sessions=sessions_count,
+            enrollment_balance=paid_balance,
+            owed_sessions=max(0, enrollment.sessions_attended - enrollment.sessions_paid_for) - old_debt,
+            amount=amount,
+            notes=notes
+        )]
+        if enrollment.credit_balance != old_credit_balance:
+            ledger_entries.append(LedgerService.entry(
+                LedgerService.ADJUSTMENT,
+                sessions=enrollment.credit_balance - old_credit_balance,
+                enrollment_balance=paid_balance + enrollment.credit_balance - old_credit_balance,
+                notes='رصيد سماح بعد أول دفع'
+            ))
+        
+        return old_values, new_values, ledger_entries
+
+    @staticmethod
+    def credit_allows_attendance():
+        """
+        شرط can_attend_session بصيغة SQL (للتحديث الشرطي)
+        
+        مسموح إذا: معفى، أو (ليس طالباً جديداً بدون دفع
+        و credit_balance - (sessions_attended - sessions_paid_for) >= 0)
+        """
+        return Q(financial_status='exempt') | (
+            ~Q(is_new_student=True, sessions_paid_for=0) &
+            Q(credit_balance__gte=F('sessions_attended') - F('sessions_paid_for'))
+        )
+
+    @staticmethod
+    def record_attendance_and_update_credit(student, group, enrollment_id=None):
+        """
+        تسجيل الحضور وتحديث عداد الحصص المحضور
+        يتم استدعاؤه بعد تسجيل الحضور بنجاح
+        
+        خصم الحصة بتحديث شرطي واحد بدون قفل:
+        UPDATE ... SET sessions_attended = sessions_attended + 1
+        WHERE ... AND <الائتمان ما زال يسمح>
+        
+        Args:
+            student: كائن الطالب
+            group: كائن المجموعة
+            enrollment_id: رقم التسجيل إن كان معروفاً (يغني عن البحث)
             
-        except StudentGroupEnrollment.DoesNotExist:
-            pass
+        Returns:
+            dict | None: {
+                'consumed': bool (False إذا نفد الائتمان منذ الفحص),
+                'sessions_attended', 'sessions_paid_for', 'credit_balance'
+            } أو None إذا لم يكن مسجلاً
+        """
+        enrollments = StudentGroupEnrollment.objects.filter(is_active=True)
+        if enrollment_id is not None:
+            enrollments = enrollments.filter(pk=enrollment_id)
+        else:
+            enrollments = enrollments.filter(student=student, group=group)
+
+        consumed = enrollments.filter(
+            CreditService.credit_allows_attendance()
+        ).update(sessions_attended=F('sessions_attended') + 1)
+
+        counters = enrollments.values(
+            'id', 'sessions_attended', 'sessions_paid_for', 'credit_balance', 'is_new_student'
+        ).first()
+        if counters is None:
+            return None
+
+        result = {
+            'consumed': bool(consumed),
+            'sessions_attended': counters['sessions_attended'],
+            'sessions_paid_for': counters['sessions_paid_for'],
+            'credit_balance': counters['credit_balance'],
+        }
+        if not consumed:
+            return result
+
+        debt = counters['sessions_attended'] - counters['sessions_paid_for']
+        remaining_credit = counters['credit_balance'] - debt
+        
+        LedgerService.post(
+            student.student_id,
+            group.group_id,
+            counters['id'],
+            LedgerService.entry(
+                LedgerService.ATTENDANCE_DEBIT,
+                sessions=-1,
+                enrollment_balance=remaining_credit,
+                owed_sessions=1 if debt > 0 else 0
+            )
+        )
+        
+        # update() لا يرسل post_save - تحديث لقطة فهرس اليوم بعد نجاح المعاملة
+        # (التراجع عن الحضور لا يترك رصيداً مخصوماً في الفهرس)
+        transaction.on_commit(lambda: RosterIndexService.update_enrollment_snapshot(
+            student.student_code,
+            counters['id'],
+            sessions_attended=counters['sessions_attended'],
+            sessions_paid_for=counters['sessions_paid_for'],
+            credit_balance=counters['credit_balance']
+        ))
+
+        # إرسال تحذير عند حصة واحدة متبقية
+        if remaining_credit == CreditService.CREDIT_LIMIT_WARNING:
+            CreditService._send_credit_warning(student, group, remaining_credit)
+        
+        # إرسال تحذير عند الحصة الثانية غير المدفوعة
+        if debt == 2 and not counters['is_new_student']:
+            CreditService._send_final_warning(student, group)
+
+        return result
 
     @staticmethod
     @transaction.atomic
@@ -375,6 +668,19 @@ class CreditService:
             enrollment.credit_balance = new_balance
             enrollment.save()
             
+            LedgerService.post(
+                student.student_id,
+                group.group_id,
+                enrollment.pk,
+                LedgerService.entry(
+                    LedgerService.ADJUSTMENT,
+                    sessions=new_balance - old_balance,
+                    enrollment_balance=new_balance + enrollment.sessions_paid_for - enrollment.sessions_attended,
+                    notes=notes
+                ),
+                performed_by=performed_by
+            )
+            
             # تسجيل في سجل التدقيق
             CreditService._log_audit(
                 student=student,
@@ -397,6 +703,67 @@ class CreditService:
                 'message': 'الطالب غير مسجل في هذه المجموعة'
             }
 
+    @staticmethod
+    @transaction.atomic
+    def reset_enrollments_credit(enrollment_ids, is_new_student=None, performed_by=None, notes=''):
+        """
+        إعادة رصيد الائتمان لعدة تسجيلات إلى رصيد البداية (إجراءات الإدارة)
+        
+        Each enrollment gets NEW_STUDENT_CREDIT or RETURNING_STUDENT_CREDIT
+        per its is_new_student flag; passing is_new_student also sets the
+        flag and clears a financial block. Every change is posted to the
+        ledger and the audit log like adjust_credit_balance.
+        
+        Returns:
+            عدد التسجيلات المعدلة
+        """
+        enrollments = StudentGroupEnrollment.objects.select_for_update(of=('self',)).filter(
+            pk__in=list(enrollment_ids)
+        ).select_related('student', 'group').order_by('pk')
+        
+        count = 0
+        for enrollment in enrollments:
+            old_balance = enrollment.credit_balance
+            old_is_new = enrollment.is_new_student
+            if is_new_student is not None:
+                enrollment.is_new_student = is_new_student
+                enrollment.is_financially_blocked = False
+                enrollment.financial_block_reason = ''
+            enrollment.credit_balance = (
+                CreditService.NEW_STUDENT_CREDIT if enrollment.is_new_student
+                else CreditService.RETURNING_STUDENT_CREDIT
+            )
+            enrollment.save()
+            count += 1
+            
+            if enrollment.credit_balance != old_balance:
+                LedgerService.post(
+                    enrollment.student_id,
+                    enrollment.group_id,
+                    enrollment.pk,
+                    LedgerService.entry(
+                        LedgerService.ADJUSTMENT,
+                        sessions=enrollment.credit_balance - old_balance,
+                        enrollment_balance=(
+                            enrollment.credit_balance + enrollment.sessions_paid_for - enrollment.sessions_attended
+                        ),
+                        notes=notes
+                    ),
+                    performed_by=performed_by
+                )
+            
+            CreditService._log_audit(
+                student=enrollment.student,
+                group=enrollment.group,
+                action='credit_adjustment',
+                old_value={'credit_balance': old_balance, 'is_new_student': old_is_new},
+                new_value={'credit_balance': enrollment.credit_balance, 'is_new_student': enrollment.is_new_student},
+                notes=notes,
+                performed_by=performed_by
+            )
+        
+        return count
+
     @staticmethod
     def _log_audit(student, group, action, old_value=None, new_value=None,
                    amount=None, sessions_count=None, notes='', performed_by=None):
@@ -415,48 +782,30 @@ class CreditService:
 
     @staticmethod
     def _send_credit_warning(student, group, remaining_credit):
-        """إرسال تحذير عند اقتراب نفاد الائتمان"""
-        context = {
-            'student_name': student.full_name,
-            'group_name': group.group_name,
-            'remaining_credit': remaining_credit
-        }
-        
-        notification = get_credit_whatsapp_message('credit_warning', context)
-        
+        """إرسال تحذير عند اقتراب نفاد الائتمان (بعد نجاح المعاملة)"""
         try:
-            whatsapp = WhatsAppService()
-            whatsapp.send_message(
-                to=student.parent_phone,
-                message=notification['message'],
-                student=student,
-                student_name=student.full_name,
-                notification_type='credit_warning'
+            NotificationDispatcher.dispatch(
+                send_credit_warning_task,
+                student_id=student.student_id,
+                group_id=group.group_id,
+                warning_type='credit_warning',
+                remaining_credit=remaining_credit
             )
         except Exception as e:
-            print(f"Failed to send credit warning: {e}")
+            print(f"Failed to queue credit warning: {e}")
 
     @staticmethod
     def _send_final_warning(student, group):
-        """إرسال تحذير نهائي عند الحصة الثانية غير المدفوعة"""
-        context = {
-            'student_name': student.full_name,
-            'group_name': group.group_name
-        }
-        
-        notification = get_credit_whatsapp_message('credit_final_warning', context)
-        
+        """إرسال تحذير نهائي عند الحصة الثانية غير المدفوعة (بعد نجاح المعاملة)"""
         try:
-            whatsapp = WhatsAppService()
-            whatsapp.send_message(
-                to=student.parent_phone,
-                message=notification['message'],
-                student=student,
-                student_name=student.full_name,
-                notification_type='credit_final_warning'
+            NotificationDispatcher.dispatch(
+                send_credit_warning_task,
+                student_id=student.student_id,
+                group_id=group.group_id,
+                warning_type='credit_final_warning'
             )
         except Exception as e:
-            print(f"Failed to send final warning: {e}")
+            print(f"Failed to queue final warning: {e}")
 
     @staticmethod
     def _trigger_payment_confirmation(student, amount, payment):
@@ -470,7 +819,8 @@ class CreditService:
             # Generate receipt number
             receipt_number = f"PAY-{payment.payment_date.strftime('%Y%m%d')}-{payment.payment_id}"
             
-            send_payment_confirmation_task.delay(
+            NotificationDispatcher.dispatch(
+                send_payment_confirmation_task,
                 student_id=student.student_id,
                 amount=float(amount),
                 receipt_number=receipt_number,
@@ -480,6 +830,56 @@ class CreditService:
             # Don't block payment if notification task fails
             print(f"Failed to queue payment confirmation notification: {e}")
 
+    @staticmethod
+    def _trigger_bulk_payment_confirmation(paid_lines, paid_at):
+        """
+        إيصال واحد لكل رقم ولي أمر في الدفع الجماعي
+        
+        Args:
+            paid_lines: [(enrollment, line, audit_log)]
+            
+        Returns:
+            list: الإيصالات المرسلة
+        """
+        by_phone = {}
+        for enrollment, line, audit_log in paid_lines:
+            by_phone.setdefault(enrollment.student.parent_phone, []).append((enrollment, line, audit_log))
+        
+        receipts = []
+        for parent_phone, phone_lines in by_phone.items():
+            receipt_number = f"PAY-{paid_at.strftime('%Y%m%d')}-B{min(log.log_id for _, _, log in phone_lines)}"
+            amount = sum(line['amount'] for _, line, _ in phone_lines)
+            items = [
+                {
+                    'student_name': enrollment.student.full_name,
+                    'group_name': enrollment.group.group_name,
+                    'amount': float(line['amount']),
+                    'sessions': line['sessions'],
+                }
+                for enrollment, line, _ in phone_lines
+            ]
+            receipts.append({
+                'parent_phone': parent_phone,
+                'receipt_number': receipt_number,
+                'amount': float(amount),
+                'lines': items,
+            })
+            
+            try:
+                NotificationDispatcher.dispatch(
+                    send_bulk_payment_confirmation_task,
+                    student_ids=sorted({enrollment.student_id for enrollment, _, _ in phone_lines}),
+                    lines=items,
+                    amount=float(amount),
+                    receipt_number=receipt_number,
+                    payment_date_str=paid_at.isoformat()
+                )
+            except Exception as e:
+                # Don't block payment if notification task fails
+                print(f"Failed to queue bulk payment confirmation: {e}")
+        
+        return receipts
+
     @staticmethod
     def get_students_with_debt(group=None):
         """
@@ -504,156 +904,486 @@ class CreditService:
         
         return enrollments
 
+    @staticmethod
+    def _credit_report_enrollments(group=None, student=None):
+        enrollments = StudentGroupEnrollment.objects.filter(is_active=True)
+        if group:
+            enrollments = enrollments.filter(group=group)
+        if student:
+            enrollments = enrollments.filter(student=student)
+        return enrollments
+
     @staticmethod
     def get_credit_report(group=None, student=None):
         """
         الحصول على تقرير شامل عن حالة الائتمان
         
+        كل العدادات في استعلام تجميعي واحد، والتفاصيل تُقرأ على دفعات
+        عند التكرار عليها (لا تُحمّل كل التسجيلات في الذاكرة)
+        
         Args:
             group: تصفية حسب المجموعة (اختياري)
             student: تصفية حسب الطالب (اختياري)
             
         Returns:
-            dict: تقرير شامل
+            dict: تقرير شامل - 'details' مولّد صفوف (iter_credit_report_rows)،
+            يُقرأ مرة واحدة
         """
-        enrollments = StudentGroupEnrollment.objects.filter(is_active=True)
-        
-        if group:
-            enrollments = enrollments.filter(group=group)
-        if student:
-            enrollments = enrollments.filter(student=student)
-        
-        enrollments = enrollments.select_related('student', 'group')
+        counters = CreditService._credit_report_enrollments(group, student).aggregate(
+            total_enrollments=Count('id'),
+            new_students=Count('id', filter=Q(is_new_student=True)),
+            returning_students=Count('id', filter=Q(is_new_student=False)),
+            financially_blocked=Count('id', filter=Q(is_financially_blocked=True)),
+            with_debt=Count('id', filter=Q(sessions_attended__gt=F('sessions_paid_for'))),
+        )
         
-        report = {
-            'total_enrollments': enrollments.count(),
-            'new_students': enrollments.filter(is_new_student=True).count(),
-            'returning_students': enrollments.filter(is_new_student=False).count(),
-            'financially_blocked': enrollments.filter(is_financially_blocked=True).count(),
-            'with_debt': 0,
-            'details': []
+        return {
+            **counters,
+            'details': CreditService.iter_credit_report_rows(group=group, student=student)
         }
+
+    @staticmethod
+    def iter_credit_report_rows(group=None, student=None, chunk_size=None):
+        """
+        صفوف تفاصيل تقرير الائتمان (قراءة على دفعات بدون كائنات النماذج)
         
-        for enrollment in enrollments:
-            debt = enrollment.sessions_attended - enrollment.sessions_paid_for
-            if debt > 0:
-                report['with_debt'] += 1
-            
-            report['details'].append({
-                'student_name': enrollment.student.full_name,
-                'group_name': enrollment.group.group_name,
-                'is_new_student': enrollment.is_new_student,
-                'credit_balance': enrollment.credit_balance,
-                'sessions_attended': enrollment.sessions_attended,
-                'sessions_paid_for': enrollment.sessions_paid_for,
-                'debt': debt,
-                'is_blocked': enrollment.is_financially_blocked,
-                'block_reason': enrollment.financial_block_reason,
-            })
-        
-        return report
+        Yields:
+            dict: مفاتيحه CREDIT_REPORT_FIELDS
+        """
+        rows = CreditService._credit_report_enrollments(group, student).order_by(
+            'group__group_name', 'student__full_name', 'id'
+        ).values_list(
+            'student__student_code', 'student__full_name', 'group__group_name', 'is_new_student',
+            'credit_balance', 'sessions_attended', 'sessions_paid_for',
+            F('sessions_attended') - F('sessions_paid_for'),
+            'is_financially_blocked', 'financial_block_reason'
+        )
+        for row in rows.iterator(chunk_size=chunk_size or CreditService.CREDIT_REPORT_CHUNK_SIZE):
+            yield dict(zip(CreditService.CREDIT_REPORT_FIELDS, row))
 
 
 class SettlementService:
+    """
+    خدمة تسويات المدرسين الشهرية (استعلامات تجميعية)
+    
+    A settlement for any number of teachers takes three queries:
+    - groups of the teachers
+    - revenue and expected revenue per group (SUM over payments)
+    - per-student breakdown (payments joined with student and group)
+    
+    The expected fee comes from a conditional SQL expression over the
+    enrollment's financial_status / custom_fee and the group's standard_fee
+    (same rules as Student.get_monthly_fee_for_group).
+    """
+    
+    DEFAULT_CENTER_PERCENTAGE = 30
+    
+    FINANCIAL_STATUS_DISPLAY = dict(StudentGroupEnrollment.FINANCIAL_STATUS_CHOICES)
+    PAYMENT_STATUS_DISPLAY = dict(Payment.STATUS_CHOICES)
     
     @staticmethod
     def calculate_teacher_settlement(teacher_id, year, month):
         """
         حساب مستحقات المدرس لشهر معين
         """
-        # الحصول على مجموعات المدرس
-        groups = Group.objects.filter(teacher_id=teacher_id)
+        settlements = SettlementService._build_settlements(year, month, teacher_ids=[teacher_id])
+        return {
+            'success': True,
+            'data': settlements[0]
+        }
+    
+    @staticmethod
+    def calculate_month_settlements(year, month, teacher_ids=None):
+        """
+        حساب مستحقات كل المدرسين لشهر معين (تسوية نهاية الشهر)
         
-        total_revenue = 0
-        breakdown = []
+        Args:
+            teacher_ids: قصر الحساب على مدرسين معينين (None = كل المدرسين النشطين)
         
-        for group in groups:
-            group_data = SettlementService.calculate_group_revenue(
-                group.group_id, year, month
+        Returns:
+            dict: {'success', 'data': [تسوية لكل مدرس بنفس شكل calculate_teacher_settlement]}
+        """
+        if teacher_ids is None:
+            from apps.teachers.models import Teacher
+            teacher_ids = list(
+                Teacher.objects.filter(is_active=True).values_list('teacher_id', flat=True)
             )
-            
-            total_revenue += group_data['revenue']
-            breakdown.append({
-                'group_name': group.group_name,
-                'students': group_data['students'],
-                'revenue': group_data['revenue']
-            })
-        
-        # حساب الحصص
-        center_percentage = groups.first().center_percentage if groups.exists() else 30
-        center_share = total_revenue * (center_percentage / 100)
-        teacher_share = total_revenue - center_share
         
         return {
             'success': True,
-            'data': {
+            'data': SettlementService._build_settlements(year, month, teacher_ids=teacher_ids)
+        }
+    
+    @staticmethod
+    def calculate_group_revenue(group_id, year, month):
+        """
+        حساب إيرادات مجموعة معينة
+        الآن يدعم الطلاب المسجلين في مجموعات متعددة
+        """
+        rows = SettlementService._payment_rows(year, month).filter(group_id=group_id)
+        students = [SettlementService._student_entry(row) for row in rows]
+        
+        return {
+            'revenue': sum(student['amount_paid'] for student in students),
+            'students': students
+        }
+    
+    # ========================================
+    # Queries
+    # ========================================
+    
+    @staticmethod
+    def _build_settlements(year, month, teacher_ids):
+        """
+        التسويات بنفس ترتيب teacher_ids
+        """
+        groups = list(
+            Group.objects.filter(teacher_id__in=teacher_ids).values(
+                'group_id', 'group_name', 'teacher_id', 'center_percentage'
+            )
+        )
+        group_ids = [group['group_id'] for group in groups]
+        
+        payments = SettlementService._payment_rows(year, month).filter(group_id__in=group_ids)
+        
+        totals = {
+            row['group_id']: row
+            for row in payments.order_by().values('group_id').annotate(
+                revenue=Sum('amount_paid'),
+                expected_revenue=Sum('expected_fee')
+            )
+        }
+        
+        students = {}
+        for row in payments:
+            students.setdefault(row['group_id'], []).append(SettlementService._student_entry(row))
+        
+        groups_by_teacher = {}
+        for group in groups:
+            groups_by_teacher.setdefault(group['teacher_id'], []).append(group)
+        
+        settlements = []
+        for teacher_id in teacher_ids:
+            teacher_groups = groups_by_teacher.get(teacher_id, [])
+            
+            total_revenue = 0
+            total_expected = 0
+            breakdown = []
+            for group in teacher_groups:
+                group_totals = totals.get(group['group_id'], {})
+                revenue = float(group_totals.get('revenue') or 0)
+                expected = float(group_totals.get('expected_revenue') or 0)
+                total_revenue += revenue
+                total_expected += expected
+                breakdown.append({
+                    'group_id': group['group_id'],
+                    'group_name': group['group_name'],
+                    'students': students.get(group['group_id'], []),
+                    'revenue': revenue,
+                    'expected_revenue': expected,
+                })
+            
+            # نسبة السنتر من أول مجموعة للمدرس
+            center_percentage = (
+                teacher_groups[0]['center_percentage']
+                if teacher_groups else SettlementService.DEFAULT_CENTER_PERCENTAGE
+            )
+            center_share = total_revenue * (float(center_percentage) / 100)
+            teacher_share = total_revenue - center_share
+            
+            settlements.append({
                 'teacher_id': teacher_id,
                 'year': year,
                 'month': month,
-                'total_revenue': round(float(total_revenue), 2),
-                'center_share': round(float(center_share), 2),
-                'teacher_share': round(float(teacher_share), 2),
+                'total_revenue': round(total_revenue, 2),
+                'expected_revenue': round(total_expected, 2),
+                'center_share': round(center_share, 2),
+                'teacher_share': round(teacher_share, 2),
                 'center_percentage': float(center_percentage),
                 'breakdown': breakdown
-            }
-        }
+            })
+        
+        return settlements
     
     @staticmethod
-    def calculate_group_revenue(group_id, year, month):
+    def month_range(year, month):
         """
-        حساب إيرادات مجموعة معينة
-        الآن يدعم الطلاب المسجلين في مجموعات متعددة
+        (أول يوم في الشهر، أول يوم في الشهر التالي)
         """
-        from apps.teachers.models import Group
-        from apps.students.models import StudentGroupEnrollment
-
         start_date = datetime(year, month, 1).date()
-
-        # آخر يوم في الشهر
         if month == 12:
             end_date = datetime(year + 1, 1, 1).date()
         else:
             end_date = datetime(year, month + 1, 1).date()
-
-        # الحصول على المدفوعات لهذه المجموعة
-        payments = Payment.objects.filter(
-            group_id=group_id,
+        return start_date, end_date
+    
+    @staticmethod
+    def _payment_rows(year, month):
+        """
+        مدفوعات الشهر مع الحالة المالية للتسجيل والمصروفات المتوقعة (استعلام واحد)
+        """
+        start_date, end_date = SettlementService.month_range(year, month)
+        
+        enrollment = StudentGroupEnrollment.objects.filter(
+            student_id=OuterRef('student_id'),
+            group_id=OuterRef('group_id')
+        )
+        
+        return Payment.objects.filter(
             month__gte=start_date,
             month__lt=end_date
-        ).select_related('student', 'group')
-
-        revenue = 0
-        students = []
+        ).annotate(
+            enrollment_status=Subquery(enrollment.values('financial_status')[:1]),
+            enrollment_custom_fee=Subquery(enrollment.values('custom_fee')[:1]),
+        ).annotate(
+            expected_fee=Case(
+                When(enrollment_status='exempt', then=Value(Decimal('0'))),
+                When(enrollment_status='symbolic', then=Coalesce(F('enrollment_custom_fee'), Value(Decimal('0')))),
+                When(enrollment_status__isnull=False, then=F('group__standard_fee')),
+                default=Value(Decimal('0')),
+                output_field=models.DecimalField(max_digits=10, decimal_places=2)
+            )
+        ).values(
+            'group_id', 'student__full_name', 'enrollment_status', 'expected_fee',
+            'amount_paid', 'status', 'sessions_attended'
+        ).order_by('student__full_name')
+    
+    @staticmethod
+    def _student_entry(row):
+        return {
+            'name': row['student__full_name'],
+            'financial_status': SettlementService.FINANCIAL_STATUS_DISPLAY.get(row['enrollment_status'], 'غير محدد'),
+            'expected_fee': float(row['expected_fee']),
+            'amount_paid': float(row['amount_paid']),
+            'payment_status': SettlementService.PAYMENT_STATUS_DISPLAY.get(row['status'], row['status']),
+            'sessions_attended': row['sessions_attended']
+        }
 
-        for payment in payments:
-            student = payment.student
-            group = payment.group
 
-            # جلب الحالة المالية من التسجيل
-            try:
-                enrollment = StudentGroupEnrollment.objects.get(
-                    student=student,
-                    group=group
+class SettlementSnapshotService:
+    """
+    لقطات التسويات الشهرية المخزنة (TeacherSettlement)
+    
+    Each snapshot stores the checksum of its inputs: the month's payments of
+    the teacher's groups (count, id/amount/session sums, last update) and the
+    groups' fee and center percentage. A read compares the stored checksum
+    with a fresh one (two aggregate queries) and recomputes - as a new
+    version - only when they differ.
+    """
+    
+    # Teachers per month-end chunk (one Celery task each)
+    CHUNK_SIZE = 25
+    
+    # ========================================
+    # Reading
+    # ========================================
+    
+    @staticmethod
+    def get_settlement(teacher_id, year, month):
+        """
+        أحدث تسوية مخزنة للمدرس (تُحسب من جديد فقط إذا تغيرت المدخلات)
+        
+        Returns:
+            TeacherSettlement
+        """
+        return SettlementSnapshotService.snapshot_teachers(year, month, [teacher_id])[0][0]
+    
+    @staticmethod
+    def get_report_pdf(snapshot):
+        """
+        تقرير PDF للتسوية (يُنشأ مرة واحدة ويُخزن مع اللقطة)
+        
+        Returns:
+            bytes
+        """
+        if snapshot.report_pdf:
+            return bytes(snapshot.report_pdf)
+        
+        from utils.pdf_generator import generate_settlement_report
+        
+        pdf = generate_settlement_report(SettlementSnapshotService._report_data(snapshot)).getvalue()
+        TeacherSettlement.objects.filter(pk=snapshot.pk).update(report_pdf=pdf)
+        snapshot.report_pdf = pdf
+        return pdf
+    
+    # ========================================
+    # Writing
+    # ========================================
+    
+    @staticmethod
+    def snapshot_teachers(year, month, teacher_ids):
+        """
+        لقطة حالية لكل مدرس (إصدار جديد فقط للمدرسين الذين تغيرت مدخلاتهم)
+        
+        Returns:
+            tuple: (TeacherSettlement بنفس ترتيب teacher_ids, عدد الإصدارات الجديدة)
+        """
+        month_start = SettlementService.month_range(year, month)[0]
+        checksums = SettlementSnapshotService.input_checksums(year, month, teacher_ids)
+        latest = SettlementSnapshotService._latest(month_start, teacher_ids)
+        
+        changed = [
+            teacher_id for teacher_id in teacher_ids
+            if teacher_id not in latest or latest[teacher_id].checksum != checksums[teacher_id]
+        ]
+        created = 0
+        if changed:
+            new_snapshots = [
+                TeacherSettlement(
+                    teacher_id=data['teacher_id'],
+                    month=month_start,
+                    version=latest[data['teacher_id']].version + 1 if data['teacher_id'] in latest else 1,
+                    checksum=checksums[data['teacher_id']],
+                    total_revenue=data['total_revenue'],
+                    expected_revenue=data['expected_revenue'],
+                    center_share=data['center_share'],
+                    teacher_share=data['teacher_share'],
+                    center_percentage=data['center_percentage'],
+                    data=data,
                 )
-                financial_status_display = enrollment.get_financial_status_display()
-            except StudentGroupEnrollment.DoesNotExist:
-                financial_status_display = 'غير محدد'
-
-            expected_fee = student.get_monthly_fee_for_group(group)
-            amount_paid = float(payment.amount_paid)
-
-            revenue += amount_paid
-
-            students.append({
-                'name': student.full_name,
-                'financial_status': financial_status_display,
-                'expected_fee': float(expected_fee),
-                'amount_paid': amount_paid,
-                'payment_status': payment.get_status_display(),
-                'sessions_attended': payment.sessions_attended
-            })
-
+                for data in SettlementService._build_settlements(year, month, changed)
+            ]
+            try:
+                with transaction.atomic():
+                    TeacherSettlement.objects.bulk_create(new_snapshots)
+                latest.update({snapshot.teacher_id: snapshot for snapshot in new_snapshots})
+                created = len(new_snapshots)
+            except IntegrityError:
+                # A concurrent run stored the same versions first
+                latest = SettlementSnapshotService._latest(month_start, teacher_ids)
+        
+        return [latest[teacher_id] for teacher_id in teacher_ids], created
+    
+    @staticmethod
+    def snapshot_month(year, month, teacher_ids=None, chunk_size=None):
+        """
+        تسوية نهاية الشهر لكل المدرسين النشطين على دفعات
+        
+        Returns:
+            dict: {'teachers', 'chunks', 'created'}
+        """
+        if teacher_ids is None:
+            teacher_ids = SettlementSnapshotService.active_teacher_ids()
+        
+        created = 0
+        chunks = SettlementSnapshotService.chunks(teacher_ids, chunk_size)
+        for chunk in chunks:
+            created += SettlementSnapshotService.snapshot_teachers(year, month, chunk)[1]
+        
         return {
-            'revenue': revenue,
-            'students': students
+            'teachers': len(teacher_ids),
+            'chunks': len(chunks),
+            'created': created,
+        }
+    
+    # ========================================
+    # Helpers
+    # ========================================
+    
+    @staticmethod
+    def active_teacher_ids():
+        from apps.teachers.models import Teacher
+        return list(
+            Teacher.objects.filter(is_active=True).order_by('teacher_id').values_list('teacher_id', flat=True)
+        )
+    
+    @staticmethod
+    def chunks(teacher_ids, chunk_size=None):
+        size = chunk_size or SettlementSnapshotService.CHUNK_SIZE
+        return [teacher_ids[index:index + size] for index in range(0, len(teacher_ids), size)]
+    
+    @staticmethod
+    def input_checksums(year, month, teacher_ids):
+        """
+        بصمة مدخلات التسوية لكل مدرس (ثلاثة استعلامات)
+        
+        Covers everything the snapshot shows: the month's payments, the
+        teacher's groups (name, fee, center percentage) and, for students
+        paid in the month, the enrollment's financial_status / custom_fee
+        (the expected fee) and the student's name.
+        
+        Returns:
+            dict: {teacher_id: sha256 hex}
+        """
+        from django.db.models import Exists
+        
+        start_date, end_date = SettlementService.month_range(year, month)
+        month_payments = Payment.objects.filter(month__gte=start_date, month__lt=end_date)
+        
+        payments = {
+            row['group__teacher_id']: row
+            for row in month_payments.filter(
+                group__teacher_id__in=teacher_ids
+            ).order_by().values('group__teacher_id').annotate(
+                count=Count('payment_id'),
+                ids=Sum('payment_id'),
+                paid=Sum('amount_paid'),
+                sessions=Sum('sessions_attended'),
+                updated=Max('updated_at')
+            )
+        }
+        
+        groups = {}
+        for row in Group.objects.filter(teacher_id__in=teacher_ids).order_by('group_id').values_list(
+            'teacher_id', 'group_id', 'group_name', 'standard_fee', 'center_percentage'
+        ):
+            groups.setdefault(row[0], []).append(row[1:])
+        
+        enrollments = {}
+        for row in StudentGroupEnrollment.objects.filter(
+            Exists(month_payments.filter(student_id=OuterRef('student_id'), group_id=OuterRef('group_id'))),
+            group__teacher_id__in=teacher_ids
+        ).order_by('group_id', 'student_id').values_list(
+            'group__teacher_id', 'group_id', 'student_id', 'financial_status', 'custom_fee', 'student__full_name'
+        ):
+            enrollments.setdefault(row[0], []).append(row[1:])
+        
+        checksums = {}
+        for teacher_id in teacher_ids:
+            row = payments.get(teacher_id, {})
+            inputs = [
+                [row.get(field) for field in ('count', 'ids', 'paid', 'sessions', 'updated')],
+                groups.get(teacher_id, []),
+                enrollments.get(teacher_id, []),
+            ]
+            checksums[teacher_id] = hashlib.sha256(
+                json.dumps(inputs, cls=DjangoJSONEncoder).encode()
+            ).hexdigest()
+        return checksums
+    
+    @staticmethod
+    def _latest(month_start, teacher_ids):
+        latest = {}
+        snapshots = TeacherSettlement.objects.filter(
+            teacher_id__in=teacher_ids,
+            month=month_start
+        ).defer('report_pdf').order_by('teacher_id', '-version')
+        for snapshot in snapshots:
+            latest.setdefault(snapshot.teacher_id, snapshot)
+        return latest
+    
+    @staticmethod
+    def _report_data(snapshot):
+        """
+        بيانات generate_settlement_report
+        """
+        data = snapshot.data
+        rows = [
+            [group['group_name'], student['name'], student['financial_status'],
+             f"{student['expected_fee']:.2f}", f"{student['amount_paid']:.2f}", student['payment_status']]
+            for group in data['breakdown']
+            for student in group['students']
+        ]
+        return {
+            'summary': {
+                'المدرس': snapshot.teacher.full_name,
+                'الشهر': snapshot.month.strftime('%Y-%m'),
+                'إجمالي الإيراد': f"{data['total_revenue']:.2f}",
+                'الإيراد المتوقع': f"{data['expected_revenue']:.2f}",
+                'نصيب السنتر': f"{data['center_share']:.2f} ({data['center_percentage']:g}%)",
+                'نصيب المدرس': f"{data['teacher_share']:.2f}",
+                'الإصدار': snapshot.version,
+            },
+            'headers': ['المجموعة', 'الطالب', 'الحالة المالية', 'المتوقع', 'المدفوع', 'حالة الدفع'],
+            'rows': rows,
         }
@@ -0,0 +1,68 @@
+"""
+Celery Tasks for Payments
+Month-end teacher settlement snapshots and ledger balance reconciliation
+"""
+
+from celery import group, shared_task
+from celery.utils.log import get_task_logger
+from django.utils import timezone
+
+logger = get_task_logger(__name__)
+
+
+@shared_task(name='payments.snapshot_month_settlements')
+def snapshot_month_settlements(year=None, month=None):
+    """
+    Persist settlement snapshots for every active teacher.
+    
+    Defaults to the previous month. Teachers are split into chunks of
+    SettlementSnapshotService.CHUNK_SIZE and each chunk runs as its own
+    task, so workers process them in parallel.
+    
+    Runs on the 1st of every month via Celery Beat.
+    """
+    from apps.payments.services import SettlementSnapshotService
+    
+    if year is None or month is None:
+        today = timezone.localdate()
+        year, month = (today.year, today.month - 1) if today.month > 1 else (today.year - 1, 12)
+    
+    teacher_ids = SettlementSnapshotService.active_teacher_ids()
+    chunks = SettlementSnapshotService.chunks(teacher_ids)
+    if chunks:
+        group(snapshot_settlement_chunk.s(year, month, chunk) for chunk in chunks).apply_async()
+    
+    logger.info(f"Queued {len(chunks)} settlement chunks for {len(teacher_ids)} teachers ({year}-{month:02d})")
+    return {'year': year, 'month': month, 'teachers': len(teacher_ids), 'chunks': len(chunks)}
+
+
+@shared_task(name='payments.snapshot_settlement_chunk')
+def snapshot_settlement_chunk(year, month, teacher_ids):
+    """
+    Snapshot one chunk of teachers (new versions only where inputs changed).
+    """
+    from apps.payments.services import SettlementSnapshotService
+    
+    _, created = SettlementSnapshotService.snapshot_teachers(year, month, teacher_ids)
+    logger.info(f"Settlement chunk {year}-{month:02d}: {len(teacher_ids)} teachers, {created} new versions")
+    return {'teachers': len(teacher_ids), 'created': created}
+
+
+@shared_task(name='payments.reconcile_ledger_balances')
+def reconcile_ledger_balances():
+    """
+    Compare every StudentBalance with the enrollment counters and rebuild
+    the ones that drifted (counters changed outside CreditService).
+    
+    Runs nightly via Celery Beat.
+    """
+    from apps.payments.ledger import LedgerService
+    
+    result = LedgerService.reconcile()
+    for item in result['drifted']:
+        logger.warning(
+            f"Ledger drift for student {item['student_id']}: "
+            f"stored {item['stored']}, expected {item['expected']}"
+        )
+    logger.info(f"Reconciled {result['checked']} student balances, {len(result['drifted'])} rebuilt")
+    return {'checked': result['checked'], 'rebuilt': len(result['drifted'])}
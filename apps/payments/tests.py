@@ -4,7 +4,7 @@ Tests for Payment Service
 
 from django.test import TestCase
 from django.utils import timezone
-from datetime import datetime, timedelta, time
+from datetime import date, datetime, timedelta, time
 from decimal import Decimal
 from apps.teachers.models import Teacher, Group, Room
 from apps.students.models import Student, StudentGroupEnrollment
@@ -268,3 +268,570 @@ class PaymentStatusTest(TestCase):
         self.assertEqual(payment.status, 'paid')
         # Overpayment is recorded
         self.assertGreater(payment.amount_paid, payment.amount_due)
+
+
+class CreditConsumeTest(TestCase):
+    """Test conditional credit consume (CreditService.record_attendance_and_update_credit)"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.teacher = Teacher.objects.create(
+            full_name='Test Teacher',
+            phone='01234567890',
+            email='teacher@test.com',
+            specialization='Math',
+            hire_date=timezone.now().date()
+        )
+        self.room = Room.objects.create(name='Test Room', capacity=30)
+        self.group = Group.objects.create(
+            group_name='Test Group',
+            teacher=self.teacher,
+            room=self.room,
+            schedule_day='Saturday',
+            schedule_time=time(10, 0),
+            standard_fee=Decimal('300.00')
+        )
+        self.student = Student.objects.create(
+            student_code='CRD001',
+            full_name='Credit Student',
+            parent_phone='01234567890'
+        )
+        # Returning student with one session of credit left
+        self.enrollment = StudentGroupEnrollment.objects.create(
+            student=self.student,
+            group=self.group,
+            financial_status='normal',
+            is_new_student=False,
+            credit_balance=2,
+            sessions_attended=1,
+            sessions_paid_for=0
+        )
+
+    def test_consume_increments_counters(self):
+        """Test consume returns the new counters"""
+        from apps.payments.services import CreditService
+        credit = CreditService.record_attendance_and_update_credit(self.student, self.group)
+        self.assertTrue(credit['consumed'])
+        self.assertEqual(credit['sessions_attended'], 2)
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.sessions_attended, 2)
+
+    def test_consume_refused_when_credit_exhausted(self):
+        """Test the conditional update refuses once credit runs out"""
+        from apps.payments.services import CreditService
+        StudentGroupEnrollment.objects.filter(pk=self.enrollment.pk).update(sessions_attended=3)
+
+        credit = CreditService.record_attendance_and_update_credit(
+            self.student, self.group, enrollment_id=self.enrollment.pk
+        )
+        self.assertFalse(credit['consumed'])
+        self.assertEqual(credit['sessions_attended'], 3)
+
+    def test_condition_matches_can_attend_session(self):
+        """Test the SQL condition agrees with can_attend_session"""
+        from apps.payments.services import CreditService
+        cases = [
+            {'financial_status': 'exempt', 'is_new_student': True, 'sessions_paid_for': 0},
+            {'financial_status': 'normal', 'is_new_student': True, 'sessions_paid_for': 0},
+            {'financial_status': 'normal', 'sessions_attended': 4, 'sessions_paid_for': 2},
+            {'financial_status': 'normal', 'sessions_attended': 5, 'sessions_paid_for': 2},
+        ]
+        for fields in cases:
+            StudentGroupEnrollment.objects.filter(pk=self.enrollment.pk).update(**fields)
+            self.enrollment.refresh_from_db()
+            matches = StudentGroupEnrollment.objects.filter(
+                CreditService.credit_allows_attendance(),
+                pk=self.enrollment.pk
+            ).exists()
+            self.assertEqual(matches, self.enrollment.can_attend_session()['allowed'], fields)
+
+    def test_no_monthly_payment_update_when_refused(self):
+        """Test the monthly payment row is untouched when consume is refused"""
+        from apps.attendance.services import AttendanceService
+        StudentGroupEnrollment.objects.filter(pk=self.enrollment.pk).update(sessions_attended=3)
+        payment = Payment.objects.create(
+            student=self.student,
+            group=self.group,
+            month=timezone.localdate().replace(day=1),
+            amount_due=Decimal('300.00')
+        )
+
+        AttendanceService.update_payment_sessions(self.student, self.group)
+
+        payment.refresh_from_db()
+        self.assertEqual(payment.sessions_attended, 0)
+
+
+class SettlementTestCase(TestCase):
+    """Two teachers with September payments (shared settlement fixture)"""
+
+    def setUp(self):
+        self.month = date(2026, 9, 1)
+        room = Room.objects.create(name='Settle Room', capacity=30)
+        self.teachers = []
+        self.groups = []
+        for index in range(2):
+            teacher = Teacher.objects.create(
+                full_name=f'Teacher {index}',
+                phone=f'0123456780{index}',
+                email=f'teacher{index}@test.com',
+                specialization='Math',
+                hire_date=self.month
+            )
+            group = Group.objects.create(
+                group_name=f'Group {index}',
+                teacher=teacher,
+                room=room,
+                schedule_day='Saturday',
+                schedule_time=time(10 + index * 3, 0),
+                standard_fee=Decimal('400.00'),
+                center_percentage=Decimal('25.00')
+            )
+            self.teachers.append(teacher)
+            self.groups.append(group)
+
+        statuses = [('normal', None, '400.00'), ('symbolic', Decimal('100.00'), '50.00'), ('exempt', None, '0.00')]
+        for index, (status, custom_fee, paid) in enumerate(statuses):
+            student = Student.objects.create(
+                student_code=f'SET00{index}',
+                full_name=f'Student {index}',
+                parent_phone='01234567891'
+            )
+            StudentGroupEnrollment.objects.create(
+                student=student,
+                group=self.groups[0],
+                financial_status=status,
+                custom_fee=custom_fee
+            )
+            Payment.objects.create(
+                student=student,
+                group=self.groups[0],
+                month=self.month,
+                amount_due=Decimal('400.00'),
+                amount_paid=Decimal(paid)
+            )
+
+        # Payment without an enrollment (student left the group)
+        former = Student.objects.create(student_code='SET009', full_name='Former', parent_phone='01234567899')
+        Payment.objects.create(
+            student=former, group=self.groups[1], month=self.month,
+            amount_due=Decimal('400.00'), amount_paid=Decimal('200.00')
+        )
+        # Other month - ignored
+        Payment.objects.create(
+            student=former, group=self.groups[1], month=date(2026, 10, 1),
+            amount_due=Decimal('400.00'), amount_paid=Decimal('400.00')
+        )
+
+
+class SettlementEngineTest(SettlementTestCase):
+    """Test aggregate teacher settlements"""
+
+    def test_teacher_settlement_from_aggregates(self):
+        """Test revenue, expected fees and shares of one teacher"""
+        from apps.payments.services import SettlementService
+
+        with self.assertNumQueries(3):
+            data = SettlementService.calculate_teacher_settlement(self.teachers[0].teacher_id, 2026, 9)['data']
+
+        self.assertEqual(data['total_revenue'], 450.0)
+        self.assertEqual(data['expected_revenue'], 500.0)
+        self.assertEqual(data['center_share'], 112.5)
+        self.assertEqual(data['teacher_share'], 337.5)
+        students = data['breakdown'][0]['students']
+        self.assertEqual(
+            [(student['financial_status'], student['expected_fee']) for student in students],
+            [('عادي', 400.0), ('مبلغ رمزي', 100.0), ('إعفاء كامل', 0.0)]
+        )
+
+    def test_month_settlements_for_all_teachers(self):
+        """Test the month-end run covers every active teacher with a fixed query count"""
+        from apps.payments.services import SettlementService
+
+        with self.assertNumQueries(4):
+            settlements = SettlementService.calculate_month_settlements(2026, 9)['data']
+
+        self.assertEqual([data['total_revenue'] for data in settlements], [450.0, 200.0])
+        former = settlements[1]['breakdown'][0]['students'][0]
+        self.assertEqual((former['financial_status'], former['expected_fee']), ('غير محدد', 0.0))
+        self.assertEqual(
+            SettlementService.calculate_group_revenue(self.groups[1].group_id, 2026, 9)['revenue'], 200.0
+        )
+
+
+class SettlementSnapshotTest(SettlementTestCase):
+    """Test persisted, versioned settlement snapshots"""
+
+    def test_snapshot_reused_until_payments_change(self):
+        """Test a new version is written only when the month's payments change"""
+        from apps.payments.models import TeacherSettlement
+        from apps.payments.services import SettlementSnapshotService
+
+        teacher_id = self.teachers[0].teacher_id
+        first = SettlementSnapshotService.get_settlement(teacher_id, 2026, 9)
+        self.assertEqual((first.version, float(first.total_revenue)), (1, 450.0))
+
+        # Unchanged inputs: checksum queries + latest snapshot only
+        with self.assertNumQueries(4):
+            again = SettlementSnapshotService.get_settlement(teacher_id, 2026, 9)
+        self.assertEqual(again.pk, first.pk)
+
+        payment = Payment.objects.get(student__student_code='SET001')
+        payment.amount_paid = Decimal('100.00')
+        payment.save()
+
+        second = SettlementSnapshotService.get_settlement(teacher_id, 2026, 9)
+        self.assertEqual((second.version, second.data['total_revenue']), (2, 500.0))
+        self.assertEqual(TeacherSettlement.objects.filter(teacher_id=teacher_id).count(), 2)
+
+        # Enrollment fee status and student names are inputs too
+        StudentGroupEnrollment.objects.filter(student=payment.student).update(financial_status='exempt')
+        self.assertEqual(SettlementSnapshotService.get_settlement(teacher_id, 2026, 9).version, 3)
+        Student.objects.filter(pk=payment.student_id).update(full_name='Renamed Student')
+        fourth = SettlementSnapshotService.get_settlement(teacher_id, 2026, 9)
+        self.assertEqual(fourth.version, 4)
+        self.assertIn('Renamed Student', str(fourth.data))
+
+    def test_month_job_snapshots_in_chunks(self):
+        """Test the month-end task covers all teachers and is idempotent"""
+        from apps.payments.models import TeacherSettlement
+        from apps.payments.services import SettlementSnapshotService
+        from apps.payments.tasks import snapshot_month_settlements
+
+        result = snapshot_month_settlements.delay(2026, 9).get()
+        self.assertEqual((result['teachers'], result['chunks']), (2, 1))
+        self.assertEqual(TeacherSettlement.objects.count(), 2)
+
+        rerun = SettlementSnapshotService.snapshot_month(2026, 9, chunk_size=1)
+        self.assertEqual((rerun['chunks'], rerun['created']), (2, 0))
+
+    def test_report_pdf_cached_with_snapshot(self):
+        """Test the settlement PDF is generated once and stored"""
+        from unittest.mock import patch
+        from django.contrib.auth import get_user_model
+        from apps.payments.models import TeacherSettlement
+
+        get_user_model().objects.create_user(username='accountant', password='pass')
+        self.client.login(username='accountant', password='pass')
+        url = f'/payments/{self.teachers[0].teacher_id}/settlement/2026/9/pdf/'
+
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(response.content.startswith(b'%PDF'))
+
+        with patch('utils.pdf_generator.generate_settlement_report') as generate:
+            cached = self.client.get(url)
+        generate.assert_not_called()
+        self.assertEqual(cached.content, response.content)
+        self.assertIsNotNone(TeacherSettlement.objects.get().report_pdf)
+
+
+class StudentLedgerTest(TestCase):
+    """Test the student ledger and materialized balances"""
+
+    def setUp(self):
+        teacher = Teacher.objects.create(
+            full_name='Ledger Teacher',
+            phone='01234567800',
+            email='ledger@test.com',
+            specialization='Math',
+            hire_date=timezone.now().date()
+        )
+        room = Room.objects.create(name='Ledger Room', capacity=30)
+        self.groups = [
+            Group.objects.create(
+                group_name=f'Ledger Group {index}',
+                teacher=teacher,
+                room=room,
+                schedule_day='Saturday',
+                schedule_time=time(10 + index * 3, 0),
+                standard_fee=Decimal('400.00')
+            )
+            for index in range(2)
+        ]
+        self.student = Student.objects.create(
+            student_code='LED001',
+            full_name='Ledger Student',
+            parent_phone='01234567801'
+        )
+        self.enrollment = StudentGroupEnrollment.objects.create(student=self.student, group=self.groups[0])
+        # Enrollment from before the ledger: 3 attended, 0 paid, 2 grace
+        StudentGroupEnrollment.objects.create(
+            student=self.student, group=self.groups[1],
+            is_new_student=False, credit_balance=2, sessions_attended=3
+        )
+
+    def test_credit_changes_post_running_balances(self):
+        """Test payment, attendance and adjustment entries and the student balance"""
+        from apps.payments.ledger import LedgerService
+        from apps.payments.services import CreditService
+
+        group = self.groups[0]
+        CreditService.record_payment_and_update_credit(self.student, group, Decimal('400.00'), 4)
+        CreditService.record_attendance_and_update_credit(self.student, group)
+        CreditService.adjust_credit_balance(self.student, group, 0, notes='manual')
+
+        statement = LedgerService.get_statement(self.student.student_id)
+        self.assertEqual(
+            [(entry['entry_type'], entry['sessions'], entry['enrollment_balance'], entry['student_balance'])
+             for entry in statement['entries']],
+            [
+                ('payment_credit', 4, 4, 3),
+                ('adjustment', 2, 6, 5),
+                ('attendance_debit', -1, 5, 4),
+                ('adjustment', -2, 3, 2),
+            ]
+        )
+        # Seeded from the earlier enrollment (-1 session of credit)
+        self.assertEqual((statement['opening_balance'], statement['closing_balance']), (-1, 2))
+
+        with self.assertNumQueries(1):
+            balance = LedgerService.get_balance(self.student.student_id)
+        self.assertEqual(balance, {'balance': 2, 'owed_sessions': 3, 'total_paid': 400.0})
+        self.assertEqual(LedgerService.get_enrollment_balance(self.enrollment.pk), 3)
+        self.assertEqual(LedgerService.rebuild_balance(self.student.student_id)['balance'], 2)
+
+    def test_ledger_api_statement_range(self):
+        """Test the ledger endpoint filters the statement by date"""
+        from django.contrib.auth import get_user_model
+        from apps.payments.services import CreditService
+
+        CreditService.record_payment_and_update_credit(self.student, self.groups[0], Decimal('400.00'), 4)
+        get_user_model().objects.create_user(username='ledger', password='pass')
+        self.client.login(username='ledger', password='pass')
+        url = f'/api/payments/ledger/{self.student.student_id}/'
+
+        data = self.client.get(url).json()
+        self.assertEqual(data['balance']['balance'], 5)
+        self.assertEqual(len(data['statement']['entries']), 2)
+
+        tomorrow = (timezone.localdate() + timedelta(days=1)).isoformat()
+        later = self.client.get(url, {'start': tomorrow}).json()['statement']
+        self.assertEqual((later['entries'], later['opening_balance']), ([], 5))
+        self.assertEqual(self.client.get(url, {'start': 'soon'}).status_code, 400)
+
+    def test_admin_credit_reset_posts_adjustments(self):
+        """Test admin credit resets go through the ledger and reconcile repairs drift"""
+        from apps.payments.ledger import LedgerService
+        from apps.payments.models import StudentBalance
+        from apps.payments.services import CreditService
+        from apps.payments.tasks import reconcile_ledger_balances
+
+        self.assertEqual(LedgerService.get_balance(self.student.student_id)['balance'], -1)
+        count = CreditService.reset_enrollments_credit([self.enrollment.pk], is_new_student=False, notes='admin')
+        self.assertEqual(count, 1)
+
+        self.enrollment.refresh_from_db()
+        self.assertEqual((self.enrollment.is_new_student, self.enrollment.credit_balance), (False, 2))
+        entry = LedgerService.get_statement(self.student.student_id)['entries'][-1]
+        self.assertEqual((entry['entry_type'], entry['sessions'], entry['student_balance']), ('adjustment', 2, 1))
+        self.assertEqual(reconcile_ledger_balances(), {'checked': 1, 'rebuilt': 0})
+
+        # Counters edited behind the ledger's back
+        StudentGroupEnrollment.objects.filter(pk=self.enrollment.pk).update(sessions_attended=1)
+        self.assertEqual(reconcile_ledger_balances(), {'checked': 1, 'rebuilt': 1})
+        self.assertEqual(StudentBalance.objects.get(pk=self.student.student_id).balance, 0)
+
+
+class CreditReportTest(TestCase):
+    """Test the aggregate credit report and its exports"""
+
+    def setUp(self):
+        teacher = Teacher.objects.create(
+            full_name='Report Teacher',
+            phone='01234567810',
+            email='report@test.com',
+            specialization='Math',
+            hire_date=timezone.now().date()
+        )
+        room = Room.objects.create(name='Report Room', capacity=30)
+        self.group = Group.objects.create(
+            group_name='Report Group',
+            teacher=teacher,
+            room=room,
+            schedule_day='Saturday',
+            schedule_time=time(10, 0),
+            standard_fee=Decimal('400.00')
+        )
+        counters = [
+            # (is_new_student, credit_balance, attended, paid_for, blocked)
+            (True, 0, 0, 0, True),
+            (False, 2, 3, 1, False),
+            (False, 2, 4, 4, False),
+        ]
+        for index, (is_new, credit, attended, paid, blocked) in enumerate(counters):
+            student = Student.objects.create(
+                student_code=f'REP00{index}',
+                full_name=f'Report Student {index}',
+                parent_phone='01234567811'
+            )
+            StudentGroupEnrollment.objects.create(
+                student=student, group=self.group, is_new_student=is_new, credit_balance=credit,
+                sessions_attended=attended, sessions_paid_for=paid, is_financially_blocked=blocked
+            )
+
+    def test_counters_in_one_query(self):
+        """Test all counters come from a single aggregate and details are lazy"""
+        from apps.payments.services import CreditService
+
+        with self.assertNumQueries(1):
+            report = CreditService.get_credit_report(group=self.group)
+        self.assertEqual(
+            {key: value for key, value in report.items() if key != 'details'},
+            {'total_enrollments': 3, 'new_students': 1, 'returning_students': 2,
+             'financially_blocked': 1, 'with_debt': 1}
+        )
+
+        details = list(report['details'])
+        self.assertEqual([row['debt'] for row in details], [0, 2, 0])
+        self.assertEqual(details[1]['student_code'], 'REP001')
+
+    def test_csv_and_xlsx_exports(self):
+        """Test the streamed CSV and the write-only Excel export"""
+        import csv
+        import io
+        from django.contrib.auth import get_user_model
+        from openpyxl import load_workbook
+
+        get_user_model().objects.create_user(username='supervisor', password='pass', role='supervisor')
+        get_user_model().objects.create_user(username='reporter', password='pass', role='admin')
+        url = '/payments/credit-report/export/'
+
+        # Supervisors are redirected away from the export
+        self.client.login(username='supervisor', password='pass')
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.login(username='reporter', password='pass')
+
+        response = self.client.get(url, {'group': self.group.group_id})
+        self.assertTrue(response.streaming)
+        lines = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8-sig'))))
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[2][:3], ['REP001', 'Report Student 1', 'Report Group'])
+
+        response = self.client.get(url, {'format': 'xlsx'})
+        sheet = load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+        self.assertEqual(sheet.max_row, 4)
+        self.assertEqual(sheet.cell(row=3, column=8).value, 2)
+        self.assertEqual(self.client.get(url, {'format': 'pdf'}).status_code, 400)
+
+    def test_exports_neutralize_formulas(self):
+        """Test cells that look like spreadsheet formulas are exported as text"""
+        from apps.payments.exports import CreditReportExport
+        from apps.payments.services import CreditService
+
+        Student.objects.filter(student_code='REP001').update(full_name='=HYPERLINK("http://x")')
+        StudentGroupEnrollment.objects.filter(student__student_code='REP002').update(
+            financial_block_reason='@SUM(A1)'
+        )
+        rows = CreditService.iter_credit_report_rows(group=self.group)
+        values = {row['student_code']: CreditReportExport._values(row) for row in rows}
+
+        self.assertEqual(values['REP001'][1], '\'=HYPERLINK("http://x")')
+        self.assertEqual(values['REP002'][9], "'@SUM(A1)")
+        # Numbers stay numbers
+        self.assertEqual(values['REP001'][7], 2)
+
+
+class BulkPaymentTest(TestCase):
+    """Test recording a family's payments in one batch"""
+
+    def setUp(self):
+        teacher = Teacher.objects.create(
+            full_name='Bulk Teacher',
+            phone='01234567820',
+            email='bulk@test.com',
+            specialization='Math',
+            hire_date=timezone.now().date()
+        )
+        room = Room.objects.create(name='Bulk Room', capacity=30)
+        self.groups = [
+            Group.objects.create(
+                group_name=f'Bulk Group {index}',
+                teacher=teacher,
+                room=room,
+                schedule_day='Saturday',
+                schedule_time=time(10 + index * 3, 0),
+                standard_fee=Decimal('300.00')
+            )
+            for index in range(2)
+        ]
+        self.students = [
+            Student.objects.create(student_code=f'BLK00{index}', full_name=f'Bulk Student {index}', parent_phone=phone)
+            for index, phone in enumerate(['01000000001', '01000000001', '01000000002'])
+        ]
+        for student, group in [(self.students[0], 0), (self.students[0], 1), (self.students[1], 0), (self.students[2], 0)]:
+            StudentGroupEnrollment.objects.create(student=student, group=self.groups[group])
+        # Earlier payment this month for one of the lines
+        Payment.objects.create(
+            student=self.students[0], group=self.groups[0], month=timezone.localdate().replace(day=1),
+            amount_due=Decimal('300.00'), amount_paid=Decimal('100.00'), status='partial'
+        )
+
+    def _entries(self):
+        return [
+            {'student_id': self.students[0].student_id, 'group_id': self.groups[0].group_id, 'amount': '200', 'sessions': 4},
+            {'student_id': self.students[0].student_id, 'group_id': self.groups[1].group_id, 'amount': '150', 'sessions': 2},
+            {'student_id': self.students[1].student_id, 'group_id': self.groups[0].group_id, 'amount': '300', 'sessions': 4},
+            {'student_id': self.students[2].student_id, 'group_id': self.groups[0].group_id, 'amount': '300', 'sessions': 4},
+        ]
+
+    def test_bulk_payment_with_one_receipt_per_parent(self):
+        """Test counters, audit rows, monthly payments and consolidated receipts"""
+        from unittest.mock import patch
+        from apps.notifications.dispatch import NotificationDispatcher
+        from apps.payments.models import PaymentAuditLog
+        from apps.payments.services import CreditService
+
+        with patch.object(NotificationDispatcher, 'dispatch') as dispatch:
+            result = CreditService.record_bulk_payments(self._entries())
+
+        self.assertTrue(result['success'])
+        self.assertEqual(result['total_amount'], 950.0)
+        self.assertEqual(
+            [(receipt['parent_phone'], receipt['amount'], len(receipt['lines'])) for receipt in result['receipts']],
+            [('01000000001', 650.0, 3), ('01000000002', 300.0, 1)]
+        )
+        self.assertEqual(dispatch.call_count, 2)
+        self.assertEqual(dispatch.call_args_list[0].kwargs['receipt_number'], result['receipts'][0]['receipt_number'])
+
+        self.assertEqual(PaymentAuditLog.objects.filter(action='bulk_payment').count(), 4)
+        enrollment = StudentGroupEnrollment.objects.get(student=self.students[0], group=self.groups[0])
+        self.assertEqual((enrollment.sessions_paid_for, enrollment.credit_balance, enrollment.is_new_student), (4, 2, False))
+
+        payments = {
+            (payment.student_id, payment.group_id): (payment.amount_paid, payment.status)
+            for payment in Payment.objects.all()
+        }
+        self.assertEqual(len(payments), 4)
+        self.assertEqual(payments[(self.students[0].student_id, self.groups[0].group_id)], (Decimal('300.00'), 'paid'))
+        self.assertEqual(payments[(self.students[0].student_id, self.groups[1].group_id)], (Decimal('150.00'), 'partial'))
+
+    def test_bulk_payment_is_all_or_nothing(self):
+        """Test an invalid or unenrolled line rejects the whole batch"""
+        from apps.payments.models import PaymentAuditLog
+        from apps.payments.services import CreditService
+
+        entries = self._entries()
+        entries[3]['group_id'] = self.groups[1].group_id
+        result = CreditService.record_bulk_payments(entries)
+        self.assertEqual((result['success'], result['errors'][0]['index']), (False, 3))
+        self.assertFalse(PaymentAuditLog.objects.exists())
+        self.assertEqual(StudentGroupEnrollment.objects.filter(sessions_paid_for__gt=0).count(), 0)
+
+        result = CreditService.record_bulk_payments(self._entries() + [self._entries()[0]])
+        self.assertEqual(result['errors'][0]['index'], 4)
+
+    def test_bulk_payment_api(self):
+        """Test the bulk payment endpoint"""
+        import json
+        from django.contrib.auth import get_user_model
+
+        get_user_model().objects.create_user(username='desk', password='pass')
+        self.client.login(username='desk', password='pass')
+        url = '/api/payments/bulk/'
+
+        response = self.client.post(url, json.dumps({'entries': self._entries()}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['receipts']), 2)
+        self.assertEqual(self.client.post(url, 'nope', content_type='application/json').status_code, 400)
@@ -7,5 +7,7 @@ urlpatterns = [
     path('', views.payment_list, name='list'),
     path('create/', views.payment_create, name='create'),
     path('settlements/', views.settlement_list, name='settlement_list'),
+    path('credit-report/export/', views.credit_report_export, name='credit_report_export'),
     path('<int:teacher_id>/settlement/', views.teacher_settlement, name='settlement'),
+    path('<int:teacher_id>/settlement/<int:year>/<int:month>/pdf/', views.teacher_settlement_pdf, name='settlement_pdf'),
 ]
@@ -4,8 +4,9 @@ from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
 from .models import Payment
-from .services import SettlementService
+from .services import SettlementSnapshotService
 from apps.teachers.models import Teacher
+from apps.accounts.decorators import admin_required
 import logging
 
 logger = logging.getLogger(__name__)
@@ -93,19 +94,78 @@ def teacher_settlement(request, teacher_id):
         year = int(request.POST.get('year', timezone.now().year))
         month = int(request.POST.get('month', timezone.now().month))
         
-        result = SettlementService.calculate_teacher_settlement(teacher_id, year, month)
+        # Stored snapshot - recomputed only if the month's payments changed
+        snapshot = SettlementSnapshotService.get_settlement(teacher.teacher_id, year, month)
         
-        if result['success']:
-            return render(request, 'payments/settlement.html', {
-                'teacher': teacher,
-                'settlement': result['data']
-            })
-        else:
-            return JsonResponse(result, status=400)
+        return render(request, 'payments/settlement.html', {
+            'teacher': teacher,
+            'settlement': snapshot.data,
+            'snapshot': snapshot
+        })
     
     return render(request, 'payments/settlement.html', {'teacher': teacher})
 
 
+@login_required
+def teacher_settlement_pdf(request, teacher_id, year, month):
+    """
+    Download the settlement report PDF (cached with the settlement snapshot).
+    """
+    from django.http import Http404, HttpResponse
+    
+    teacher = get_object_or_404(Teacher, pk=teacher_id)
+    if not 1 <= month <= 12:
+        raise Http404('Invalid month')
+    
+    snapshot = SettlementSnapshotService.get_settlement(teacher.teacher_id, year, month)
+    response = HttpResponse(SettlementSnapshotService.get_report_pdf(snapshot), content_type='application/pdf')
+    response['Content-Disposition'] = (
+        f'attachment; filename="settlement-{teacher.teacher_id}-{year}-{month:02d}-v{snapshot.version}.pdf"'
+    )
+    return response
+
+
+@login_required
+@admin_required
+@require_http_methods(["GET"])
+def credit_report_export(request):
+    """
+    Download the credit report as CSV (streamed) or Excel.
+    
+    Query: ?format=csv|xlsx&group=<group_id>
+    """
+    from django.http import FileResponse, StreamingHttpResponse
+    from apps.teachers.models import Group
+    from .exports import CreditReportExport
+    from .services import CreditService
+    
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in ('csv', 'xlsx'):
+        return JsonResponse({'success': False, 'error': 'Unsupported format'}, status=400)
+    
+    group = None
+    if request.GET.get('group'):
+        group = get_object_or_404(Group, pk=request.GET['group'])
+    
+    rows = CreditService.iter_credit_report_rows(group=group)
+    filename = f'credit-report-{timezone.localdate().isoformat()}.{export_format}'
+    
+    if export_format == 'csv':
+        response = StreamingHttpResponse(
+            CreditReportExport.csv_lines(rows),
+            content_type='text/csv; charset=utf-8'
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    
+    return FileResponse(
+        CreditReportExport.write_xlsx(rows),
+        as_attachment=True,
+        filename=filename,
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+
+
 @login_required
 @require_http_methods(["POST"])
 def record_payment(request, payment_id):
@@ -2,7 +2,7 @@ from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 from django.db.models import Sum, Count, Q
 from django.http import JsonResponse
-from django.core.cache import cache
+from utils.cache_utils import CachedPayload
 from apps.students.models import Student
 from apps.teachers.models import Teacher, Group
 from apps.attendance.models import Attendance, Session
@@ -12,73 +12,73 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+DASHBOARD_STATS_CACHE = CachedPayload('dashboard_stats', ttl=300)
+
 
 @login_required
 def stats_api(request):
     """
     API endpoint for dashboard statistics with caching.
     """
-    # Check cache first
-    cache_key = f'dashboard_stats_{timezone.now().date()}'
-    cached_stats = cache.get(cache_key)
-    
-    if cached_stats:
-        return JsonResponse({'stats': cached_stats, 'cached': True})
-    
     try:
         today = timezone.now().date()
-        this_month = today.replace(day=1)
-
-        # Get statistics with optimized queries
-        total_students = Student.objects.filter(is_active=True).count()
-        total_teachers = Teacher.objects.filter(is_active=True).count()
-        total_groups = Group.objects.filter(is_active=True).count()
-
-        # Today's attendance
-        today_attendances = Attendance.objects.filter(
-            session__session_date=today
-        ).count()
-
-        # This month payments
-        month_payments = Payment.objects.filter(
-            month__gte=this_month
-        ).aggregate(
-            total_due=Sum('amount_due'),
-            total_paid=Sum('amount_paid')
+        # Fresh for 5 minutes; afterwards one worker rebuilds while others get the last stats
+        stats, cached = DASHBOARD_STATS_CACHE.fetch(
+            lambda: _build_dashboard_stats(today), today
         )
-
-        # Pending payments
-        pending_payments = Payment.objects.filter(
-            status__in=['unpaid', 'partial']
-        ).count()
-
-        # Present today
-        present_today = Attendance.objects.filter(
-            session__session_date=today,
-            status='present'
-        ).count()
-
-        stats = {
-            'total_students': total_students,
-            'total_teachers': total_teachers,
-            'total_groups': total_groups,
-            'today_present': present_today,
-            'today_attendances': today_attendances,
-            'pending_payments': pending_payments,
-            'month_due': float(month_payments['total_due'] or 0),
-            'month_paid': float(month_payments['total_paid'] or 0),
-        }
         
-        # Cache for 5 minutes
-        cache.set(cache_key, stats, 300)
-        
-        return JsonResponse({'stats': stats, 'cached': False})
+        return JsonResponse({'stats': stats, 'cached': cached})
     
     except Exception as e:
         logger.exception(f"Error generating dashboard stats: {str(e)}")
         return JsonResponse({'error': 'Failed to load statistics'}, status=500)
 
 
+def _build_dashboard_stats(today):
+    """Dashboard statistics payload (uncached)"""
+    this_month = today.replace(day=1)
+
+    # Get statistics with optimized queries
+    total_students = Student.objects.filter(is_active=True).count()
+    total_teachers = Teacher.objects.filter(is_active=True).count()
+    total_groups = Group.objects.filter(is_active=True).count()
+
+    # Today's attendance
+    today_attendances = Attendance.objects.filter(
+        session__session_date=today
+    ).count()
+
+    # This month payments
+    month_payments = Payment.objects.filter(
+        month__gte=this_month
+    ).aggregate(
+        total_due=Sum('amount_due'),
+        total_paid=Sum('amount_paid')
+    )
+
+    # Pending payments
+    pending_payments = Payment.objects.filter(
+        status__in=['unpaid', 'partial']
+    ).count()
+
+    # Present today
+    present_today = Attendance.objects.filter(
+        session__session_date=today,
+        status='present'
+    ).count()
+
+    return {
+        'total_students': total_students,
+        'total_teachers': total_teachers,
+        'total_groups': total_groups,
+        'today_present': present_today,
+        'today_attendances': today_attendances,
+        'pending_payments': pending_payments,
+        'month_due': float(month_payments['total_due'] or 0),
+        'month_paid': float(month_payments['total_paid'] or 0),
+    }
+
+
 @login_required
 def recent_activity_api(request):
     """
@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.utils.html import format_html
+from django.db import transaction
 from django.db.models import F
+from apps.attendance.roster_index import RosterIndexService
 from .models import Student, StudentGroupEnrollment
 
 
@@ -54,12 +56,15 @@ class StudentAdmin(admin.ModelAdmin):
     def activate_students(self, request, queryset):
         """تفعيل الطلاب المحددين"""
         count = queryset.update(is_active=True)
+        # queryset.update() sends no post_save - invalidate like the Student signal
+        transaction.on_commit(RosterIndexService.invalidate_all)
         self.message_user(request, f'تم تفعيل {count} طالب/طالبة')
     activate_students.short_description = "✅ تفعيل الطلاب المحددين"
 
     def deactivate_students(self, request, queryset):
         """إلغاء تفعيل الطلاب المحددين"""
         count = queryset.update(is_active=False)
+        transaction.on_commit(RosterIndexService.invalidate_all)
         self.message_user(request, f'تم إلغاء تفعيل {count} طالب/طالبة')
     deactivate_students.short_description = "❌ إلغاء تفعيل الطلاب المحددين"
 
@@ -176,60 +181,73 @@ class StudentGroupEnrollmentAdmin(admin.ModelAdmin):
         'reset_credit_balance', 'clear_financial_block'
     ]
 
+    def _update_enrollments(self, queryset, **fields):
+        """
+        queryset.update() sends no post_save - drop the students' roster
+        entries like the enrollment signal does
+        """
+        student_codes = list(queryset.values_list('student__student_code', flat=True))
+        count = queryset.update(**fields)
+        transaction.on_commit(lambda: RosterIndexService.invalidate_students(student_codes))
+        return count
+
     def set_normal_status(self, request, queryset):
         """تعيين الحالة المالية: عادي"""
-        count = queryset.update(financial_status='normal', custom_fee=None)
+        count = self._update_enrollments(queryset, financial_status='normal', custom_fee=None)
         self.message_user(request, f'تم تعيين {count} تسجيل كـ "عادي"')
     set_normal_status.short_description = "💰 تعيين: عادي"
 
     def set_exempt_status(self, request, queryset):
         """تعيين الحالة المالية: إعفاء كامل"""
-        count = queryset.update(financial_status='exempt', custom_fee=None)
+        count = self._update_enrollments(queryset, financial_status='exempt', custom_fee=None)
         self.message_user(request, f'تم تعيين {count} تسجيل كـ "إعفاء كامل"')
     set_exempt_status.short_description = "🎁 تعيين: إعفاء كامل"
 
     def activate_enrollments(self, request, queryset):
         """تفعيل التسجيلات المحددة"""
-        count = queryset.update(is_active=True)
+        count = self._update_enrollments(queryset, is_active=True)
         self.message_user(request, f'تم تفعيل {count} تسجيل')
     activate_enrollments.short_description = "✅ تفعيل التسجيلات"
 
     def mark_as_new_student(self, request, queryset):
         """تعيين الطلاب كطلاب جدد"""
-        count = queryset.update(
+        from apps.payments.services import CreditService
+        count = CreditService.reset_enrollments_credit(
+            queryset.values_list('pk', flat=True),
             is_new_student=True,
-            credit_balance=0,
-            is_financially_blocked=False,
-            financial_block_reason=''
+            performed_by=request.user,
+            notes='تعيين كطالب جديد من لوحة الإدارة'
         )
         self.message_user(request, f'تم تعيين {count} طالب كـ "طالب جديد" (رصيد = 0)')
     mark_as_new_student.short_description = "🆕 تعيين: طالب جديد (رصيد 0)"
 
     def mark_as_returning_student(self, request, queryset):
         """تعيين الطلاب كطلاب قدامى"""
-        count = queryset.update(
+        from apps.payments.services import CreditService
+        count = CreditService.reset_enrollments_credit(
+            queryset.values_list('pk', flat=True),
             is_new_student=False,
-            credit_balance=2,
-            is_financially_blocked=False,
-            financial_block_reason=''
+            performed_by=request.user,
+            notes='تعيين كطالب قديم من لوحة الإدارة'
         )
         self.message_user(request, f'تم تعيين {count} طالب كـ "طالب قديم" (رصيد = 2)')
     mark_as_returning_student.short_description = "🔄 تعيين: طالب قديم (رصيد 2)"
 
     def reset_credit_balance(self, request, queryset):
         """إعادة تعيين رصيد الائتمان"""
-        for enrollment in queryset:
-            if enrollment.is_new_student:
-                enrollment.credit_balance = 0
-            else:
-                enrollment.credit_balance = 2
-            enrollment.save()
-        self.message_user(request, f'تم إعادة تعيين رصيد الائتمان لـ {queryset.count()} طالب')
+        from apps.payments.services import CreditService
+        count = CreditService.reset_enrollments_credit(
+            queryset.values_list('pk', flat=True),
+            performed_by=request.user,
+            notes='إعادة تعيين الرصيد من لوحة الإدارة'
+        )
+        self.message_user(request, f'تم إعادة تعيين رصيد الائتمان لـ {count} طالب')
     reset_credit_balance.short_description = "🔄 إعادة تعيين رصيد الائتمان"
 
     def clear_financial_block(self, request, queryset):
         """إزالة الحظر المالي"""
-        count = queryset.update(
+        count = self._update_enrollments(
+            queryset,
             is_financially_blocked=False,
             financial_block_reason=''
         )
@@ -15,6 +15,7 @@ from django.db import models
 from django.db.models import Q, Count
 from django.utils import timezone
 from django.core.cache import cache
+from utils.cache_utils import CachedPayload
 
 
 class RoomScheduleService:
@@ -30,6 +31,9 @@ class RoomScheduleService:
     WORK_HOUR_START = 8  # 8:00 AM
     WORK_HOUR_END = 20   # 8:00 PM
     
+    # شبكة الجدول الأسبوعي - نادراً ما تتغير
+    WEEKLY_GRID_CACHE = CachedPayload('weekly_room_grid', ttl=300)
+    
     @classmethod
     def check_room_conflict(
         cls,
@@ -388,13 +392,22 @@ class RoomScheduleService:
                 'schedule': {...}
             }
         """
-        from .models import Room
-        
         if start_hour is None:
             start_hour = cls.WORK_HOUR_START
         if end_hour is None:
             end_hour = cls.WORK_HOUR_END
         
+        # Invalidated on Group/Room changes (teachers/signals.py)
+        return cls.WEEKLY_GRID_CACHE.get(
+            lambda: cls._build_weekly_grid_data(start_hour, end_hour),
+            start_hour, end_hour
+        )
+    
+    @classmethod
+    def _build_weekly_grid_data(cls, start_hour: int, end_hour: int) -> Dict[str, Any]:
+        """بناء شبكة الجدول الأسبوعي (بدون كاش)"""
+        from .models import Room
+        
         rooms = list(Room.objects.filter(is_active=True).order_by('name'))
         days = ['Saturday', 'Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
         time_slots = [f"{h:02d}:00" for h in range(start_hour, end_hour + 1)]
@@ -413,7 +426,7 @@ class RoomScheduleService:
         
         # تعبئة الحجوزات
         from .models import Group
-        groups = Group.objects.filter(is_active=True)
+        groups = Group.objects.filter(is_active=True).select_related('room', 'teacher')
         
         for group in groups:
             end_time = group.get_end_time()
@@ -1,6 +1,6 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import Teacher
+from .models import Teacher, Group, Room
 
 
 @receiver(post_save, sender=Teacher)
@@ -11,3 +11,16 @@ def generate_teacher_qr_on_create(sender, instance, created, **kwargs):
     if created and not instance.qr_code_base64:
         # Avoid recursion by checking if QR already exists
         instance.generate_qr_code()
+
+
+@receiver(post_save, sender=Teacher)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def invalidate_weekly_grid(sender, instance, **kwargs):
+    """
+    Schedule, room or teacher name changed - drop every cached weekly grid
+    """
+    from .services import RoomScheduleService
+    RoomScheduleService.WEEKLY_GRID_CACHE.invalidate()
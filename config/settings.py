@@ -249,6 +249,40 @@ CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_ENABLE_UTC = True
 
+# Attendance audit writes (BlockedAttempt)
+# sync: written inside the scan transaction (durable)
+# memory: per-process write-behind queue - unflushed rows are lost on a crash
+# redis: shared write-behind queue flushed by Celery - survives restarts
+ATTENDANCE_AUDIT_WRITE_MODE = config('ATTENDANCE_AUDIT_WRITE_MODE', default='sync')
+ATTENDANCE_AUDIT_FLUSH_ROWS = config('ATTENDANCE_AUDIT_FLUSH_ROWS', default=50, cast=int)
+ATTENDANCE_AUDIT_FLUSH_MS = config('ATTENDANCE_AUDIT_FLUSH_MS', default=1000, cast=int)
+
+# Scan-path latency histograms (per kiosk / per step, see apps/attendance/scan_metrics.py)
+ATTENDANCE_SCAN_METRICS_ENABLED = config('ATTENDANCE_SCAN_METRICS_ENABLED', default=True, cast=bool)
+# Bearer token for scraping /api/attendance/metrics/kiosks/ (empty: admin session only)
+METRICS_API_TOKEN = config('METRICS_API_TOKEN', default='')
+
+# Repeated scans of the same student/session are answered from the cache
+# (see apps/attendance/scan_dedup.py); 0 disables the de-duplication window
+ATTENDANCE_SCAN_DEDUP_SECONDS = config('ATTENDANCE_SCAN_DEDUP_SECONDS', default=10, cast=int)
+ATTENDANCE_SCAN_IDEMPOTENCY_SECONDS = config('ATTENDANCE_SCAN_IDEMPOTENCY_SECONDS', default=300, cast=int)
+# Offline kiosk scans older than this are rejected by the batch endpoint
+ATTENDANCE_BATCH_MAX_AGE_HOURS = config('ATTENDANCE_BATCH_MAX_AGE_HOURS', default=48, cast=int)
+
+# Live monitor minute snapshots for replay (see apps/attendance/monitor_history.py)
+LIVE_MONITOR_SNAPSHOT_START_HOUR = config('LIVE_MONITOR_SNAPSHOT_START_HOUR', default=8, cast=int)
+LIVE_MONITOR_SNAPSHOT_END_HOUR = config('LIVE_MONITOR_SNAPSHOT_END_HOUR', default=22, cast=int)
+LIVE_MONITOR_SNAPSHOT_RETENTION_DAYS = config('LIVE_MONITOR_SNAPSHOT_RETENTION_DAYS', default=180, cast=int)
+
+# Kiosk heartbeats are kept in the cache (see apps/attendance/kiosk_heartbeat.py)
+# online: polled within ONLINE_SECONDS; stale: key still alive (TTL); offline: key expired
+KIOSK_HEARTBEAT_ONLINE_SECONDS = config('KIOSK_HEARTBEAT_ONLINE_SECONDS', default=30, cast=int)
+KIOSK_HEARTBEAT_TTL_SECONDS = config('KIOSK_HEARTBEAT_TTL_SECONDS', default=300, cast=int)
+
+# Signed kiosk manifest of the room's sessions (see apps/attendance/kiosk_manifest.py)
+KIOSK_MANIFEST_HORIZON_MINUTES = config('KIOSK_MANIFEST_HORIZON_MINUTES', default=180, cast=int)
+KIOSK_MANIFEST_TTL_SECONDS = config('KIOSK_MANIFEST_TTL_SECONDS', default=300, cast=int)
+
 # Celery Beat Schedule (only if celery is installed)
 if crontab is not None:
     CELERY_BEAT_SCHEDULE = {
@@ -264,7 +298,45 @@ if crontab is not None:
             'task': 'attendance.check_teacher_attendance',
             'schedule': crontab(minute='*/5'),  # Every 5 minutes
         },
+        'materialize-today-sessions': {
+            'task': 'attendance.materialize_today_sessions',
+            'schedule': crontab(minute=0),  # Every hour (idempotent)
+        },
+        'drain-notification-spool': {
+            'task': 'notifications.drain_dispatch_spool',
+            'schedule': crontab(minute='*/1'),  # Every minute
+        },
+        'reconcile-session-counters': {
+            'task': 'attendance.reconcile_session_counters',
+            'schedule': crontab(minute='*/5'),  # Every 5 minutes
+        },
+        'record-monitor-snapshot': {
+            'task': 'attendance.record_monitor_snapshot',
+            'schedule': crontab(minute='*/1'),  # Every minute (operating hours only)
+        },
+        'purge-monitor-snapshots': {
+            'task': 'attendance.purge_monitor_snapshots',
+            'schedule': crontab(hour=3, minute=30),  # Daily at 3:30 AM
+        },
+        'flush-kiosk-heartbeats': {
+            'task': 'attendance.flush_kiosk_heartbeats',
+            'schedule': crontab(minute='*/1'),  # Every minute (below the heartbeat TTL)
+        },
+        'snapshot-month-settlements': {
+            'task': 'payments.snapshot_month_settlements',
+            'schedule': crontab(hour=2, minute=0, day_of_month=1),  # 1st of every month at 2 AM (previous month)
+        },
+        'reconcile-ledger-balances': {
+            'task': 'payments.reconcile_ledger_balances',
+            'schedule': crontab(hour=3, minute=0),  # Daily at 3 AM
+        },
     }
+
+    if ATTENDANCE_AUDIT_WRITE_MODE == 'redis':
+        CELERY_BEAT_SCHEDULE['flush-attendance-audit-buffer'] = {
+            'task': 'attendance.flush_audit_buffer',
+            'schedule': ATTENDANCE_AUDIT_FLUSH_MS / 1000.0,  # Every M milliseconds
+        }
 else:
     CELERY_BEAT_SCHEDULE = {}
 
@@ -276,6 +348,10 @@ ULTRAMSG_TOKEN = config('ULTRAMSG_TOKEN', default='')
 # Notification Settings
 NOTIFICATION_METHOD = config('NOTIFICATION_METHOD', default='whatsapp')
 ENABLE_FIRST_MONTH_STRICT_PAYMENT = config('ENABLE_FIRST_MONTH_STRICT_PAYMENT', default=True, cast=bool)
+# Local spool for notifications published while the broker is down (see apps/notifications/dispatch.py)
+NOTIFICATION_SPOOL_PATH = config('NOTIFICATION_SPOOL_PATH', default=str(BASE_DIR / 'spool' / 'notifications.jsonl'))
+# After a failed publish, skip the broker (spool directly) for this many seconds
+NOTIFICATION_BROKER_RETRY_SECONDS = config('NOTIFICATION_BROKER_RETRY_SECONDS', default=30, cast=int)
 
 
 # GLM-4 API Configuration
@@ -8,4 +8,14 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
+# gunicorn's gevent workers patch the standard library; psycopg2 is a C
+# extension and needs its own wait callback to yield between queries
+try:
+    from gevent import monkey
+    if monkey.is_module_patched('socket'):
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+except ImportError:
+    pass
+
 application = get_wsgi_application()
@@ -6,7 +6,7 @@ module.exports = {
         {
             name: 'educore-web',
             script: 'gunicorn',
-            args: 'config.wsgi:application --bind 0.0.0.0:3000 --workers 4 --timeout 120 --access-logfile logs/access.log --error-logfile logs/error.log',
+            args: 'config.wsgi:application --bind 0.0.0.0:3000 --workers 4 --worker-class gevent --worker-connections 200 --timeout 120 --access-logfile logs/access.log --error-logfile logs/error.log',
             cwd: '/root/.gemini/antigravity/scratch/SYSeducore',
             interpreter: 'venv/bin/python',
             instances: 1,
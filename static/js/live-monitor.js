@@ -3,7 +3,8 @@
  * جافاسكريبت للشاشة الحية لمراقبة الحضور
  * 
  * Features:
- * - Auto-refresh every 5 seconds
+ * - Server-pushed updates (SSE): snapshot on connect, then per-room deltas
+ * - Falls back to polling every 5 seconds without EventSource
  * - Smooth animations for data updates
  * - Full-screen mode support
  * - Room detail modal
@@ -15,10 +16,22 @@ class LiveMonitor {
         this.refreshInterval = 5000; // 5 seconds
         this.autoRefresh = true;
         this.refreshTimer = null;
+        this.eventSource = null;
+        this.streamFailures = 0;
+        this.useStream = typeof EventSource !== 'undefined';
         this.lastData = null;
+
+        // Wall screens show one channel (a subset of rooms) from its own endpoints
+        const body = document.body.dataset;
+        this.channel = body.channel || null;
+        this.apiBase = this.channel
+            ? `/api/attendance/monitor/channel/${this.channel}/`
+            : '/api/attendance/monitor/';
+
+        // Server-side settings are the defaults; localStorage overrides them per screen
         this.settings = {
-            refreshInterval: 5,
-            showAlerts: true,
+            refreshInterval: parseInt(body.refreshInterval || '5', 10),
+            showAlerts: body.showAlerts !== '0',
             enableSounds: false,
             kioskMode: true
         };
@@ -34,8 +47,10 @@ class LiveMonitor {
         this.initDateTime();
         this.initEventListeners();
 
-        // Load initial data
-        this.loadDashboardData();
+        // Load initial data (the stream starts with a snapshot)
+        if (!this.useStream) {
+            this.loadDashboardData();
+        }
 
         // Start auto-refresh
         if (this.autoRefresh) {
@@ -48,8 +63,12 @@ class LiveMonitor {
         }
     }
 
+    settingsKey() {
+        return this.channel ? `monitorSettings:${this.channel}` : 'monitorSettings';
+    }
+
     loadSettings() {
-        const saved = localStorage.getItem('monitorSettings');
+        const saved = localStorage.getItem(this.settingsKey());
         if (saved) {
             this.settings = { ...this.settings, ...JSON.parse(saved) };
         }
@@ -71,7 +90,7 @@ class LiveMonitor {
         this.settings.enableSounds = document.getElementById('enable-sounds').checked;
         this.settings.kioskMode = document.getElementById('kiosk-mode').checked;
 
-        localStorage.setItem('monitorSettings', JSON.stringify(this.settings));
+        localStorage.setItem(this.settingsKey(), JSON.stringify(this.settings));
 
         // Apply new settings
         this.refreshInterval = this.settings.refreshInterval * 1000;
@@ -149,7 +168,7 @@ class LiveMonitor {
 
     async loadDashboardData() {
         try {
-            const response = await fetch('/api/attendance/monitor/live-status/');
+            const response = await fetch(`${this.apiBase}live-status/`);
             const result = await response.json();
 
             if (result.success) {
@@ -244,10 +263,6 @@ class LiveMonitor {
                                 <i class="fas fa-check-circle"></i>
                                 حاضر: ${s.present}
                             </div>
-                            <div class="stat-item late">
-                                <i class="fas fa-clock"></i>
-                                متأخر: ${s.late}
-                            </div>
                             <div class="stat-item blocked">
                                 <i class="fas fa-ban"></i>
                                 محظور: ${s.blocked_total}
@@ -450,6 +465,11 @@ class LiveMonitor {
     }
 
     startAutoRefresh() {
+        if (this.useStream) {
+            this.connectStream();
+            return;
+        }
+
         if (this.refreshTimer) {
             clearInterval(this.refreshTimer);
         }
@@ -460,12 +480,68 @@ class LiveMonitor {
     }
 
     stopAutoRefresh() {
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
+        }
         if (this.refreshTimer) {
             clearInterval(this.refreshTimer);
             this.refreshTimer = null;
         }
     }
 
+    connectStream() {
+        if (this.eventSource) {
+            return;
+        }
+
+        this.eventSource = new EventSource(`${this.apiBase}stream/`);
+
+        this.eventSource.addEventListener('snapshot', (event) => {
+            this.streamFailures = 0;
+            this.updateDashboard(JSON.parse(event.data));
+        });
+
+        this.eventSource.addEventListener('room', (event) => {
+            this.streamFailures = 0;
+            this.applyRoomDelta(JSON.parse(event.data));
+        });
+
+        this.eventSource.onerror = () => {
+            // EventSource reconnects on its own; give up on repeated failures
+            this.streamFailures += 1;
+            if (this.streamFailures >= 5) {
+                console.warn('Live stream unavailable, falling back to polling');
+                this.stopAutoRefresh();
+                this.useStream = false;
+                this.loadDashboardData();
+                this.startAutoRefresh();
+            }
+        };
+    }
+
+    applyRoomDelta(delta) {
+        if (!this.lastData) {
+            return;
+        }
+
+        const room = delta.room;
+        const rooms = this.lastData.rooms.map(existing => existing.id === room.id ? room : existing);
+        const alerts = this.lastData.alerts
+            .filter(alert => alert.room !== room.name)
+            .concat(delta.alerts);
+
+        // Same totals as LiveMonitorService._generate_dashboard_data
+        const activeRooms = rooms.filter(existing => existing.status === 'active');
+        const summary = {
+            ...this.lastData.summary,
+            active_sessions: activeRooms.length,
+            total_present_today: activeRooms.reduce((total, existing) => total + existing.session.present, 0)
+        };
+
+        this.updateDashboard({ ...this.lastData, summary, rooms, alerts });
+    }
+
     toggleFullscreen() {
         if (!document.fullscreenElement) {
             document.documentElement.requestFullscreen();
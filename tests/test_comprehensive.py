@@ -537,3 +537,68 @@ class PerformanceTests(BaseTestCase):
         self.client.login(username='testuser', password='testpass123')
         response = self.client.get(reverse('students:list'))
         self.assertEqual(response.status_code, 200)
+
+
+# ==================== Cache Utility Tests ====================
+
+class CachedPayloadTests(BaseTestCase):
+    """Stale-while-revalidate payload cache"""
+
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import cache
+        cache.clear()
+
+    def _counting_builder(self):
+        calls = []
+
+        def build():
+            calls.append(1)
+            return len(calls)
+        return build, calls
+
+    def test_fresh_payload_is_built_once(self):
+        """Test repeated reads within the TTL reuse one build"""
+        from utils.cache_utils import CachedPayload
+        payload = CachedPayload('test_payload', ttl=60)
+        build, calls = self._counting_builder()
+
+        self.assertEqual(payload.fetch(build, 'a'), (1, False))
+        self.assertEqual(payload.fetch(build, 'a'), (1, True))
+        self.assertEqual(payload.get(build, 'b'), 2)
+        self.assertEqual(len(calls), 2)
+
+    def test_stale_payload_served_while_another_worker_rebuilds(self):
+        """Test an expired payload is served when the rebuild lock is taken"""
+        from unittest.mock import patch
+        from django.core.cache import cache
+        from utils.cache_utils import CachedPayload
+        payload = CachedPayload('test_payload', ttl=1, stale_ttl=60, jitter=0)
+        build, calls = self._counting_builder()
+        payload.get(build)
+
+        with patch('utils.cache_utils.time.time', return_value=timezone.now().timestamp() + 5):
+            cache.add(f'{payload._key(())}:lock', 1, 10)
+            self.assertEqual(payload.fetch(build), (1, True))
+
+            cache.delete(f'{payload._key(())}:lock')
+            self.assertEqual(payload.fetch(build), (2, False))
+        self.assertEqual(len(calls), 2)
+
+    def test_weekly_grid_invalidated_on_group_change(self):
+        """Test a schedule change drops the cached weekly grid"""
+        from apps.teachers.services import RoomScheduleService
+        first = RoomScheduleService.get_weekly_grid_data()
+        self.assertEqual(first['schedule'][self.room.name]['Sunday']['11:00']['available'], True)
+
+        Group.objects.create(
+            group_name='مجموعة الأحد',
+            teacher=self.teacher,
+            room=self.room,
+            schedule_day='Sunday',
+            schedule_time=time(11, 0),
+            standard_fee=Decimal('200.00')
+        )
+
+        second = RoomScheduleService.get_weekly_grid_data()
+        self.assertEqual(second['schedule'][self.room.name]['Sunday']['11:00']['available'], False)
@@ -0,0 +1,167 @@
+"""
+Shared Cache Utilities
+تخزين مؤقت للوحات المعلومات مع الحماية من التدافع
+
+CachedPayload wraps an expensive payload builder (dashboard stats, live
+monitor, schedule grid) with:
+
+- stale-while-revalidate: an expired payload is kept for stale_ttl more
+  seconds. The first request that sees it expired rebuilds it inline (and
+  pays the build time); concurrent requests get the stale payload
+  meanwhile. Nothing is rebuilt in the background - a payload nobody
+  reads is simply left to expire.
+- single-flight: a short cache lock (cache.add) lets only one worker
+  rebuild a key; on a cold miss the others wait briefly for its result
+- jittered TTLs: each write gets a slightly different freshness window so
+  keys written together do not all expire in the same second
+- versioned invalidation: invalidate() bumps a namespace version, which
+  turns every key of the namespace into a miss
+
+All state lives in django.core.cache, so it is shared between workers.
+"""
+
+import logging
+import random
+import time
+from typing import Any, Callable, Tuple
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class CachedPayload:
+    """
+    حمولة مخزنة مؤقتاً تُعاد بناؤها من عامل واحد فقط
+    """
+
+    PREFIX = 'swr'
+
+    # How often waiters look for the lock holder's result
+    WAIT_INTERVAL = 0.05
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        stale_ttl: float = None,
+        jitter: float = 0.1,
+        lock_timeout: float = 10,
+        wait_timeout: float = 5,
+    ):
+        """
+        Args:
+            name: Namespace of the cache keys
+            ttl: Seconds a payload is fresh (before jitter)
+            stale_ttl: Extra seconds an expired payload may still be served
+                (default: same as ttl)
+            jitter: Fraction of ttl randomly added or removed per write
+            lock_timeout: Seconds the rebuild lock is held at most
+            wait_timeout: Seconds a cold-miss waiter waits for the lock holder
+                before building the payload itself
+        """
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = ttl if stale_ttl is None else stale_ttl
+        self.jitter = jitter
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = min(wait_timeout, lock_timeout)
+
+    # ========================================
+    # Reading
+    # ========================================
+
+    def get(self, builder: Callable[[], Any], *key_parts: Any, refresh: bool = False) -> Any:
+        """
+        القيمة المخزنة أو بناؤها
+
+        Args:
+            builder: Callable returning the payload
+            key_parts: Extra key parts (e.g. date, filter values)
+            refresh: Build now and store, ignoring the cached value
+        """
+        return self.fetch(builder, *key_parts, refresh=refresh)[0]
+
+    def fetch(self, builder: Callable[[], Any], *key_parts: Any, refresh: bool = False) -> Tuple[Any, bool]:
+        """
+        مثل get مع بيان مصدر القيمة
+
+        Returns:
+            (payload, cached) - cached is False when this call built it
+        """
+        key = self._key(key_parts)
+        lock_key = f'{key}:lock'
+
+        if refresh:
+            return self._build(key, builder), False
+
+        entry = cache.get(key)
+        if entry is not None:
+            if time.time() < entry['fresh_until']:
+                return entry['value'], True
+
+            # Stale: this request rebuilds inline if it wins the lock,
+            # concurrent requests keep serving the old payload
+            if not cache.add(lock_key, 1, self.lock_timeout):
+                return entry['value'], True
+            try:
+                return self._build(key, builder), False
+            finally:
+                cache.delete(lock_key)
+
+        # Cold miss: the lock holder builds, the others wait for its result
+        if cache.add(lock_key, 1, self.lock_timeout):
+            try:
+                return self._build(key, builder), False
+            finally:
+                cache.delete(lock_key)
+
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.WAIT_INTERVAL)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry['value'], True
+            if cache.get(lock_key) is None:
+                break
+
+        # Lock holder failed or is too slow - do not leave the request waiting
+        return self._build(key, builder), False
+
+    # ========================================
+    # Writing
+    # ========================================
+
+    def invalidate(self) -> None:
+        """
+        إبطال كل مفاتيح هذه الحمولة (زيادة رقم الإصدار)
+        """
+        version_key = self._version_key()
+        try:
+            cache.incr(version_key)
+        except ValueError:
+            cache.add(version_key, 1, None)
+
+    def _build(self, key: str, builder: Callable[[], Any]) -> Any:
+        value = builder()
+
+        ttl = self.ttl * random.uniform(1 - self.jitter, 1 + self.jitter)
+        entry = {'value': value, 'fresh_until': time.time() + ttl}
+        try:
+            cache.set(key, entry, ttl + self.stale_ttl)
+        except Exception:
+            # A cache outage degrades to uncached reads
+            logger.exception(f"Failed to cache payload {key}")
+        return value
+
+    # ========================================
+    # Keys
+    # ========================================
+
+    def _version_key(self) -> str:
+        return f'{self.PREFIX}:{self.name}:version'
+
+    def _key(self, key_parts) -> str:
+        version = cache.get(self._version_key(), 0)
+        parts = ':'.join(str(part) for part in key_parts)
+        return f'{self.PREFIX}:{self.name}:v{version}:{parts}'
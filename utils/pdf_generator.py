@@ -32,34 +32,37 @@ class PDFGenerator:
     def _setup_arabic_font(self):
         """
         Setup Arabic font for PDF generation
+        (falls back to Helvetica when the font file is missing)
         """
+        self.font_name = 'Helvetica'
         try:
             # Register Arabic font (you need to have an Arabic font file)
             font_path = os.path.join(settings.BASE_DIR, 'static', 'fonts', 'ArabicFont.ttf')
             
             if os.path.exists(font_path):
                 pdfmetrics.registerFont(TTFont('Arabic', font_path))
-                
-                # Create Arabic styles
-                self.styles.add(ParagraphStyle(
-                    name='ArabicHeading',
-                    parent=self.styles['Heading1'],
-                    fontName='Arabic',
-                    fontSize=18,
-                    alignment=TA_RIGHT,
-                    spaceAfter=20
-                ))
-                
-                self.styles.add(ParagraphStyle(
-                    name='ArabicNormal',
-                    parent=self.styles['Normal'],
-                    fontName='Arabic',
-                    fontSize=10,
-                    alignment=TA_RIGHT,
-                    wordWrap='RTL'
-                ))
+                self.font_name = 'Arabic'
         except Exception as e:
             print(f"Warning: Could not setup Arabic font: {str(e)}")
+        
+        # Create Arabic styles
+        self.styles.add(ParagraphStyle(
+            name='ArabicHeading',
+            parent=self.styles['Heading1'],
+            fontName=self.font_name,
+            fontSize=18,
+            alignment=TA_RIGHT,
+            spaceAfter=20
+        ))
+        
+        self.styles.add(ParagraphStyle(
+            name='ArabicNormal',
+            parent=self.styles['Normal'],
+            fontName=self.font_name,
+            fontSize=10,
+            alignment=TA_RIGHT,
+            wordWrap='RTL'
+        ))
     
     def generate_pdf(self, data, filename=None):
         """
@@ -153,7 +156,7 @@ class PDFGenerator:
             ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
             ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
             ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Arabic'),
+            ('FONTNAME', (0, 0), (-1, -1), self.font_name),
             ('FONTSIZE', (0, 0), (-1, 0), 10),
             ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
             ('BACKGROUND', (0, 1), (-1, -1), colors.beige),